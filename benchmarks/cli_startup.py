@@ -0,0 +1,85 @@
+"""
+Measures how long the ``jobmon`` command line tool takes to run, since health
+scripts tend to run commands like ``jobmon status`` many times a minute.
+
+Run it from the top of the source tree::
+
+    $ python3 benchmarks/cli_startup.py --runs 50
+
+There are three cases:
+
+- ``interpreter`` is an empty Python process, which is the floor that the
+  others can't get under.
+- ``import`` is how long importing :mod:`jobmon.runner` takes, as measured
+  inside a new interpreter.
+- ``status`` is a whole ``jobmon status`` process, run against a real
+  supervisor.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import common
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+RUN_CLI = 'import sys; from jobmon import runner; sys.exit(runner.main())'
+TIME_IMPORT = ('import time; start = time.perf_counter(); '
+               'from jobmon import runner; '
+               'print(time.perf_counter() - start)')
+
+def time_process(argv, env):
+    """
+    :return: How long a process takes to run, in seconds.
+    """
+    start_time = time.perf_counter()
+    subprocess.run(argv, env=env, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start_time
+
+def add_args(arg_parser):
+    arg_parser.add_argument('--runs', type=int, default=50,
+                            help='How many times to run each case')
+    arg_parser.add_argument('--port', type=int, default=17540,
+                            help='The first of two ports for the supervisor')
+
+def run(args):
+    """
+    :return: The times taken by each case.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = SOURCE_DIR
+    env['JOBMON_PORT'] = '{},{}'.format(args.port, args.port + 1)
+
+    cases = {}
+    cases['interpreter'] = common.summarize(
+        [time_process([sys.executable, '-c', 'pass'], env)
+         for _ in range(args.runs)])
+
+    import_times = []
+    for _ in range(args.runs):
+        output = subprocess.check_output([sys.executable, '-c', TIME_IMPORT],
+                                         env=env)
+        import_times.append(float(output))
+    cases['import'] = common.summarize(import_times)
+
+    jobs = {'idle': {'command': 'sleep 3600', 'autostart': True}}
+    with common.Supervisor(jobs, args.port):
+        cases['status'] = common.summarize(
+            [time_process([sys.executable, '-c', RUN_CLI, 'status', 'idle'],
+                          env)
+             for _ in range(args.runs)])
+
+    return cases
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    add_args(arg_parser)
+    common.add_output_args(arg_parser)
+    args = arg_parser.parse_args()
+    common.report('cli_startup', run(args), args)
+
+if __name__ == '__main__':
+    main()
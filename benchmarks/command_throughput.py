@@ -0,0 +1,77 @@
+"""
+Measures how many commands per second a real supervisor can answer through
+:class:`jobmon.transport.CommandPipe`, with different numbers of clients
+sending commands at once.
+
+Run it from the top of the source tree::
+
+    $ python3 benchmarks/command_throughput.py --clients 1 4 16
+
+Each client sends status queries for a running job, one after another, for
+the whole duration - so this is the rate at which the command server, the
+service's request queue and the service thread can turn commands around.
+"""
+import argparse
+import threading
+import time
+
+import common
+
+def client_loop(supervisor, deadline, latencies):
+    """
+    Sends status queries until the deadline, recording how long each took.
+    """
+    command_pipe = supervisor.command_pipe()
+    while time.perf_counter() < deadline:
+        start_time = time.perf_counter()
+        command_pipe.is_running('idle')
+        latencies.append(time.perf_counter() - start_time)
+
+def add_args(arg_parser):
+    arg_parser.add_argument('--clients', type=int, nargs='+',
+                            default=[1, 4, 16],
+                            help='Numbers of concurrent clients to test')
+    arg_parser.add_argument('--duration', type=float, default=5,
+                            help='How long to test each number of clients, '
+                                 'in seconds')
+    arg_parser.add_argument('--port', type=int, default=17500,
+                            help='The first of two ports for the supervisor')
+
+def run(args):
+    """
+    :return: The throughput and latencies for each number of clients.
+    """
+    jobs = {'idle': {'command': 'sleep 3600', 'autostart': True}}
+
+    cases = {}
+    with common.Supervisor(jobs, args.port) as supervisor:
+        for clients in args.clients:
+            latencies = []
+            deadline = time.perf_counter() + args.duration
+            threads = [threading.Thread(target=client_loop,
+                                        args=(supervisor, deadline, latencies))
+                       for _ in range(clients)]
+
+            start_time = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start_time
+
+            case = cases['clients={}'.format(clients)] = {
+                'commands_per_sec': len(latencies) / elapsed,
+            }
+            case.update(common.summarize(latencies))
+
+    return cases
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    add_args(arg_parser)
+    common.add_output_args(arg_parser)
+    args = arg_parser.parse_args()
+    common.report('command_throughput', run(args), args)
+
+if __name__ == '__main__':
+    main()
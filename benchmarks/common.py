@@ -0,0 +1,212 @@
+"""
+Helpers shared by the benchmarks. Every benchmark reports its results in the
+same shape - a set of named cases, each of which has a few named numbers -
+so that they can all be written out as JSON and compared between runs by
+``benchmarks/compare.py``::
+
+    {
+        "metadata": {"python": "3.11.7", "commit": "...", ...},
+        "results": {
+            "spawn_latency": {
+                "fork heap=0MiB": {"median_ms": 0.8, "p95_ms": 1.2, ...},
+                ...
+            },
+            ...
+        }
+    }
+
+Numbers whose names end with ``_per_sec`` are better when they are higher;
+all of the others (latencies and durations) are better when they are lower.
+"""
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from jobmon import config, launcher, transport
+
+def percentile(ordered, fraction):
+    """
+    Picks a percentile out of a sorted list of samples.
+    """
+    index = min(len(ordered) - 1, int(len(ordered) * fraction))
+    return ordered[index]
+
+def summarize(latencies):
+    """
+    Summarizes a list of latencies.
+
+    :param latencies: The latencies, in seconds.
+    :return: A :class:`dict` of the count, mean, median, 95th and 99th \
+    percentile, and maximum, in milliseconds.
+    """
+    ordered = sorted(latencies)
+    if not ordered:
+        return {'count': 0}
+
+    return {
+        'count': len(ordered),
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'median_ms': percentile(ordered, 0.5) * 1000,
+        'p95_ms': percentile(ordered, 0.95) * 1000,
+        'p99_ms': percentile(ordered, 0.99) * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+def get_metadata():
+    """
+    Describes the machine and the source tree that the benchmarks were run
+    on, since results from different machines can't be compared.
+    """
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__),
+            stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+def add_output_args(arg_parser):
+    """
+    Adds the ``--json`` option, which every benchmark supports.
+    """
+    arg_parser.add_argument('--json', metavar='FILE',
+                            help='Also write the results to this file as '
+                                 'JSON (- for standard output)')
+
+def write_results(results, path):
+    """
+    Writes results, along with the metadata, as JSON.
+
+    :param dict results: Maps each benchmark's name to its cases.
+    :param str path: The file to write to, or ``-`` for standard output.
+    """
+    document = {'metadata': get_metadata(), 'results': results}
+    if path == '-':
+        json.dump(document, sys.stdout, indent=2, sort_keys=True)
+        print()
+    else:
+        with open(path, 'w') as output_file:
+            json.dump(document, output_file, indent=2, sort_keys=True)
+
+def print_cases(name, cases):
+    """
+    Prints a benchmark's cases as a table, with one row per case.
+    """
+    columns = []
+    for numbers in cases.values():
+        for column in numbers:
+            if column not in columns:
+                columns.append(column)
+
+    case_width = max([len(case) for case in cases] + [len(name)])
+    print(name.ljust(case_width), *('{:>12}'.format(column) for column in columns))
+    for case, numbers in cases.items():
+        print(case.ljust(case_width),
+              *('{:>12.3f}'.format(numbers[column]) if column in numbers
+                else '{:>12}'.format('-') for column in columns))
+    print()
+
+def report(name, cases, args):
+    """
+    Prints a benchmark's cases, and writes them as JSON if ``--json`` was
+    given.
+    """
+    if args.json != '-':
+        print_cases(name, cases)
+
+    if args.json is not None:
+        write_results({name: cases}, args.json)
+
+class Supervisor:
+    """
+    Runs a real supervisor, via :func:`launcher.run_fork`, for as long as
+    the ``with`` block lasts::
+
+        >>> with Supervisor({'job': {'command': 'true'}}, 17500) as supervisor:
+        ...     supervisor.command_pipe().is_running('job')
+
+    The control port can also be a Unix socket address, in which case the
+    event port has to be given as well.
+    """
+    # How long to wait for the supervisor to start and to stop, in seconds
+    TIMEOUT = 30
+
+    def __init__(self, jobs, control_port, event_port=None, **supervisor):
+        self.jobs = jobs
+        self.control_port = control_port
+        self.event_port = (event_port if event_port is not None
+                           else control_port + 1)
+        self.supervisor = supervisor
+        self.temp_dir = None
+        self.pid = None
+
+    def __enter__(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        supervisor = {
+            'control-port': self.control_port,
+            'event-port': self.event_port,
+            'log-file': os.path.join(self.temp_dir.name, 'supervisor.log'),
+            'log-level': 'WARNING',
+        }
+        supervisor.update(self.supervisor)
+
+        config_file = os.path.join(self.temp_dir.name, 'config.json')
+        with open(config_file, 'w') as config_output:
+            json.dump({'supervisor': supervisor, 'jobs': self.jobs},
+                      config_output)
+
+        config_handler = config.ConfigHandler()
+        config_handler.load(config_file)
+        self.pid = launcher.run_fork(config_handler)
+
+        # The command server can be listening before the service has
+        # started, so the supervisor is only ready once it answers
+        deadline = time.time() + self.TIMEOUT
+        while True:
+            try:
+                self.command_pipe().get_jobs()
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+
+        return self
+
+    def command_pipe(self):
+        return transport.CommandPipe(self.control_port)
+
+    def event_stream(self):
+        return transport.EventStream(self.event_port)
+
+    def __exit__(self, *exc_info):
+        try:
+            self.command_pipe().terminate()
+        except IOError:
+            pass
+
+        deadline = time.time() + self.TIMEOUT
+        while time.time() < deadline:
+            pid, _ = os.waitpid(self.pid, os.WNOHANG)
+            if pid != 0:
+                break
+            time.sleep(0.05)
+        else:
+            os.kill(self.pid, 9)
+            os.waitpid(self.pid, 0)
+
+        self.temp_dir.cleanup()
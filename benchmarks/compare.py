@@ -0,0 +1,91 @@
+"""
+Compares two sets of benchmark results written with ``--json``, and reports
+every number which has got worse by more than a given tolerance.
+
+Run it from the top of the source tree::
+
+    $ python3 benchmarks/compare.py baseline.json results.json --tolerance 10
+
+This exits with a status of 1 if anything regressed, so that it can be used
+to fail a build. Only the cases and numbers present in both files are
+compared; the ``count`` of samples is never compared.
+"""
+import argparse
+import json
+import sys
+
+# Numbers which only describe the benchmark itself, not how fast it went
+IGNORED = {'count'}
+
+def higher_is_better(metric):
+    """
+    :return: Whether bigger values of a number are improvements.
+    """
+    return metric.endswith('_per_sec')
+
+def compare(baseline, current, tolerance):
+    """
+    Compares two sets of results.
+
+    :param float tolerance: How much worse a number can get before it is \
+    counted as a regression, as a percentage.
+    :return: A list of ``(benchmark, case, metric, baseline, current, \
+    change, regressed)`` tuples, where the change is a percentage and is \
+    positive for improvements.
+    """
+    rows = []
+    for benchmark, cases in sorted(baseline.items()):
+        for case, numbers in sorted(cases.items()):
+            current_numbers = current.get(benchmark, {}).get(case)
+            if current_numbers is None:
+                continue
+
+            for metric, old in sorted(numbers.items()):
+                new = current_numbers.get(metric)
+                if metric in IGNORED or new is None or old == 0:
+                    continue
+
+                change = (new - old) / old * 100
+                if not higher_is_better(metric):
+                    change = -change
+
+                rows.append((benchmark, case, metric, old, new, change,
+                             change < -tolerance))
+
+    return rows
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument('baseline', help='The results to compare against')
+    arg_parser.add_argument('current', help='The new results')
+    arg_parser.add_argument('--tolerance', type=float, default=10,
+                            help='How much worse (as a percentage) a number '
+                                 'can get before it counts as a regression')
+    arg_parser.add_argument('--all', action='store_true',
+                            help='Show every number, not just the regressions')
+    args = arg_parser.parse_args()
+
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(args.current) as current_file:
+        current = json.load(current_file)
+
+    if baseline['metadata'].get('platform') != current['metadata'].get('platform'):
+        print('Warning: the results are from different platforms',
+              file=sys.stderr)
+
+    rows = compare(baseline['results'], current['results'], args.tolerance)
+    regressions = 0
+    for benchmark, case, metric, old, new, change, regressed in rows:
+        regressions += regressed
+        if regressed or args.all:
+            print('{:<4} {} / {} / {}: {:.3f} -> {:.3f} ({:+.1f}%)'.format(
+                'FAIL' if regressed else 'ok', benchmark, case, metric,
+                old, new, change))
+
+    print('{} numbers compared, {} regressed by more than {}%'.format(
+        len(rows), regressions, args.tolerance))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Measures how long :meth:`jobmon.config.ConfigHandler.load` takes as the
+number of jobs grows.
+
+Run it from the top of the source tree::
+
+    $ python3 benchmarks/config_load.py --jobs 10 100 1000
+
+Each number of jobs is tested twice - once with every job in the main
+configuration file, and once with each job in a file of its own, found via
+``include-dirs``.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import common
+
+from jobmon import config
+
+def make_job(index, temp_dir):
+    """
+    Makes up a job which uses most of the common options.
+    """
+    return {
+        'command': 'sleep {}'.format(index),
+        'autostart': index % 2 == 0,
+        'restart': index % 3 == 0,
+        'working-dir': temp_dir,
+        'stdout': os.path.join(temp_dir, 'job-{}.log'.format(index)),
+        'env': {'JOB_INDEX': str(index)},
+    }
+
+def write_config(temp_dir, job_count, included):
+    """
+    Writes out a configuration with a number of jobs.
+
+    :param bool included: Whether to put each job in a separate file, or \
+    to put them all into the main configuration file.
+    :return: The path to the main configuration file.
+    """
+    jobs = {'job-{}'.format(index): make_job(index, temp_dir)
+            for index in range(job_count)}
+
+    supervisor = {'log-level': 'WARNING'}
+    main_config = {'supervisor': supervisor}
+    if included:
+        jobs_dir = os.path.join(temp_dir, 'jobs')
+        os.mkdir(jobs_dir)
+        supervisor['include-dirs'] = [os.path.join(jobs_dir, '*.json')]
+
+        for name, job in jobs.items():
+            with open(os.path.join(jobs_dir, name + '.json'), 'w') as job_file:
+                json.dump({name: job}, job_file)
+    else:
+        main_config['jobs'] = jobs
+
+    config_file = os.path.join(temp_dir, 'config.json')
+    with open(config_file, 'w') as config_output:
+        json.dump(main_config, config_output)
+    return config_file
+
+def measure(job_count, included, iterations):
+    """
+    Loads a configuration repeatedly.
+
+    :return: A list of load times, in seconds.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        config_file = write_config(temp_dir, job_count, included)
+
+        latencies = []
+        for _ in range(iterations):
+            start_time = time.perf_counter()
+            config.ConfigHandler().load(config_file)
+            latencies.append(time.perf_counter() - start_time)
+
+    return latencies
+
+def add_args(arg_parser):
+    arg_parser.add_argument('--jobs', type=int, nargs='+',
+                            default=[10, 100, 1000],
+                            help='Numbers of jobs to test')
+    arg_parser.add_argument('--iterations', type=int, default=20,
+                            help='How many times to load each configuration')
+
+def run(args):
+    """
+    :return: The load times for each number of jobs and layout.
+    """
+    cases = {}
+    for job_count in args.jobs:
+        for layout, included in (('single-file', False), ('include-dirs', True)):
+            latencies = measure(job_count, included, args.iterations)
+            cases['jobs={} {}'.format(job_count, layout)] = \
+                common.summarize(latencies)
+
+    return cases
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    add_args(arg_parser)
+    common.add_output_args(arg_parser)
+    args = arg_parser.parse_args()
+    common.report('config_load', run(args), args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Measures how long it takes :class:`jobmon.event_server.EventServer` to get an
+event to all of its subscribers, as the number of subscribers grows.
+
+Run it from the top of the source tree::
+
+    $ python3 benchmarks/event_fanout.py --subscribers 1 10 100
+
+The latency reported for each event is the time between handing the event to
+the event server and the last subscriber receiving it.
+"""
+import argparse
+import selectors
+import time
+
+import common
+
+from jobmon import event_server, metrics, protocol, transport
+
+def get_subscribers():
+    """
+    :return: How many subscribers the event server has accepted.
+    """
+    samples = metrics.EVENT_SUBSCRIBERS.samples()
+    return samples[0][2] if samples else 0
+
+def add_args(arg_parser):
+    arg_parser.add_argument('--subscribers', type=int, nargs='+',
+                            default=[1, 10, 100],
+                            help='Numbers of subscribers to test')
+    arg_parser.add_argument('--events', type=int, default=200,
+                            help='How many events to send per test')
+    arg_parser.add_argument('--port', type=int, default=17510,
+                            help='The port for the event server')
+
+def measure(port, subscribers, events):
+    """
+    Sends events to a number of subscribers, one at a time.
+
+    :return: A list of latencies, in seconds.
+    """
+    server = event_server.EventServer(port)
+    server.start()
+
+    streams = [transport.EventStream(port) for _ in range(subscribers)]
+    pollster = selectors.DefaultSelector()
+    for stream in streams:
+        pollster.register(stream, selectors.EVENT_READ)
+
+    try:
+        # Don't time anything until every subscriber has been accepted, or
+        # the first few events would only go to some of them
+        deadline = time.perf_counter() + 30
+        while get_subscribers() < subscribers:
+            if time.perf_counter() > deadline:
+                raise IOError('Subscribers were not accepted in time')
+            time.sleep(0.01)
+
+        latencies = []
+        for _ in range(events):
+            start_time = time.perf_counter()
+            server.send('bench', protocol.EVENT_STOPJOB)
+
+            waiting = subscribers
+            while waiting:
+                for key, _ in pollster.select():
+                    key.fileobj.next_event()
+                    waiting -= 1
+
+            latencies.append(time.perf_counter() - start_time)
+    finally:
+        server.terminate()
+        server.wait_for_exit()
+        for stream in streams:
+            stream.destroy()
+
+    return latencies
+
+def run(args):
+    """
+    :return: The latencies for each number of subscribers.
+    """
+    return {'subscribers={}'.format(subscribers):
+                common.summarize(measure(args.port, subscribers, args.events))
+            for subscribers in args.subscribers}
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    add_args(arg_parser)
+    common.add_output_args(arg_parser)
+    args = arg_parser.parse_args()
+    common.report('event_fanout', run(args), args)
+
+if __name__ == '__main__':
+    main()
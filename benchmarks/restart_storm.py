@@ -0,0 +1,106 @@
+"""
+Measures how quickly a real supervisor can handle a storm of crashing jobs,
+and how responsive it stays to commands while it does.
+
+Run it from the top of the source tree::
+
+    $ python3 benchmarks/restart_storm.py --jobs 10 100
+
+Every job runs ``false`` and is restarted automatically, so each one crashes,
+is restarted, and crashes again (at which point it is throttled). The
+benchmark starts all of them at once, and times how long it takes for every
+job to be restarted, while another thread keeps asking the supervisor about a
+job which isn't crashing.
+"""
+import argparse
+import threading
+import time
+
+import common
+
+from jobmon import protocol
+
+def probe_loop(supervisor, done, latencies):
+    """
+    Sends status queries until the storm is over, recording how long each
+    took.
+    """
+    command_pipe = supervisor.command_pipe()
+    while not done.is_set():
+        start_time = time.perf_counter()
+        command_pipe.is_running('idle')
+        latencies.append(time.perf_counter() - start_time)
+        time.sleep(0.001)
+
+def measure(port, job_count):
+    """
+    Crashes a number of jobs at once.
+
+    :return: A tuple of the time taken for every job to be restarted, and \
+    the latencies of the status queries sent in the meantime.
+    """
+    jobs = {'crash-{}'.format(index): {'command': 'false', 'restart': True}
+            for index in range(job_count)}
+    jobs['idle'] = {'command': 'sleep 3600', 'autostart': True}
+
+    with common.Supervisor(jobs, port) as supervisor:
+        event_stream = supervisor.event_stream()
+        command_pipe = supervisor.command_pipe()
+
+        done = threading.Event()
+        latencies = []
+        prober = threading.Thread(target=probe_loop,
+                                  args=(supervisor, done, latencies))
+
+        start_time = time.perf_counter()
+        prober.start()
+        for index in range(job_count):
+            command_pipe.start_job('crash-{}'.format(index))
+
+        waiting = set(jobs) - {'idle'}
+        while waiting:
+            event = event_stream.next_event()
+            if event.event_code == protocol.EVENT_RESTARTJOB:
+                waiting.discard(event.job_name)
+
+        elapsed = time.perf_counter() - start_time
+        done.set()
+        prober.join()
+        event_stream.destroy()
+
+    return elapsed, latencies
+
+def add_args(arg_parser):
+    arg_parser.add_argument('--jobs', type=int, nargs='+', default=[10, 100],
+                            help='Numbers of crashing jobs to test')
+    arg_parser.add_argument('--port', type=int, default=17520,
+                            help='The first of two ports for the supervisor')
+
+def run(args):
+    """
+    :return: The restart throughput, and the latency of the status queries, \
+    for each number of jobs.
+    """
+    cases = {}
+    for job_count in args.jobs:
+        elapsed, latencies = measure(args.port, job_count)
+
+        case = cases['jobs={}'.format(job_count)] = {
+            'storm_ms': elapsed * 1000,
+            'restarts_per_sec': job_count / elapsed,
+        }
+        case.update({'probe_' + key: value
+                     for key, value in common.summarize(latencies).items()
+                     if key != 'count'})
+
+    return cases
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    add_args(arg_parser)
+    common.add_output_args(arg_parser)
+    args = arg_parser.parse_args()
+    common.report('restart_storm', run(args), args)
+
+if __name__ == '__main__':
+    main()
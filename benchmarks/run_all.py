@@ -0,0 +1,79 @@
+"""
+Runs every benchmark, and writes all of their results into one JSON file
+which can be compared against another run with ``benchmarks/compare.py``.
+
+Run it from the top of the source tree::
+
+    $ python3 benchmarks/run_all.py --json results.json
+    $ python3 benchmarks/run_all.py --quick --only ticker_ops config_load
+
+``--quick`` cuts down the sizes and iterations of each benchmark, which is
+good enough to check that they all work but is too noisy to compare.
+"""
+import argparse
+import collections
+
+import common
+
+import cli_startup
+import command_throughput
+import config_load
+import event_fanout
+import restart_storm
+import spawn_latency
+import ticker_ops
+import transport_latency
+
+BENCHMARKS = collections.OrderedDict([
+    ('command_throughput', command_throughput),
+    ('transport_latency', transport_latency),
+    ('event_fanout', event_fanout),
+    ('spawn_latency', spawn_latency),
+    ('restart_storm', restart_storm),
+    ('ticker_ops', ticker_ops),
+    ('config_load', config_load),
+    ('cli_startup', cli_startup),
+])
+
+# The arguments given to each benchmark by --quick
+QUICK_ARGS = {
+    'command_throughput': ['--clients', '1', '4', '--duration', '1'],
+    'transport_latency': ['--commands', '500'],
+    'event_fanout': ['--subscribers', '1', '10', '--events', '50'],
+    'spawn_latency': ['--heap-sizes', '0', '--iterations', '20'],
+    'restart_storm': ['--jobs', '10'],
+    'ticker_ops': ['--timers', '100', '1000'],
+    'config_load': ['--jobs', '10', '100', '--iterations', '5'],
+    'cli_startup': ['--runs', '5'],
+}
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument('--quick', action='store_true',
+                            help='Run smaller versions of each benchmark')
+    arg_parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS),
+                            help='Run only these benchmarks')
+    common.add_output_args(arg_parser)
+    args = arg_parser.parse_args()
+
+    results = {}
+    for name, benchmark in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+
+        # Each benchmark gets its defaults (or the quick arguments) from its
+        # own parser, the same as if it were run by itself
+        benchmark_parser = argparse.ArgumentParser()
+        benchmark.add_args(benchmark_parser)
+        benchmark_args = benchmark_parser.parse_args(
+            QUICK_ARGS[name] if args.quick else [])
+
+        results[name] = benchmark.run(benchmark_args)
+        if args.json != '-':
+            common.print_cases(name, results[name])
+
+    if args.json is not None:
+        common.write_results(results, args.json)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,578 @@
+"""
+Runs a real supervisor under a long, randomized load, checking that it stays
+healthy and reporting how quickly it answers as time goes on.
+
+Run it from the top of the source tree::
+
+    $ python3 benchmarks/soak.py --duration 86400 --report-file soak.jsonl
+
+The supervisor is given thousands of jobs - short-lived jobs which sleep for
+a moment and exit, and crash-looping jobs which fail as soon as they start
+and are restarted automatically. Several clients then start, stop and query
+random jobs for the whole run, while the harness checks that:
+
+- The supervisor doesn't leak file descriptors or threads. These go up and
+  down with the number of running jobs, so every ``--quiesce-interval``
+  seconds the load is paused, every job is stopped, and the counts are
+  compared with those from before any job was started.
+- The supervisor doesn't leave zombie processes behind. A zombie child which
+  is still there at the next check counts as a leak.
+- The status of each short-lived job agrees with the last event sent about
+  it, once it has been quiet for a while. (Crash-looping jobs aren't checked,
+  since no event is sent when a job is throttled.)
+
+Every ``--report-interval`` seconds, the percentiles of the latencies since
+the last report are printed (and written to ``--report-file`` as a line of
+JSON), for each kind of command and for the time between a start or stop
+command and the matching event. Any p99 over ``--slo-p99-ms`` is reported as
+an SLO breach. The harness exits with a status of 1 if any check failed or
+any SLO was breached.
+"""
+import argparse
+import json
+import os
+import random
+import select
+import sys
+import threading
+import time
+
+import common
+
+from jobmon import metrics, protocol, transport
+
+# The kinds of commands sent by the clients, and how often each is sent
+COMMAND_WEIGHTS = (('status', 60), ('start', 20), ('stop', 15), ('list', 5))
+
+# How long a job has to go without events before its status is checked
+SETTLE_TIME = 2
+
+# How long to wait for every job to stop when quiescing
+QUIESCE_TIMEOUT = 60
+
+# What a client can get instead of an answer from the supervisor. Refused
+# commands (a JobError) are expected, but these aren't.
+TRANSPORT_ERRORS = (OSError, protocol.ProtocolTimeout)
+
+class LatencyLog:
+    """
+    Collects latencies by category. Each report only covers the latencies
+    since the previous one, while the whole run is kept in a histogram so
+    that it doesn't grow without bound.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.recent = {}
+        self.total = metrics.Histogram('soak_latency_seconds',
+                                       'Latencies over the whole run.',
+                                       ['category'])
+
+    def record(self, category, latency):
+        with self.lock:
+            self.recent.setdefault(category, []).append(latency)
+        self.total.observe(latency, category)
+
+    def take_recent(self):
+        """
+        :return: The latencies of each category since the last call.
+        """
+        with self.lock:
+            recent, self.recent = self.recent, {}
+        return recent
+
+    def summarize_total(self):
+        """
+        :return: The estimated percentiles of each category over the whole \
+        run, in milliseconds.
+        """
+        summaries = {}
+        for (category,), (buckets, _, count) in self.total.snapshot().items():
+            summary = summaries[category] = {'count': count}
+            for name, quantile in (('median_ms', 0.5), ('p95_ms', 0.95),
+                                   ('p99_ms', 0.99)):
+                summary[name] = metrics.bucket_quantile(
+                    quantile, self.total.buckets, buckets) * 1000
+        return summaries
+
+class EventTracker(threading.Thread):
+    """
+    Follows the event stream, keeping track of what each job should be doing
+    according to its events, and timing how long events take to follow the
+    commands which caused them.
+    """
+    def __init__(self, supervisor, latencies):
+        super().__init__()
+        self.event_stream = supervisor.event_stream()
+        self.latencies = latencies
+        self.done = threading.Event()
+
+        self.lock = threading.Lock()
+
+        # Maps each job to a tuple of (running, time of the last event,
+        # number of events so far)
+        self.states = {}
+
+        # Maps each job to the (event code, time) of the command sent to it,
+        # whose event hasn't arrived yet
+        self.pending = {}
+
+    def expect(self, job, event_code):
+        """
+        Notes that a command has been sent which should cause an event.
+        """
+        with self.lock:
+            self.pending[job] = (event_code, time.perf_counter())
+
+    def cancel(self, job):
+        """
+        Notes that a command failed, so it won't cause an event after all.
+        """
+        with self.lock:
+            self.pending.pop(job, None)
+
+    def is_pending(self, job):
+        with self.lock:
+            return job in self.pending
+
+    def get_state(self, job):
+        with self.lock:
+            return self.states.get(job, (False, 0, 0))
+
+    def run(self):
+        while not self.done.is_set():
+            readers, _, _ = select.select([self.event_stream], [], [], 0.5)
+            if not readers:
+                continue
+
+            event = self.event_stream.next_event()
+            now = time.perf_counter()
+            job = event.job_name
+
+            with self.lock:
+                _, _, event_count = self.states.get(job, (False, 0, 0))
+                running = event.event_code != protocol.EVENT_STOPJOB
+                self.states[job] = (running, time.time(), event_count + 1)
+
+                expected = self.pending.get(job)
+                if expected is not None and expected[0] == event.event_code:
+                    del self.pending[job]
+                    self.latencies.record(
+                        'event:' + protocol.Event.EVENT_NAMES[event.event_code],
+                        now - expected[1])
+
+        self.event_stream.destroy()
+
+    def terminate(self):
+        self.done.set()
+        self.join()
+
+class LoadClient(threading.Thread):
+    """
+    Sends random commands about random jobs, until it is terminated. Any
+    command which doesn't get an answer is reported as a violation.
+    """
+    def __init__(self, supervisor, jobs, tracker, latencies, seed, violation):
+        super().__init__()
+        self.command_pipe = supervisor.command_pipe()
+        self.jobs = jobs
+        self.tracker = tracker
+        self.latencies = latencies
+        self.random = random.Random(seed)
+        self.violation = violation
+
+        self.done = threading.Event()
+        self.running = threading.Event()
+        self.running.set()
+
+        # Commands which the supervisor refused are expected (like starting a
+        # job which is already running), but connection errors aren't
+        self.errors = 0
+
+    def send_command(self, command, job):
+        if command == 'status':
+            self.command_pipe.is_running(job)
+        elif command == 'list':
+            self.command_pipe.get_jobs()
+        elif command == 'start':
+            self.tracker.expect(job, protocol.EVENT_STARTJOB)
+            try:
+                self.command_pipe.start_job(job)
+            except transport.JobError:
+                self.tracker.cancel(job)
+        elif command == 'stop':
+            self.tracker.expect(job, protocol.EVENT_STOPJOB)
+            try:
+                self.command_pipe.stop_job(job)
+            except transport.JobError:
+                self.tracker.cancel(job)
+
+    def run(self):
+        commands, weights = zip(*COMMAND_WEIGHTS)
+        while not self.done.is_set():
+            self.running.wait()
+            command = self.random.choices(commands, weights)[0]
+            job = self.random.choice(self.jobs)
+
+            start_time = time.perf_counter()
+            try:
+                self.send_command(command, job)
+            except TRANSPORT_ERRORS as ex:
+                self.errors += 1
+                self.tracker.cancel(job)
+                self.violation('No answer to {} of {} - {!r}'.format(
+                    command, job, ex))
+                continue
+            self.latencies.record('command:' + command,
+                                  time.perf_counter() - start_time)
+
+    def terminate(self):
+        self.done.set()
+        self.running.set()
+        self.join()
+
+def count_entries(path):
+    """
+    :return: How many entries are in a directory, or ``None`` if it can't \
+    be read.
+    """
+    try:
+        return len(os.listdir(path))
+    except OSError:
+        return None
+
+def find_zombies(parent):
+    """
+    :return: The set of zombie processes whose parent is the given process.
+    """
+    zombies = set()
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+
+        try:
+            with open('/proc/{}/stat'.format(entry)) as stat_file:
+                stat = stat_file.read()
+        except OSError:
+            continue
+
+        # The state and the parent are the first two fields after the
+        # command name, which can contain spaces
+        fields = stat[stat.rindex(')') + 2:].split()
+        if fields[0] == 'Z' and int(fields[1]) == parent:
+            zombies.add(int(entry))
+
+    return zombies
+
+def make_jobs(short_jobs, crash_jobs, rand):
+    """
+    Makes up the configuration for the jobs under test.
+    """
+    jobs = {}
+    for index in range(short_jobs):
+        jobs['short-{}'.format(index)] = {
+            'command': 'sleep {}'.format(rand.choice([0.1, 0.5, 1, 2, 5])),
+        }
+
+    for index in range(crash_jobs):
+        jobs['crash-{}'.format(index)] = {
+            'command': rand.choice(['false', 'sh -c "sleep 0.1; exit 3"']),
+            'restart': True,
+        }
+
+    return jobs
+
+class Soak:
+    """
+    Drives the whole soak test, from the main thread.
+    """
+    def __init__(self, args):
+        self.args = args
+        self.rand = random.Random(args.seed)
+        self.jobs = make_jobs(args.short_jobs, args.crash_jobs, self.rand)
+        self.latencies = LatencyLog()
+        self.violations = []
+        self.slo_breaches = 0
+
+        self.supervisor = None
+        self.tracker = None
+        self.clients = []
+        self.baseline = None
+        self.zombies = set()
+        self.suspects = {}
+        self.report_file = None
+
+    def violation(self, message):
+        print('VIOLATION:', message, file=sys.stderr)
+        self.violations.append(message)
+
+    def get_resources(self):
+        """
+        :return: The number of file descriptors and threads that the \
+        supervisor has.
+        """
+        pid = self.supervisor.pid
+        return (count_entries('/proc/{}/fd'.format(pid)),
+                count_entries('/proc/{}/task'.format(pid)))
+
+    def check_zombies(self):
+        zombies = find_zombies(self.supervisor.pid)
+        for zombie in zombies & self.zombies:
+            self.violation('Zombie process {} was not reaped'.format(zombie))
+        self.zombies = zombies
+
+    def check_statuses(self):
+        """
+        Compares the status of each quiet short-lived job against its events.
+        A mismatch only counts if it is still there at the next check, with
+        no events in between, since the status and the event are updated at
+        slightly different times.
+        """
+        command_pipe = self.supervisor.command_pipe()
+        before = {job: self.tracker.get_state(job) for job in self.jobs}
+        try:
+            statuses = command_pipe.get_jobs()
+        except TRANSPORT_ERRORS as ex:
+            self.violation('Could not get statuses - {!r}'.format(ex))
+            return
+
+        suspects = {}
+        now = time.time()
+        for job, (running, last_event, event_count) in before.items():
+            if not job.startswith('short-') or self.tracker.is_pending(job):
+                continue
+            if now - last_event < SETTLE_TIME:
+                continue
+            if self.tracker.get_state(job)[2] != event_count:
+                continue
+
+            if statuses.get(job) != running:
+                if self.suspects.get(job) == event_count:
+                    self.violation(
+                        '{} is {} but its last event said it was {}'.format(
+                            job, 'running' if statuses.get(job) else 'stopped',
+                            'running' if running else 'stopped'))
+                else:
+                    suspects[job] = event_count
+
+        self.suspects = suspects
+
+    def quiesce(self):
+        """
+        Pauses the load, stops every job, and checks that the supervisor is
+        back to the number of file descriptors and threads it started with.
+        """
+        for client in self.clients:
+            client.running.clear()
+
+        # The clients may be in the middle of a command, which could start a
+        # job after it has been stopped - so stop everything repeatedly
+        command_pipe = self.supervisor.command_pipe()
+        deadline = time.time() + QUIESCE_TIMEOUT
+        try:
+            while True:
+                for job in self.jobs:
+                    try:
+                        command_pipe.stop_job(job)
+                    except transport.JobError:
+                        pass
+
+                time.sleep(1)
+                if not any(command_pipe.get_jobs().values()):
+                    break
+                if time.time() > deadline:
+                    self.violation('Jobs did not stop within {}s'.format(
+                        QUIESCE_TIMEOUT))
+                    break
+        except TRANSPORT_ERRORS as ex:
+            self.violation('Could not stop every job - {!r}'.format(ex))
+
+        time.sleep(SETTLE_TIME)
+        fds, threads = self.get_resources()
+        base_fds, base_threads = self.baseline
+        if fds is None or threads is None:
+            self.violation('The supervisor has exited')
+        else:
+            if fds > base_fds + self.args.fd_slack:
+                self.violation(
+                    'Leaked file descriptors: {} at start, {} now'.format(
+                        base_fds, fds))
+            if threads > base_threads + self.args.thread_slack:
+                self.violation('Leaked threads: {} at start, {} now'.format(
+                    base_threads, threads))
+
+        for client in self.clients:
+            client.running.set()
+
+        return fds, threads
+
+    def report(self, elapsed, quiesced):
+        """
+        Prints the latencies since the last report, and checks them against
+        the SLO.
+        """
+        fds, threads = self.get_resources()
+        entry = {
+            'elapsed': round(elapsed, 1),
+            'fds': fds,
+            'threads': threads,
+            'zombies': len(self.zombies),
+            'errors': sum(client.errors for client in self.clients),
+            'violations': len(self.violations),
+            'latencies': {},
+            'slo_breaches': [],
+        }
+        if quiesced is not None:
+            entry['quiesced_fds'], entry['quiesced_threads'] = quiesced
+
+        print('--- {:.0f}s: {} fds, {} threads, {} zombies, {} errors, '
+              '{} violations'.format(elapsed, fds, threads, entry['zombies'],
+                                     entry['errors'], entry['violations']))
+
+        for category, samples in sorted(self.latencies.take_recent().items()):
+            summary = entry['latencies'][category] = common.summarize(samples)
+            breached = summary['p99_ms'] > self.args.slo_p99_ms
+            if breached:
+                entry['slo_breaches'].append(category)
+                self.slo_breaches += 1
+
+            summary['p90_ms'] = common.percentile(sorted(samples), 0.9) * 1000
+            print('{:<20} {:>8} p50={:.2f}ms p90={:.2f}ms p99={:.2f}ms '
+                  'max={:.2f}ms{}'.format(
+                      category, summary['count'], summary['median_ms'],
+                      summary['p90_ms'], summary['p99_ms'], summary['max_ms'],
+                      '  SLO BREACH' if breached else ''))
+
+        if self.report_file is not None:
+            self.report_file.write(json.dumps(entry, sort_keys=True) + '\n')
+            self.report_file.flush()
+
+    def run(self):
+        """
+        :return: ``True`` if the supervisor stayed healthy and within its \
+        SLO for the whole run.
+        """
+        args = self.args
+        if args.report_file is not None:
+            self.report_file = open(args.report_file, 'a')
+
+        print('Starting supervisor with {} jobs'.format(len(self.jobs)))
+        with common.Supervisor(self.jobs, args.port) as self.supervisor:
+            self.tracker = EventTracker(self.supervisor, self.latencies)
+            self.tracker.start()
+
+            # The threads aren't daemons, so they have to be stopped however
+            # the run ends, or the harness never exits
+            try:
+                self.run_load()
+            finally:
+                self.stop_threads()
+
+        print('=== Whole run')
+        for category, summary in sorted(self.latencies.summarize_total().items()):
+            print('{:<20} {:>8} p50~{:.2f}ms p95~{:.2f}ms p99~{:.2f}ms'.format(
+                category, summary['count'], summary['median_ms'],
+                summary['p95_ms'], summary['p99_ms']))
+        print('{} violations, {} SLO breaches'.format(len(self.violations),
+                                                     self.slo_breaches))
+
+        if self.report_file is not None:
+            self.report_file.close()
+
+        return not self.violations and not self.slo_breaches
+
+    def run_load(self):
+        """
+        Runs the clients against the supervisor for the whole run, checking
+        on it and reporting as it goes.
+        """
+        args = self.args
+        time.sleep(SETTLE_TIME)
+        self.baseline = self.get_resources()
+        print('Baseline: {} fds, {} threads'.format(*self.baseline))
+
+        job_names = sorted(self.jobs)
+        self.clients = [
+            LoadClient(self.supervisor, job_names, self.tracker,
+                       self.latencies, self.rand.random(), self.violation)
+            for _ in range(args.clients)]
+        for client in self.clients:
+            client.start()
+
+        start_time = time.time()
+        next_report = start_time + args.report_interval
+        next_quiesce = start_time + args.quiesce_interval
+        quiesced = None
+        try:
+            while time.time() - start_time < args.duration:
+                time.sleep(args.check_interval)
+                self.check_zombies()
+                self.check_statuses()
+
+                if time.time() >= next_quiesce:
+                    quiesced = self.quiesce()
+                    next_quiesce = time.time() + args.quiesce_interval
+
+                if time.time() >= next_report:
+                    self.report(time.time() - start_time, quiesced)
+                    quiesced = None
+                    next_report = time.time() + args.report_interval
+        except KeyboardInterrupt:
+            print('Interrupted')
+
+        # Always finish with a leak check, since that's the one that
+        # takes longest to show up
+        quiesced = self.quiesce()
+        self.stop_threads()
+        self.report(time.time() - start_time, quiesced)
+
+    def stop_threads(self):
+        """
+        Stops the clients and the event tracker, if they are running.
+        """
+        for client in self.clients:
+            if client.is_alive():
+                client.terminate()
+
+        if self.tracker is not None and self.tracker.is_alive():
+            self.tracker.terminate()
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument('--duration', type=float, default=3600,
+                            help='How long to run for, in seconds')
+    arg_parser.add_argument('--short-jobs', type=int, default=2000,
+                            help='How many short-lived jobs to run')
+    arg_parser.add_argument('--crash-jobs', type=int, default=500,
+                            help='How many crash-looping jobs to run')
+    arg_parser.add_argument('--clients', type=int, default=16,
+                            help='How many clients to send commands at once')
+    arg_parser.add_argument('--check-interval', type=float, default=5,
+                            help='How often to check for zombies and '
+                                 'inconsistent statuses, in seconds')
+    arg_parser.add_argument('--report-interval', type=float, default=60,
+                            help='How often to report latencies, in seconds')
+    arg_parser.add_argument('--quiesce-interval', type=float, default=600,
+                            help='How often to stop every job and check for '
+                                 'leaks, in seconds')
+    arg_parser.add_argument('--slo-p99-ms', type=float, default=250,
+                            help='The highest acceptable p99 latency of any '
+                                 'command or event, in milliseconds')
+    arg_parser.add_argument('--fd-slack', type=int, default=4,
+                            help='How many more file descriptors than at the '
+                                 'start are tolerated')
+    arg_parser.add_argument('--thread-slack', type=int, default=2,
+                            help='How many more threads than at the start '
+                                 'are tolerated')
+    arg_parser.add_argument('--report-file', metavar='FILE',
+                            help='Append each report to this file, as a '
+                                 'line of JSON')
+    arg_parser.add_argument('--seed', type=int, default=0,
+                            help='The seed for the jobs and the load')
+    arg_parser.add_argument('--port', type=int, default=17530,
+                            help='The first of two ports for the supervisor')
+    args = arg_parser.parse_args()
+
+    return 0 if Soak(args).run() else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Measures how long it takes :class:`jobmon.monitor.ChildProcess` to launch a
+child, comparing the ``fork`` and ``posix-spawn`` spawn methods as the
+supervisor's heap grows.
+
+Run it from the top of the source tree::
+
+    $ python3 benchmarks/spawn_latency.py --heap-sizes 0 256 1024
+
+The latency reported is the time spent inside of :meth:`ChildProcess.start`,
+which is the time that the supervisor's service thread is blocked for.
+"""
+import argparse
+import threading
+import time
+
+import common
+
+from jobmon import forkserver, monitor, protocol
+
+class StopWaiter:
+    """
+    A replacement for the status server's socket, which lets the benchmark
+    wait until the child has exited.
+    """
+    def __init__(self):
+        self.stopped = threading.Event()
+
+    def send(self, event):
+        if event.event_code == protocol.EVENT_STOPJOB:
+            self.stopped.set()
+
+def measure(spawn_method, command, iterations, fork_server=None):
+    """
+    Starts a command repeatedly, and returns how long each start took.
+
+    :return: A list of latencies, in seconds.
+    """
+    waiter = StopWaiter()
+    child = monitor.ChildProcess(waiter, 'bench', command, spawn=spawn_method)
+    child.set_fork_server(fork_server)
+
+    latencies = []
+    for _ in range(iterations):
+        waiter.stopped.clear()
+
+        start_time = time.perf_counter()
+        child.start()
+        latencies.append(time.perf_counter() - start_time)
+
+        waiter.stopped.wait()
+
+        # The waiter thread sends the stop event right after clearing the
+        # PID, but make sure before starting the next child
+        while child.get_status():
+            time.sleep(0.001)
+
+    return latencies
+
+def add_args(arg_parser):
+    arg_parser.add_argument('--heap-sizes', type=int, nargs='+',
+                            default=[0, 256, 1024],
+                            help='Extra heap sizes to test, in MiB')
+    arg_parser.add_argument('--iterations', type=int, default=100,
+                            help='How many children to start per test')
+    arg_parser.add_argument('--command', default='/bin/true',
+                            help='The command to launch')
+
+def run(args):
+    """
+    :return: The latencies of each spawn method at each heap size.
+    """
+    # The fork server has to be started while the benchmark is still small,
+    # which is the same as in the supervisor
+    fork_server = forkserver.ForkServer()
+    fork_server.start()
+
+    cases = {}
+    try:
+        for heap_size in args.heap_sizes:
+            # Make sure that the pages are actually touched, so that fork has
+            # to copy the page tables for them
+            ballast = bytearray(b'x' * (heap_size * 1024 * 1024))
+
+            for spawn_method in monitor.SPAWN_METHODS:
+                latencies = measure(spawn_method, args.command,
+                                    args.iterations, fork_server)
+                case = '{} heap={}MiB'.format(spawn_method, heap_size)
+                cases[case] = common.summarize(latencies)
+
+            del ballast
+    finally:
+        fork_server.terminate()
+
+    return cases
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    add_args(arg_parser)
+    common.add_output_args(arg_parser)
+    args = arg_parser.parse_args()
+    common.report('spawn_latency', run(args), args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Measures how :class:`jobmon.ticker.Ticker` copes with large numbers of timers.
+
+Run it from the top of the source tree::
+
+    $ python3 benchmarks/ticker_ops.py --timers 100 1000 5000
+
+For each number of timers, this times registering all of them with a running
+ticker, unregistering them all again, and then registering them all to expire
+at the same moment - the last of which is reported as how late the final
+callback ran.
+"""
+import argparse
+import threading
+import time
+
+import common
+
+from jobmon import ticker
+
+class Countdown:
+    """
+    A ticker callback which lets the benchmark wait until a number of timers
+    have expired.
+    """
+    def __init__(self, count):
+        self.lock = threading.Lock()
+        self.remaining = count
+        self.finished = threading.Event()
+        self.finish_time = None
+
+    def __call__(self, key):
+        with self.lock:
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.finish_time = time.time()
+                self.finished.set()
+
+def measure(timers):
+    """
+    Runs each of the ticker operations with a number of timers.
+
+    :return: A :class:`dict` of the results.
+    """
+    countdown = Countdown(timers)
+    the_ticker = ticker.Ticker(countdown)
+    the_ticker.start()
+
+    try:
+        # These timers are far enough away that none of them expire
+        far_away = time.time() + 3600
+        start_time = time.perf_counter()
+        for key in range(timers):
+            the_ticker.register(key, far_away)
+        register_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for key in range(timers):
+            the_ticker.unregister(key)
+        unregister_time = time.perf_counter() - start_time
+
+        # Leave enough time to register all of the timers before any of them
+        # expire, judging by how long registering took the first time
+        expiry = time.time() + register_time * 2 + 0.5
+        for key in range(timers):
+            the_ticker.register(key, expiry)
+
+        countdown.finished.wait()
+        expire_lateness = countdown.finish_time - expiry
+    finally:
+        the_ticker.terminate()
+        the_ticker.wait_for_exit()
+
+    return {
+        'register_per_sec': timers / register_time,
+        'unregister_per_sec': timers / unregister_time,
+        'expire_all_ms': expire_lateness * 1000,
+    }
+
+def add_args(arg_parser):
+    arg_parser.add_argument('--timers', type=int, nargs='+',
+                            default=[100, 1000, 5000],
+                            help='Numbers of timers to test')
+
+def run(args):
+    """
+    :return: The results for each number of timers.
+    """
+    return {'timers={}'.format(timers): measure(timers)
+            for timers in args.timers}
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    add_args(arg_parser)
+    common.add_output_args(arg_parser)
+    args = arg_parser.parse_args()
+    common.report('ticker_ops', run(args), args)
+
+if __name__ == '__main__':
+    main()
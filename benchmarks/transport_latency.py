@@ -0,0 +1,82 @@
+"""
+Compares how long a command takes to answer over TCP and over a Unix socket
+(see :mod:`jobmon.address`), through :class:`jobmon.transport.CommandPipe`.
+
+Run it from the top of the source tree::
+
+    $ python3 benchmarks/transport_latency.py --commands 5000
+
+Each command is a status query for a running job, sent one after another by a
+single client. By default, a command pipe connects for each command, so every
+query pays for connecting as well as for the round trip; the ``-kept-open``
+cases send every query over one connection instead, as ``jobmon batch`` does.
+"""
+import argparse
+import os
+import time
+
+import common
+
+from jobmon import transport
+
+def measure(supervisor, commands, keep_open):
+    """
+    :return: The latencies of the status queries, in seconds.
+    """
+    command_pipe = transport.CommandPipe(supervisor.control_port, keep_open)
+
+    # The first few commands warm up the supervisor's caches
+    for _ in range(min(100, commands)):
+        command_pipe.is_running('idle')
+
+    latencies = []
+    for _ in range(commands):
+        start_time = time.perf_counter()
+        command_pipe.is_running('idle')
+        latencies.append(time.perf_counter() - start_time)
+
+    command_pipe.destroy()
+    return latencies
+
+def add_args(arg_parser):
+    arg_parser.add_argument('--commands', type=int, default=5000,
+                            help='How many commands to send over each '
+                                 'transport')
+    arg_parser.add_argument('--port', type=int, default=17520,
+                            help='The first of two ports for the TCP '
+                                 'supervisor')
+
+def run(args):
+    """
+    :return: The latencies over each transport.
+    """
+    jobs = {'idle': {'command': 'sleep 3600', 'autostart': True}}
+    unix_name = '@jobmon-bench-{}'.format(os.getpid())
+    transports = [
+        ('tcp', (args.port, args.port + 1)),
+        ('unix', (unix_name + '-control', unix_name + '-events')),
+    ]
+
+    cases = {}
+    for name, (control_port, event_port) in transports:
+        with common.Supervisor(jobs, control_port, event_port) as supervisor:
+            for keep_open in (False, True):
+                case = name + ('-kept-open' if keep_open else '')
+                latencies = measure(supervisor, args.commands, keep_open)
+
+                cases[case] = {
+                    'commands_per_sec': len(latencies) / sum(latencies),
+                }
+                cases[case].update(common.summarize(latencies))
+
+    return cases
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    add_args(arg_parser)
+    common.add_output_args(arg_parser)
+    args = arg_parser.parse_args()
+    common.report('transport_latency', run(args), args)
+
+if __name__ == '__main__':
+    main()
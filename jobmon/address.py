@@ -0,0 +1,221 @@
+"""
+JobMon Socket Addresses
+=======================
+
+The command and event servers can listen either on TCP (on localhost) or on a
+Unix domain socket. Their addresses are written the same way in the
+``supervisor`` configuration as in ``$JOBMON_PORT``:
+
+- A port number, such as ``6666``, is a TCP port on localhost.
+- An absolute path, such as ``/run/jobmon/control.sock``, is a Unix socket on
+  the filesystem. The socket file is removed when the server closes.
+- A name starting with ``@``, such as ``@jobmon-control``, is a Unix socket in
+  Linux's abstract namespace, which doesn't leave anything on the filesystem.
+
+Paths and names can also be written with a ``unix:`` prefix.
+
+Unix sockets skip the TCP/IP stack, which makes each round trip quicker, and
+they let the supervisor see which user each client is running as (using
+``SO_PEERCRED``) - clients whose UID isn't allowed are disconnected as soon
+as they connect. TCP clients can't be told apart, so any local user can
+connect to a TCP port.
+"""
+from collections import namedtuple
+import errno
+import os
+import pwd
+import socket
+import stat
+import struct
+
+# The credentials of a socket's peer, as a struct ucred
+PEERCRED = struct.Struct('iII')
+
+# Allows clients running as any user to connect
+ANY_UID = '*'
+
+# An address that a server listens on. The family is either AF_INET (whose
+# target is a port on localhost) or AF_UNIX (whose target is the socket's
+# address, which starts with a NUL byte in the abstract namespace).
+Address = namedtuple('Address', ['family', 'target'])
+
+def parse(value):
+    """
+    Reads an address, in any of the forms described above.
+
+    :param value: The address, as a port number or a string.
+    :return: An :class:`Address`.
+    :raises ValueError: If the address is invalid.
+    """
+    if isinstance(value, bool):
+        raise ValueError('Invalid address {}'.format(value))
+
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+
+    if isinstance(value, int):
+        if not 0 < value < 65536:
+            raise ValueError('Invalid port {}'.format(value))
+        return Address(socket.AF_INET, value)
+
+    if not isinstance(value, str):
+        raise ValueError('Invalid address {}'.format(value))
+
+    path = value[len('unix:'):] if value.startswith('unix:') else value
+    if path.startswith('@') and len(path) > 1:
+        return Address(socket.AF_UNIX, '\0' + path[1:])
+    elif path.startswith('/'):
+        return Address(socket.AF_UNIX, path)
+
+    raise ValueError('Invalid address "{}" - expected a port, an absolute '
+                     'path or an @name'.format(value))
+
+def to_str(address):
+    """
+    :return: An address written in the form that :func:`parse` reads.
+    """
+    if address.family == socket.AF_INET:
+        return str(address.target)
+    elif address.target.startswith('\0'):
+        return '@' + address.target[1:]
+    else:
+        return address.target
+
+def is_unix(address):
+    """
+    :return: Whether the address is a Unix socket.
+    """
+    return address.family == socket.AF_UNIX
+
+def connect(address):
+    """
+    Connects to a server.
+
+    :return: The connected socket.
+    :raises OSError: If the server can't be connected to.
+    """
+    sock = socket.socket(address.family, socket.SOCK_STREAM)
+    try:
+        if address.family == socket.AF_INET:
+            sock.connect(('localhost', address.target))
+        else:
+            sock.connect(address.target)
+    except OSError:
+        sock.close()
+        raise
+
+    return sock
+
+def remove_stale(path):
+    """
+    Removes a socket file left behind by a server which didn't close
+    properly. Sockets which a server is still listening on are left alone.
+
+    :raises OSError: If a server is still listening on the socket, or the \
+    path is something other than a socket.
+    """
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise OSError(errno.EEXIST, 'Not a socket', path)
+    except FileNotFoundError:
+        return
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+
+    raise OSError(errno.EADDRINUSE, 'Address already in use', path)
+
+def listen(address, backlog=10):
+    """
+    Creates a socket which listens on an address.
+
+    :return: The listening socket.
+    """
+    sock = socket.socket(address.family, socket.SOCK_STREAM)
+    try:
+        if address.family == socket.AF_INET:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(('localhost', address.target))
+        else:
+            if not address.target.startswith('\0'):
+                remove_stale(address.target)
+            sock.bind(address.target)
+
+        sock.listen(backlog)
+    except OSError:
+        sock.close()
+        raise
+
+    return sock
+
+def close_listener(sock, address):
+    """
+    Closes a socket created by :func:`listen`, and removes its socket file if
+    it has one.
+    """
+    sock.close()
+    if is_unix(address) and not address.target.startswith('\0'):
+        try:
+            os.unlink(address.target)
+        except OSError:
+            pass
+
+def read_uids(values):
+    """
+    Reads the users which are allowed to connect to Unix sockets, each of
+    which is a UID or a user name, or :data:`ANY_UID` to allow everyone.
+
+    :return: A :class:`frozenset` of UIDs, or :data:`ANY_UID`.
+    :raises ValueError: If a user doesn't exist.
+    """
+    if values == ANY_UID:
+        return ANY_UID
+
+    if not isinstance(values, list):
+        raise ValueError('Expected a list of users, or "{}"'.format(ANY_UID))
+
+    uids = set()
+    for value in values:
+        if isinstance(value, int) and not isinstance(value, bool):
+            uids.add(value)
+        elif isinstance(value, str):
+            try:
+                uids.add(pwd.getpwnam(value).pw_uid)
+            except KeyError:
+                raise ValueError('No such user "{}"'.format(value))
+        else:
+            raise ValueError('Invalid user {}'.format(value))
+
+    return frozenset(uids)
+
+def default_uids():
+    """
+    :return: The users who can connect when none are configured, which are \
+    the supervisor's own user and root.
+    """
+    return frozenset((0, os.getuid()))
+
+def peer_allowed(sock, allowed_uids):
+    """
+    Checks whether a client connected to a Unix socket is running as one of
+    the allowed users. Clients connected over TCP are always allowed, since
+    there's no telling who they are.
+
+    :param socket.socket sock: The client's socket.
+    :param allowed_uids: The allowed UIDs, or :data:`ANY_UID`.
+    :return: A tuple of ``(allowed, uid)``, where the UID is ``None`` if it \
+    isn't known.
+    """
+    if sock.family != socket.AF_UNIX:
+        return True, None
+
+    credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                  PEERCRED.size)
+    _, uid, _ = PEERCRED.unpack(credentials)
+    return allowed_uids == ANY_UID or uid in allowed_uids, uid
@@ -0,0 +1,275 @@
+"""
+JobMon Batches
+==============
+
+Runs many commands over a single connection to the supervisor, for
+``jobmon batch`` (which reads them from a file or standard input) and
+``jobmon shell`` (which reads them interactively). Each line is one command,
+written the same way as on the command line but without the ``jobmon``::
+
+    start --with-deps web worker
+    status web worker db
+    scale worker 4
+    # Comments and blank lines are skipped
+    stop worker
+
+Every line is sent as one batch request (see :meth:`CommandPipe.run_batch`),
+so a line naming several jobs is answered in a single round trip. The results
+are written out as soon as each line is answered, either as lines of text or
+as one JSON object per job.
+"""
+from collections import namedtuple
+import importlib
+import json
+import shlex
+
+from jobmon import protocol
+
+# The commands which take any number of jobs, and the command that is sent to
+# the supervisor for each job
+JOB_COMMANDS = {
+    'start': protocol.CMD_START,
+    'stop': protocol.CMD_STOP,
+    'status': protocol.CMD_STATUS,
+    'pid': protocol.CMD_STATUS,
+}
+
+SHELL_PROMPT = 'jobmon> '
+
+SHELL_HELP = '''Commands:
+  start [--with-deps] JOB...
+  stop JOB...
+  status JOB...
+  pid JOB...
+  scale JOB REPLICAS
+  list-jobs
+  help
+  quit'''
+
+# A command that has been read, along with the commands that it sends to the
+# supervisor - the name decides how the results are written out
+Request = namedtuple('Request', ['name', 'commands'])
+
+def job_request(name, jobs, args=None):
+    """
+    Makes a request which sends the same command for each of several jobs.
+
+    :param str name: One of the names in :data:`JOB_COMMANDS`.
+    :param list jobs: The names of the jobs.
+    :param dict args: The arguments to send along with each command.
+    :return: A :class:`Request`.
+    """
+    return Request(name, [protocol.Command(job, JOB_COMMANDS[name], args)
+                          for job in jobs])
+
+def parse_line(line):
+    """
+    Reads one command.
+
+    :return: A :class:`Request`, or ``None`` if the line is blank or a \
+    comment.
+    :raises ValueError: If the command is invalid.
+    """
+    words = shlex.split(line, comments=True)
+    if not words:
+        return None
+
+    name, args = words[0], words[1:]
+    if name in JOB_COMMANDS:
+        command_args = None
+        if name == 'start' and '--with-deps' in args:
+            command_args = {'dependencies': True}
+            args = [arg for arg in args if arg != '--with-deps']
+
+        for arg in args:
+            if arg.startswith('-'):
+                raise ValueError('Unknown option {}'.format(arg))
+
+        if not args:
+            raise ValueError('{} needs at least one job'.format(name))
+        return job_request(name, args, command_args)
+    elif name == 'scale':
+        if len(args) != 2:
+            raise ValueError('scale needs a job and a number of replicas')
+
+        try:
+            replicas = int(args[1])
+        except ValueError:
+            raise ValueError('Invalid number of replicas "{}"'.format(args[1]))
+
+        return Request(name, [protocol.Command(args[0], protocol.CMD_SCALE,
+                                               {'replicas': replicas})])
+    elif name == 'list-jobs':
+        if args:
+            raise ValueError('list-jobs does not take any arguments')
+        return Request(name, [protocol.Command(None, protocol.CMD_JOB_LIST)])
+    else:
+        raise ValueError('Unknown command "{}"'.format(name))
+
+def describe(name, command, result):
+    """
+    Works out what to report about the response to a command.
+
+    :param str name: The name of the command that was read.
+    :param protocol.Command command: The command that was sent.
+    :param result: The supervisor's response.
+    :return: A :class:`dict`, which is written out as-is in JSON mode.
+    """
+    record = {'command': name}
+    if command.job_name is not None:
+        record['job'] = command.job_name
+
+    if isinstance(result, protocol.FailureResponse):
+        record['ok'] = False
+        record['error'] = protocol.reason_to_str(result.reason)
+        return record
+
+    record['ok'] = True
+    if isinstance(result, protocol.StatusResponse):
+        record['running'] = result.is_running
+        record['pid'] = result.pid
+        for field in ('healthy', 'ready', 'status_text'):
+            value = getattr(result, field)
+            if value is not None:
+                record[field] = value
+    elif isinstance(result, protocol.JobListResponse):
+        record['jobs'] = result.all_jobs
+
+    return record
+
+def format_record(record):
+    """
+    :return: The lines of text which report a result, using the same words \
+    as the rest of the command line tools.
+    """
+    name = record['command']
+    if not record['ok']:
+        return ['ERROR {} {}: {}'.format(name, record.get('job', ''),
+                                         record['error'])]
+    elif name == 'status':
+        if not record['running']:
+            state = 'STOPPED'
+        elif record.get('healthy') is False:
+            state = 'UNHEALTHY'
+        else:
+            state = 'RUNNING'
+        return ['{} {}'.format(state, record['job'])]
+    elif name == 'pid':
+        return ['{} {}'.format(record['job'], record['pid'] or '-')]
+    elif name == 'list-jobs':
+        return ['{} {}'.format('RUNNING' if running else 'STOPPED', job)
+                for job, running in record['jobs'].items()]
+    else:
+        return ['OK {} {}'.format(name, record['job'])]
+
+def status_code(record):
+    """
+    Works out the exit status that a result would give if it were the only
+    one, following ``jobmon status`` for ``status`` and ``pid``.
+
+    :return: 0 if the command worked (and the job is running and healthy, \
+    when asking about it), 1 if it didn't (or the job isn't running), 2 if \
+    the job doesn't exist and 3 if the job is failing its health checks.
+    """
+    if not record['ok']:
+        return 2 if record['error'] == protocol.reason_to_str(
+            protocol.ERR_NO_SUCH_JOB) else 1
+    elif record['command'] in ('status', 'pid'):
+        if not record['running']:
+            return 1
+        elif record['command'] == 'status' and record.get('healthy') is False:
+            return 3
+    return 0
+
+def send(command_pipe, request, output, as_json=False):
+    """
+    Sends a request and writes out the results.
+
+    :param transport.CommandPipe command_pipe: The connection to use.
+    :param Request request: The request to send.
+    :param output: The file to write the results to.
+    :param bool as_json: Whether to write the results as JSON.
+    :return: The results, as :func:`describe` makes them.
+    """
+    results = command_pipe.run_batch(request.commands)
+    records = [describe(request.name, command, result)
+               for command, result in zip(request.commands, results)]
+
+    for record in records:
+        if as_json:
+            print(json.dumps(record, sort_keys=True), file=output)
+        else:
+            for line in format_record(record):
+                print(line, file=output)
+
+    output.flush()
+    return records
+
+def run(command_pipe, lines, output, as_json=False):
+    """
+    Runs each command, writing out its results before reading the next.
+    Invalid commands are reported and skipped, rather than stopping the rest.
+
+    :param transport.CommandPipe command_pipe: The connection to use, which \
+    should be kept open.
+    :param lines: The commands, as an iterable of lines.
+    :param output: The file to write the results to.
+    :param bool as_json: Whether to write the results as JSON.
+    :return: 0 if every command worked, or 1 otherwise.
+    """
+    failed = False
+    for line in lines:
+        try:
+            request = parse_line(line)
+        except ValueError as error:
+            failed = True
+            if as_json:
+                print(json.dumps({'ok': False, 'error': str(error),
+                                  'line': line.rstrip('\n')}, sort_keys=True),
+                      file=output)
+            else:
+                print('ERROR', error, file=output)
+            output.flush()
+            continue
+
+        if request is None:
+            continue
+
+        records = send(command_pipe, request, output, as_json)
+        if not all(record['ok'] for record in records):
+            failed = True
+
+    return 1 if failed else 0
+
+def read_interactive(prompt=SHELL_PROMPT):
+    """
+    Reads commands typed at the terminal, until ``quit`` or the end of the
+    input. ``help`` shows the commands, and isn't passed along.
+
+    :return: An iterator of lines.
+    """
+    try:
+        # Gives the prompt line editing and history, where it's available -
+        # importing it is enough for input() to use it
+        importlib.import_module('readline')
+    except ImportError:
+        pass
+
+    while True:
+        try:
+            line = input(prompt)
+        except EOFError:
+            print()
+            return
+        except KeyboardInterrupt:
+            # Like other shells, this abandons the line rather than exiting
+            print()
+            continue
+
+        word = line.strip()
+        if word in ('quit', 'exit'):
+            return
+        elif word == 'help':
+            print(SHELL_HELP)
+        else:
+            yield line
@@ -1,93 +1,469 @@
 """
 The command server accepts connections and dispatches commands to the service.
 """
+from concurrent.futures import Future
 import logging
-import select
+import os
+import selectors
 import socket
 import threading
 
-from jobmon import protocol, util
+from jobmon import address, protocol, tracing, util
 
 LOGGER = logging.getLogger('jobmon.command_server')
 
+# How many connections can be waiting to be accepted, which is enough for a
+# crowd of scripts connecting to wait on a job at once
+LISTEN_BACKLOG = 128
+
+def rejected(job_name):
+    """
+    :return: A :class:`Future` holding the response to a command that the \
+    supervisor doesn't understand.
+    """
+    future = Future()
+    future.set_result(protocol.FailureResponse(job_name,
+                                               protocol.ERR_BAD_COMMAND))
+    return future
+
+def gather(futures):
+    """
+    Combines the responses to the commands in a batch.
+
+    :param list futures: The :class:`Future` holding each response.
+    :return: A :class:`Future` holding a :class:`protocol.BatchResponse` \
+    once every response is in, or ``None`` if any of them is ``None``.
+    """
+    batch = Future()
+    results = [None] * len(futures)
+    remaining = [len(futures)]
+    lock = threading.Lock()
+
+    def collect(index, future):
+        results[index] = future.result()
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+
+        if None in results:
+            # The service isn't running, so there's nothing to answer with
+            batch.set_result(None)
+        else:
+            batch.set_result(protocol.BatchResponse(results))
+
+    if not futures:
+        batch.set_result(protocol.BatchResponse([]))
+    for index, future in enumerate(futures):
+        future.add_done_callback(
+            lambda future, index=index: collect(index, future))
+
+    return batch
+
 class CommandServer(threading.Thread, util.TerminableThreadMixin):
     """
     The command server manages a server and a collection of clients,
     calls into the supervisor when a command comes in, and sends the
     response back to the sender.
     """
-    def __init__(self, port, supervisor):
+    def __init__(self, port, supervisor, slow_threshold=None,
+                 allowed_uids=None, handed_over=None):
+        """
+        :param port: The address to listen on, in any form that \
+        :func:`address.parse` reads.
+        :param float slow_threshold: How long a command can take (in \
+        seconds) before it is logged as slow, or ``None`` to not log slow \
+        commands.
+        :param allowed_uids: The users who can connect over a Unix socket, \
+        which defaults to :func:`address.default_uids`.
+        :param dict handed_over: The listening socket and the clients of the \
+        supervisor that this one replaced, including the client which asked \
+        for the replacement (see :meth:`hand_over`).
+        """
         threading.Thread.__init__(self)
         util.TerminableThreadMixin.__init__(self)
 
-        LOGGER.info('Binding commands to localhost:%d', port)
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind(('localhost', port))
-        self.sock.listen(10)
+        self.address = address.parse(port)
+        self.clients = set()
+        self.requester = None
+        if handed_over is None:
+            LOGGER.info('Binding commands to %s',
+                        address.to_str(self.address))
+            self.sock = address.listen(self.address, LISTEN_BACKLOG)
+        else:
+            LOGGER.info('Taking over commands on %s',
+                        address.to_str(self.address))
+            self.sock = socket.socket(fileno=handed_over['listener'])
+            self.clients = {
+                protocol.ProtocolStreamSocket(socket.socket(fileno=fd))
+                for fd in handed_over['clients']}
+            self.requester = protocol.ProtocolStreamSocket(
+                socket.socket(fileno=handed_over['requester']))
+
+        if allowed_uids is None:
+            allowed_uids = address.default_uids()
+        self.allowed_uids = allowed_uids
 
         self.supervisor = supervisor
+        self.slow_threshold = slow_threshold
+
+        self.selector = selectors.DefaultSelector()
+
+        # Clients whose last command hasn't been answered yet, and those of
+        # them which have sent another command already - these aren't read
+        # from until they have their answer
+        self.waiting = set()
+        self.paused = set()
+
+        # While the supervisor is re-executing, the client which asked for
+        # it, and the clients which are left for the next supervisor (which
+        # aren't read from, and are picked up again if it turns out that the
+        # supervisor can't re-execute)
+        self.handing_over = None
+        self.left_over = []
+
+        # The supervisor's responses are given to the server by putting them
+        # here and waking it up, as (client, command, trace, result) tuples
+        self.lock = threading.Lock()
+        self.replies = []
+        wake_reader, wake_writer = os.pipe()
+        os.set_blocking(wake_writer, False)
+        self.wake_reader = os.fdopen(wake_reader, 'rb', buffering=0)
+        self.wake_writer = os.fdopen(wake_writer, 'wb', buffering=0)
 
     @util.log_crashes(LOGGER, 'Command server error')
     def run(self):
         """
         Manages connections, and calls into the supervisor when commands
         come in.
+
+        Clients can send as many commands as they like over one connection,
+        each of which is answered before the next is read - the connection
+        is only closed once the client closes it. The server never waits on
+        the supervisor, so clients whose commands take a while to answer
+        (such as waits) don't hold up anybody else.
         """
-        method_dict = {
+        self.method_dict = {
             protocol.CMD_START: self.supervisor.start_job,
             protocol.CMD_STOP: self.supervisor.stop_job,
             protocol.CMD_STATUS: self.supervisor.get_status,
             protocol.CMD_JOB_LIST: self.supervisor.list_jobs,
             protocol.CMD_QUIT: self.supervisor.terminate,
+            protocol.CMD_SPAWN_PLAN: self.supervisor.get_spawn_plan,
+            protocol.CMD_OUTPUT_RING: self.supervisor.get_output_ring,
+            protocol.CMD_SET_PLACEMENT: self.supervisor.set_placement,
+            protocol.CMD_STATS: self.supervisor.get_stats,
+            protocol.CMD_SCALE: self.supervisor.scale_job,
+            protocol.CMD_WAIT: self.supervisor.wait_job,
         }
 
-        while True:
-            readers, _, _ = select.select([self.sock, self.exit_reader], [], [])
-
-            if self.exit_reader in readers:
-                break
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.selector.register(self.wake_reader, selectors.EVENT_READ)
+        self.selector.register(self.exit_reader, selectors.EVENT_READ)
+        for client in self.clients:
+            self.selector.register(client, selectors.EVENT_READ)
 
-            if self.sock in readers:
-                _client, _ = self.sock.accept()
-                client = protocol.ProtocolStreamSocket(_client)
-                LOGGER.info('Accepted client')
+        if self.requester is not None:
+            # The client which asked the last supervisor to re-execute is
+            # answered once the service has taken over
+            self.clients.add(self.requester)
+            self.waiting.add(self.requester)
+            self.selector.register(self.requester, selectors.EVENT_READ)
+            message = protocol.Command(None, protocol.CMD_REEXEC)
+            future = self.supervisor.finish_reexec()
+            future.add_done_callback(
+                lambda future: self.reply_ready(self.requester, message,
+                                                tracing.Trace(), future))
 
-                try:
-                    message = client.recv()
-                except (IOError, OSError):
-                    LOGGER.info('Incomplete command from client - closing')
-                    client.close()
-                    continue
-                except protocol.ProtocolTimeout:
-                    LOGGER.info('Client did not send command quickly enough')
-                    client.close()
+        quitting = False
+        while not quitting:
+            for key, _ in self.selector.select():
+                if key.fileobj == self.exit_reader:
+                    quitting = True
+                elif key.fileobj == self.sock:
+                    self.accept()
+                elif key.fileobj == self.wake_reader:
+                    self.wake_reader.read(512)
+                    quitting = self.send_replies()
+                elif key.fileobj not in self.clients:
+                    # It was closed while handling an earlier event
                     continue
+                elif key.fileobj in self.waiting:
+                    self.check_waiting(key.fileobj)
+                else:
+                    self.receive(key.fileobj)
 
-                method = method_dict[message.command_code]
+                if quitting:
+                    break
 
-                LOGGER.info('Received message %s', message)
+        LOGGER.info('Closing...')
+        for client in self.clients:
+            client.close()
 
-                if message.command_code in (protocol.CMD_JOB_LIST, 
-                                            protocol.CMD_QUIT):
-                    result = method().result()
-                else:
-                    result = method(message.job_name).result()
+        self.selector.close()
+        self.wake_reader.close()
+        self.wake_writer.close()
+        self.cleanup()
+        address.close_listener(self.sock, self.address)
 
-                LOGGER.info('Got result from supervisor: %s', result)
-                if result is not None:
-                    try:
-                        client.send(result)
-                    except OSError:
-                        LOGGER.info('Client died before result could be sent')
-                        pass
+    def accept(self):
+        """
+        Accepts a new client, if its user is allowed to connect.
+        """
+        _client, _ = self.sock.accept()
+        allowed, uid = address.peer_allowed(_client, self.allowed_uids)
+        if not allowed:
+            LOGGER.warning('Rejecting client running as UID %d', uid)
+            _client.close()
+        else:
+            client = protocol.ProtocolStreamSocket(_client)
+            self.clients.add(client)
+            self.selector.register(client, selectors.EVENT_READ)
+            LOGGER.info('Accepted client')
 
-                LOGGER.info('Closing client')
-                client.close()
+    def disconnect(self, client):
+        """
+        Closes a client's connection.
+        """
+        LOGGER.info('Closing client')
+        self.clients.discard(client)
+        self.waiting.discard(client)
+        if client not in self.paused:
+            self.selector.unregister(client)
+        self.paused.discard(client)
+        client.close()
 
-                if message.command_code == protocol.CMD_QUIT:
-                    break
+    def check_waiting(self, client):
+        """
+        Handles a client becoming readable while its last command hasn't been
+        answered, which is usually because it has disconnected.
+        """
+        try:
+            data = client.sock.recv(1, socket.MSG_PEEK)
+        except OSError:
+            data = b''
 
-        LOGGER.info('Closing...')
-        self.cleanup()
-        self.sock.close()
+        if not data:
+            LOGGER.info('Client disconnected while waiting for a reply')
+            self.disconnect(client)
+        else:
+            # It has sent its next command early, which is read once the
+            # last one is answered
+            self.selector.unregister(client)
+            self.paused.add(client)
+
+    def submit(self, message):
+        """
+        Passes a command along to the supervisor.
+
+        :param protocol.Command message: The command.
+        :return: A :class:`Future` holding the response, which is ``None`` if \
+        there isn't one to send.
+        """
+        method = self.method_dict.get(message.command_code)
+        if method is None:
+            return rejected(message.job_name)
+
+        if message.command_code in (protocol.CMD_JOB_LIST, protocol.CMD_QUIT,
+                                    protocol.CMD_STATS):
+            return method()
+        elif message.args is not None:
+            return method(message.job_name, message.args)
+        else:
+            return method(message.job_name)
+
+    def run_batch(self, commands):
+        """
+        Answers each of the commands in a batch. They are all passed along to
+        the supervisor before any of them is answered, so that the service
+        handles them one after the other.
+
+        :param list commands: The serialized commands.
+        :return: A :class:`Future` holding a :class:`protocol.BatchResponse`, \
+        or ``None`` if the service isn't running.
+        """
+        futures = []
+        for dct in commands:
+            try:
+                message = protocol.Command.unserialize(dct)
+            except (KeyError, TypeError, ValueError):
+                futures.append(rejected(None))
+                continue
+
+            # Batches can't be nested, quitting has nothing to answer, and
+            # re-executing is answered by another supervisor
+            if message.command_code in (protocol.CMD_BATCH,
+                                        protocol.CMD_QUIT,
+                                        protocol.CMD_REEXEC):
+                futures.append(rejected(message.job_name))
+            else:
+                futures.append(self.submit(message))
+
+        return gather(futures)
+
+    def receive(self, client):
+        """
+        Reads a command from a client and passes it along to the supervisor.
+        The response is sent back by :meth:`send_replies`, once it comes.
+        """
+        trace = tracing.Trace()
+        try:
+            message = client.recv()
+        except (IOError, OSError):
+            LOGGER.info('Client disconnected')
+            self.disconnect(client)
+            return
+        except protocol.ProtocolTimeout:
+            LOGGER.info('Client did not send command quickly enough')
+            self.disconnect(client)
+            return
+
+        trace.mark(tracing.RECEIVED)
+        LOGGER.info('Received message %s', message)
+
+        if message.command_code == protocol.CMD_BATCH:
+            # The commands in a batch aren't traced one by one, since they
+            # would all share this trace
+            trace.command = 'batch'
+            if isinstance(message.args, list):
+                future = self.run_batch(message.args)
+            else:
+                future = rejected(None)
+        elif message.command_code == protocol.CMD_REEXEC:
+            trace.command = 'reexec'
+            future = self.hand_over(client)
+        else:
+            trace.command = getattr(
+                self.method_dict.get(message.command_code), '__name__', None)
+
+            # The shim picks up the trace from this thread, and passes it
+            # along to the service
+            with trace:
+                future = self.submit(message)
+
+        self.waiting.add(client)
+        future.add_done_callback(
+            lambda future: self.reply_ready(client, message, trace, future))
+
+    def hand_over(self, client):
+        """
+        Stops accepting connections and reading commands, and asks the
+        supervisor to re-execute itself. The listening socket and the idle
+        clients are passed along to the new supervisor, while clients whose
+        commands are still being answered are cut off when it re-executes.
+
+        :param client: The client which asked for the re-execution, which \
+        the new supervisor answers.
+        :return: A :class:`Future` holding the response, which only comes \
+        from this supervisor if it can't re-execute.
+        """
+        if self.handing_over is not None:
+            # Another client has already asked for it
+            return rejected(None)
+
+        LOGGER.info('Handing over to a new supervisor')
+        idle = [other for other in self.clients
+                if other is not client and other not in self.waiting]
+        self.selector.unregister(self.sock)
+        for other in idle:
+            self.selector.unregister(other)
+
+        self.handing_over = client
+        self.left_over = idle
+        return self.supervisor.reexec(self.sock.fileno(), client.fileno(),
+                                      [other.fileno() for other in idle])
+
+    def resume(self):
+        """
+        Picks up the connections that were left for the next supervisor,
+        once it turns out that there won't be one.
+        """
+        LOGGER.info('Not handing over after all')
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        for client in self.left_over:
+            if client in self.clients:
+                self.selector.register(client, selectors.EVENT_READ)
+        self.handing_over = None
+        self.left_over = []
+
+    def reply_ready(self, client, message, trace, future):
+        """
+        Hands a response over to the server's thread. This is called by
+        whichever thread finished the future.
+        """
+        with self.lock:
+            self.replies.append((client, message, trace, future.result()))
+            wake = len(self.replies) == 1
+
+        # The server empties the list whenever it wakes, so one byte in the
+        # pipe is enough for all of the replies waiting in the list
+        if wake:
+            try:
+                self.wake_writer.write(b' ')
+            except ValueError:
+                # The server has already closed
+                pass
+
+    def send_replies(self):
+        """
+        Sends back each of the responses that the supervisor has finished.
+
+        :return: Whether the supervisor was told to quit.
+        """
+        with self.lock:
+            replies, self.replies = self.replies, []
+
+        quitting = False
+        for client, message, trace, result in replies:
+            if (message.command_code == protocol.CMD_REEXEC and
+                    client is self.handing_over):
+                # The supervisor is still here, so it couldn't re-execute
+                self.resume()
+
+            if client not in self.clients:
+                continue
+
+            if self.answer(client, message, trace, result):
+                self.waiting.discard(client)
+                if client in self.paused:
+                    self.paused.discard(client)
+                    self.selector.register(client, selectors.EVENT_READ)
+            else:
+                self.disconnect(client)
+
+            if message.command_code == protocol.CMD_QUIT:
+                quitting = True
+
+        return quitting
+
+    def answer(self, client, message, trace, result):
+        """
+        Sends back the supervisor's response to a command.
+
+        :return: Whether the client is still connected (or should be).
+        """
+        trace.mark(tracing.RESUMED)
+
+        LOGGER.info('Got result from supervisor: %s', result)
+        connected = True
+        if result is not None:
+            try:
+                client.send(result)
+            except OSError:
+                LOGGER.info('Client died before result could be sent')
+                connected = False
+        elif message.command_code != protocol.CMD_QUIT:
+            # There's no result when the service isn't running, which the
+            # client finds out about by being disconnected
+            connected = False
+
+        trace.mark(tracing.REPLIED)
+        if trace.command is not None:
+            # Waits take as long as the job does, so they aren't slow in the
+            # sense that the threshold is meant to catch
+            if message.command_code == protocol.CMD_WAIT:
+                trace.finish()
+            else:
+                trace.finish(self.slow_threshold)
+
+        return connected
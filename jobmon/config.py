@@ -13,14 +13,18 @@ Typically, the use for this module is simply::
     >>> config_handler = ConfigHandler()
     >>> config_handler.load(SOME_FILE)
 """
+from collections import namedtuple
 import glob
 import json
 import logging
 import os
+import resource
 import signal
 import string
 
-from jobmon import monitor
+from jobmon import (
+    address, dependencies, health, limits, monitor, output, placement, schedule
+)
 
 # Get the names for both signals and log levels so that way the configuration
 # file authors do not have to reference those constants numerically.
@@ -40,6 +44,76 @@ LOG_LEVELS = {
                       'WARNING')
 }
 
+# How long (in seconds) jobs are given to exit when the supervisor shuts down,
+# before they are killed, unless the configuration says otherwise
+DEFAULT_SHUTDOWN_TIMEOUT = 10
+
+# The attributes of a ConfigHandler which come from the supervisor's part of
+# the main configuration, rather than from the jobs
+SUPERVISOR_SETTINGS = (
+    'working_dir', 'control_port', 'event_port', 'allowed_uids', 'includes',
+    'log_level', 'log_file', 'watch_includes', 'spawn_method', 'cgroup_root',
+    'metrics_port', 'slow_request_threshold', 'health_check_workers',
+    'shutdown_timeout', 'state_file', 'config_file',
+)
+
+# Each instance of a replicated job finds its index in this environment variable
+INSTANCE_ENV_VAR = 'JOBMON_INSTANCE'
+
+# A job which runs as several instances. The template is the job's definition,
+# which the instances are copies of, restart is whether the instances are
+# restarted automatically, and autostart is whether they are started along
+# with the supervisor.
+ReplicaGroup = namedtuple('ReplicaGroup', ['template', 'restart', 'autostart'])
+
+def instance_name(group, index):
+    """
+    :param str group: The name of the replicated job.
+    :param int index: The index of the instance, starting from 0.
+    :return: The name of the instance's job.
+    """
+    return '{}:{}'.format(group, index)
+
+def expand_groups(names, jobs, replica_groups):
+    """
+    Replaces the names of any replicated jobs with the names of their
+    instances.
+
+    :param names: A list of job names.
+    :param jobs: The jobs which exist, by name.
+    :param replica_groups: The replicated jobs which exist, by name.
+    :return: The expanded list of job names.
+    """
+    expanded = []
+    for name in names:
+        if name in replica_groups and name not in jobs:
+            prefix = instance_name(name, '')
+            expanded.extend(job for job in jobs
+                            if job.startswith(prefix) and
+                            job[len(prefix):].isdigit())
+        else:
+            expanded.append(name)
+    return expanded
+
+def make_instance(process_class, template, index):
+    """
+    Creates an instance of a replicated job, which has the same definition as
+    the job's template except for its name and instance index.
+
+    :param type process_class: The class to create the instance as.
+    :param monitor.ChildProcessSkeleton template: The job's definition.
+    :param int index: The index of the instance.
+    :return: The new instance.
+    """
+    instance = process_class(instance_name(template.name, index),
+                             template.program)
+    instance.update_from(template)
+
+    env = dict(template.env)
+    env[INSTANCE_ENV_VAR] = str(index)
+    instance.config(env=env)
+    return instance
+
 def expand_path_vars(path):
     """
     Expands a path variable which uses $-style substitutions.
@@ -57,27 +131,90 @@ class ConfigHandler:
     - :attr:`jobs` maps each job name to a 
       :class:`jobmon.monitor.ChlidProcesSkeleton`.
     - :attr:`working_dir` stores the supervisor's working directory.
-    - :attr:`control_port` stores the port number which is used for commands.
-    - :attr:`event_port` stores the port number which is used for events.
+    - :attr:`control_port` stores the port number (or Unix socket address,
+      see :mod:`jobmon.address`) which is used for commands.
+    - :attr:`event_port` stores the port number (or Unix socket address)
+      which is used for events.
+    - :attr:`allowed_uids` stores the users who can connect to Unix sockets,
+      or ``None`` for the supervisor's own user and root.
     - :attr:`log_level` stores the logging level for the supervisor's logging
       output.
     - :attr:`log_file` stores the path where the supervisor's logging output
       will be written.
     - :attr:`autostarts` stores a list of jobs to start immediately.
     - :attr:`restarts` lists the jobs which are restarted automatically.
+    - :attr:`job_files` maps each included job file to the names of the jobs
+      which were loaded from it.
+    - :attr:`replica_groups` maps the name of each replicated job to its
+      :class:`ReplicaGroup`. Its instances are in :attr:`jobs`, named by
+      :func:`instance_name`.
+    - :attr:`group_files` maps each included job file to the names of the
+      replicated jobs which were loaded from it.
+    - :attr:`spawn_method` stores the default way that jobs are launched.
+    - :attr:`watch_includes` indicates whether the ``include-dirs`` should be
+      watched for changes while the supervisor is running.
+    - :attr:`cgroup_root` stores the cgroup that jobs' cgroups are created
+      in, or ``None`` to use the supervisor's own cgroup.
+    - :attr:`metrics_port` stores the port number which metrics are served
+      on, or ``None`` to not serve them.
+    - :attr:`slow_request_threshold` stores how long (in seconds) a command
+      can take before it is logged as slow, or ``None`` to not log them.
+    - :attr:`health_check_workers` stores how many health checks can run at
+      once.
+    - :attr:`shutdown_timeout` stores how long (in seconds) jobs are given to
+      exit when the supervisor shuts down, before they are killed - jobs can
+      have timeouts of their own.
+    - :attr:`state_file` stores the path of the journal which records the
+      jobs' processes (see :mod:`jobmon.journal`), or ``None`` to not keep
+      one.
+    - :attr:`config_file` stores the absolute path of the main configuration
+      file, which the supervisor re-reads when it re-executes itself, or
+      ``None`` if the configuration didn't come from a file.
+
+    Jobs are created as instances of ``process_class``, which is normally
+    :class:`monitor.ChildProcessSkeleton` - the simulation (see
+    :mod:`jobmon.simulation`) swaps in processes which don't really run.
     """
-    def __init__(self):
+    def __init__(self, process_class=monitor.ChildProcessSkeleton):
+        self.process_class = process_class
         self.jobs = {}
         self.logger = logging.getLogger('config')
 
         self.working_dir = '.'
         self.control_port = 6666
         self.event_port = 6667
+        self.allowed_uids = None
         self.includes = []
         self.log_level = logging.WARNING
         self.log_file = '/dev/null'
         self.autostarts = []
         self.restarts = []
+        self.job_files = {}
+        self.replica_groups = {}
+        self.group_files = {}
+        self.watch_includes = False
+        self.spawn_method = monitor.SPAWN_FORK
+        self.cgroup_root = None
+        self.metrics_port = None
+        self.slow_request_threshold = None
+        self.health_check_workers = health.DEFAULT_WORKERS
+        self.shutdown_timeout = DEFAULT_SHUTDOWN_TIMEOUT
+        self.state_file = None
+        self.config_file = None
+
+    def copy_settings(self):
+        """
+        Creates a handler with the same supervisor settings as this one, but
+        without any jobs. Job files which are reloaded are read into one of
+        these, so that their jobs are built the same way as they were when
+        the supervisor started.
+
+        :return: A new :class:`ConfigHandler`.
+        """
+        handler = ConfigHandler(self.process_class)
+        for setting in SUPERVISOR_SETTINGS:
+            setattr(handler, setting, getattr(self, setting))
+        return handler
 
     def read_type(self, dct, key, expected_type, default=None):
         """
@@ -98,6 +235,273 @@ class ConfigHandler:
 
         return value
 
+    def read_spawn_method(self, dct, default):
+        """
+        Reads the ``spawn-method`` option, falling back to the default if it
+        is invalid or not supported on this platform.
+
+        :param dict dct: The JSON object to read the information from.
+        :param str default: The default spawn method.
+        """
+        spawn_method = self.read_type(dct, 'spawn-method', str, default)
+        if spawn_method not in monitor.SPAWN_METHODS:
+            self.logger.warning('%s is not a valid spawn method', spawn_method)
+            return default
+
+        if (spawn_method == monitor.SPAWN_POSIX_SPAWN and 
+                not hasattr(os, 'posix_spawnp')):
+            self.logger.warning('posix_spawn is not supported, using fork')
+            return monitor.SPAWN_FORK
+
+        return spawn_method
+
+    def read_rotation(self, job):
+        """
+        Reads the options that control how a job's captured output is rotated.
+
+        :param dict job: The job's JSON object.
+        :return: An :class:`output.RotationPolicy`.
+        """
+        policy = output.DEFAULT_ROTATION
+        if 'rotate-size' in job:
+            policy = policy._replace(max_size=self.read_type(
+                job, 'rotate-size', int, policy.max_size))
+        if 'rotate-age' in job:
+            policy = policy._replace(max_age=self.read_type(
+                job, 'rotate-age', (int, float), policy.max_age))
+        if 'rotate-keep' in job:
+            policy = policy._replace(keep=self.read_type(
+                job, 'rotate-keep', int, policy.keep))
+        if 'rotate-compress' in job:
+            policy = policy._replace(compress=self.read_type(
+                job, 'rotate-compress', bool, policy.compress))
+
+        return policy
+
+    def read_rlimits(self, job):
+        """
+        Reads the rlimits of a job. Each rlimit is either a single number
+        (used as both the soft and hard limit) or a list of the soft and hard
+        limit, where ``null`` means unlimited.
+
+        :param dict job: The job's JSON object.
+        :return: A tuple of ``(rlimit, soft, hard)`` tuples.
+        """
+        rlimits = []
+        for name, value in self.read_type(job, 'rlimits', dict, {}).items():
+            rlimit = limits.get_rlimit(name)
+            if rlimit is None:
+                self.logger.error('%s is not a valid rlimit', name)
+                continue
+
+            if not isinstance(value, list):
+                value = [value, value]
+
+            if (len(value) != 2 or
+                    not all(bound is None or isinstance(bound, int)
+                            for bound in value)):
+                self.logger.error('Expected rlimit "%s" to be a number or a '
+                                  'list of two numbers, but got %s',
+                                  name, value)
+                continue
+
+            soft, hard = [resource.RLIM_INFINITY if bound is None else bound
+                          for bound in value]
+            rlimits.append((rlimit, soft, hard))
+
+        return tuple(rlimits)
+
+    def read_cgroup_limits(self, job):
+        """
+        Reads the limits placed upon a job's cgroup.
+
+        - ``memory-max`` is the most memory (in bytes) that the job can use.
+        - ``cpu-max`` is either the number of CPUs that the job can use (which
+          can be fractional), or a string in the format used by ``cpu.max``.
+        - ``pids-max`` is the most processes that the job can have at once.
+
+        :param dict job: The job's JSON object.
+        :return: A :class:`limits.CgroupLimits`.
+        """
+        cgroup = self.read_type(job, 'cgroup', dict, {})
+        cgroup_limits = limits.CgroupLimits(None, None, None)
+
+        if 'memory-max' in cgroup:
+            cgroup_limits = cgroup_limits._replace(memory_max=self.read_type(
+                cgroup, 'memory-max', int, None))
+
+        if 'cpu-max' in cgroup:
+            cpu_max = self.read_type(cgroup, 'cpu-max', (int, float, str), None)
+            if isinstance(cpu_max, (int, float)):
+                cpu_max = '{} {}'.format(int(cpu_max * limits.CPU_PERIOD),
+                                         limits.CPU_PERIOD)
+            cgroup_limits = cgroup_limits._replace(cpu_max=cpu_max)
+
+        if 'pids-max' in cgroup:
+            cgroup_limits = cgroup_limits._replace(pids_max=self.read_type(
+                cgroup, 'pids-max', int, None))
+
+        return cgroup_limits
+
+    def read_placement(self, job):
+        """
+        Reads how a job's processes are scheduled, from the ``cpu-affinity``,
+        ``nice``, ``io-class`` and ``io-priority`` keys. If any of these are
+        invalid, then the job is scheduled the same way as the supervisor.
+
+        :param dict job: The job's JSON object.
+        :return: A :class:`placement.Placement`.
+        """
+        try:
+            return placement.from_dict(job)
+        except ValueError as ex:
+            self.logger.error('Invalid placement - %s', ex)
+            return placement.NO_PLACEMENT
+
+    def read_health_check(self, job):
+        """
+        Reads a job's ``health-check``, which is described in
+        :func:`health.from_dict`.
+
+        :return: A :class:`health.HealthCheck`, or ``None`` if it is invalid.
+        """
+        try:
+            return health.from_dict(job['health-check'])
+        except ValueError as ex:
+            self.logger.error('Invalid health check - %s', ex)
+            return None
+
+    def read_shutdown_timeout(self, dct):
+        """
+        Reads a ``shutdown-timeout``, which is a positive number of seconds.
+
+        :return: The timeout, or ``None`` if it is invalid.
+        """
+        timeout = self.read_type(dct, 'shutdown-timeout', (int, float), None)
+        if timeout is not None and timeout <= 0:
+            self.logger.error('shutdown-timeout must be positive, got %s',
+                              timeout)
+            return None
+        return timeout
+
+    def read_address(self, dct, key, default):
+        """
+        Reads the address of one of the supervisor's sockets, which is a port
+        number or a Unix socket address (see :func:`address.parse`).
+
+        :param dict dct: The JSON object to read the information from.
+        :param str key: The name of the value to read.
+        :param default: The default address.
+        """
+        value = self.read_type(dct, key, (int, str), default)
+        try:
+            address.parse(value)
+            return value
+        except ValueError as ex:
+            self.logger.error('Invalid %s - %s', key, ex)
+            return default
+
+    def read_schedule(self, job):
+        """
+        Reads a job's ``schedule``, which is described in
+        :func:`schedule.from_config`.
+
+        :return: A :class:`schedule.Schedule`, or ``None`` if it is invalid.
+        """
+        try:
+            return schedule.from_config(job['schedule'])
+        except ValueError as ex:
+            self.logger.error('Invalid schedule - %s', ex)
+            return None
+
+    def read_job_names(self, job, key):
+        """
+        Reads a list of job names, such as a job's ``requires``.
+
+        :return: A list of names, which is empty if the value is invalid.
+        """
+        names = self.read_type(job, key, list, [])
+        if not all(isinstance(name, str) for name in names):
+            self.logger.error('Expected "%s" to be a list of job names', key)
+            return []
+        return names
+
+    def read_replicas(self, job):
+        """
+        Reads how many instances of a job to run, from either ``replicas`` or
+        its alias ``numprocs``.
+
+        :return: The number of instances, or ``None`` if the job isn't \
+        replicated (or the value is invalid).
+        """
+        key = 'replicas' if 'replicas' in job else 'numprocs'
+        replicas = self.read_type(job, key, int, None)
+        if replicas is not None and replicas < 0:
+            self.logger.error('%s cannot be negative, got %d', key, replicas)
+            return None
+        return replicas
+
+    def expand_groups(self, names):
+        """
+        Replaces the names of any replicated jobs with the names of their
+        instances.
+
+        :param names: A list of job names.
+        :return: The expanded list of job names.
+        """
+        return expand_groups(names, self.jobs, self.replica_groups)
+
+    def resolve_dependencies(self, jobs=None, replica_groups=None):
+        """
+        Makes every job depend only on jobs which exist, dropping any which
+        don't. Depending on a replicated job means depending on all of the
+        instances that it was configured with.
+
+        :param jobs: The jobs which can be depended on, by name, if there \
+        are others besides these - such as when a job file is reloaded.
+        :param replica_groups: The replicated jobs which can be depended on, \
+        by name, if there are others besides these.
+        """
+        if jobs is None:
+            jobs = self.jobs
+        if replica_groups is None:
+            replica_groups = self.replica_groups
+
+        # Templates are checked too, since instances added by scaling a job
+        # up are copied from them
+        templates = [(group, replica_group.template)
+                     for group, replica_group in self.replica_groups.items()]
+        for job_name, job in list(self.jobs.items()) + templates:
+            for key in ('requires', 'after'):
+                names = expand_groups(getattr(job, key), jobs,
+                                      replica_groups)
+                missing = [name for name in names if name not in jobs]
+                if missing:
+                    self.logger.error('%s has unknown %s: %s', job_name, key,
+                                      ', '.join(missing))
+                    names = [name for name in names if name in jobs]
+
+                if tuple(names) != getattr(job, key):
+                    job.config(**{key: names})
+
+    def check_dependencies(self):
+        """
+        Checks that every job depends only on jobs which exist, dropping any
+        which don't, and that no jobs depend on each other in a cycle.
+
+        :raises ValueError: If there is a cycle.
+        """
+        self.resolve_dependencies()
+
+        cycle = dependencies.find_cycle({
+            job_name: dependencies.get_dependencies(job)
+            for job_name, job in self.jobs.items()
+        })
+        if cycle is not None:
+            self.logger.error('Jobs depend on each other in a cycle: %s',
+                              ' -> '.join(cycle))
+            raise ValueError('Dependency cycle: {}'.format(' -> '.join(cycle)))
+
     def load(self, config_file):
         """
         Loads the main jobs file, extracting information from both the main
@@ -108,6 +512,7 @@ class ConfigHandler:
         self.logger.info('Loading main configuration file "%s"', config_file)
         with open(config_file) as config:
             config_info = json.load(config)
+        self.config_file = os.path.abspath(config_file)
            
         if 'supervisor' in config_info:
             if not isinstance(config_info['supervisor'], dict):
@@ -125,6 +530,8 @@ class ConfigHandler:
             self.logger.error('No jobs are configured, aborting')
             raise ValueError
 
+        self.check_dependencies()
+
     def handle_supervisor_config(self, supervisor_map):
         """
         Parses out the options meant for the supervisor.
@@ -137,12 +544,19 @@ class ConfigHandler:
                                    self.working_dir))
 
         if 'control-port' in supervisor_map:
-            self.control_port = self.read_type(supervisor_map, 'control-port', int, 
-                                   self.control_port)
+            self.control_port = self.read_address(supervisor_map, 'control-port',
+                                                  self.control_port)
 
         if 'event-port' in supervisor_map:
-            self.event_port = self.read_type(supervisor_map, 'event-port', int, 
-                                   self.event_port)
+            self.event_port = self.read_address(supervisor_map, 'event-port',
+                                                self.event_port)
+
+        if 'allowed-uids' in supervisor_map:
+            try:
+                self.allowed_uids = address.read_uids(
+                    supervisor_map['allowed-uids'])
+            except ValueError as ex:
+                self.logger.error('Invalid allowed-uids - %s', ex)
 
         if 'include-dirs' in supervisor_map:
             self.includes = self.read_type(supervisor_map, 'include-dirs', 
@@ -163,6 +577,48 @@ class ConfigHandler:
                     self.read_type(supervisor_map, 'log-file', str, 
                                    self.log_file))
 
+        if 'spawn-method' in supervisor_map:
+            self.spawn_method = self.read_spawn_method(supervisor_map,
+                                                       self.spawn_method)
+
+        if 'watch-includes' in supervisor_map:
+            self.watch_includes = self.read_type(supervisor_map, 
+                    'watch-includes', bool, self.watch_includes)
+
+        if 'cgroup-root' in supervisor_map:
+            self.cgroup_root = expand_path_vars(
+                    self.read_type(supervisor_map, 'cgroup-root', str,
+                                   self.cgroup_root))
+
+        if 'metrics-port' in supervisor_map:
+            self.metrics_port = self.read_type(supervisor_map, 'metrics-port',
+                                               int, self.metrics_port)
+
+        if 'slow-request-threshold' in supervisor_map:
+            self.slow_request_threshold = self.read_type(
+                    supervisor_map, 'slow-request-threshold', (int, float),
+                    self.slow_request_threshold)
+
+        if 'health-check-workers' in supervisor_map:
+            workers = self.read_type(supervisor_map, 'health-check-workers',
+                                     int, self.health_check_workers)
+            if workers <= 0:
+                self.logger.error('health-check-workers must be positive, '
+                                  'got %d', workers)
+            else:
+                self.health_check_workers = workers
+
+        if 'shutdown-timeout' in supervisor_map:
+            timeout = self.read_shutdown_timeout(supervisor_map)
+            if timeout is not None:
+                self.shutdown_timeout = timeout
+
+        if 'state-file' in supervisor_map:
+            state_file = self.read_type(supervisor_map, 'state-file', str,
+                                        self.state_file)
+            if state_file is not None:
+                self.state_file = expand_path_vars(state_file)
+
         included_jobfiles = []
         for include_glob in self.includes:
             self.logger.info('Expanding glob "%s"', include_glob)
@@ -173,35 +629,52 @@ class ConfigHandler:
 
         for filename in included_jobfiles:
             try:
-                self.logger.info('Loading job file "%s"', filename)
-                with open(filename) as jobfile:
-                    jobs_map = json.load(jobfile)
-
-                if not isinstance(jobs_map, dict):
-                    self.logger.warning('"%s" is not a valid jobs file', filename)
-                else:
-                    self.handle_jobs(jobs_map)
+                self.load_job_file(filename)
             except OSError as ex:
                 self.logger.warning('Unable to open "%s" - %s', filename, ex)
                 raise ValueError('No jobs defined - cannot continue')
 
+    def load_job_file(self, filename):
+        """
+        Loads the jobs from a single job file, and records which jobs came
+        from that file in :attr:`job_files`.
+
+        :param str filename: The path to the job file.
+        """
+        self.logger.info('Loading job file "%s"', filename)
+        filename = os.path.normpath(filename)
+        with open(filename) as jobfile:
+            jobs_map = json.load(jobfile)
+
+        if not isinstance(jobs_map, dict):
+            self.logger.warning('"%s" is not a valid jobs file', filename)
+            self.job_files[filename] = []
+        else:
+            old_groups = set(self.replica_groups)
+            self.job_files[filename] = self.handle_jobs(jobs_map)
+            self.group_files[filename] = [group for group in self.replica_groups
+                                          if group not in old_groups]
+
     def handle_jobs(self, jobs_map):
         """
         Parses out a group of jobs.
 
         :param dict jobs_map: A dictionary of jobs, indexed by name.
+        :return: A list of the names of the jobs which were added.
         """
+        added_jobs = []
         for job_name, job in jobs_map.items():
             self.logger.info('Parsing info for %s', job_name)
             if 'command' not in job:
                 self.logger.warning('Continuing - %s lacks a command', job_name)
                 continue
 
-            if job_name in self.jobs:
+            if job_name in self.jobs or job_name in self.replica_groups:
                 self.logger.warning('Continuing - job %s is a duplicate', job_name)
                 continue
 
-            process = monitor.ChildProcessSkeleton(job_name, job['command'])
+            process = self.process_class(job_name, job['command'],
+                                         spawn=self.spawn_method)
 
             if 'stdin' in job:
                 default_value = process.stdin
@@ -231,14 +704,86 @@ class ConfigHandler:
                 else:
                     process.config(sig=SIGNAL_NAMES[sig_name])
 
+            if 'spawn-method' in job:
+                process.config(spawn=self.read_spawn_method(
+                    job, process.spawn_method))
+
+            if 'capture-output' in job:
+                if self.read_type(job, 'capture-output', bool, False):
+                    process.config(capture=self.read_rotation(job))
+
+            if 'rlimits' in job:
+                process.config(rlimits=self.read_rlimits(job))
+
+            if 'cgroup' in job:
+                process.config(cgroup=self.read_cgroup_limits(job))
+
+            if any(key in job for key in placement.PLACEMENT_KEYS):
+                process.config(placement=self.read_placement(job))
+
+            if 'health-check' in job:
+                process.config(health=self.read_health_check(job))
+
+            if 'notify' in job:
+                process.config(notify=self.read_type(job, 'notify', bool,
+                                                     process.notify))
+
+            for key in ('requires', 'after'):
+                if key in job:
+                    process.config(**{key: self.read_job_names(job, key)})
+
+            if 'schedule' in job:
+                process.config(schedule=self.read_schedule(job))
+
+            if 'shutdown-timeout' in job:
+                process.config(
+                    shutdown_timeout=self.read_shutdown_timeout(job))
+
+            if 'ring-buffer' in job:
+                ring_size = self.read_type(job, 'ring-buffer', int, None)
+                if ring_size is not None and ring_size <= 0:
+                    self.logger.error('ring-buffer must be positive, got %d',
+                                      ring_size)
+                else:
+                    process.config(ring=ring_size)
+
+            should_autostart = False
             if 'autostart' in job:
                 should_autostart = self.read_type(job, 'autostart', bool, False)
-                if should_autostart:
-                    self.autostarts.append(job_name)
 
+            should_restart = False
             if 'restart' in job:
                 should_restart = self.read_type(job, 'restart', bool, False)
+
+            replicas = None
+            if 'replicas' in job or 'numprocs' in job:
+                replicas = self.read_replicas(job)
+
+            if replicas is None:
+                instances = [process]
+            else:
+                self.replica_groups[job_name] = ReplicaGroup(
+                    process, should_restart, should_autostart)
+                instances = [make_instance(self.process_class, process, index)
+                             for index in range(replicas)]
+
+            for instance in instances:
+                if instance.name in self.jobs:
+                    self.logger.warning('Continuing - job %s is a duplicate',
+                                        instance.name)
+                    continue
+
+                if should_autostart:
+                    self.autostarts.append(instance.name)
+
                 if should_restart:
-                    self.restarts.append(job_name)
+                    self.restarts.append(instance.name)
+
+                # Work out how to launch the job now, rather than every time
+                # that it starts
+                instance.get_spawn_plan()
+
+                self.jobs[instance.name] = instance
+                added_jobs.append(instance.name)
 
-            self.jobs[job_name] = process
+        return added_jobs
@@ -0,0 +1,87 @@
+"""
+JobMon Job Dependencies
+=======================
+
+Jobs can depend on each other in two ways:
+
+- ``requires`` names jobs which have to be running for this one to work.
+  Starting this job with its dependencies (and autostarting it) starts them
+  too, and this job is started after them.
+- ``after`` names jobs which this job is started after, if they are being
+  started at the same time, but which aren't started along with it.
+
+A dependency counts as up once it is running, or once it has said that it is
+ready if it reports its readiness (see :mod:`jobmon.notify`). Jobs are
+started as soon as all of their dependencies are up, so independent jobs are
+started together rather than one after another. Jobs are stopped in the
+reverse order - each job is stopped once every job that depends on it has
+stopped.
+"""
+
+def get_dependencies(job):
+    """
+    :param monitor.ChildProcessSkeleton job: The job.
+    :return: Every job which the job is started after.
+    """
+    return job.requires + job.after
+
+def find_cycle(graph):
+    """
+    Looks for a cycle in a dependency graph.
+
+    :param dict graph: Maps each job to the jobs that it depends on. Any \
+    dependencies which aren't in the graph are ignored.
+    :return: The cycle as a list of jobs, starting and ending with the same \
+    job, or ``None`` if there are no cycles.
+    """
+    # The depth-first search is done with an explicit stack, since a long
+    # chain of jobs could otherwise run into the recursion limit
+    visiting, done = set(), set()
+    for root in graph:
+        if root in done:
+            continue
+
+        path = [root]
+        stack = [iter(graph[root])]
+        visiting.add(root)
+        while stack:
+            for dependency in stack[-1]:
+                if dependency not in graph or dependency in done:
+                    continue
+
+                if dependency in visiting:
+                    return path[path.index(dependency):] + [dependency]
+
+                path.append(dependency)
+                stack.append(iter(graph[dependency]))
+                visiting.add(dependency)
+                break
+            else:
+                stack.pop()
+                finished = path.pop()
+                visiting.remove(finished)
+                done.add(finished)
+
+    return None
+
+def pull_in(jobs, requires):
+    """
+    Works out which jobs have to be started along with the given ones.
+
+    :param jobs: The jobs being started.
+    :param requires: Called with a job, and returns the jobs that it \
+    requires.
+    :return: A :class:`set` of the given jobs and everything they require, \
+    directly or indirectly.
+    """
+    needed = set()
+    stack = list(jobs)
+    while stack:
+        job = stack.pop()
+        if job in needed:
+            continue
+
+        needed.add(job)
+        stack.extend(requires(job))
+
+    return needed
@@ -2,13 +2,15 @@
 The event server is responsible for dispatching events from the supervisor
 to clients waiting for them.
 """
+from concurrent.futures import Future
 import logging
 import os
 import selectors
 import socket
 import threading
+import time
 
-from jobmon import protocol, util
+from jobmon import address, metrics, protocol, util
 
 LOGGER = logging.getLogger('jobmon.event_server')
 
@@ -17,14 +19,34 @@ class EventServer(threading.Thread):
     The event server manages a server and a collection of clients, and pushes
     events to them as they come in from the supervisor.
     """
-    def __init__(self, port):
+    def __init__(self, port, allowed_uids=None, handed_over=None):
+        """
+        :param port: The address to listen on, in any form that \
+        :func:`address.parse` reads.
+        :param allowed_uids: The users who can connect over a Unix socket, \
+        which defaults to :func:`address.default_uids`.
+        :param dict handed_over: The listening socket and the clients of the \
+        supervisor that this one replaced, as returned by :meth:`hand_over`.
+        """
         super().__init__()
 
-        LOGGER.info('Binding events to localhost:%d', port)
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.bind(('localhost', port))
-        self.sock.listen(10)
+        self.address = address.parse(port)
+        self.subscribers = []
+        if handed_over is None:
+            LOGGER.info('Binding events to %s', address.to_str(self.address))
+            self.sock = address.listen(self.address)
+        else:
+            LOGGER.info('Taking over events on %s',
+                        address.to_str(self.address))
+            self.sock = socket.socket(fileno=handed_over['listener'])
+            self.subscribers = [
+                protocol.ProtocolStreamSocket(socket.socket(fileno=fd),
+                                              timeout=None)
+                for fd in handed_over['clients']]
+
+        if allowed_uids is None:
+            allowed_uids = address.default_uids()
+        self.allowed_uids = allowed_uids
 
         # Since we can't really select on queues, pipes are the next best
         # option
@@ -34,6 +56,9 @@ class EventServer(threading.Thread):
         self.bridge_out = protocol.ProtocolFile(os.fdopen(writer, 'wb'),
                                                 timeout=None)
 
+        # Set by hand_over, which stops the server without closing anything
+        self.handoff = None
+
     @util.log_crashes(LOGGER, 'Event server error')
     def run(self):
         """
@@ -44,7 +69,11 @@ class EventServer(threading.Thread):
         pollster.register(self.bridge_in, selectors.EVENT_READ)
 
         done = False
-        clients = set()
+        clients = set(self.subscribers)
+        for client in clients:
+            pollster.register(client, selectors.EVENT_READ)
+        metrics.EVENT_SUBSCRIBERS.set(len(clients))
+
         while not done:
             events = pollster.select()
 
@@ -53,24 +82,47 @@ class EventServer(threading.Thread):
                     LOGGER.info('Client connected')
 
                     _client, _ = self.sock.accept()
+                    allowed, uid = address.peer_allowed(_client,
+                                                        self.allowed_uids)
+                    if not allowed:
+                        LOGGER.warning('Rejecting client running as UID %d',
+                                       uid)
+                        _client.close()
+                        continue
+
                     client = protocol.ProtocolStreamSocket(_client, timeout=None)
 
                     pollster.register(client, selectors.EVENT_READ)
                     clients.add(client)
+                    metrics.EVENT_SUBSCRIBERS.set(len(clients))
                 elif key.fileobj == self.bridge_in:
                     msg = self.bridge_in.recv()
+                    if (msg.event_code == protocol.EVENT_TERMINATE and
+                            self.handoff is not None):
+                        # Every event before this one has been sent, and
+                        # the clients carry on with the next supervisor
+                        self.handoff.set_result({
+                            'listener': self.sock.fileno(),
+                            'clients': [client.fileno()
+                                        for client in clients],
+                        })
+                        return
                     LOGGER.info('Reporting %s to %d clients',
                             msg,
                             len(clients))
 
                     dead_clients = set()
 
+                    fanout_start = time.perf_counter()
                     for client in clients:
                         try:
                             client.send(msg)
                         except OSError:
                             dead_clients.add(client)
 
+                    metrics.EVENT_FANOUT_LATENCY.observe(
+                        time.perf_counter() - fanout_start)
+
                     for client in dead_clients:
                         LOGGER.info('Client died during sending - cleaning up')
                         try:
@@ -83,6 +135,8 @@ class EventServer(threading.Thread):
                         except KeyError:
                             LOGGER.warning('Could not unregister client %s', client)
 
+                    metrics.EVENT_SUBSCRIBERS.set(len(clients))
+
                     if msg.event_code == protocol.EVENT_TERMINATE:
                         done = True
                 else:
@@ -97,30 +151,48 @@ class EventServer(threading.Thread):
                         clients.remove(key.fileobj)
                     except KeyError:
                         LOGGER.warning('Could not unregister client %s', key.fileobj)
+
+                    metrics.EVENT_SUBSCRIBERS.set(len(clients))
                         
 
         LOGGER.info('Closing...')
 
         for client in clients:
             client.close()
+        metrics.EVENT_SUBSCRIBERS.set(0)
 
         self.bridge_in.close()
         self.bridge_out.close()
-        self.sock.close()
+        address.close_listener(self.sock, self.address)
 
-    def send(self, job, event_type):
+    def send(self, job, event_type, output=None):
         """
         Sends out an event to all waiting clients.
+
+        :param list output: The last lines that the job wrote, if it exited \
+        with a failure.
         """
         LOGGER.info('Pumping event[%s] about job %s', 
                 protocol.Event.EVENT_NAMES[event_type],
                 job)
 
         try:
-            self.bridge_out.send(protocol.Event(job, event_type))
+            self.bridge_out.send(protocol.Event(job, event_type, output))
         except ValueError:
             pass
 
+    def hand_over(self):
+        """
+        Stops the server once every event so far has been sent, leaving its
+        sockets open for the supervisor that replaces this one.
+
+        :return: The file descriptors of the listening socket and of the \
+        clients, as a :class:`dict` which can be given to the next server.
+        """
+        self.handoff = Future()
+        self.terminate()
+        return self.handoff.result()
+
     def terminate(self):
         try:
             self.bridge_out.send(protocol.Event('', protocol.EVENT_TERMINATE))
@@ -0,0 +1,459 @@
+"""
+JobMon Fork Server
+==================
+
+The fork server is a small helper process which launches children on behalf
+of the supervisor. It is forked by :func:`jobmon.launcher.execute_supervisor`
+before the supervisor has started any threads (or loaded anything large), so
+forking it is cheap and safe, unlike forking the supervisor itself.
+
+The supervisor and the helper talk over a socketpair, using the same framing
+as :mod:`jobmon.protocol` (a 4-byte length, followed by a JSON body):
+
+- The supervisor sends spawn requests, which contain the ``argv``, ``env``,
+  ``cwd``, the paths to use for the standard streams, and the ``rlimits``,
+  ``cgroup`` and ``placement`` to apply to the child.
+- The helper replies to each request with the PID of the child (or ``None``
+  if it could not fork), and later sends an exit notification when the child
+  dies.
+
+If the helper dies, any children that it was watching are polled until they
+exit, and a new helper is started in its place. By then the supervisor has
+threads, so the new helper is not forked from it - a fresh interpreter is
+executed instead (running this module), and handed its end of a new
+socketpair.
+
+If the helper doesn't answer a spawn request within :data:`SPAWN_TIMEOUT`,
+then :meth:`ForkServer.spawn` gives up on it, so that the job can be started
+some other way. Should the helper get around to starting the child after all,
+that child is killed.
+"""
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from jobmon import limits, placement, util
+
+LOGGER = logging.getLogger('jobmon.forkserver')
+
+# How often (in seconds) children are checked after their helper has died
+ORPHAN_POLL_INTERVAL = 0.5
+
+# How long (in seconds) a spawn request waits for the helper to answer
+SPAWN_TIMEOUT = 5
+
+def send_message(sock, message):
+    """
+    Sends a single framed JSON message over a socket.
+    """
+    json_bytes = json.dumps(message).encode('utf-8')
+    sock.sendall(struct.pack('>I', len(json_bytes)) + json_bytes)
+
+def recv_message(sock):
+    """
+    Reads a single framed JSON message from a socket.
+
+    :return: The decoded message, or ``None`` if the socket was closed.
+    """
+    buffer = b''
+    length = None
+    while True:
+        needed = 4 if length is None else length
+        while len(buffer) < needed:
+            chunk = sock.recv(needed - len(buffer))
+            if not chunk:
+                return None
+            buffer += chunk
+
+        if length is None:
+            (length,) = struct.unpack('>I', buffer)
+            buffer = b''
+        else:
+            return json.loads(buffer.decode('utf-8'))
+
+def exec_child(request):
+    """
+    Sets up the current (freshly forked) process as described by a spawn
+    request, and executes it. This never returns.
+    """
+    try:
+        os.setsid()
+
+        if request['cgroup'] is not None:
+            limits.join_cgroup(request['cgroup'])
+
+        stdin = os.open(request['stdin'], os.O_RDONLY)
+        stdout = os.open(request['stdout'],
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+        stderr = os.open(request['stderr'],
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+
+        os.dup2(stdin, 0)
+        os.dup2(stdout, 1)
+        os.dup2(stderr, 2)
+        for fd in (stdin, stdout, stderr):
+            if fd > 2:
+                os.close(fd)
+
+        if request['cwd'] is not None:
+            os.chdir(request['cwd'])
+
+        cpus, nice, io_class, io_priority = request['placement']
+        placement.apply_placement(placement.Placement(
+            None if cpus is None else frozenset(cpus),
+            nice, io_class, io_priority))
+
+        limits.apply_rlimits(request['rlimits'])
+
+        argv = request['argv']
+        os.execvpe(argv[0], argv, request['env'])
+    finally:
+        os._exit(127)
+
+def serve(sock):
+    """
+    The main loop of the helper process - this spawns children as requested,
+    and reports their PIDs and exits back over the socket. This never returns.
+
+    :param socket.socket sock: The helper's end of the socketpair.
+    """
+    # SIGCHLD is turned into a byte on this pipe, so that it can be waited
+    # on along with the socket
+    child_reader, child_writer = os.pipe()
+    os.set_blocking(child_writer, False)
+    signal.set_wakeup_fd(child_writer)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+    # The supervisor may have handlers installed which make no sense here
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    try:
+        while True:
+            try:
+                readers, _, _ = select.select([sock, child_reader], [], [])
+            except InterruptedError:
+                continue
+
+            if child_reader in readers:
+                os.read(child_reader, 512)
+                while True:
+                    try:
+                        pid, status = os.waitpid(-1, os.WNOHANG)
+                    except ChildProcessError:
+                        break
+
+                    if pid == 0:
+                        break
+
+                    send_message(sock, {'exit': pid, 'status': status})
+
+            if sock in readers:
+                request = recv_message(sock)
+                if request is None:
+                    # The supervisor is gone, so there's nobody to report to
+                    break
+
+                try:
+                    pid = os.fork()
+                except OSError:
+                    pid = None
+
+                if pid == 0:
+                    sock.close()
+                    exec_child(request)
+
+                send_message(sock, {'id': request['id'], 'pid': pid})
+    finally:
+        os._exit(0)
+
+class ForkServer:
+    """
+    The supervisor's side of the fork server. This owns the helper process,
+    and a reader thread which handles the messages that the helper sends.
+
+    :param float spawn_timeout: How long (in seconds) to wait for the \
+    helper to answer a spawn request.
+    """
+    def __init__(self, spawn_timeout=SPAWN_TIMEOUT):
+        self.lock = threading.Lock()
+        self.sock = None
+        self.helper_pid = None
+        self.terminated = False
+        self.spawn_timeout = spawn_timeout
+
+        # Spawn requests which are waiting on a reply, indexed by ID
+        self.next_id = 0
+        self.pending = {}
+
+        # Maps each child's PID to the function that is called when it dies.
+        # Until the child is watched via :meth:`watch`, the callback is None.
+        self.watchers = {}
+
+        # Children that exited before anybody started watching them, along
+        # with their exit statuses
+        self.early_exits = {}
+
+        # Children that the helper started after their spawn request had
+        # timed out - these have been killed, and nobody cares when they exit
+        self.abandoned = set()
+
+    def start(self):
+        """
+        Forks the helper process and starts reading its messages. This should
+        be called before the supervisor starts any other threads.
+        """
+        supervisor_end, helper_end = socket.socketpair()
+
+        helper_pid = os.fork()
+        if helper_pid == 0:
+            supervisor_end.close()
+            serve(helper_end)
+
+        helper_end.close()
+        self.use_helper(supervisor_end, helper_pid,
+                        lambda: os.waitpid(helper_pid, 0))
+
+    def restart(self):
+        """
+        Starts a new helper process after the last one died. Since the
+        supervisor has threads by now, this executes a new interpreter for
+        the helper rather than forking one from the supervisor.
+        """
+        supervisor_end, helper_end = socket.socketpair()
+        try:
+            helper = subprocess.Popen(
+                [sys.executable, '-m', 'jobmon.forkserver',
+                 str(helper_end.fileno())],
+                stdin=subprocess.DEVNULL, pass_fds=(helper_end.fileno(),))
+        except OSError as ex:
+            LOGGER.error('Could not restart fork server - %s', ex)
+            supervisor_end.close()
+            return
+        finally:
+            helper_end.close()
+
+        self.use_helper(supervisor_end, helper.pid, helper.wait)
+
+    def use_helper(self, sock, helper_pid, wait_helper):
+        """
+        Sends spawn requests to a newly started helper, and starts reading
+        its messages.
+
+        :param socket.socket sock: The supervisor's end of the socketpair.
+        :param int helper_pid: The PID of the helper.
+        :param wait_helper: A function which reaps the helper once it has \
+        died.
+        """
+        with self.lock:
+            self.sock = sock
+            self.helper_pid = helper_pid
+        LOGGER.info('Started fork server with PID %d', helper_pid)
+
+        reader_thread = threading.Thread(target=self.read_messages,
+                                         args=(sock, wait_helper))
+        reader_thread.daemon = True
+        reader_thread.start()
+
+    def spawn(self, argv, env, cwd, stdin, stdout, stderr, rlimits=(),
+              cgroup=None, child_placement=placement.NO_PLACEMENT):
+        """
+        Asks the helper to launch a child process.
+
+        :param list argv: The arguments to execute.
+        :param dict env: The complete environment of the child.
+        :param str cwd: The working directory of the child, or ``None``.
+        :param str stdin: The path to use for the child's standard input.
+        :param str stdout: The path to use for the child's standard output.
+        :param str stderr: The path to use for the child's standard error.
+        :param rlimits: A sequence of ``(rlimit, soft, hard)`` tuples to \
+        apply to the child.
+        :param str cgroup: The cgroup to put the child in, or ``None``.
+        :param placement.Placement child_placement: The CPU affinity and \
+        priorities of the child.
+        :return: The PID of the child, or ``None`` if it was not started.
+        :raises TimeoutError: If the helper didn't answer in time - the \
+        child can be started some other way, since the helper won't start \
+        it (or kills it if it does).
+        """
+        future = Future()
+        with self.lock:
+            request_id = self.next_id
+            self.next_id += 1
+            self.pending[request_id] = future
+            sock = self.sock
+
+        try:
+            send_message(sock, {
+                'id': request_id, 'argv': argv, 'env': env, 'cwd': cwd,
+                'stdin': stdin, 'stdout': stdout, 'stderr': stderr,
+                'rlimits': [list(rlimit) for rlimit in rlimits],
+                'cgroup': cgroup,
+                'placement': [
+                    None if child_placement.cpus is None
+                    else sorted(child_placement.cpus)] + list(child_placement[1:]),
+            })
+        except OSError as ex:
+            LOGGER.warning('Could not send spawn request - %s', ex)
+            with self.lock:
+                self.pending.pop(request_id, None)
+            return None
+
+        try:
+            return future.result(timeout=self.spawn_timeout)
+        except FutureTimeoutError:
+            with self.lock:
+                answered = self.pending.pop(request_id, None) is None
+
+            if answered:
+                # The reply came in while we were giving up on it
+                return future.result()
+
+            LOGGER.warning('Fork server did not answer spawn request %d '
+                           'within %s seconds', request_id, self.spawn_timeout)
+            raise TimeoutError('Fork server did not answer in time')
+
+    def watch(self, pid, callback):
+        """
+        Calls a function once the given child has exited. If the child has
+        already exited, then the function is called immediately.
+
+        :param int pid: The PID returned by :meth:`spawn`.
+        :param callback: A function taking the child's exit status (as \
+        returned by ``waitpid``), which is ``None`` if the status is unknown.
+        """
+        with self.lock:
+            if pid in self.early_exits:
+                status = self.early_exits.pop(pid)
+                already_exited = True
+            else:
+                self.watchers[pid] = callback
+                already_exited = False
+
+        if already_exited:
+            callback(status)
+
+    def child_exited(self, pid, status):
+        """
+        Dispatches the exit of a child to whoever is watching it.
+        """
+        with self.lock:
+            if pid in self.abandoned:
+                self.abandoned.remove(pid)
+                return
+
+            callback = self.watchers.pop(pid, None)
+            if callback is None:
+                self.early_exits[pid] = status
+
+        if callback is not None:
+            callback(status)
+
+    @util.log_crashes(LOGGER, 'Error in fork server')
+    def read_messages(self, sock, wait_helper):
+        """
+        Handles spawn replies and exit notifications from one helper, until
+        it dies.
+        """
+        while True:
+            try:
+                message = recv_message(sock)
+            except OSError:
+                message = None
+
+            if message is None:
+                break
+
+            if 'exit' in message:
+                self.child_exited(message['exit'], message['status'])
+            else:
+                pid = message['pid']
+                with self.lock:
+                    future = self.pending.pop(message['id'], None)
+                    if pid is not None:
+                        if future is None:
+                            self.abandoned.add(pid)
+                        else:
+                            self.watchers.setdefault(pid, None)
+
+                if future is not None:
+                    future.set_result(pid)
+                elif pid is not None:
+                    # Its job has been started some other way since then
+                    LOGGER.warning('Killing child %d, which the fork server '
+                                   'started too late', pid)
+                    # It may not have made its own process group yet
+                    for kill in (os.killpg, os.kill):
+                        try:
+                            kill(pid, signal.SIGKILL)
+                        except OSError:
+                            pass
+
+        sock.close()
+        wait_helper()
+
+        with self.lock:
+            # Anything which was waiting on the old helper can't be answered
+            for future in self.pending.values():
+                future.set_result(None)
+            self.pending.clear()
+
+            orphans = set(self.watchers)
+            self.abandoned.clear()
+            restart = not self.terminated
+
+        if orphans:
+            LOGGER.warning('Fork server died with %d children', len(orphans))
+            orphan_thread = threading.Thread(target=self.poll_orphans,
+                                             args=(orphans,))
+            orphan_thread.daemon = True
+            orphan_thread.start()
+
+        if restart:
+            LOGGER.warning('Fork server died - restarting it')
+            self.restart()
+
+    @util.log_crashes(LOGGER, 'Error in fork server orphan poller')
+    def poll_orphans(self, orphans):
+        """
+        Watches the children of a dead helper - since they are no longer our
+        descendants, the only way to tell when they die is to poll them.
+        """
+        while orphans:
+            time.sleep(ORPHAN_POLL_INTERVAL)
+            for pid in list(orphans):
+                try:
+                    os.kill(pid, 0)
+                except ProcessLookupError:
+                    orphans.remove(pid)
+                    self.child_exited(pid, None)
+                except PermissionError:
+                    # The PID has been reused by somebody else's process
+                    orphans.remove(pid)
+                    self.child_exited(pid, None)
+
+    def terminate(self):
+        """
+        Stops the helper process - it exits once it sees that its socket has
+        been closed.
+        """
+        with self.lock:
+            self.terminated = True
+            sock = self.sock
+
+        if sock is not None:
+            sock.shutdown(socket.SHUT_RDWR)
+
+if __name__ == '__main__':
+    # A helper which replaces one that died - its socket is passed to it by
+    # the supervisor, see ForkServer.restart
+    serve(socket.socket(fileno=int(sys.argv[1])))
@@ -0,0 +1,104 @@
+"""
+JobMon Re-execution
+===================
+
+Replaces a running supervisor with a fresh copy of itself - usually a newer
+version of JobMon - without stopping its jobs or turning clients away. This
+is what ``jobmon reexec`` does.
+
+The old supervisor stops accepting connections and reading commands, finishes
+whatever it was already asked to do, and then executes
+``python -m jobmon.launcher CONFIG`` in its own process. The new supervisor
+has the same PID, so it is still the parent of the jobs that the old one
+forked. Along the way, the old supervisor keeps open (and the new one takes
+over):
+
+- The listening command and event sockets, so that clients who connect in the
+  meantime wait in the listen backlog rather than being refused.
+- The connections of event listeners, and of command clients which aren't
+  waiting on an answer.
+- The notification socket and the output capture pipes, which jobs are still
+  using.
+
+A description of all of this, along with each job's process and the service's
+bookkeeping, is written as JSON to an unnamed file, whose descriptor is given
+to the new supervisor in :data:`ENV_VAR`. The client which asked for the
+re-execution is answered by the new supervisor, once it has taken over.
+
+Commands which are still being answered when the supervisor re-executes (such
+as waits) are cut off, and their clients see the connection close. Jobs which
+were launched by the fork server are taken over like those left behind by a
+supervisor that died (see :mod:`jobmon.journal`), since the fork server is
+started again along with the supervisor.
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+
+LOGGER = logging.getLogger('jobmon.handoff')
+
+# The environment variable that the new supervisor finds the handoff's file
+# descriptor in
+ENV_VAR = 'JOBMON_HANDOFF'
+
+def get_command(config_file):
+    """
+    :param str config_file: The path to the main configuration file.
+    :return: The arguments which run the new supervisor.
+    """
+    return [sys.executable, '-m', 'jobmon.launcher', config_file]
+
+def execute(config_file, handoff, fds):
+    """
+    Re-executes the supervisor, passing a handoff to the new one. This only
+    returns if the supervisor can't be executed.
+
+    :param str config_file: The path to the main configuration file.
+    :param dict handoff: What the new supervisor takes over, which must be \
+    serializable as JSON.
+    :param fds: The file descriptors mentioned in the handoff, which are \
+    kept open for the new supervisor.
+    :raises OSError: If the supervisor can't be executed.
+    """
+    handoff = dict(handoff, fds=list(fds))
+    handoff_file = tempfile.TemporaryFile()
+    handoff_file.write(json.dumps(handoff).encode('utf-8'))
+    handoff_file.flush()
+    handoff_file.seek(0)
+
+    for fd in fds:
+        os.set_inheritable(fd, True)
+    os.set_inheritable(handoff_file.fileno(), True)
+
+    env = dict(os.environ)
+    env[ENV_VAR] = str(handoff_file.fileno())
+
+    argv = get_command(config_file)
+    LOGGER.info('Re-executing as %s', argv)
+    try:
+        os.execve(argv[0], argv, env)
+    finally:
+        handoff_file.close()
+
+def receive():
+    """
+    Reads the handoff from the supervisor that this one replaced, if it was
+    started that way. The environment variable is removed, and the file
+    descriptors that were passed along are made uninheritable again, so
+    that jobs don't inherit either of them.
+
+    :return: The handoff, as a :class:`dict`, or ``None`` if there wasn't \
+    one.
+    """
+    fd = os.environ.pop(ENV_VAR, None)
+    if fd is None:
+        return None
+
+    with os.fdopen(int(fd), 'rb') as handoff_file:
+        handoff = json.loads(handoff_file.read().decode('utf-8'))
+
+    for fd in handoff['fds']:
+        os.set_inheritable(fd, False)
+    return handoff
@@ -0,0 +1,261 @@
+"""
+JobMon Health Checks
+====================
+
+Checks whether running jobs are actually working, rather than only whether
+their processes exist. Each job can have one health check, which is one of:
+
+- ``exec`` runs a probe command, and passes if it exits with a status of 0.
+- ``tcp`` connects to a port, and passes if the connection is accepted.
+- ``file`` checks when a file was last modified, and passes if that was
+  recently enough - this suits jobs which touch a heartbeat file.
+
+The service schedules each check on its ticker, a jittered interval after the
+previous one finished, so that the checks of jobs which started together
+drift apart rather than all running at once. The probes themselves are run by
+a :class:`HealthChecker`, in a bounded pool of worker threads, so that slow
+probes never hold up the service.
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import random
+import signal
+import socket
+import subprocess
+import time
+
+from jobmon import monitor
+
+LOGGER = logging.getLogger('jobmon.health')
+
+CHECK_EXEC, CHECK_TCP, CHECK_FILE = 'exec', 'tcp', 'file'
+CHECK_KINDS = (CHECK_EXEC, CHECK_TCP, CHECK_FILE)
+
+# What happens once a job has failed too many checks in a row - either it is
+# restarted, or only an event is sent (an event is sent in both cases)
+ACTION_RESTART, ACTION_EVENT = 'restart', 'event'
+ACTIONS = (ACTION_RESTART, ACTION_EVENT)
+
+DEFAULT_INTERVAL = 30
+DEFAULT_TIMEOUT = 5
+DEFAULT_FAILURES = 3
+DEFAULT_WORKERS = 4
+
+# How far each check can be moved away from its interval, as a fraction of it
+JITTER = 0.2
+
+# How much of a failed probe's output is kept, in characters
+MESSAGE_LENGTH = 200
+
+# A job's health check:
+#
+# - kind is one of CHECK_KINDS, and target is what it checks - the command
+#   for exec, a (host, port) tuple for tcp, and a (path, max age in seconds)
+#   tuple for file
+# - interval is how long to wait between checks, and timeout is how long a
+#   probe can take before it fails, both in seconds
+# - failures is how many checks in a row have to fail before the job counts
+#   as unhealthy, and action is one of ACTIONS
+HealthCheck = namedtuple('HealthCheck', ['kind', 'target', 'interval',
+                                         'timeout', 'failures', 'action'])
+
+# The key that a job's next check is registered under in the ticker, which
+# keeps it apart from the job's restart timer
+CheckKey = namedtuple('CheckKey', ['job'])
+
+def read_positive(dct, key, default):
+    """
+    Reads a number from a dictionary, which has to be above zero.
+    """
+    value = dct.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError('{} must be a positive number'.format(key))
+    return value
+
+def from_dict(dct):
+    """
+    Reads a health check from a job's ``health-check`` configuration, which
+    has exactly one of the keys ``exec`` (a command), ``tcp`` (a port, or a
+    ``host:port`` string) or ``file`` (a path, along with ``max-age``), and
+    optionally ``interval``, ``timeout``, ``failures`` and ``on-failure``.
+
+    :return: A :class:`HealthCheck`.
+    :raises ValueError: If the health check is invalid.
+    """
+    if not isinstance(dct, dict):
+        raise ValueError('health-check must be a dictionary')
+
+    kinds = [kind for kind in CHECK_KINDS if kind in dct]
+    if len(kinds) != 1:
+        raise ValueError('health-check needs exactly one of: {}'.format(
+            ', '.join(CHECK_KINDS)))
+    kind = kinds[0]
+
+    if kind == CHECK_EXEC:
+        target = dct[CHECK_EXEC]
+        if not isinstance(target, str) or not target.strip():
+            raise ValueError('exec must be a command')
+    elif kind == CHECK_TCP:
+        address = dct[CHECK_TCP]
+        if isinstance(address, int) and not isinstance(address, bool):
+            target = ('localhost', address)
+        elif isinstance(address, str) and ':' in address:
+            host, _, port = address.rpartition(':')
+            target = (host, int(port))
+        else:
+            raise ValueError('tcp must be a port or "host:port"')
+    else:
+        path = dct[CHECK_FILE]
+        if not isinstance(path, str):
+            raise ValueError('file must be a path')
+        target = (path, read_positive(dct, 'max-age', None))
+
+    interval = read_positive(dct, 'interval', DEFAULT_INTERVAL)
+    timeout = read_positive(dct, 'timeout', DEFAULT_TIMEOUT)
+
+    failures = dct.get('failures', DEFAULT_FAILURES)
+    if isinstance(failures, bool) or not isinstance(failures, int) or failures < 1:
+        raise ValueError('failures must be at least 1')
+
+    action = dct.get('on-failure', ACTION_RESTART)
+    if action not in ACTIONS:
+        raise ValueError('on-failure must be one of: {}'.format(
+            ', '.join(ACTIONS)))
+
+    return HealthCheck(kind, target, interval, timeout, failures, action)
+
+def probe_exec(command, timeout):
+    """
+    Runs a probe command, killing it (and anything it started) if it takes
+    too long.
+
+    :return: A tuple of ``(passed, message)``.
+    """
+    if monitor.needs_shell(command):
+        argv = ['/bin/sh', '-c', command]
+    else:
+        argv = command.split()
+
+    probe = subprocess.Popen(argv, stdin=subprocess.DEVNULL,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             start_new_session=True)
+    try:
+        output, _ = probe.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        try:
+            os.killpg(probe.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        probe.communicate()
+        return False, 'Probe timed out after {}s'.format(timeout)
+
+    if probe.returncode == 0:
+        return True, None
+
+    output = output.decode('utf-8', 'replace').strip()[-MESSAGE_LENGTH:]
+    message = 'Probe exited with status {}'.format(probe.returncode)
+    return False, message + (': ' + output if output else '')
+
+def probe_tcp(address, timeout):
+    """
+    Connects to a port, and disconnects straight away.
+
+    :return: A tuple of ``(passed, message)``.
+    """
+    try:
+        socket.create_connection(address, timeout=timeout).close()
+        return True, None
+    except OSError as ex:
+        return False, 'Cannot connect to {}:{} - {}'.format(
+            address[0], address[1], ex)
+
+def probe_file(path, max_age):
+    """
+    Checks that a file was modified recently.
+
+    :return: A tuple of ``(passed, message)``.
+    """
+    try:
+        age = time.time() - os.stat(path).st_mtime
+    except OSError as ex:
+        return False, 'Cannot check {} - {}'.format(path, ex.strerror)
+
+    if age > max_age:
+        return False, '{} was last modified {:.0f}s ago'.format(path, age)
+    return True, None
+
+def run_probe(check):
+    """
+    Runs a health check once.
+
+    :param HealthCheck check: The check to run.
+    :return: A tuple of ``(passed, message)``, where the message says why \
+    the check failed (and is ``None`` if it passed).
+    """
+    try:
+        if check.kind == CHECK_EXEC:
+            return probe_exec(check.target, check.timeout)
+        elif check.kind == CHECK_TCP:
+            return probe_tcp(check.target, check.timeout)
+        else:
+            return probe_file(*check.target)
+    except OSError as ex:
+        return False, 'Cannot run probe - {}'.format(ex)
+
+class HealthChecker:
+    """
+    Runs health checks in a pool of worker threads, and reports their results
+    through a callback.
+
+    :param callback: Called with the job, the PID that was checked, whether \
+    the check passed, and why it failed (or ``None``).
+    :param int workers: The most probes which can run at once.
+    """
+    def __init__(self, callback, workers=DEFAULT_WORKERS):
+        self.callback = callback
+        self.pool = ThreadPoolExecutor(max_workers=workers,
+                                       thread_name_prefix='health-check')
+        self.random = random.Random()
+
+    def next_check_time(self, check, now):
+        """
+        Works out when a job should next be checked.
+
+        :return: The absolute time of the next check.
+        """
+        return now + check.interval * self.random.uniform(1 - JITTER, 1 + JITTER)
+
+    def submit(self, job, pid, check):
+        """
+        Queues up a check of a job, which is run as soon as a worker is free.
+        """
+        def report(future):
+            if future.cancelled():
+                return
+
+            passed, message = future.result()
+            LOGGER.info('Health check of %s (PID %d): %s', job, pid,
+                        'passed' if passed else message)
+            self.callback(job, pid, passed, message)
+
+        try:
+            future = self.pool.submit(run_probe, check)
+        except RuntimeError:
+            # The pool has been shut down, so the supervisor is exiting
+            return
+
+        future.add_done_callback(report)
+
+    def terminate(self):
+        """
+        Stops running checks, dropping any which haven't started yet.
+        """
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def wait_for_exit(self):
+        """
+        Waits for the checks that are already running to finish.
+        """
+        self.pool.shutdown(wait=True)
@@ -0,0 +1,281 @@
+"""
+JobMon State Journal
+====================
+
+Remembers which processes the supervisor's jobs are running, so that a
+supervisor which dies (or is killed) doesn't lose track of them. When it is
+started again, it picks its jobs' processes back up rather than starting
+second copies of them.
+
+The journal is a file of JSON lines, each of which updates what is known about
+one job::
+
+    {"job": "web", "pid": 4122, "since": 1922473}
+    {"job": "web", "ready": 4122}
+    {"job": "web", "restarted": 1712345678.5}
+    {"job": "web", "pid": null}
+
+``since`` is when the process started, in clock ticks after boot (as the
+kernel reports it in ``/proc/PID/stat``). A PID can be reused once its process
+exits, so a process is only taken back if it has the same start time as the
+one that was recorded. A stopped job has a ``pid`` of ``null``, which also
+clears its start time and readiness, while ``restarted`` (the last time that
+the job was restarted, used for restart throttling) outlasts its process.
+
+Lines are only ever appended, each in a single write, so a supervisor that
+dies can at worst leave a partial line at the end, which is skipped when the
+journal is loaded. Once the lines greatly outnumber the jobs that they
+describe, the journal is compacted - rewritten with one line per job, and
+moved over the old one so that it is replaced all at once.
+"""
+from collections import namedtuple
+import json
+import logging
+import os
+
+LOGGER = logging.getLogger('jobmon.journal')
+
+# The journal is compacted once it has this many times more lines than the
+# jobs it remembers (plus some slack, so that a handful of jobs aren't
+# compacted every few starts)
+COMPACT_FACTOR = 4
+COMPACT_SLACK = 256
+
+# What the journal knows about a job - its process (or None if it isn't
+# running), when that process started, the process which reported that it was
+# ready (if it did) and when the job last restarted (or None)
+JobState = namedtuple('JobState', ['pid', 'since', 'ready', 'restarted'])
+
+STOPPED = JobState(None, None, None, None)
+
+def process_start_time(pid):
+    """
+    Finds out when a process started.
+
+    :return: The process' start time, in clock ticks after boot, or ``None`` \
+    if there is no such process. Processes which have exited but haven't \
+    been reaped yet still have one, so that a supervisor which takes over \
+    its own children (see :mod:`jobmon.handoff`) can reap them.
+    """
+    try:
+        with open('/proc/{}/stat'.format(pid), 'rb') as stat_file:
+            stat = stat_file.read()
+    except OSError:
+        return None
+
+    # The command name is in parentheses and can contain anything, including
+    # spaces and parentheses, so the fields are counted from after its end.
+    # What follows is the state (field 3) through to the start time (field 22)
+    fields = stat[stat.rfind(b')') + 2:].split()
+    try:
+        return int(fields[19])
+    except (IndexError, ValueError):
+        return None
+
+def is_running(pid, since):
+    """
+    Checks whether a process is still running - and is the same process,
+    rather than a new process which has been given the same PID.
+
+    :param int since: When the process started, as returned by \
+    :func:`process_start_time`, or ``None`` if that isn't known.
+    """
+    return since is not None and process_start_time(pid) == since
+
+def apply(state, record):
+    """
+    Updates a job's state with one line of the journal.
+
+    :param JobState state: What was known about the job before.
+    :param dict record: The line, without its job name.
+    :return: The new :class:`JobState`.
+    """
+    if 'pid' in record:
+        state = state._replace(pid=record['pid'], since=record.get('since'),
+                               ready=None)
+    if 'ready' in record:
+        state = state._replace(ready=record['ready'])
+    if 'restarted' in record:
+        state = state._replace(restarted=record['restarted'])
+    return state
+
+def load(path):
+    """
+    Reads a journal, skipping any lines which can't be read.
+
+    :param str path: Where the journal is.
+    :return: A tuple of the number of lines, and a :class:`dict` mapping \
+    each job's name onto its :class:`JobState`. Jobs which aren't running \
+    and have no restart history are left out.
+    """
+    states = {}
+    lines = 0
+    try:
+        with open(path, 'rb') as journal_file:
+            contents = journal_file.read()
+    except FileNotFoundError:
+        return 0, states
+
+    for line in contents.splitlines():
+        lines += 1
+        try:
+            record = json.loads(line.decode('utf-8'))
+            job = record.pop('job')
+            if not isinstance(job, str):
+                raise ValueError('job name is not a string')
+        except (ValueError, KeyError, AttributeError, TypeError):
+            LOGGER.warning('Skipping unreadable line %d of %s', lines, path)
+            continue
+
+        states[job] = apply(states.get(job, STOPPED), record)
+        if states[job] == STOPPED:
+            del states[job]
+
+    return lines, states
+
+def encode(records):
+    """
+    :return: The bytes of the journal lines for some records.
+    """
+    return ''.join(json.dumps(record, separators=(',', ':')) + '\n'
+                   for record in records).encode('utf-8')
+
+def to_record(job, state):
+    """
+    :return: A single journal line which sets a job's whole state.
+    """
+    record = {'job': job, 'pid': state.pid}
+    if state.since is not None:
+        record['since'] = state.since
+    if state.ready is not None:
+        record['ready'] = state.ready
+    if state.restarted is not None:
+        record['restarted'] = state.restarted
+    return record
+
+class Journal:
+    """
+    Keeps the journal of a running supervisor. This is only used by the
+    service thread, so it doesn't do any locking of its own.
+    """
+    def __init__(self, path):
+        """
+        Reads the journal left by the last supervisor, if there is one. It
+        isn't written to until :meth:`open` is called.
+
+        :param str path: Where the journal is kept.
+        """
+        self.path = path
+        self.lines, self.states = load(path)
+        self.fd = None
+
+    def open(self):
+        """
+        Compacts the journal, and opens it for adding to.
+        """
+        self.compact()
+
+    def close(self):
+        """
+        Stops writing to the journal.
+        """
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def get(self, job):
+        """
+        :return: What is known about a job, as a :class:`JobState`.
+        """
+        return self.states.get(job, STOPPED)
+
+    def is_alive(self, job):
+        """
+        Checks whether the process that a job was last running is still
+        running - and is the same process, rather than a new process which
+        has been given the same PID.
+        """
+        state = self.get(job)
+        return is_running(state.pid, state.since)
+
+    def started(self, job, pid):
+        """
+        Records that a job has started a new process. Adopted processes are
+        already in the journal, and are left as they are.
+        """
+        if self.get(job).pid != pid:
+            self.update(job, pid=pid, since=process_start_time(pid))
+
+    def ready(self, job, pid):
+        """
+        Records that a job's process has reported that it is ready.
+        """
+        self.update(job, ready=pid)
+
+    def restarted(self, job, when):
+        """
+        Records when a job was last restarted.
+        """
+        self.update(job, restarted=when)
+
+    def stopped(self, job):
+        """
+        Records that a job's process has exited.
+        """
+        if self.get(job).pid is not None:
+            self.update(job, pid=None)
+
+    def forget(self, job):
+        """
+        Removes everything known about a job, once it has been removed.
+        """
+        if job in self.states:
+            self.update(job, pid=None, restarted=None)
+
+    def update(self, job, **record):
+        """
+        Applies a change to a job's state, and adds it to the journal.
+        """
+        state = apply(self.get(job), record)
+        if state == STOPPED:
+            self.states.pop(job, None)
+        else:
+            self.states[job] = state
+
+        record['job'] = job
+        self.write([record])
+
+        if self.lines > COMPACT_FACTOR * (len(self.states) + COMPACT_SLACK):
+            self.compact()
+
+    def write(self, records):
+        """
+        Adds lines to the end of the journal.
+        """
+        if self.fd is None:
+            return
+
+        try:
+            os.write(self.fd, encode(records))
+            self.lines += len(records)
+        except OSError as ex:
+            LOGGER.error('Cannot write to journal %s - %s', self.path, ex)
+
+    def compact(self):
+        """
+        Replaces the journal with a single line for each job.
+        """
+        self.close()
+        temp_path = self.path + '.new'
+        records = [to_record(job, state) for job, state in self.states.items()]
+        try:
+            with open(temp_path, 'wb') as journal_file:
+                journal_file.write(encode(records))
+
+            os.replace(temp_path, self.path)
+            self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            self.lines = len(records)
+            LOGGER.info('Compacted journal %s to %d jobs', self.path,
+                        len(records))
+        except OSError as ex:
+            LOGGER.error('Cannot write journal %s - %s', self.path, ex)
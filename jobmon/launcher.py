@@ -9,22 +9,32 @@ this module will be something like the following::
     >>> config_handler = config.ConfigHandler
     >>> config_handler.load(SOME_FILE)
     >>> run(config_handler)
+
+It is also what a supervisor which re-executes itself runs, as
+``python -m jobmon.launcher CONFIG`` (see :mod:`jobmon.handoff`).
 """
 import logging
 import os
 import sys
+import threading
 
 from jobmon import (
-    daemon, service, command_server, event_server, status_server, ticker, util
+    config, daemon, forkserver, handoff, health, journal, limits, metrics,
+    monitor, notify, output, placement, service, command_server, event_server,
+    status_server, ticker, util, watcher
 )
 
-# Make sure that we get console logging before the supervisor becomes a
-# daemon, so if any errors occur before that, they can be seen
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s %(message)s')
-
 LOGGER = logging.getLogger('jobmon.launcher')
 
+def log_to_console():
+    """
+    Sends log messages to the console until the supervisor starts logging to
+    its own file, so that any errors from before it becomes a daemon can be
+    seen.
+    """
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(message)s')
+
 def run_daemon(config_handler, as_daemon=True):
     """
     Starts the supervisor daemon, passing to it the appropriate 
@@ -69,11 +79,26 @@ def run_fork(config_handler):
     else:
         return pid
 
-def execute_supervisor(config_handler):
+def uses_fork_server(config_handler):
+    """
+    Figures out whether any job needs the fork server.
+
+    :param config.ConfigHandler config_handler: The configuration.
+    :return: ``True`` if the fork server should be started.
+    """
+    if config_handler.spawn_method == monitor.SPAWN_FORK_SERVER:
+        return True
+
+    return any(job.spawn_method == monitor.SPAWN_FORK_SERVER
+               for job in config_handler.jobs.values())
+
+def execute_supervisor(config_handler, handed_over=None):
     """
     Runs the supervisor according to the given configuration.
 
     :param config.ConfigHandler config_handler: The configuration.
+    :param dict handed_over: What the supervisor that this one replaced \
+    left for it, as returned by :func:`handoff.receive`.
     """
     # Read the jobs and start up the supervisor, and then make sure to
     # die if we exit
@@ -83,39 +108,143 @@ def execute_supervisor(config_handler):
                             level=config_handler.log_level,
                             format='%(name)s %(asctime)s %(message)s')
 
+        # This has to come before the fork server is started, since the
+        # supervisor (and the fork server along with it) has to move out of the
+        # cgroup that the jobs' cgroups are created in
+        if handed_over is None:
+            handed_over = {}
+
+        cgroups = None
+        if handed_over.get('cgroup_root') is not None:
+            # The supervisor is already in the cgroup that it set up, which
+            # setting it up again would nest another cgroup inside of
+            cgroups = limits.CgroupManager(handed_over['cgroup_root'])
+        elif any(job.cgroup_limits is not None
+                 for job in config_handler.jobs.values()):
+            cgroups = limits.CgroupManager.setup(config_handler.cgroup_root)
+            if cgroups is None:
+                LOGGER.warning('cgroups are not available - jobs will only '
+                               'be limited by their rlimits')
+
+        # The fork server has to be started before any threads are, since
+        # forking a process with threads is asking for trouble
+        fork_server = None
+        if uses_fork_server(config_handler):
+            fork_server = forkserver.ForkServer()
+            fork_server.start()
+
+        if handed_over.get('fork_server') is not None:
+            # The last supervisor's fork server exits now that it's gone
+            reaper = threading.Thread(target=monitor.reap,
+                                      args=(handed_over['fork_server'],))
+            reaper.daemon = True
+            reaper.start()
 
         supervisor_shim = service.SupervisorShim()
-        events = event_server.EventServer(config_handler.event_port)
+        events = event_server.EventServer(config_handler.event_port,
+                                          config_handler.allowed_uids,
+                                          handed_over.get('events'))
 
         restart_svr = ticker.Ticker(supervisor_shim.on_job_timer_expire)
         commands = command_server.CommandServer(
-            config_handler.control_port, supervisor_shim)
+            config_handler.control_port, supervisor_shim,
+            config_handler.slow_request_threshold,
+            config_handler.allowed_uids, handed_over.get('commands'))
 
         status = status_server.StatusServer(supervisor_shim)
 
+        include_watcher = None
+        if config_handler.watch_includes:
+            include_globs = [config.expand_path_vars(include_glob)
+                             for include_glob in config_handler.includes]
+            try:
+                include_watcher = watcher.IncludeWatcher(
+                    include_globs, supervisor_shim.reload_job_file)
+            except OSError as ex:
+                LOGGER.warning('Cannot watch include-dirs - %s', ex)
+
+        # Jobs may still be using the last supervisor's pipes and socket,
+        # even if the configuration no longer needs them
+        output_capture = None
+        if 'output' in handed_over or any(
+                job.capture is not None or job.ring is not None
+                for job in config_handler.jobs.values()):
+            output_capture = output.OutputCapture(handed_over.get('output'))
+
+        # This is always running, since a job file which is loaded later on
+        # can add jobs which report their readiness
+        notify_server = notify.NotifyServer(supervisor_shim,
+                                            handed_over.get('notify'))
+
+        metrics_server = None
+        if config_handler.metrics_port is not None:
+            metrics_server = metrics.MetricsServer(config_handler.metrics_port)
+
+        # The checker's workers are only started once there are checks to
+        # run, so it costs nothing when no job has a health check
+        health_checker = health.HealthChecker(
+            supervisor_shim.on_health_check_done,
+            config_handler.health_check_workers)
+
+        state_journal = None
+        if config_handler.state_file is not None:
+            state_journal = journal.Journal(config_handler.state_file)
+
         supervisor = service.SupervisorService(
-                config_handler, events, status, restart_svr)
+                config_handler, events, status, restart_svr, include_watcher,
+                fork_server, output_capture, cgroups,
+                placement.CpuAllocator(), metrics_server, health_checker,
+                notify_server, state_journal, handed_over.get('service'))
 
         events.start()
-        commands.start()
+        if 'commands' not in handed_over:
+            commands.start()
         status.start()
         restart_svr.start()
+        if include_watcher is not None:
+            include_watcher.start()
+        if output_capture is not None:
+            output_capture.start()
+        notify_server.start()
+        if metrics_server is not None:
+            metrics_server.start()
         supervisor.start()
 
         # This has to be done last, since it starts up the autostart
         # jobs and gets the ball rolling
         supervisor_shim.set_service(supervisor)
+        if 'commands' in handed_over:
+            # The clients which were handed over may have commands waiting,
+            # which have to come after the service has taken over
+            commands.start()
 
         # The event server should be the last to terminate, since it
         # has to tell the outside world that we're gone
         LOGGER.info('Waiting for events to exit')
         events.wait_for_exit()
+
+        # The event server also stops when it is handed over to a new
+        # supervisor, which the service is about to re-execute into
+        supervisor.join()
     except Exception as ex:
         LOGGER.error('DEAD SUPERVISOR', exc_info=True)
     finally:
         LOGGER.info('Peace out!')
         os._exit(0)
 
+def main():
+    """
+    Runs the supervisor in the foreground, from the configuration file given
+    on the command line. This is how a supervisor which re-executes itself
+    is started, so that it takes over from the one that it replaced.
+    """
+    handed_over = handoff.receive()
+    log_to_console()
+
+    config_handler = config.ConfigHandler()
+    config_handler.load(sys.argv[1])
+    execute_supervisor(config_handler, handed_over)
+
 class SupervisorDaemon(daemon.Daemon):
     def run(self, config_handler):
         """
@@ -125,3 +254,6 @@ class SupervisorDaemon(daemon.Daemon):
         """
         LOGGER.info('Done daemonizing, launching supervisor')
         execute_supervisor(config_handler)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+JobMon Resource Limits
+======================
+
+Limits the resources that jobs can use, in two different ways:
+
+- rlimits are set in the child, just before it executes its command. These
+  are always available, but they only apply to each process individually.
+- If the supervisor has a cgroup v2 hierarchy delegated to it, then each job
+  with cgroup limits gets a cgroup of its own. These limit the job as a whole
+  (including anything that it forks), and also make it possible to signal
+  everything that the job started at once.
+
+cgroup v2 only allows controllers to be enabled for a cgroup's children if
+the cgroup itself has no processes in it. So, :meth:`CgroupManager.setup`
+moves the supervisor into a ``supervisor`` cgroup, and each job gets a cgroup
+next to that one::
+
+    <delegated cgroup>/
+        supervisor/
+        job-<name>/
+        ...
+"""
+from collections import namedtuple
+import logging
+import os
+import re
+import resource
+import signal
+import threading
+
+LOGGER = logging.getLogger('jobmon.limits')
+
+# The controllers that the supervisor needs for the limits it supports
+CGROUP_CONTROLLERS = ('cpu', 'memory', 'pids')
+
+# The period (in microseconds) used when a CPU limit is given as a number of
+# CPUs
+CPU_PERIOD = 100000
+
+# The limits placed upon a job's cgroup. Each of these is the value written
+# to the file of the same name (memory.max, cpu.max and pids.max), or None to
+# leave the limit at its default.
+CgroupLimits = namedtuple('CgroupLimits', ['memory_max', 'cpu_max', 'pids_max'])
+
+# Maps each of the resource.RLIMIT_* constants to the name used in the
+# configuration - for example, RLIMIT_NOFILE is 'nofile'
+RLIMIT_NAMES = {}
+for _name in sorted(dir(resource)):
+    if _name.startswith('RLIMIT_'):
+        RLIMIT_NAMES.setdefault(getattr(resource, _name),
+                                _name[len('RLIMIT_'):].lower())
+
+def get_rlimit(name):
+    """
+    Finds the rlimit with the given name.
+
+    :param str name: The name of the rlimit, such as ``nofile`` or ``as``.
+    :return: One of the ``resource.RLIMIT_*`` constants, or ``None`` if there \
+    is no such rlimit on this platform.
+    """
+    return getattr(resource, 'RLIMIT_' + name.upper(), None)
+
+def apply_rlimits(rlimits):
+    """
+    Sets the rlimits of the current process. This is meant to be called in a
+    freshly forked child, before it executes its command.
+
+    :param rlimits: A sequence of ``(rlimit, soft, hard)`` tuples.
+    """
+    for rlimit, soft, hard in rlimits:
+        resource.setrlimit(rlimit, (soft, hard))
+
+def join_cgroup(path):
+    """
+    Moves the current process into a cgroup.
+
+    :param str path: The directory of the cgroup.
+    """
+    procs = os.open(os.path.join(path, 'cgroup.procs'), os.O_WRONLY)
+    try:
+        os.write(procs, str(os.getpid()).encode('ascii'))
+    finally:
+        os.close(procs)
+
+def find_own_cgroup():
+    """
+    Finds the cgroup v2 directory that the current process is in.
+
+    :return: The path to the cgroup, or ``None`` if cgroup v2 isn't mounted.
+    """
+    mount_point = None
+    with open('/proc/self/mountinfo') as mountinfo:
+        for line in mountinfo:
+            # The filesystem type comes after the '-' separator, while the
+            # mount point is always the 5th field
+            fields = line.split()
+            separator = fields.index('-')
+            if fields[separator + 1] == 'cgroup2':
+                mount_point = fields[4]
+                break
+
+    if mount_point is None:
+        return None
+
+    with open('/proc/self/cgroup') as cgroups:
+        for line in cgroups:
+            hierarchy, _, path = line.rstrip('\n').split(':', 2)
+            if hierarchy == '0':
+                return os.path.normpath(
+                    os.path.join(mount_point, path.lstrip('/')))
+
+    return None
+
+class CgroupManager:
+    """
+    Creates and controls the cgroups of the supervisor's jobs.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.lock = threading.Lock()
+        self.cgroups = set()
+
+    @staticmethod
+    def setup(root=None):
+        """
+        Takes over a cgroup for the supervisor's jobs. This has to be done
+        before the fork server is started, so that the fork server ends up in
+        the supervisor's cgroup rather than in the delegated one.
+
+        :param str root: The delegated cgroup, or ``None`` to use the cgroup \
+        that the supervisor was started in.
+        :return: A :class:`CgroupManager`, or ``None`` if cgroup v2 isn't \
+        available or hasn't been delegated to the supervisor.
+        """
+        try:
+            if root is None:
+                root = find_own_cgroup()
+                if root is None:
+                    LOGGER.warning('cgroup v2 is not mounted')
+                    return None
+
+            with open(os.path.join(root, 'cgroup.controllers')) as controllers:
+                available = controllers.read().split()
+
+            missing = [controller for controller in CGROUP_CONTROLLERS
+                       if controller not in available]
+            if missing:
+                LOGGER.warning('cgroup "%s" does not have the controllers: %s',
+                               root, ', '.join(missing))
+                return None
+
+            supervisor_cgroup = os.path.join(root, 'supervisor')
+            os.makedirs(supervisor_cgroup, exist_ok=True)
+            join_cgroup(supervisor_cgroup)
+
+            with open(os.path.join(root, 'cgroup.subtree_control'), 'w') as subtree:
+                subtree.write(' '.join('+' + controller
+                                       for controller in CGROUP_CONTROLLERS))
+        except OSError as ex:
+            LOGGER.warning('Cannot use cgroup "%s" - %s', root, ex)
+            return None
+
+        LOGGER.info('Using cgroup "%s" for jobs', root)
+        return CgroupManager(root)
+
+    def get_cgroup(self, job, limits):
+        """
+        Creates the cgroup for a job if it doesn't exist, and sets its limits.
+
+        :param str job: The name of the job.
+        :param CgroupLimits limits: The limits to apply to the job.
+        :return: The path to the cgroup, or ``None`` if it could not be \
+        created.
+        """
+        path = os.path.join(self.root, 'job-' + re.sub(r'[^\w.-]', '_', job))
+        try:
+            os.makedirs(path, exist_ok=True)
+            for filename, value in (('memory.max', limits.memory_max),
+                                    ('cpu.max', limits.cpu_max),
+                                    ('pids.max', limits.pids_max)):
+                with open(os.path.join(path, filename), 'w') as limit_file:
+                    limit_file.write('max' if value is None else str(value))
+        except OSError as ex:
+            LOGGER.warning('Cannot set up cgroup for %s - %s', job, ex)
+            return None
+
+        with self.lock:
+            self.cgroups.add(path)
+        return path
+
+    def get_processes(self, path):
+        """
+        :return: The PIDs of every process in a cgroup.
+        """
+        with open(os.path.join(path, 'cgroup.procs')) as procs:
+            return [int(pid) for pid in procs.read().split()]
+
+    def signal(self, path, sig):
+        """
+        Sends a signal to every process in a cgroup. SIGKILL is sent via
+        ``cgroup.kill`` where the kernel supports it, which (unlike signalling
+        each process in turn) can't miss processes that are in the middle of
+        forking.
+
+        :param str path: The directory of the cgroup.
+        :param int sig: The signal to send.
+        :return: ``True`` if the cgroup was signalled, ``False`` if it could \
+        not be.
+        """
+        try:
+            kill_file = os.path.join(path, 'cgroup.kill')
+            if sig == signal.SIGKILL and os.path.exists(kill_file):
+                with open(kill_file, 'w') as kill:
+                    kill.write('1')
+                return True
+
+            for pid in self.get_processes(path):
+                try:
+                    os.kill(pid, sig)
+                except ProcessLookupError:
+                    pass
+            return True
+        except OSError as ex:
+            LOGGER.warning('Cannot signal cgroup "%s" - %s', path, ex)
+            return False
+
+    def cleanup(self):
+        """
+        Removes the cgroups of every job. This should only be done once all of
+        the jobs have stopped.
+        """
+        with self.lock:
+            cgroups, self.cgroups = self.cgroups, set()
+
+        for path in cgroups:
+            try:
+                os.rmdir(path)
+            except OSError as ex:
+                LOGGER.warning('Cannot remove cgroup "%s" - %s', path, ex)
@@ -0,0 +1,354 @@
+"""
+JobMon Metrics
+==============
+
+Keeps track of what the supervisor itself is doing, and serves it over HTTP
+in the Prometheus text format. The metrics are updated by the parts of the
+supervisor as things happen, so answering a scrape only means formatting the
+current values - it never has to look at the jobs themselves.
+
+The metrics live in :data:`REGISTRY`, and are always kept up to date, whether
+or not a :class:`MetricsServer` is running::
+
+    >>> JOB_STARTS.inc('my-job')
+    >>> print(REGISTRY.render())
+"""
+import bisect
+import http.server
+import logging
+import select
+import threading
+
+from jobmon import util
+
+LOGGER = logging.getLogger('jobmon.metrics')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# The upper bounds (in seconds) of the histogram buckets used for latencies,
+# which go from a tenth of a millisecond to a few seconds
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def format_labels(names, values, extra=()):
+    """
+    Formats a set of labels the way they appear after a metric's name.
+    """
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                                         .replace('"', '\\"')
+                                         .replace('\n', '\\n'))
+        for name, value in pairs) + '}'
+
+def format_value(value):
+    """
+    Formats a sample value, which Prometheus wants as a float.
+    """
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+def bucket_quantile(quantile, bounds, counts):
+    """
+    Estimates a quantile from a histogram's buckets, the same way as
+    Prometheus' ``histogram_quantile`` - by assuming that the observations in
+    each bucket are spread evenly across it.
+
+    :param float quantile: The quantile, between 0 and 1.
+    :param bounds: The upper bounds of the buckets, not including ``+Inf``.
+    :param counts: How many observations fell into each bucket (not \
+    cumulative), including the ``+Inf`` bucket.
+    :return: The estimated quantile, or ``None`` if there are no observations.
+    """
+    total = sum(counts)
+    if total == 0:
+        return None
+
+    rank = quantile * total
+    seen = 0
+    lower = 0
+    for bound, count in zip(bounds, counts):
+        if count and seen + count >= rank:
+            return lower + (bound - lower) * (rank - seen) / count
+        seen += count
+        lower = bound
+
+    # Anything beyond the last bucket can't be placed any more precisely
+    return bounds[-1]
+
+class Metric:
+    """
+    A named value, or a family of values which are told apart by their
+    labels. Each distinct set of label values is kept separately.
+    """
+    TYPE = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def remove(self, *label_values):
+        """
+        Forgets the value with the given labels, such as when a job has been
+        removed.
+        """
+        with self.lock:
+            self.values.pop(label_values, None)
+
+    def samples(self):
+        """
+        :return: A list of ``(name, labels, value)`` tuples, where the labels \
+        are already formatted.
+        """
+        with self.lock:
+            values = list(self.values.items())
+
+        return [(self.name, format_labels(self.label_names, label_values), value)
+                for label_values, value in sorted(values)]
+
+    def render(self):
+        """
+        :return: The lines describing this metric in the text format.
+        """
+        lines = ['# HELP {} {}'.format(self.name, self.help_text),
+                 '# TYPE {} {}'.format(self.name, self.TYPE)]
+        for name, labels, value in self.samples():
+            lines.append('{}{} {}'.format(name, labels, format_value(value)))
+        return lines
+
+class Counter(Metric):
+    """
+    A value which only ever goes up.
+    """
+    TYPE = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+class Gauge(Metric):
+    """
+    A value which can go up and down. Instead of being set, a gauge without
+    labels can be given a function which is called whenever it is scraped -
+    this is only meant for values which are cheap to find, like the size of a
+    queue.
+    """
+    TYPE = 'gauge'
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self.function = None
+
+    def set(self, value, *label_values):
+        with self.lock:
+            self.values[label_values] = value
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set_function(self, function):
+        """
+        :param function: Returns the gauge's value, or ``None`` to stop \
+        calling a function.
+        """
+        self.function = function
+
+    def samples(self):
+        function = self.function
+        if function is not None:
+            return [(self.name, '', function())]
+
+        return super().samples()
+
+class Histogram(Metric):
+    """
+    Counts observations (such as latencies) into buckets, and keeps their sum.
+    """
+    TYPE = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        # Only the bucket that the value falls into is counted here - the
+        # buckets are made cumulative when they are rendered
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            if label_values not in self.values:
+                self.values[label_values] = [[0] * (len(self.buckets) + 1), 0, 0]
+
+            counts = self.values[label_values]
+            counts[0][index] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    def snapshot(self):
+        """
+        :return: A :class:`dict` mapping each set of label values to a tuple \
+        of ``(bucket counts, sum, count)``. The bucket counts are not \
+        cumulative, and the last is the ``+Inf`` bucket.
+        """
+        with self.lock:
+            return {label_values: (list(buckets), total, count)
+                    for label_values, (buckets, total, count)
+                    in self.values.items()}
+
+    def samples(self):
+        samples = []
+        for label_values, (buckets, total, count) in sorted(
+                self.snapshot().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),),
+                                           buckets):
+                cumulative += bucket_count
+                samples.append((
+                    self.name + '_bucket',
+                    format_labels(self.label_names, label_values,
+                                  [('le', format_value(bound))]),
+                    cumulative))
+
+            labels = format_labels(self.label_names, label_values)
+            samples.append((self.name + '_sum', labels, total))
+            samples.append((self.name + '_count', labels, count))
+
+        return samples
+
+class Registry:
+    """
+    The collection of metrics served by the :class:`MetricsServer`.
+    """
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        """
+        Adds a metric to the registry.
+
+        :return: The metric.
+        """
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        :return: Every metric, in the Prometheus text format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+JOB_STARTS = REGISTRY.register(Counter(
+    'jobmon_job_starts_total', 'Times that each job has started.', ['job']))
+JOB_STOPS = REGISTRY.register(Counter(
+    'jobmon_job_stops_total', 'Times that each job has stopped.', ['job']))
+JOB_RESTARTS = REGISTRY.register(Counter(
+    'jobmon_job_restarts_total',
+    'Times that each job has been restarted automatically.', ['job']))
+JOBS_RUNNING = REGISTRY.register(Gauge(
+    'jobmon_jobs_running', 'Jobs which are currently running.'))
+JOBS_THROTTLED = REGISTRY.register(Gauge(
+    'jobmon_jobs_throttled',
+    'Jobs which are waiting out their restart backoff.'))
+COMMAND_LATENCY = REGISTRY.register(Histogram(
+    'jobmon_command_latency_seconds',
+    'Time taken to answer each kind of command.', ['command']))
+COMMAND_STAGE_LATENCY = REGISTRY.register(Histogram(
+    'jobmon_command_stage_latency_seconds',
+    'Time that each kind of command spends in each stage of being answered.',
+    ['command', 'stage']))
+EVENT_FANOUT_LATENCY = REGISTRY.register(Histogram(
+    'jobmon_event_fanout_latency_seconds',
+    'Time taken to send an event to every subscriber.'))
+EVENT_SUBSCRIBERS = REGISTRY.register(Gauge(
+    'jobmon_event_subscribers', 'Clients connected to the event server.'))
+SERVICE_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'jobmon_service_queue_depth',
+    'Requests waiting to be handled by the service.'))
+TICKER_TIMERS = REGISTRY.register(Gauge(
+    'jobmon_ticker_timers', 'Timers waiting to expire in the tickers.'))
+HEALTH_CHECK_FAILURES = REGISTRY.register(Counter(
+    'jobmon_health_check_failures_total',
+    'Health checks that each job has failed.', ['job']))
+JOBS_UNHEALTHY = REGISTRY.register(Gauge(
+    'jobmon_jobs_unhealthy', 'Running jobs which are failing health checks.'))
+
+# The metrics which are labelled by job, and have to be cleaned up once a job
+# is gone
+JOB_METRICS = (JOB_STARTS, JOB_STOPS, JOB_RESTARTS, HEALTH_CHECK_FAILURES)
+
+def forget_job(job):
+    """
+    Removes the values of a job which has been removed (or scaled away), so
+    that it doesn't stay in the metrics forever.
+    """
+    for metric in JOB_METRICS:
+        metric.remove(job)
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answers scrapes of ``/metrics`` with the contents of the registry.
+    """
+    # Scrapers which connect and then go quiet shouldn't hold up the server
+    timeout = 5
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        LOGGER.debug('%s - %s', self.address_string(), format % args)
+
+class MetricsServer(threading.Thread, util.TerminableThreadMixin):
+    """
+    Serves the metrics over HTTP, on localhost only.
+    """
+    def __init__(self, port, registry=REGISTRY):
+        threading.Thread.__init__(self)
+        util.TerminableThreadMixin.__init__(self)
+
+        LOGGER.info('Binding metrics to localhost:%d', port)
+        self.server = http.server.HTTPServer(('localhost', port),
+                                             MetricsRequestHandler)
+        self.server.registry = registry
+
+    @util.log_crashes(LOGGER, 'Metrics server error')
+    def run(self):
+        """
+        Answers requests until the server is terminated.
+        """
+        while True:
+            readers, _, _ = select.select(
+                [self.server.socket, self.exit_reader], [], [])
+
+            if self.exit_reader in readers:
+                break
+
+            if self.server.socket in readers:
+                self.server.handle_request()
+
+        LOGGER.info('Closing...')
+        self.cleanup()
+        self.server.server_close()
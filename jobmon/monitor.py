@@ -16,16 +16,139 @@ The event queue (``THE_EVENT_QUEUE`` in the example) receives two kinds of
 events from the child process - :class:`ProcStart` indicates that a process has
 been started, while :class:`ProcStop` indicates that a process has stopped.
 """
+from collections import namedtuple
 import logging
 import os
+import select
 import signal
 import sys
 import threading
+import time
+from types import MappingProxyType
 
-from jobmon import protocol, util
+from jobmon import limits, notify, output, placement, protocol, util
 
 LOGGER = logging.getLogger('supervisor.child-process')
 
+# The ways that a child process can be launched. Forking is the traditional
+# way, while posix_spawn avoids copying the supervisor (which can be large,
+# and has many threads) into the child. The fork server avoids both, by having
+# a small helper process (see jobmon.forkserver) do the forking.
+SPAWN_FORK, SPAWN_POSIX_SPAWN, SPAWN_FORK_SERVER = (
+    'fork', 'posix-spawn', 'fork-server')
+SPAWN_METHODS = (SPAWN_FORK, SPAWN_POSIX_SPAWN, SPAWN_FORK_SERVER)
+
+# If a command contains any of these characters, or starts with one of these
+# words (or a variable assignment), then it has to be run by /bin/sh -
+# otherwise, it can be split on whitespace and executed directly.
+SHELL_CHARS = set('|&;<>()$`\\"\'*?[]#~{}!\n')
+SHELL_WORDS = {
+    '.', ':', 'alias', 'break', 'case', 'cd', 'continue', 'eval', 'exec',
+    'exit', 'export', 'for', 'if', 'read', 'readonly', 'return', 'set',
+    'shift', 'source', 'times', 'trap', 'ulimit', 'umask', 'unset', 'until',
+    'wait', 'while',
+}
+
+# Everything needed to launch a job, which is worked out once when the job is
+# configured. 'argv' is the exact argument list to execute, and 'env' is the
+# complete environment of the child (the supervisor's, plus the job's).
+# 'rlimits' is a tuple of (rlimit, soft, hard) and 'cgroup' is the path to the
+# job's cgroup (or None), both of which are applied in the child before exec.
+# 'placement' is the job's placement.Placement - in the compiled plan, its CPUs
+# may be placement.AUTO_CPUS, which are replaced by real ones on each start.
+SpawnPlan = namedtuple('SpawnPlan', ['argv', 'env', 'stdin', 'stdout',
+                                     'stderr', 'working_dir', 'exit_signal',
+                                     'spawn_method', 'rlimits', 'cgroup',
+                                     'placement'])
+
+# How often a process which was started by an earlier supervisor is checked
+# on, when it can't be waited for with a pidfd
+ADOPTED_POLL_INTERVAL = 1.0
+
+# Held while a child is reaped and its exit is reported. The service takes
+# this (and never gives it back) before re-executing the supervisor, so that
+# children which exit in the meantime are left for the new supervisor to reap,
+# rather than having their exits reported to a supervisor that is going away.
+REAP_LOCK = threading.RLock()
+
+def needs_shell(command):
+    """
+    Figures out whether a command uses any shell syntax, or if it is a plain
+    list of words which can be executed without involving ``/bin/sh``.
+
+    :param str command: The command to check.
+    :return: ``True`` if the command has to be run by a shell.
+    """
+    words = command.split()
+    if not words or words[0] in SHELL_WORDS or '=' in words[0]:
+        return True
+
+    return any(char in SHELL_CHARS for char in command)
+
+def wait_for_child(pid):
+    """
+    Waits for a child process to exit, without reaping it.
+    """
+    while True:
+        try:
+            os.waitid(os.P_PID, pid, os.WEXITED | os.WNOWAIT)
+            return
+        except ChildProcessError:
+            return
+        except InterruptedError:
+            pass
+
+def reap(pid):
+    """
+    Reaps a process which has exited, if it is a child of this one.
+
+    :return: The process' exit status, as returned by ``waitpid``, or \
+    ``None`` if it isn't a child of this process.
+    """
+    try:
+        _, status = os.waitpid(pid, 0)
+        return status
+    except ChildProcessError:
+        return None
+
+def wait_for_exit(pid):
+    """
+    Waits for a process to exit, whether or not it is a child of this one -
+    this covers processes which were started by an earlier supervisor, which
+    has since been replaced. The process isn't reaped, which is left to
+    :func:`reap`.
+    """
+    try:
+        pidfd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        pidfd = None
+    except (AttributeError, OSError):
+        # Without pidfds (before Linux 5.3), the only way to tell when a
+        # process that isn't ours exits is to keep checking for it
+        while True:
+            try:
+                result = os.waitid(os.P_PID, pid,
+                                   os.WEXITED | os.WNOHANG | os.WNOWAIT)
+                if result is not None:
+                    return
+            except ChildProcessError:
+                pass
+
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                return
+            except PermissionError:
+                pass
+            time.sleep(ADOPTED_POLL_INTERVAL)
+
+    if pidfd is not None:
+        try:
+            # The pidfd becomes readable once the process exits
+            select.select([pidfd], [], [])
+        finally:
+            os.close(pidfd)
+
 class AtomicBox:
     """
     A value, which can only be accessed by one thread at a time.
@@ -70,6 +193,39 @@ class ChildProcess:
         self.env = {}
         self.working_dir = None
         self.exit_signal = signal.SIGTERM
+        self.spawn_method = SPAWN_FORK
+        self.fork_server = None
+        self.capture = None
+        self.ring = None
+        self.output_capture = None
+        self.rlimits = ()
+        self.cgroup_limits = None
+        self.cgroups = None
+        self.placement = placement.NO_PLACEMENT
+        self.cpu_allocator = None
+        self.health_check = None
+        self.notify = False
+        self.notify_socket = None
+        self.requires = ()
+        self.after = ()
+        self.schedule = None
+        self.shutdown_timeout = None
+
+        # The CPUs given to the current child by the CPU allocator, which are
+        # given back when it exits
+        self.allocated_cpus = None
+
+        # How the last child exited - the status is as returned by waitpid()
+        # (or None if it isn't known), and the child counts as stopped if it
+        # was asked to exit via :meth:`kill`
+        self.exit_status = None
+        self.was_stopped = False
+
+        # The plan is compiled the first time it's needed, and thrown away
+        # whenever the job is reconfigured. The running plan is the one that
+        # the current child was started with.
+        self.spawn_plan = None
+        self.running_plan = None
 
         self.config(**config)
 
@@ -90,7 +246,32 @@ class ChildProcess:
           dictionary.
         - ``cwd`` sets the working directory of the child process.
         - ``sig`` sets the signal to send when terminating the child process.
+        - ``spawn`` sets how the child process is launched - this is one of
+          the values in :data:`SPAWN_METHODS`.
+        - ``capture`` is either ``None``, if the child writes directly to its
+          ``stdout`` and ``stderr`` files, or an :class:`output.RotationPolicy`
+          if the supervisor should write them on the child's behalf.
+        - ``ring`` is the size (in bytes) of the ring buffer that keeps the
+          child's most recent output, or ``None`` to not keep one.
+        - ``rlimits`` is a sequence of ``(rlimit, soft, hard)`` tuples, which
+          are set in the child before it executes its command.
+        - ``cgroup`` is either ``None``, or the :class:`limits.CgroupLimits`
+          of the cgroup that the child is run in.
+        - ``placement`` is the :class:`placement.Placement` of the child,
+          which controls its CPU affinity, nice level and I/O priority.
+        - ``health`` is either ``None``, or the :class:`health.HealthCheck`
+          that the supervisor runs while the child is running.
+        - ``notify`` is whether the child is given the supervisor's
+          notification socket, which it can report its readiness on.
+        - ``requires`` and ``after`` are the names of the jobs that this one
+          depends on - see :mod:`jobmon.dependencies`.
+        - ``schedule`` is either ``None``, or the :class:`schedule.Schedule`
+          that the supervisor starts the child on.
+        - ``shutdown_timeout`` is how long (in seconds) the child is given to
+          exit when the supervisor shuts down, before it is killed, or
+          ``None`` to use the supervisor's default.
         """
+        self.spawn_plan = None
         for config_name, config_value in config.items():
             if config_name == 'stdin':
                 self.stdin = config_value
@@ -104,10 +285,290 @@ class ChildProcess:
                 self.working_dir = config_value
             elif config_name == 'sig':
                 self.exit_signal = config_value
+            elif config_name == 'spawn':
+                if config_value not in SPAWN_METHODS:
+                    raise ValueError('No spawn method "{}"'.format(config_value))
+                self.spawn_method = config_value
+            elif config_name == 'capture':
+                self.capture = config_value
+            elif config_name == 'ring':
+                if config_value is not None and config_value <= 0:
+                    raise ValueError('Ring buffer size must be positive')
+                self.ring = config_value
+            elif config_name == 'rlimits':
+                self.rlimits = tuple(config_value)
+            elif config_name == 'cgroup':
+                self.cgroup_limits = config_value
+            elif config_name == 'placement':
+                self.placement = config_value
+            elif config_name == 'health':
+                self.health_check = config_value
+            elif config_name == 'notify':
+                self.notify = config_value
+            elif config_name == 'requires':
+                self.requires = tuple(config_value)
+            elif config_name == 'after':
+                self.after = tuple(config_value)
+            elif config_name == 'schedule':
+                self.schedule = config_value
+            elif config_name == 'shutdown_timeout':
+                if config_value is not None and config_value <= 0:
+                    raise ValueError('Shutdown timeout must be positive')
+                self.shutdown_timeout = config_value
             else:
                 raise NameError('No configuration option "{}"'.format(
                                 config_name))
 
+    def same_definition(self, other):
+        """
+        Checks whether another child process would be launched in exactly
+        the same way as this one.
+
+        :param ChildProcess other: The child process to compare against.
+        :return: ``True`` if the two definitions match, ``False`` otherwise.
+        """
+        return (self.program == other.program and
+                self.stdin == other.stdin and
+                self.stdout == other.stdout and
+                self.stderr == other.stderr and
+                self.env == other.env and
+                self.working_dir == other.working_dir and
+                self.exit_signal == other.exit_signal and
+                self.spawn_method == other.spawn_method and
+                self.capture == other.capture and
+                self.ring == other.ring and
+                self.rlimits == other.rlimits and
+                self.cgroup_limits == other.cgroup_limits and
+                self.placement == other.placement and
+                self.health_check == other.health_check and
+                self.notify == other.notify and
+                self.requires == other.requires and
+                self.after == other.after and
+                self.schedule == other.schedule and
+                self.shutdown_timeout == other.shutdown_timeout)
+
+    def update_from(self, other):
+        """
+        Replaces the definition of this child process with the definition of
+        another. If this child is currently running, it is not affected - the
+        new definition is used the next time that it is started.
+
+        :param ChildProcess other: The child process to copy from.
+        """
+        self.program = other.program
+        self.spawn_plan = None
+        self.config(stdin=other.stdin, stdout=other.stdout,
+                    stderr=other.stderr, env=other.env,
+                    cwd=other.working_dir, sig=other.exit_signal,
+                    spawn=other.spawn_method, capture=other.capture,
+                    ring=other.ring, rlimits=other.rlimits,
+                    cgroup=other.cgroup_limits, placement=other.placement,
+                    health=other.health_check, notify=other.notify,
+                    requires=other.requires, after=other.after,
+                    schedule=other.schedule,
+                    shutdown_timeout=other.shutdown_timeout)
+
+    def set_fork_server(self, fork_server):
+        """
+        Sets up the fork server used by the ``fork-server`` spawn method. If
+        no fork server is given, then those jobs fall back to forking.
+
+        :param forkserver.ForkServer fork_server: The fork server.
+        """
+        self.fork_server = fork_server
+
+    def set_cgroups(self, cgroups):
+        """
+        Sets up the cgroup manager used by jobs which have ``cgroup``
+        configured. If no cgroup manager is given, then those jobs are only
+        limited by their rlimits.
+
+        :param limits.CgroupManager cgroups: The cgroup manager.
+        """
+        self.cgroups = cgroups
+        self.spawn_plan = None
+
+    def set_cpu_allocator(self, cpu_allocator):
+        """
+        Sets up the CPU allocator used by jobs with an ``auto`` CPU affinity.
+        If no CPU allocator is given, then those jobs can run on any CPU.
+
+        :param placement.CpuAllocator cpu_allocator: The CPU allocator.
+        """
+        self.cpu_allocator = cpu_allocator
+
+    def set_notify_socket(self, address):
+        """
+        Sets up the notification socket given to jobs which have ``notify``
+        configured. If no address is given, then those jobs can't report
+        their readiness.
+
+        :param str address: The socket's address, as given in \
+        ``$NOTIFY_SOCKET``.
+        """
+        self.notify_socket = address
+        self.spawn_plan = None
+
+    def set_output_capture(self, output_capture):
+        """
+        Sets up the output capture used by jobs which have ``capture`` or
+        ``ring`` configured. If no output capture is given, those jobs write to
+        their files directly (and don't keep a ring buffer).
+
+        :param output.OutputCapture output_capture: The output capture.
+        """
+        self.output_capture = output_capture
+        self.spawn_plan = None
+
+    def get_output_paths(self):
+        """
+        Figures out where the child's standard output and error should go,
+        which are pipes to the supervisor if its output is being captured.
+
+        :return: A tuple of ``(stdout, stderr)`` paths.
+        """
+        if self.output_capture is None:
+            return self.stdout, self.stderr
+
+        if self.capture is None and self.ring is None:
+            return self.stdout, self.stderr
+
+        # Keeping a ring buffer means that the supervisor has to see the
+        # output, even if it isn't rotating the files
+        policy = self.capture or output.NO_ROTATION
+        ring = self.get_ring()
+
+        paths = []
+        for path in (self.stdout, self.stderr):
+            if path == os.devnull and ring is None:
+                paths.append(path)
+            else:
+                paths.append(self.output_capture.get_fifo(path, policy, ring))
+
+        return tuple(paths)
+
+    def get_ring(self):
+        """
+        Gets the ring buffer that keeps the child's most recent output.
+
+        :return: An :class:`output.RingBuffer`, or ``None`` if the child \
+        doesn't have one.
+        """
+        if self.ring is None or self.output_capture is None:
+            return None
+
+        return self.output_capture.get_ring(self.name, self.ring)
+
+    def get_recent_output(self, lines):
+        """
+        Gets the last few lines of output that the child wrote.
+
+        :param int lines: The most lines to return.
+        :return: A list of lines, or ``None`` if the child doesn't keep a \
+        ring buffer.
+        """
+        ring = self.get_ring()
+        if ring is None:
+            return None
+
+        # The child's last lines may still be in its pipe
+        if not self.output_capture.sync(ring):
+            LOGGER.warning('Output capture did not catch up with %s - its '
+                           'recent output may be incomplete', self.name)
+
+        recent_lines, _ = ring.tail(lines)
+        return recent_lines
+
+    def crashed(self):
+        """
+        Checks whether the last child exited on its own, with a failure.
+        """
+        return (not self.was_stopped and
+                self.exit_status is not None and
+                self.exit_status != 0)
+
+    def get_argv(self):
+        """
+        Figures out the argument list used to execute this job's command.
+
+        :return: A list of arguments, the first of which is the program.
+        """
+        if needs_shell(self.program):
+            return ['/bin/sh', '-c', self.program]
+        else:
+            return self.program.split()
+
+    def get_spawn_plan(self):
+        """
+        Gets the :class:`SpawnPlan` for this job, compiling it if the job has
+        been reconfigured since it was last compiled.
+
+        :return: A :class:`SpawnPlan`.
+        """
+        if self.spawn_plan is None:
+            self.spawn_plan = self.compile_spawn_plan()
+
+        return self.spawn_plan
+
+    def compile_spawn_plan(self):
+        """
+        Works out everything needed to launch this job - this is only done
+        when the job is configured, and reused for every start.
+
+        :return: A :class:`SpawnPlan`.
+        """
+        cgroup = None
+        if self.cgroup_limits is not None and self.cgroups is not None:
+            cgroup = self.cgroups.get_cgroup(self.name, self.cgroup_limits)
+
+        spawn_method = self.spawn_method
+        if spawn_method == SPAWN_POSIX_SPAWN and (self.rlimits or cgroup):
+            # posix_spawn can't run anything in the child before it executes,
+            # which is where the limits have to be applied
+            LOGGER.info('%s has resource limits - launching it with %s '
+                        'instead of %s', self.name, SPAWN_FORK, spawn_method)
+            spawn_method = SPAWN_FORK
+
+        argv = self.get_argv()
+        if spawn_method == SPAWN_POSIX_SPAWN and self.working_dir is not None:
+            # There is no portable posix_spawn file action for changing
+            # directories, so have a shell do it - it execs the command, so it
+            # doesn't stick around afterwards
+            argv = ['/bin/sh', '-c', 'cd -- "$1" && shift && exec "$@"',
+                    'sh', self.working_dir] + argv
+
+        env = dict(os.environ)
+        env.update(self.env)
+        if self.notify and self.notify_socket is not None:
+            env[notify.ENV_VAR] = self.notify_socket
+
+        stdout, stderr = self.get_output_paths()
+        plan = SpawnPlan(tuple(argv), MappingProxyType(env), self.stdin,
+                         stdout, stderr, self.working_dir,
+                         self.exit_signal, spawn_method, self.rlimits, cgroup,
+                         self.placement)
+
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug('Compiled spawn plan for %s', self.name)
+            LOGGER.debug('- command = "%s"', self.program)
+            LOGGER.debug('- argv = %s', list(plan.argv))
+            LOGGER.debug('- spawn method = %s', plan.spawn_method)
+            LOGGER.debug('- stdin = %s', plan.stdin)
+            LOGGER.debug('- sdout = %s', plan.stdout)
+            LOGGER.debug('- stderr = %s', plan.stderr)
+            LOGGER.debug('- rlimits = %s', plan.rlimits)
+            LOGGER.debug('- cgroup = %s', plan.cgroup)
+            LOGGER.debug('- placement = %s', placement.to_dict(plan.placement))
+            LOGGER.debug('- environment')
+            for var, value in self.env.items():
+                LOGGER.debug('* "%s" = "%s"', var, value)
+
+            LOGGER.debug('- working directory = %s',
+                plan.working_dir if plan.working_dir is not None
+                else os.getcwd())
+
+        return plan
+
     def start(self):
         """
         Launches the subprocess.
@@ -115,6 +576,129 @@ class ChildProcess:
         if self.child_pid.get() is not None:
             raise ValueError('Child process already running - cannot start another')
 
+        plan = self.get_spawn_plan()
+        self.exit_status = None
+        self.was_stopped = False
+
+        if plan.placement.cpus == placement.AUTO_CPUS:
+            self.allocated_cpus = self.allocate_cpus()
+            plan = plan._replace(
+                placement=plan.placement._replace(cpus=self.allocated_cpus))
+        use_fork_server = (plan.spawn_method == SPAWN_FORK_SERVER and
+                           self.fork_server is not None)
+
+        if use_fork_server:
+            try:
+                child_pid = self.fork_server_child(plan)
+            except TimeoutError:
+                LOGGER.warning('Fork server is not answering - forking %s '
+                               'directly', self.name)
+                use_fork_server = False
+                child_pid = self.fork_child(plan)
+        elif plan.spawn_method == SPAWN_POSIX_SPAWN:
+            child_pid = self.posix_spawn_child(plan)
+        else:
+            child_pid = self.fork_child(plan)
+
+        if child_pid is None:
+            # posix_spawn and the fork server report failures to us directly,
+            # rather than having the child die - make this look the same as a
+            # child which died immediately, so that the service treats it the
+            # same way
+            self.release_cpus()
+            self.event_sock.send(protocol.Event(self.name, protocol.EVENT_STARTJOB))
+            self.event_sock.send(protocol.Event(self.name, protocol.EVENT_STOPJOB))
+            return
+
+        self.running_plan = plan
+        self.child_pid.set(child_pid)
+        self.event_sock.send(protocol.Event(self.name, protocol.EVENT_STARTJOB))
+        LOGGER.info('Started %s at PID %d', self.name, child_pid)
+
+        if use_fork_server:
+            # The fork server is the parent of the child, so it is the only
+            # one who can wait on it
+            self.fork_server.watch(child_pid, self.child_exited)
+            return
+
+        @util.log_crashes(LOGGER, 'Error in child ' + self.name)
+        def wait_for_subprocess():
+            # Since waitpid() is synchronous (doing it asynchronously takes
+            # a good deal more work), the waiting is done in a worker thread
+            # whose only job is to wait until the child dies, and then to
+            # notify the parent.
+            #
+            # Although Linux pre-2.4 had issues with this (read waitpid(2)),
+            # this is fully compatible with POSIX.
+            LOGGER.info('Waiting on "%s"', self.program)
+            wait_for_child(child_pid)
+            with REAP_LOCK:
+                self.child_exited(reap(child_pid))
+
+        # Although it might seem like a waste to spawn a thread for each
+        # running child, they don't do much work (they basically block for
+        # their whole existence).
+        waiter_thread = threading.Thread(target=wait_for_subprocess)
+        waiter_thread.start()
+
+    def adopt(self, pid):
+        """
+        Takes charge of a process which is already running this job, such as
+        one that was started by an earlier supervisor. Its exit is noticed
+        the same way as any other child's, although its exit status is only
+        known if it is a child of this process.
+
+        :param int pid: The process' PID.
+        """
+        if self.child_pid.get() is not None:
+            raise ValueError('Child process already running - cannot adopt another')
+
+        self.running_plan = self.get_spawn_plan()
+        self.exit_status = None
+        self.was_stopped = False
+
+        self.child_pid.set(pid)
+        self.event_sock.send(protocol.Event(self.name, protocol.EVENT_STARTJOB))
+        LOGGER.info('Adopted %s at PID %d', self.name, pid)
+
+        @util.log_crashes(LOGGER, 'Error in child ' + self.name)
+        def wait_for_adopted():
+            wait_for_exit(pid)
+            with REAP_LOCK:
+                self.child_exited(reap(pid))
+
+        waiter_thread = threading.Thread(target=wait_for_adopted)
+        waiter_thread.start()
+
+    def child_exited(self, status=None):
+        """
+        Records that the child has died, and notifies the owner.
+
+        :param int status: The child's exit status, as returned by \
+        ``waitpid``, or ``None`` if it isn't known.
+        """
+        with REAP_LOCK:
+            LOGGER.info('"%s" died with status %s', self.program, status)
+            self.exit_status = status
+
+            # When a job is stopped, nothing that it started should outlive it
+            cgroup = self.running_plan.cgroup
+            if self.was_stopped and cgroup is not None:
+                self.cgroups.signal(cgroup, signal.SIGKILL)
+
+            self.release_cpus()
+            self.child_pid.set(None)
+            self.event_sock.send(
+                protocol.Event(self.name, protocol.EVENT_STOPJOB))
+
+    def fork_child(self, plan):
+        """
+        Launches the child by forking the supervisor and setting up the child's
+        environment before executing the command.
+
+        :param SpawnPlan plan: The plan to launch the child with.
+        :return: The PID of the child.
+        """
         # Since we're going to be redirecting stdout/stderr, we need to flush
         # these streams to prevent the child's logs from getting polluted
         sys.stdout.flush()
@@ -129,95 +713,199 @@ class ChildProcess:
                 # parent).
                 os.setsid()
 
+                # Move into the job's cgroup before doing anything else, so
+                # that everything the child does is accounted to the job
+                if plan.cgroup is not None:
+                    limits.join_cgroup(plan.cgroup)
+
                 # Put the proper file descriptors in to replace the standard
                 # streams
-                stdin = open(self.stdin)
-                stdout = open(self.stdout, 'a')
-                stderr = open(self.stderr, 'a')
+                stdin = os.open(plan.stdin, os.O_RDONLY)
+                stdout = os.open(plan.stdout, 
+                                 os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
+                stderr = os.open(plan.stderr, 
+                                 os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666)
 
-                os.dup2(stdin.fileno(), sys.stdin.fileno())
-                os.dup2(stdout.fileno(), sys.stdout.fileno())
-                os.dup2(stderr.fileno(), sys.stderr.fileno())
+                os.dup2(stdin, 0)
+                os.dup2(stdout, 1)
+                os.dup2(stderr, 2)
 
                 # (This only closes the original file descriptors, not the
                 #  copied ones, so the files are not lost)
-                stdin.close()
-                stdout.close()
-                stderr.close()
-
-                # Update the child's environment with whatever variables were
-                # given to us.
-                for key, value in self.env.items():
-                    os.environ[key] = value
+                for fd in (stdin, stdout, stderr):
+                    if fd > 2:
+                        os.close(fd)
 
                 # Change the directory to the preferred working directory for the
                 # child
-                if self.working_dir is not None:
-                    os.chdir(self.working_dir)
+                if plan.working_dir is not None:
+                    os.chdir(plan.working_dir)
+
+                placement.apply_placement(plan.placement)
 
-                # Run the child - to avoid keeping around an extra process, go
-                # ahead and pass the command to a subshell, which will replace
-                # this process
-                os.execvp('/bin/sh', ['/bin/sh', '-c', self.program])
+                # The limits are set last, so that they can't get in the way
+                # of setting up the child (for example, a low limit on open
+                # files)
+                limits.apply_rlimits(plan.rlimits)
+
+                # Run the child - to avoid keeping around an extra process, the
+                # command (or the subshell running it) replaces this process
+                os.execvpe(plan.argv[0], plan.argv, plan.env)
             finally: 
                 # Just in case we fail, we need to avoid exiting this routine.
                 # os._exit() is used here to avoid the SystemExit exception -
                 # unittest (stupidly) catches SystemExit, as raised by sys.exit(),
                 # which we need to avoid.
                 os._exit(1)
+
+        return child_pid
+
+    def posix_spawn_child(self, plan):
+        """
+        Launches the child via ``posix_spawn``, which avoids copying the
+        supervisor's address space. Everything that the child needs is
+        prepared here, and applied by the C library in the child.
+
+        :param SpawnPlan plan: The plan to launch the child with.
+        :return: The PID of the child, or ``None`` if it could not be started.
+        """
+        file_actions = [
+            (os.POSIX_SPAWN_OPEN, 0, plan.stdin, os.O_RDONLY, 0),
+            (os.POSIX_SPAWN_OPEN, 1, plan.stdout,
+                os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666),
+            (os.POSIX_SPAWN_OPEN, 2, plan.stderr,
+                os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o666),
+        ]
+
+        try:
+            child_pid = os.posix_spawnp(plan.argv[0], plan.argv, plan.env,
+                                        file_actions=file_actions, setsid=True)
+        except OSError as ex:
+            LOGGER.warning('Could not spawn "%s" - %s', self.program, ex)
+            return None
+
+        # The placement can't be applied in the child, but unlike the limits,
+        # it can be applied from the outside - there is a short window where
+        # the child runs without it, but it's inherited by anything the child
+        # starts afterwards
+        if plan.placement != placement.NO_PLACEMENT:
+            try:
+                placement.apply_placement(plan.placement, child_pid)
+            except OSError as ex:
+                LOGGER.warning('Could not place "%s" - %s', self.program, ex)
+
+        return child_pid
+
+    def fork_server_child(self, plan):
+        """
+        Launches the child by asking the fork server to do it.
+
+        :param SpawnPlan plan: The plan to launch the child with.
+        :return: The PID of the child, or ``None`` if it could not be started.
+        :raises TimeoutError: If the fork server didn't answer in time.
+        """
+        return self.fork_server.spawn(list(plan.argv), dict(plan.env),
+                                      plan.working_dir, plan.stdin,
+                                      plan.stdout, plan.stderr,
+                                      plan.rlimits, plan.cgroup,
+                                      plan.placement)
+
+    def allocate_cpus(self):
+        """
+        Picks the CPU for a child with an ``auto`` CPU affinity.
+
+        :return: A set of CPUs, or ``None`` to run on any CPU.
+        """
+        if self.cpu_allocator is None:
+            return None
+
+        return self.cpu_allocator.allocate()
+
+    def release_cpus(self):
+        """
+        Gives back any CPUs that the child got from the CPU allocator.
+        """
+        if self.allocated_cpus is not None:
+            self.cpu_allocator.release(self.allocated_cpus)
+            self.allocated_cpus = None
+
+    def change_placement(self, changes):
+        """
+        Changes the placement of the running child, and of every process that
+        it started, without restarting it. The job's configured placement is
+        not affected, so the next child is started with that.
+
+        :param placement.Placement changes: The parts of the placement to \
+        change - anything that is ``None`` is left as it is.
+        :raises ValueError: If the child isn't running.
+        :raises OSError: If the placement could not be applied.
+        """
+        child_pid = self.child_pid.get()
+        if child_pid is None:
+            raise ValueError('Child process not running - cannot place it')
+
+        if changes.cpus == placement.AUTO_CPUS:
+            old_cpus = self.allocated_cpus
+            self.allocated_cpus = self.allocate_cpus()
+            changes = changes._replace(cpus=self.allocated_cpus)
+            if old_cpus is not None:
+                self.cpu_allocator.release(old_cpus)
+        elif changes.cpus is not None:
+            self.release_cpus()
+
+        cgroup = self.running_plan.cgroup
+        if cgroup is not None:
+            pids = self.cgroups.get_processes(cgroup)
         else:
-            self.child_pid.set(child_pid)
-            self.event_sock.send(protocol.Event(self.name, protocol.EVENT_STARTJOB))
+            pids = placement.get_process_group(os.getpgid(child_pid))
 
-            LOGGER.info('Starting child process')
-            LOGGER.info('- command = "%s"', self.program)
-            LOGGER.info('- stdin = %s', self.stdin)
-            LOGGER.info('- sdout = %s', self.stdout)
-            LOGGER.info('- stderr = %s', self.stderr)
-            LOGGER.info('- environment')
-            for var, value in self.env.items():
-                LOGGER.info('* "%s" = "%s"', var, value)
+        # Every thread has its own affinity and priorities, so they all have
+        # to be changed - threads which exit in the meantime are skipped
+        for tid in placement.get_threads(pids):
+            try:
+                placement.apply_placement(changes, tid)
+            except ProcessLookupError:
+                pass
 
-            LOGGER.info('- working directory = %s',
-                self.working_dir if self.working_dir is not None
-                else os.getcwd())
+        LOGGER.info('Changed placement of %s to %s', self.name,
+                    placement.to_dict(changes))
+        self.running_plan = self.running_plan._replace(
+            placement=placement.merge(self.running_plan.placement, changes))
 
-            @util.log_crashes(LOGGER, 'Error in child ' + self.name)
-            def wait_for_subprocess():
-                # Since waitpid() is synchronous (doing it asynchronously takes
-                # a good deal more work), the waiting is done in a worker thread
-                # whose only job is to wait until the child dies, and then to
-                # notify the parent.
-                #
-                # Although Linux pre-2.4 had issues with this (read waitpid(2)),
-                # this is fully compatible with POSIX.
-                LOGGER.info('Waiting on "%s"', self.program)
-                os.waitpid(self.child_pid.get(), 0)
-                LOGGER.info('"%s" died', self.program)
-                self.child_pid.set(None)
-                self.event_sock.send(protocol.Event(self.name, protocol.EVENT_STOPJOB))
-
-            # Although it might seem like a waste to spawn a thread for each
-            # running child, they don't do much work (they basically block for
-            # their whole existence).
-            waiter_thread = threading.Thread(target=wait_for_subprocess)
-            waiter_thread.start()
-
-    def kill(self):
+    def kill(self, sig=None):
         """
         Signals the process with whatever signal was configured.
+
+        :param int sig: The signal to send instead, such as ``SIGKILL`` for \
+        a process which didn't exit when it was asked to.
         """
         child_pid = self.child_pid.get()
         if child_pid is not None:
-            LOGGER.info('Sending signal %d to "%s"', self.exit_signal, self.program)
+            # If the job was reconfigured while it was running, then the
+            # running child should get the signal it was configured with
+            exit_signal = self.running_plan.exit_signal if sig is None else sig
+            self.was_stopped = True
+            LOGGER.info('Sending signal %d to "%s"', exit_signal, self.program)
+
+            cgroup = self.running_plan.cgroup
+            if cgroup is not None and self.cgroups.signal(cgroup, exit_signal):
+                # The cgroup holds everything that the job started, even
+                # processes which have left its process group
+                LOGGER.info('Killed %s via its cgroup "%s"', self.name, cgroup)
+                return
 
             # Ensure all descendants of the process, not just the process itself,
             # die. This requires killing the process group.
             try:
                 proc_group = os.getpgid(child_pid)
+                if proc_group == os.getpgid(0):
+                    # A child which was only just forked may not have made
+                    # its own process group yet, and killing ours would take
+                    # down the supervisor (and whoever started it)
+                    raise OSError('Child is still in our process group')
 
                 LOGGER.info('Killing process group %d', proc_group)
-                os.killpg(proc_group, self.exit_signal)
+                os.killpg(proc_group, exit_signal)
                 LOGGER.info('Killed process group')
             except OSError:
                 # This happened once during the testing, and means that the
@@ -227,7 +915,7 @@ class ChildProcess:
                 # just bail.
                 try:
                     LOGGER.info('Failed to kill child group of "%s" - falling back on killing the child itself', self.name)
-                    os.kill(child_pid, self.exit_signal)
+                    os.kill(child_pid, exit_signal)
                 except OSError:
                     # So, *somehow*, the process isn't around, even though
                     # the variable state indicates it is. Obviously, the
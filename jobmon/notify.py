@@ -0,0 +1,181 @@
+"""
+JobMon Readiness Notifications
+==============================
+
+Receives ``sd_notify`` messages from jobs, so that they can say when they are
+actually ready rather than only that their process exists. Jobs with
+``notify`` set are given the address of the supervisor's notification socket
+in ``$NOTIFY_SOCKET``, which any ``sd_notify`` implementation (such as
+``systemd-notify`` or the ``sd_notify()`` function of libsystemd) can send to.
+
+The socket is a datagram socket in Linux's abstract namespace, so that it
+doesn't leave anything behind on the filesystem. Each message is a set of
+newline-separated ``KEY=VALUE`` assignments, of which these are understood:
+
+- ``READY=1`` means that the job has finished starting up.
+- ``STOPPING=1`` means that the job is shutting down, and so isn't ready any
+  more.
+- ``STATUS=...`` is a line of text describing what the job is doing.
+
+Messages are matched to jobs by the kernel's record of who sent them - they
+can come from the job's own process, or from any other process in its session
+(such as ``systemd-notify`` run from a shell script).
+"""
+import array
+import logging
+import os
+import select
+import socket
+import struct
+import threading
+
+from jobmon import util
+
+LOGGER = logging.getLogger('jobmon.notify')
+
+# The environment variable that jobs find the socket's address in
+ENV_VAR = 'NOTIFY_SOCKET'
+
+# The largest message that is read - the rest of a longer message is dropped
+MESSAGE_SIZE = 4096
+
+# How many file descriptors can be sent along with a message. They aren't
+# used, but systemd-notify sends one and waits for it to be closed, which
+# keeps it alive until its message has been matched to a job.
+MAX_FDS = 16
+
+# The credentials attached to each message, as a struct ucred
+UCRED = struct.Struct('iII')
+
+def parse_message(data):
+    """
+    Reads the assignments out of a notification.
+
+    :param bytes data: The notification, as it was received.
+    :return: A :class:`dict` mapping each key to its value.
+    """
+    fields = {}
+    for line in data.decode('utf-8', 'replace').split('\n'):
+        key, sep, value = line.partition('=')
+        if sep and key:
+            fields[key] = value
+    return fields
+
+class NotifyServer(threading.Thread, util.TerminableThreadMixin):
+    """
+    Receives notifications from jobs, and passes them on to the supervisor
+    along with the process that sent them.
+
+    :param supervisor: The shim, whose ``job_notify`` is called with the \
+    sender's PID, its session ID (or ``None`` if it has already exited), and \
+    the message's fields.
+    :param dict handed_over: The socket of the supervisor that this one \
+    replaced, as returned by :meth:`hand_over`, which jobs are still using.
+    """
+    def __init__(self, supervisor, handed_over=None):
+        threading.Thread.__init__(self)
+        util.TerminableThreadMixin.__init__(self)
+
+        self.supervisor = supervisor
+        self.keep_socket = False
+        if handed_over is not None:
+            self.address = handed_over['address']
+            self.sock = socket.socket(fileno=handed_over['fd'])
+            self.sock.setblocking(False)
+            return
+
+        # Abstract addresses are shared by everything in the same network
+        # namespace, which can include supervisors in other PID namespaces
+        self.address = 'jobmon-notify-{}-{}'.format(os.getpid(),
+                                                    os.urandom(4).hex())
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_PASSCRED, 1)
+        self.sock.setblocking(False)
+        self.sock.bind('\0' + self.address)
+
+    def get_address(self):
+        """
+        :return: The socket's address, in the form that ``$NOTIFY_SOCKET`` \
+        takes.
+        """
+        return '@' + self.address
+
+    def receive(self):
+        """
+        Reads one notification, and passes it on if it can be traced back to
+        a process.
+        """
+        try:
+            data, ancillary, _, _ = self.sock.recvmsg(
+                MESSAGE_SIZE,
+                socket.CMSG_SPACE(UCRED.size) +
+                socket.CMSG_SPACE(MAX_FDS * array.array('i').itemsize))
+        except BlockingIOError:
+            return
+
+        pid = None
+        fds = array.array('i')
+        for level, kind, cmsg_data in ancillary:
+            if level != socket.SOL_SOCKET:
+                continue
+
+            if kind == socket.SCM_CREDENTIALS:
+                pid, _, _ = UCRED.unpack(cmsg_data[:UCRED.size])
+            elif kind == socket.SCM_RIGHTS:
+                fds.frombytes(cmsg_data[:len(cmsg_data) -
+                                        (len(cmsg_data) % fds.itemsize)])
+
+        try:
+            if pid is None:
+                LOGGER.warning('Dropping notification without credentials')
+                return
+
+            try:
+                session = os.getsid(pid)
+            except OSError:
+                session = None
+
+            fields = parse_message(data)
+            LOGGER.info('Notification from PID %d (session %s): %s', pid,
+                        session, fields)
+            self.supervisor.job_notify(pid, session, fields)
+        finally:
+            # Closing these is what tells a waiting sender that its message
+            # has been dealt with
+            for fd in fds:
+                os.close(fd)
+
+    @util.log_crashes(LOGGER, 'Error in notify server')
+    def run(self):
+        """
+        Receives notifications until the server is terminated.
+        """
+        while True:
+            readers, _, _ = select.select([self.sock, self.exit_reader], [],
+                                          [])
+
+            if self.exit_reader in readers:
+                break
+
+            if self.sock in readers:
+                self.receive()
+
+        LOGGER.info('Closing...')
+        self.cleanup()
+        if not self.keep_socket:
+            self.sock.close()
+
+    def hand_over(self):
+        """
+        Stops receiving notifications, leaving the socket open for the
+        supervisor that replaces this one. Notifications which haven't been
+        read yet are left for it too.
+
+        :return: The socket and its address, as a :class:`dict` which can \
+        be given to the next server.
+        """
+        self.keep_socket = True
+        self.terminate()
+        self.wait_for_exit()
+        return {'fd': self.sock.fileno(), 'address': self.address}
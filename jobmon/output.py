@@ -0,0 +1,888 @@
+"""
+JobMon Output Capture
+=====================
+
+Captures the output of jobs which have ``capture-output`` enabled, so that the
+supervisor (rather than the job) writes it to disk. This lets the supervisor
+rotate the logs by size or age, and compress the old segments, without having
+to restart the job.
+
+Jobs can also keep a :class:`RingBuffer` of their most recent output, which is
+a fixed-size file that is memory-mapped by both the supervisor and by clients
+(via :class:`RingReader`). This means that clients can read a job's recent
+output without going through the supervisor, or reading through the whole log.
+
+Each destination file gets a named pipe in a private directory, and the pipe's
+path is handed to the job in place of the destination file. This way, the
+capture works in the same way with every spawn method, since they only ever
+deal with paths. The supervisor holds both ends of each pipe open, so that the
+pipe survives the job restarting.
+
+The work is split up so that the slow parts can't hold anything else up:
+
+- The :class:`OutputCapture` thread drains the pipes, and buffers the data for
+  each destination in a :class:`LogSink`.
+- Each sink's buffer is written out (and rotated) by a pool of writer threads.
+  If a sink's buffer fills up because the disk is slow, its pipe stops being
+  read until the buffer is written out - this only slows down the jobs writing
+  to that destination, not the rest of the supervisor.
+- Rotated segments are compressed by a separate pool of threads.
+- Files are rotated by age even if nothing is written to them, since the
+  :class:`OutputCapture` thread checks their ages every
+  :data:`AGE_CHECK_INTERVAL` seconds.
+
+Since a ring buffer is written by copying into memory, it is written directly
+by the :class:`OutputCapture` thread.
+"""
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import gzip
+import logging
+import mmap
+import os
+import selectors
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+from jobmon import util
+
+LOGGER = logging.getLogger('jobmon.output')
+
+# How much is read from a pipe at once, and how much can be buffered for a
+# single destination before its pipe is paused
+READ_SIZE = 64 * 1024
+MAX_BUFFER = 256 * 1024
+
+# How often (in seconds) files are checked for having outlived their
+# rotation policy's max_age, since jobs may not write anything to them for
+# a while
+AGE_CHECK_INTERVAL = 1
+
+# How long (in seconds) to wait for the capture thread to catch up with a
+# job's output, before reading its ring buffer anyway
+SYNC_TIMEOUT = 1
+
+WRITER_THREADS = 2
+COMPRESS_THREADS = 1
+
+# How output is rotated:
+#
+# - max_size is the size (in bytes) that a file can reach before it is
+#   rotated, or None to never rotate by size
+# - max_age is the time (in seconds) after which a file is rotated, or None to
+#   never rotate by age
+# - keep is how many rotated segments to keep around
+# - compress is whether the rotated segments should be gzipped
+RotationPolicy = namedtuple('RotationPolicy',
+                            ['max_size', 'max_age', 'keep', 'compress'])
+
+DEFAULT_ROTATION = RotationPolicy(None, None, 5, True)
+
+# Used when the output is only captured to fill a ring buffer
+NO_ROTATION = RotationPolicy(None, None, 0, False)
+
+# A ring buffer file starts with a header containing:
+#
+# - A magic number, to check that the file really is a ring buffer
+# - The capacity of the data area, which follows the header
+# - The number of bytes that have ever been written to the ring. There are two
+#   copies of this - the first is updated before new data is copied into the
+#   data area, and the second after. A reader can use the first to tell what
+#   was overwritten while it was reading, and the second to tell what is safe
+#   to read.
+RING_MAGIC = b'JMRB'
+RING_HEADER = struct.Struct('=4sIQQ')
+RING_COUNTER = struct.Struct('=Q')
+RESERVED_OFFSET = 8
+COMMITTED_OFFSET = 16
+
+# How often (in seconds) a followed ring buffer is checked for new data
+FOLLOW_INTERVAL = 0.25
+
+# One of the named pipes that jobs write their output to, along with both of
+# the supervisor's ends of it. Its output goes to a LogSink, a RingBuffer, or
+# both (either of them may be None). Once a pipe's ring buffer has been
+# replaced, the supervisor closes its write end (see OutputCapture.get_ring),
+# and handing the pipe over gives a write_fd of None.
+CapturePipe = namedtuple('CapturePipe', ['fifo', 'read_fd', 'write_fd',
+                                         'sink', 'ring'])
+
+def compress_segment(segment):
+    """
+    Gzips a rotated segment, and removes the uncompressed version.
+
+    :param str segment: The path to the segment.
+    """
+    try:
+        with open(segment, 'rb') as source:
+            with gzip.open(segment + '.gz.tmp', 'wb') as dest:
+                shutil.copyfileobj(source, dest)
+
+        os.rename(segment + '.gz.tmp', segment + '.gz')
+        os.remove(segment)
+    except OSError as ex:
+        # The segment may have been pruned before we got to it
+        LOGGER.warning('Could not compress "%s" - %s', segment, ex)
+
+class RingReader:
+    """
+    Reads the output kept in a ring buffer file. The file is mapped into
+    memory, so this never has to ask the supervisor for anything.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as ring_file:
+            self.map = mmap.mmap(ring_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, capacity, _, _ = RING_HEADER.unpack_from(self.map)
+        if magic != RING_MAGIC:
+            self.map.close()
+            raise ValueError('"{}" is not a ring buffer'.format(path))
+
+        self.path = path
+        self.capacity = capacity
+        self.data = memoryview(self.map)[RING_HEADER.size:]
+
+    def get_position(self):
+        """
+        :return: The number of bytes that have ever been written to the ring.
+        """
+        (position,) = RING_COUNTER.unpack_from(self.map, COMMITTED_OFFSET)
+        return position
+
+    def copy(self, start, end):
+        """
+        Copies the data between two positions out of the ring.
+        """
+        if start >= end:
+            return b''
+
+        first = start % self.capacity
+        last = first + (end - start)
+        if last <= self.capacity:
+            return bytes(self.data[first:last])
+        else:
+            return (bytes(self.data[first:]) +
+                    bytes(self.data[:last - self.capacity]))
+
+    def read(self, start=0):
+        """
+        Reads whatever is still in the ring, after the given position.
+
+        :param int start: The position returned by an earlier :meth:`read`, \
+        or 0 to read everything in the ring.
+        :return: A tuple of ``(data, position)``, where the position can be \
+        passed to the next :meth:`read` to get only the new data.
+        """
+        end = self.get_position()
+        start = max(start, end - self.capacity)
+        data = self.copy(start, end)
+
+        # The oldest part of what we copied may have been overwritten while
+        # we were copying it
+        (reserved,) = RING_COUNTER.unpack_from(self.map, RESERVED_OFFSET)
+        overwritten = reserved - self.capacity - start
+        if overwritten > 0:
+            data = data[overwritten:]
+
+        return data, end
+
+    def tail(self, lines):
+        """
+        Gets the last few lines in the ring.
+
+        :param int lines: The most lines to return.
+        :return: A tuple of ``(lines, position)``, where the lines are \
+        strings (without their line endings), and the position can be passed \
+        to :meth:`follow` or :meth:`read`.
+        """
+        data, position = self.read()
+        all_lines = data.decode('utf-8', 'replace').splitlines()
+
+        # Once the ring has wrapped around, the oldest line has probably been
+        # cut off
+        if position > self.capacity and all_lines:
+            all_lines.pop(0)
+
+        if lines <= 0:
+            return [], position
+        return all_lines[-lines:], position
+
+    def follow(self, position=None):
+        """
+        Yields new output as it is written to the ring, until the ring file
+        is removed (which happens when the supervisor exits).
+
+        :param int position: Where to start following from - by default, \
+        only output written after this is called is returned.
+        """
+        if position is None:
+            position = self.get_position()
+
+        while os.path.exists(self.path):
+            data, position = self.read(position)
+            if data:
+                yield data
+            else:
+                time.sleep(FOLLOW_INTERVAL)
+
+    def close(self):
+        self.data.release()
+        self.map.close()
+
+class RingBuffer(RingReader):
+    """
+    The supervisor's side of a ring buffer file, which holds the last
+    ``capacity`` bytes that a job has written. Only one thread may write to a
+    ring, but any number of threads or processes may read from it.
+    """
+    def __init__(self, path, capacity, reopen=False):
+        """
+        :param str path: Where the ring buffer file is.
+        :param int capacity: How many bytes the ring holds.
+        :param bool reopen: Whether to carry on with the existing file, \
+        rather than starting an empty one - this is used by a supervisor \
+        which takes over from another (see :mod:`jobmon.handoff`).
+        """
+        flags = os.O_RDWR if reopen else os.O_RDWR | os.O_CREAT | os.O_TRUNC
+        fd = os.open(path, flags, 0o600)
+        try:
+            if not reopen:
+                os.ftruncate(fd, RING_HEADER.size + capacity)
+            self.map = mmap.mmap(fd, 0)
+        finally:
+            os.close(fd)
+
+        self.path = path
+        self.capacity = capacity
+        self.position = 0
+        if reopen:
+            magic, capacity, _, self.position = RING_HEADER.unpack_from(
+                self.map)
+            if magic != RING_MAGIC or capacity != self.capacity:
+                self.map.close()
+                raise ValueError('"{}" is not a ring buffer of {} bytes'
+                                 .format(path, self.capacity))
+        else:
+            RING_HEADER.pack_into(self.map, 0, RING_MAGIC, capacity, 0, 0)
+
+        self.data = memoryview(self.map)[RING_HEADER.size:]
+
+    def write(self, data):
+        """
+        Adds some data to the ring, overwriting the oldest data if necessary.
+        """
+        end = self.position + len(data)
+        if len(data) > self.capacity:
+            data = data[-self.capacity:]
+
+        RING_COUNTER.pack_into(self.map, RESERVED_OFFSET, end)
+
+        start = (end - len(data)) % self.capacity
+        first = min(len(data), self.capacity - start)
+        self.data[start:start + first] = data[:first]
+        self.data[:len(data) - first] = data[first:]
+
+        RING_COUNTER.pack_into(self.map, COMMITTED_OFFSET, end)
+        self.position = end
+
+class LogSink:
+    """
+    Buffers the output meant for a single destination file, and writes it
+    out. :meth:`flush` is only ever run by one writer thread at a time.
+    """
+    def __init__(self, path, policy, compressors):
+        self.path = path
+        self.policy = policy
+        self.compressors = compressors
+
+        self.lock = threading.Lock()
+        self.chunks = []
+        self.size = 0
+
+        # Whether a flush is scheduled (or running), and which pipes were
+        # paused because the buffer was full
+        self.flushing = False
+        self.paused = []
+
+        self.file = None
+        self.opened_at = None
+
+    def append(self, data):
+        """
+        Adds some data to the buffer.
+
+        :return: ``True`` if there is room in the buffer for more data, \
+        ``False`` if the buffer is full.
+        """
+        with self.lock:
+            self.chunks.append(data)
+            self.size += len(data)
+            return self.size < MAX_BUFFER
+
+    def flush(self):
+        """
+        Writes out everything in the buffer, rotating the file if necessary.
+        """
+        with self.lock:
+            data = b''.join(self.chunks)
+            self.chunks = []
+            self.size = 0
+
+        if not data:
+            # Nothing new was written, but the file may have got too old
+            if self.file is not None and self.should_rotate():
+                self.rotate()
+            return
+
+        if self.file is None:
+            self.file = open(self.path, 'ab')
+            self.opened_at = time.time()
+
+        self.file.write(data)
+        self.file.flush()
+
+        if self.should_rotate():
+            self.rotate()
+
+    def should_rotate(self):
+        """
+        Checks whether the current file has outgrown the rotation policy.
+        """
+        policy = self.policy
+        if policy.max_size is not None and self.file.tell() >= policy.max_size:
+            return True
+
+        if (policy.max_age is not None and
+                time.time() - self.opened_at >= policy.max_age):
+            return True
+
+        return False
+
+    def is_expired(self):
+        """
+        Checks whether the current file has outlived the rotation policy's
+        ``max_age``, without needing anything to be written to it.
+        """
+        max_age = self.policy.max_age
+        opened_at = self.opened_at
+        return (max_age is not None and self.file is not None and
+                opened_at is not None and time.time() - opened_at >= max_age)
+
+    def rotate(self):
+        """
+        Moves the current file aside, and starts a new one.
+        """
+        self.file.close()
+        self.file = None
+
+        now = time.time()
+        segment = '{}.{}-{:06d}'.format(
+            self.path, time.strftime('%Y%m%d-%H%M%S', time.localtime(now)),
+            int((now % 1) * 1000000))
+
+        LOGGER.info('Rotating "%s" to "%s"', self.path, segment)
+        os.rename(self.path, segment)
+
+        if self.policy.compress:
+            self.compressors.submit(compress_segment, segment)
+
+        self.prune()
+
+    def prune(self):
+        """
+        Removes the oldest rotated segments, beyond what the policy keeps.
+        """
+        segments = sorted(glob.glob(glob.escape(self.path) + '.*-*'),
+                          key=lambda segment: segment.replace('.gz', ''))
+        segments = [segment for segment in segments
+                    if not segment.endswith('.tmp')]
+
+        for segment in segments[:max(len(segments) - self.policy.keep, 0)]:
+            LOGGER.info('Removing old segment "%s"', segment)
+            try:
+                os.remove(segment)
+            except OSError:
+                pass
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class OutputCapture(threading.Thread, util.TerminableThreadMixin):
+    """
+    Drains the pipes that jobs write their output to, and hands the output to
+    the :class:`LogSink` for each destination and the :class:`RingBuffer`
+    for each job.
+
+    :param dict handed_over: The pipes and ring buffers of the supervisor \
+    that this one replaced, as returned by :meth:`hand_over`, which jobs \
+    are still writing to.
+    """
+    def __init__(self, handed_over=None):
+        threading.Thread.__init__(self)
+        util.TerminableThreadMixin.__init__(self)
+
+        self.lock = threading.Lock()
+        self.sinks = {}
+        self.rings = {}
+
+        # Pipes are shared by every job writing to the same destination,
+        # unless the jobs have their own ring buffers
+        self.pipes = {}
+
+        # The selector is only touched by the capture thread, so other threads
+        # ask it to watch (or resume watching) a pipe by putting it here and
+        # waking it up
+        self.selector = selectors.DefaultSelector()
+        self.to_watch = []
+
+        # Ring buffers that other threads are waiting on being up to date,
+        # with the events which are set once they are
+        self.to_sync = []
+        wake_reader, wake_writer = os.pipe()
+        self.wake_reader = os.fdopen(wake_reader, 'rb', buffering=0)
+        self.wake_writer = os.fdopen(wake_writer, 'wb', buffering=0)
+
+        self.writers = ThreadPoolExecutor(max_workers=WRITER_THREADS)
+        self.compressors = ThreadPoolExecutor(max_workers=COMPRESS_THREADS)
+
+        # Both ends of every pipe, so that they can be closed on exit - unless
+        # they are being handed over to another supervisor
+        self.fds = []
+        self.keep_pipes = False
+
+        # The read ends of the pipes whose write ends have been closed, which
+        # are closed themselves once every job has stopped writing to them
+        self.retired = set()
+
+        if handed_over is None:
+            self.fifo_dir = tempfile.mkdtemp(prefix='jobmon-output-')
+            self.fifo_count = 0
+            self.ring_count = 0
+        else:
+            self.take_over(handed_over)
+
+    def take_over(self, handed_over):
+        """
+        Carries on capturing through the pipes and ring buffers of another
+        supervisor, so that jobs which are still running keep their output.
+        """
+        self.fifo_dir = handed_over['dir']
+        self.fifo_count = handed_over['fifo_count']
+        self.ring_count = handed_over['ring_count']
+
+        ring_jobs = {}
+        for job, (path, capacity) in handed_over['rings'].items():
+            try:
+                self.rings[job] = RingBuffer(path, capacity, reopen=True)
+                ring_jobs[path] = job
+            except (OSError, ValueError) as ex:
+                LOGGER.warning('Could not take over ring buffer of %s - %s',
+                               job, ex)
+
+        for handed_pipe in handed_over['pipes']:
+            path = handed_pipe['path']
+            sink = None
+            if path != os.devnull:
+                sink = self.sinks.get(path)
+                if sink is None:
+                    sink = LogSink(path, RotationPolicy(*handed_pipe['policy']),
+                                   self.compressors)
+                    self.sinks[path] = sink
+
+            ring = None
+            key = path, None
+            if handed_pipe['ring'] is not None:
+                ring = self.rings.get(ring_jobs.get(handed_pipe['ring']))
+                # A pipe whose ring was replaced (or couldn't be taken over)
+                # still has to be read, but no job gets it again
+                key = path, ring or handed_pipe['ring']
+
+            pipe = CapturePipe(handed_pipe['fifo'], handed_pipe['read_fd'],
+                               handed_pipe['write_fd'], sink, ring)
+            self.pipes[key] = pipe
+            self.fds.append(pipe.read_fd)
+            if pipe.write_fd is None:
+                self.retired.add(pipe.read_fd)
+            else:
+                self.fds.append(pipe.write_fd)
+            self.to_watch.append(pipe)
+
+        # Jobs may have written while nobody was reading, so the pipes are
+        # drained as soon as the capture thread starts
+        if self.to_watch:
+            self.wake_writer.write(b' ')
+
+    def get_fifo(self, path, policy, ring=None):
+        """
+        Gets the pipe which jobs should write to, in order to have their
+        output written to the given file.
+
+        :param str path: The destination file. If this is ``os.devnull``, \
+        then the output only goes to the ring buffer.
+        :param RotationPolicy policy: How the destination is rotated.
+        :param RingBuffer ring: A ring buffer which also gets a copy of the \
+        output, or ``None``.
+        :return: The path to the pipe.
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            if path == os.devnull:
+                sink = None
+            elif path in self.sinks:
+                sink = self.sinks[path]
+                sink.policy = policy
+            else:
+                sink = LogSink(path, policy, self.compressors)
+                self.sinks[path] = sink
+
+            if (path, ring) in self.pipes:
+                return self.pipes[path, ring].fifo
+
+            fifo = os.path.join(self.fifo_dir,
+                                '{}.fifo'.format(self.fifo_count))
+            self.fifo_count += 1
+            os.mkfifo(fifo, 0o600)
+
+            # The write end is only held so that the pipe doesn't report EOF
+            # while no job has it open
+            read_fd = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+            write_fd = os.open(fifo, os.O_WRONLY | os.O_NONBLOCK)
+            self.fds += [read_fd, write_fd]
+
+            pipe = CapturePipe(fifo, read_fd, write_fd, sink, ring)
+            self.pipes[path, ring] = pipe
+
+        LOGGER.info('Capturing output for "%s" via "%s"', path, fifo)
+        self.watch(pipe)
+        return fifo
+
+    def get_ring(self, job, capacity):
+        """
+        Gets the ring buffer which keeps a job's recent output, creating it if
+        necessary.
+
+        :param str job: The name of the job.
+        :param int capacity: How many bytes the ring buffer holds.
+        :return: A :class:`RingBuffer`.
+        """
+        with self.lock:
+            ring = self.rings.get(job)
+            if ring is not None and ring.capacity == capacity:
+                return ring
+
+            if ring is not None:
+                # Anybody still reading the old ring can keep doing so, but
+                # new readers should only find the new one
+                os.remove(ring.path)
+                self.retire_ring(ring)
+
+            path = os.path.join(self.fifo_dir,
+                                '{}.ring'.format(self.ring_count))
+            self.ring_count += 1
+
+            ring = RingBuffer(path, capacity)
+            self.rings[job] = ring
+
+        LOGGER.info('Keeping %d bytes of output for %s in "%s"',
+                    capacity, job, path)
+        return ring
+
+    def retire_ring(self, ring):
+        """
+        Closes a ring buffer which has been replaced, along with the pipes
+        which feed it. Jobs that are still running may still be writing to
+        those pipes, so only their write ends are closed here - the capture
+        thread closes the rest once the pipes report EOF (see :meth:`drain`).
+
+        This must be called with the lock held.
+        """
+        old_pipes = [pipe for pipe in self.pipes.values() if pipe.ring is ring]
+        if not old_pipes:
+            ring.close()
+            return
+
+        for pipe in old_pipes:
+            if pipe.read_fd not in self.retired:
+                os.close(pipe.write_fd)
+                self.fds.remove(pipe.write_fd)
+                self.retired.add(pipe.read_fd)
+
+    def close_pipe(self, pipe):
+        """
+        Forgets a retired pipe which nothing writes to anymore, closing the
+        ring buffer it fed if no other pipe feeds it.
+        """
+        self.selector.unregister(pipe.read_fd)
+        os.close(pipe.read_fd)
+
+        with self.lock:
+            self.fds.remove(pipe.read_fd)
+            self.retired.discard(pipe.read_fd)
+            for key, other in list(self.pipes.items()):
+                if other.read_fd == pipe.read_fd:
+                    del self.pipes[key]
+
+            close_ring = pipe.ring is not None and not any(
+                other.ring is pipe.ring for other in self.pipes.values())
+
+        LOGGER.info('Closing retired pipe "%s"', pipe.fifo)
+        try:
+            os.remove(pipe.fifo)
+        except OSError:
+            pass
+
+        if close_ring:
+            pipe.ring.close()
+
+    def hand_over(self):
+        """
+        Stops capturing output, once everything in the pipes so far has been
+        written out, and leaves the pipes for the supervisor that replaces
+        this one.
+
+        :return: The pipes and ring buffers, as a :class:`dict` which can be \
+        given to the next :class:`OutputCapture`.
+        """
+        self.keep_pipes = True
+        self.terminate()
+        self.wait_for_exit()
+
+        with self.lock:
+            return {
+                'dir': self.fifo_dir,
+                'fifo_count': self.fifo_count,
+                'ring_count': self.ring_count,
+                'rings': {job: [ring.path, ring.capacity]
+                          for job, ring in self.rings.items()},
+                'pipes': [{
+                    'path': path,
+                    'ring': ring.path if ring is not None else None,
+                    'fifo': pipe.fifo,
+                    'read_fd': pipe.read_fd,
+                    'write_fd': (None if pipe.read_fd in self.retired
+                                 else pipe.write_fd),
+                    'policy': list(pipe.sink.policy) if pipe.sink else None,
+                } for (path, ring), pipe in self.pipes.items()],
+            }
+
+    def watch(self, pipe):
+        """
+        Has the capture thread start reading from a pipe.
+        """
+        with self.lock:
+            self.to_watch.append(pipe)
+
+        try:
+            self.wake_writer.write(b' ')
+        except ValueError:
+            pass
+
+    def sync(self, ring, timeout=SYNC_TIMEOUT):
+        """
+        Waits for the capture thread to read everything that is waiting in
+        the pipes which feed a ring buffer. Once a job has exited, this
+        means that the ring buffer has all of its output.
+
+        :param RingBuffer ring: The ring buffer.
+        :param float timeout: How long (in seconds) to wait.
+        :return: ``True`` if the ring buffer is up to date, ``False`` if the \
+        capture thread didn't get to it in time.
+        """
+        synced = threading.Event()
+        with self.lock:
+            self.to_sync.append((ring, synced))
+
+        try:
+            self.wake_writer.write(b' ')
+        except ValueError:
+            return False
+
+        return synced.wait(timeout)
+
+    def schedule_flush(self, sink):
+        """
+        Has a writer thread write out a sink's buffer, unless one is already
+        going to.
+        """
+        with sink.lock:
+            if sink.flushing:
+                return
+            sink.flushing = True
+
+        try:
+            self.writers.submit(self.run_flush, sink)
+        except RuntimeError:
+            # We're shutting down - everything left is flushed on exit
+            with sink.lock:
+                sink.flushing = False
+
+    @util.log_crashes(LOGGER, 'Error writing output')
+    def run_flush(self, sink):
+        """
+        Writes out a sink's buffer, and resumes reading any pipes that were
+        paused.
+        """
+        try:
+            sink.flush()
+        except OSError as ex:
+            LOGGER.warning('Could not write to "%s" - %s', sink.path, ex)
+
+        with sink.lock:
+            sink.flushing = False
+            has_data = sink.size > 0
+            resume, sink.paused = sink.paused, []
+
+        if has_data:
+            self.schedule_flush(sink)
+
+        for pipe in resume:
+            self.watch(pipe)
+
+    def check_ages(self):
+        """
+        Has any file which has outlived its rotation policy's ``max_age``
+        rotated by a writer thread.
+        """
+        with self.lock:
+            sinks = list(self.sinks.values())
+
+        for sink in sinks:
+            if sink.is_expired():
+                self.schedule_flush(sink)
+
+    def drain(self, pipe):
+        """
+        Reads everything currently waiting in a pipe, and closes it if it has
+        been retired and nothing writes to it anymore.
+        """
+        sink = pipe.sink
+        while True:
+            try:
+                data = os.read(pipe.read_fd, READ_SIZE)
+            except BlockingIOError:
+                break
+
+            if not data:
+                # While the supervisor holds the write end, this only happens
+                # to pipes which have been retired
+                with self.lock:
+                    retired = pipe.read_fd in self.retired
+                if retired:
+                    self.close_pipe(pipe)
+                break
+
+            if pipe.ring is not None:
+                pipe.ring.write(data)
+
+            if sink is not None and not sink.append(data):
+                # Stop reading until the writers catch up, so that the buffer
+                # can't grow without bound
+                LOGGER.info('Pausing output for "%s"', sink.path)
+                with sink.lock:
+                    sink.paused.append(pipe)
+                self.selector.unregister(pipe.read_fd)
+                break
+
+        if sink is not None:
+            self.schedule_flush(sink)
+
+    @util.log_crashes(LOGGER, 'Error in output capture')
+    def run(self):
+        """
+        Reads from the pipes as data becomes available.
+        """
+        self.selector.register(self.wake_reader, selectors.EVENT_READ)
+        self.selector.register(self.exit_reader, selectors.EVENT_READ)
+
+        done = False
+        next_age_check = time.monotonic() + AGE_CHECK_INTERVAL
+        while not done:
+            timeout = max(next_age_check - time.monotonic(), 0)
+            for key, _ in self.selector.select(timeout):
+                if key.fileobj == self.exit_reader:
+                    done = True
+                elif key.fileobj == self.wake_reader:
+                    self.wake_reader.read(512)
+                    with self.lock:
+                        to_watch, self.to_watch = self.to_watch, []
+                        to_sync, self.to_sync = self.to_sync, []
+                        pipes = list(self.pipes.values())
+
+                    for pipe in to_watch:
+                        self.selector.register(pipe.read_fd,
+                                               selectors.EVENT_READ, pipe)
+                        self.drain(pipe)
+
+                    # Paused pipes are left alone, since their sinks have no
+                    # room for what they hold
+                    watched = self.selector.get_map()
+                    for ring, synced in to_sync:
+                        for pipe in pipes:
+                            if pipe.ring is ring and pipe.read_fd in watched:
+                                self.drain(pipe)
+                        synced.set()
+                elif self.selector.get_map().get(key.fd) is key:
+                    # Draining other pipes above may have paused or closed
+                    # this one
+                    self.drain(key.data)
+
+            if time.monotonic() >= next_age_check:
+                self.check_ages()
+                next_age_check = time.monotonic() + AGE_CHECK_INTERVAL
+
+        LOGGER.info('Closing...')
+
+        # Get whatever is left out of the pipes, and onto the disk
+        with self.lock:
+            pipes = list(self.pipes.values())
+            sinks = list(self.sinks.values())
+            rings = list(self.rings.values())
+
+        for pipe in pipes:
+            try:
+                self.selector.unregister(pipe.read_fd)
+            except KeyError:
+                pass
+
+            while True:
+                try:
+                    data = os.read(pipe.read_fd, READ_SIZE)
+                except BlockingIOError:
+                    break
+
+                if not data:
+                    break
+
+                if pipe.ring is not None:
+                    pipe.ring.write(data)
+                if pipe.sink is not None:
+                    pipe.sink.append(data)
+
+        self.writers.shutdown(wait=True)
+        for sink in sinks:
+            try:
+                sink.flush()
+            except OSError as ex:
+                LOGGER.warning('Could not write to "%s" - %s', sink.path, ex)
+            sink.close()
+
+        self.compressors.shutdown(wait=True)
+
+        for ring in rings:
+            ring.close()
+
+        if not self.keep_pipes:
+            for fd in self.fds:
+                os.close(fd)
+            shutil.rmtree(self.fifo_dir, ignore_errors=True)
+
+        self.selector.close()
+        self.wake_reader.close()
+        self.wake_writer.close()
+        self.cleanup()
@@ -0,0 +1,289 @@
+"""
+JobMon Placement
+================
+
+Controls how a job's processes are scheduled - which CPUs they can run on,
+their nice level, and their I/O scheduling class and priority. These are set
+in the child before it executes its command, and can also be changed while
+the job is running via :func:`apply_placement`.
+
+Jobs with an ``auto`` CPU affinity are spread across the CPUs available to the
+supervisor by a :class:`CpuAllocator`, which gives each of them the CPU with
+the fewest other automatically placed jobs on it.
+"""
+from collections import namedtuple
+import ctypes
+import errno
+import logging
+import os
+import platform
+import threading
+
+LOGGER = logging.getLogger('jobmon.placement')
+
+AUTO_CPUS = 'auto'
+
+# The keys of a job's configuration (and of placement changes) that are read
+# by from_dict
+PLACEMENT_KEYS = ('cpu-affinity', 'nice', 'io-class', 'io-priority')
+
+# The I/O scheduling classes understood by ioprio_set(2)
+IO_CLASSES = {
+    'none': 0,
+    'realtime': 1,
+    'best-effort': 2,
+    'idle': 3,
+}
+IO_CLASS_NAMES = {io_class: name for name, io_class in IO_CLASSES.items()}
+
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+IO_PRIORITIES = range(8)
+DEFAULT_IO_PRIORITY = 4
+
+# Neither libc nor the os module wrap ioprio_set, so it has to be called by
+# its syscall number, which differs between architectures
+IOPRIO_SET_SYSCALLS = {
+    'x86_64': 251,
+    'i386': 289,
+    'i686': 289,
+    'aarch64': 30,
+    'armv7l': 314,
+    'ppc64le': 273,
+    's390x': 282,
+    'riscv64': 30,
+}
+
+LIBC = ctypes.CDLL(None, use_errno=True)
+
+# How a job's processes are scheduled:
+#
+# - cpus is a frozenset of the CPUs that the job can run on, AUTO_CPUS to have
+#   a CPU picked by the CpuAllocator, or None to inherit the supervisor's
+# - nice is the job's nice level, or None to inherit the supervisor's
+# - io_class is one of the values in IO_CLASSES, and io_priority is the
+#   priority within that class - either may be None to leave it alone
+Placement = namedtuple('Placement', ['cpus', 'nice', 'io_class', 'io_priority'])
+
+NO_PLACEMENT = Placement(None, None, None, None)
+
+def parse_cpu_list(cpu_list):
+    """
+    Reads a set of CPUs, either as a list of numbers or as a string in the
+    format used by ``taskset -c`` (such as ``0-3,6``).
+
+    :return: A :class:`frozenset` of CPU numbers.
+    :raises ValueError: If the CPU list is invalid.
+    """
+    if isinstance(cpu_list, list):
+        if not all(isinstance(cpu, int) and cpu >= 0 for cpu in cpu_list):
+            raise ValueError('CPUs must be non-negative numbers')
+        cpus = frozenset(cpu_list)
+    elif isinstance(cpu_list, str):
+        cpus = set()
+        for cpu_range in cpu_list.split(','):
+            first, _, last = cpu_range.strip().partition('-')
+            cpus.update(range(int(first), int(last or first) + 1))
+        cpus = frozenset(cpus)
+    else:
+        raise ValueError('CPUs must be a list or a string')
+
+    if not cpus:
+        raise ValueError('At least one CPU must be given')
+    return cpus
+
+def format_cpu_list(cpus):
+    """
+    The inverse of :func:`parse_cpu_list`, which formats a set of CPUs as a
+    string.
+    """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and ranges[-1][1] == cpu - 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+
+    return ','.join(str(first) if first == last else '{}-{}'.format(first, last)
+                    for first, last in ranges)
+
+def from_dict(dct):
+    """
+    Reads a placement from the ``cpu-affinity``, ``nice``, ``io-class`` and
+    ``io-priority`` keys of a dictionary. Any keys which are missing are left
+    as ``None``.
+
+    :return: A :class:`Placement`.
+    :raises ValueError: If any of the keys are invalid.
+    """
+    cpus = dct.get('cpu-affinity')
+    if cpus is not None and cpus != AUTO_CPUS:
+        cpus = parse_cpu_list(cpus)
+
+    nice = dct.get('nice')
+    if nice is not None and not isinstance(nice, int):
+        raise ValueError('nice must be a number')
+
+    io_class = dct.get('io-class')
+    if io_class is not None:
+        if io_class not in IO_CLASSES:
+            raise ValueError('{} is not an I/O class'.format(io_class))
+        io_class = IO_CLASSES[io_class]
+
+    io_priority = dct.get('io-priority')
+    if io_priority is not None and io_priority not in IO_PRIORITIES:
+        raise ValueError('io-priority must be between 0 and 7')
+
+    return Placement(cpus, nice, io_class, io_priority)
+
+def to_dict(placement):
+    """
+    The inverse of :func:`from_dict`, which leaves out anything that is
+    ``None``.
+    """
+    dct = {}
+    if placement.cpus == AUTO_CPUS:
+        dct['cpu-affinity'] = AUTO_CPUS
+    elif placement.cpus is not None:
+        dct['cpu-affinity'] = format_cpu_list(placement.cpus)
+
+    if placement.nice is not None:
+        dct['nice'] = placement.nice
+
+    if placement.io_class is not None:
+        dct['io-class'] = IO_CLASS_NAMES[placement.io_class]
+
+    if placement.io_priority is not None:
+        dct['io-priority'] = placement.io_priority
+
+    return dct
+
+def merge(placement, changes):
+    """
+    :return: The given placement, with everything in the changes which isn't \
+    ``None`` replacing it.
+    """
+    return Placement(*(new if new is not None else old
+                       for old, new in zip(placement, changes)))
+
+def set_io_priority(io_class, io_priority, tid=0):
+    """
+    Sets the I/O scheduling class and priority of a thread.
+
+    :param int io_class: One of the values in :data:`IO_CLASSES`, or \
+    ``None`` for best-effort.
+    :param int io_priority: The priority within the class, or ``None`` for \
+    the default.
+    :param int tid: The thread to change, or 0 for the current one.
+    """
+    machine = platform.machine()
+    if machine not in IOPRIO_SET_SYSCALLS:
+        raise OSError(errno.ENOSYS,
+                      'ioprio_set is not supported on {}'.format(machine))
+
+    if io_class is None:
+        io_class = IO_CLASSES['best-effort']
+    if io_priority is None:
+        io_priority = DEFAULT_IO_PRIORITY
+
+    ioprio = (io_class << IOPRIO_CLASS_SHIFT) | io_priority
+    result = LIBC.syscall(IOPRIO_SET_SYSCALLS[machine], IOPRIO_WHO_PROCESS,
+                          tid, ioprio)
+    if result == -1:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+def apply_placement(placement, tid=0):
+    """
+    Applies a placement to a thread. On Linux, all of these are per-thread,
+    so changing a whole process means applying this to all of its threads.
+
+    :param Placement placement: The placement to apply. The CPUs can't be \
+    :data:`AUTO_CPUS` - they have to be allocated first.
+    :param int tid: The thread to change, or 0 for the current one.
+    """
+    if placement.cpus is not None:
+        os.sched_setaffinity(tid, placement.cpus)
+
+    if placement.nice is not None:
+        os.setpriority(os.PRIO_PROCESS, tid, placement.nice)
+
+    if placement.io_class is not None or placement.io_priority is not None:
+        set_io_priority(placement.io_class, placement.io_priority, tid)
+
+def get_process_group(pgid):
+    """
+    Finds every process in a process group.
+
+    :return: A list of PIDs.
+    """
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+
+        try:
+            with open('/proc/{}/stat'.format(entry)) as stat_file:
+                stat = stat_file.read()
+        except OSError:
+            continue
+
+        # The command name can contain spaces (and parentheses), so the
+        # fields have to be counted from the end of it - the process group
+        # is the third field afterwards
+        fields = stat[stat.rindex(')') + 2:].split()
+        if int(fields[2]) == pgid:
+            pids.append(int(entry))
+
+    return pids
+
+def get_threads(pids):
+    """
+    Finds every thread of the given processes.
+
+    :return: A list of thread IDs.
+    """
+    tids = []
+    for pid in pids:
+        try:
+            tids += [int(tid) for tid in os.listdir('/proc/{}/task'.format(pid))]
+        except OSError:
+            # The process has exited
+            pass
+
+    return tids
+
+class CpuAllocator:
+    """
+    Spreads the jobs with an ``auto`` CPU affinity across the CPUs that are
+    available to the supervisor.
+    """
+    def __init__(self, cpus=None):
+        if cpus is None:
+            cpus = os.sched_getaffinity(0)
+
+        self.lock = threading.Lock()
+        self.jobs_per_cpu = {cpu: 0 for cpu in cpus}
+
+    def allocate(self):
+        """
+        Picks the CPU with the fewest jobs on it.
+
+        :return: A :class:`frozenset` containing the CPU.
+        """
+        with self.lock:
+            cpu = min(self.jobs_per_cpu,
+                      key=lambda cpu: (self.jobs_per_cpu[cpu], cpu))
+            self.jobs_per_cpu[cpu] += 1
+
+        LOGGER.info('Allocated CPU %d', cpu)
+        return frozenset([cpu])
+
+    def release(self, cpus):
+        """
+        Returns CPUs which were given out by :meth:`allocate`.
+        """
+        with self.lock:
+            for cpu in cpus:
+                if self.jobs_per_cpu.get(cpu, 0) > 0:
+                    self.jobs_per_cpu[cpu] -= 1
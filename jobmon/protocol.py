@@ -24,8 +24,10 @@ protocol. These are:
 - Commands (:class:`Command`) are messages from the client to the supervisor,
   indicating a particular action. 
 - Responses (which can be either :class:`SuccessResponse`, 
-  :class:`FailureResponse`, :class:`StatusResponse`, :class:`JobListResponse`) 
-  indicate that success or the failure of the change.
+  :class:`FailureResponse`, :class:`StatusResponse`, :class:`JobListResponse`,
+  :class:`SpawnPlanResponse`, :class:`OutputRingResponse`,
+  :class:`StatsResponse` or :class:`BatchResponse`) indicate that success or
+  the failure of the change.
 """
 from collections import namedtuple
 import json
@@ -35,24 +37,51 @@ import struct
 
 # Constants for denoting event codes
 EVENT_STARTJOB, EVENT_STOPJOB, EVENT_RESTARTJOB, EVENT_TERMINATE = 0, 1, 2, 3
+EVENT_UNHEALTHY, EVENT_READY, EVENT_STOPPING, EVENT_KILLED = 4, 5, 6, 7
 
 # Constants which denote command codes
 CMD_START, CMD_STOP, CMD_STATUS, CMD_JOB_LIST, CMD_QUIT = 3, 4, 5, 6, 7
+CMD_SPAWN_PLAN, CMD_OUTPUT_RING, CMD_SET_PLACEMENT, CMD_STATS = 8, 9, 10, 11
+CMD_SCALE, CMD_BATCH, CMD_WAIT, CMD_REEXEC = 12, 13, 14, 15
+
+# The states which CMD_WAIT can wait for a job to reach. Jobs which report
+# their readiness are only ready once they have, and other jobs are ready as
+# soon as they are running.
+WAIT_RUNNING, WAIT_STOPPED, WAIT_READY = 'running', 'stopped', 'ready'
+WAIT_STATES = (WAIT_RUNNING, WAIT_STOPPED, WAIT_READY)
 
 # Indicates the types of messages which can be sent via sockets
-(MSG_EVENT, MSG_COMMAND, MSG_SUCCESS, MSG_FAILURE, MSG_STATUS, MSG_JOB_LIST 
-) = range(6)
+(MSG_EVENT, MSG_COMMAND, MSG_SUCCESS, MSG_FAILURE, MSG_STATUS, MSG_JOB_LIST,
+ MSG_SPAWN_PLAN, MSG_OUTPUT_RING, MSG_STATS, MSG_BATCH) = range(10)
 
 # Indicates errors which can be passed along in a FailureResponse
 (ERR_NO_SUCH_JOB, # When a job name is not registered to a job
  ERR_JOB_STARTED, # When starting an already started job
  ERR_JOB_STOPPED, # When stopping an already stopped job
- ) = range(3)
+ ERR_NO_OUTPUT_RING, # When asking for the output of a job without a ring buffer
+ ERR_BAD_PLACEMENT, # When a job's placement could not be changed
+ ERR_NOT_REPLICATED, # When scaling a job which isn't replicated
+ ERR_BAD_REPLICAS, # When scaling a job to an invalid number of instances
+ ERR_BAD_TIME, # When starting a job at a time which isn't a timestamp
+ ERR_BAD_COMMAND, # When a command is unknown or invalid, or can't be batched
+ ERR_WAIT_TIMEOUT, # When a job doesn't reach the state being waited for in time
+ ERR_REEXEC_FAILED, # When the supervisor can't re-execute itself
+ ERR_WAIT_STOPPED, # When a job stops before reaching the state being waited for
+ ) = range(12)
 
 _REASON_STR_TABLE = {
     ERR_NO_SUCH_JOB: 'No such job',
     ERR_JOB_STARTED: 'Tried to start an already running job',
-    ERR_JOB_STOPPED: 'Tried to stop an already stopped job'
+    ERR_JOB_STOPPED: 'Tried to stop an already stopped job',
+    ERR_NO_OUTPUT_RING: 'Job does not keep a ring buffer of its output',
+    ERR_BAD_PLACEMENT: 'Could not change the placement of the job',
+    ERR_NOT_REPLICATED: 'Job is not replicated',
+    ERR_BAD_REPLICAS: 'Invalid number of instances',
+    ERR_BAD_TIME: 'Invalid start time',
+    ERR_BAD_COMMAND: 'Invalid command',
+    ERR_WAIT_TIMEOUT: 'Timed out waiting for job',
+    ERR_REEXEC_FAILED: 'Could not re-execute the supervisor',
+    ERR_WAIT_STOPPED: 'Job stopped before reaching the state',
 }
 def reason_to_str(reason):
     """
@@ -62,12 +91,28 @@ def reason_to_str(reason):
     """
     return _REASON_STR_TABLE.get(reason, 'Unknown reason {}'.format(reason))
 
-class Event(namedtuple('Event', ['job_name', 'event_code'])):
+class Event(namedtuple('Event', ['job_name', 'event_code', 'output'],
+                       defaults=[None])):
+    """
+    The output is only sent with the event reporting that a job has exited
+    with a failure, and only if the job keeps a ring buffer - it is the last
+    few lines the job wrote, as a list of strings. Events reporting that a
+    job has failed its health checks have the reason the last check failed
+    as their output.
+
+    While the supervisor is shutting down, each job is reported as stopping
+    when it is sent its signal, and as killed if it is still running once
+    its shutdown timeout runs out (and it is sent ``SIGKILL``).
+    """
     EVENT_NAMES = {
         EVENT_STARTJOB: 'Started',
         EVENT_STOPJOB: 'Stopped',
         EVENT_RESTARTJOB: 'Restarted',
-        EVENT_TERMINATE: 'Server stopped'
+        EVENT_TERMINATE: 'Server stopped',
+        EVENT_UNHEALTHY: 'Unhealthy',
+        EVENT_READY: 'Ready',
+        EVENT_STOPPING: 'Stopping',
+        EVENT_KILLED: 'Killed',
     }
 
     def __str__(self):
@@ -80,11 +125,15 @@ class Event(namedtuple('Event', ['job_name', 'event_code'])):
         """
         :return: A :class:`dict` representation of this event.
         """
-        return {
+        dct = {
             'type': MSG_EVENT,
             'job': self.job_name,
             'event': self.event_code,
         }
+
+        if self.output is not None:
+            dct['output'] = self.output
+        return dct
     
     @staticmethod
     def unserialize(dct):
@@ -96,20 +145,49 @@ class Event(namedtuple('Event', ['job_name', 'event_code'])):
         """
         if dct['type'] != MSG_EVENT:
             raise ValueError
-        return Event(dct['job'], int(dct['event']))
+        return Event(dct['job'], int(dct['event']), dct.get('output'))
 
-class Command(namedtuple('Command', ['job_name', 'command_code'])):
+class Command(namedtuple('Command', ['job_name', 'command_code', 'args'],
+                         defaults=[None])):
+    """
+    The arguments are only sent with commands that need more than a job name,
+    such as changing a job's placement or scaling it - they are a dict, whose
+    contents depend upon the command.
+
+    A batch is a list of other commands (each one serialized) as its
+    arguments, which are answered in order with a :class:`BatchResponse`.
+
+    A wait takes the ``state`` to wait for (one of :data:`WAIT_STATES`) and
+    a ``timeout`` in seconds, which is ``None`` to wait for as long as it
+    takes. It is answered with the job's :class:`StatusResponse` once the
+    job reaches the state, or with :data:`ERR_WAIT_TIMEOUT` if it doesn't.
+    Waits for a job to be running or ready are answered with
+    :data:`ERR_WAIT_STOPPED` if its process exits first.
+
+    A re-execution is answered by the new supervisor, once it has taken over
+    from the old one (see :mod:`jobmon.handoff`).
+    """
     COMMAND_NAMES = {
         CMD_START: 'Start job',
         CMD_STOP: 'Stop job',
         CMD_STATUS: 'Query job status',
         CMD_JOB_LIST: 'List all jobs',
-        CMD_QUIT: 'Terminate the supervisor'
+        CMD_QUIT: 'Terminate the supervisor',
+        CMD_SPAWN_PLAN: 'Query job spawn plan',
+        CMD_OUTPUT_RING: 'Query job output ring buffer',
+        CMD_SET_PLACEMENT: 'Change job placement',
+        CMD_STATS: 'Query command latencies',
+        CMD_SCALE: 'Scale replicated job',
+        CMD_BATCH: 'Run several commands',
+        CMD_WAIT: 'Wait for job state',
+        CMD_REEXEC: 'Re-execute the supervisor',
     }
 
     def __str__(self):
         return 'Command[{}: {}]'.format(
-                self.COMMAND_NAMES[self.command_code],
+                self.COMMAND_NAMES.get(self.command_code,
+                                       'Unknown command {}'.format(
+                                           self.command_code)),
                 self.job_name)
 
     __repr__ =  __str__
@@ -118,12 +196,16 @@ class Command(namedtuple('Command', ['job_name', 'command_code'])):
         """
         :return: A :class:`dict` representation of this event.
         """
-        return {
+        dct = {
             'type': MSG_COMMAND,
             'job': self.job_name,
             'command': self.command_code,
         }
 
+        if self.args is not None:
+            dct['args'] = self.args
+        return dct
+
     @staticmethod
     def unserialize(dct):
         """
@@ -134,7 +216,7 @@ class Command(namedtuple('Command', ['job_name', 'command_code'])):
         """
         if dct['type'] != MSG_COMMAND:
             raise ValueError
-        return Command(dct['job'], int(dct['command']))
+        return Command(dct['job'], int(dct['command']), dct.get('args'))
 
 class SuccessResponse(namedtuple('SuccessResponse', ['job_name'])): 
     def __str__(self):
@@ -192,10 +274,28 @@ class FailureResponse(namedtuple('FailureResponse', ['job_name', 'reason'])):
             raise ValueError
         return FailureResponse(dct['job'], dct['reason'])
 
-class StatusResponse(namedtuple('StatusResponse', ['job_name', 'is_running', 'pid'])):
+class StatusResponse(namedtuple('StatusResponse',
+                                 ['job_name', 'is_running', 'pid', 'healthy',
+                                  'ready', 'status_text'],
+                                 defaults=[None, None, None])):
+    """
+    Whether a job is healthy is only known if it is running and has a health
+    check, and whether it is ready is only known if it reports its readiness
+    (see :mod:`jobmon.notify`), in which case it isn't ready while it is
+    stopped - otherwise, these are ``None``, and aren't sent. The status text
+    is the last ``STATUS`` that the job reported, if any.
+    """
     def __str__(self):
         if self.is_running:
-            return 'Status[{} is RUNNING at PID {}]'.format(self.job_name, self.pid)
+            if self.healthy is False:
+                state = 'UNHEALTHY'
+            elif self.ready is False:
+                state = 'STARTING'
+            else:
+                state = 'RUNNING'
+
+            return 'Status[{} is {} at PID {}]'.format(
+                self.job_name, state, self.pid)
         else:
             return 'Status[{} is STOPPED]'.format(self.job_name)
 
@@ -205,13 +305,19 @@ class StatusResponse(namedtuple('StatusResponse', ['job_name', 'is_running', 'pi
         """
         :return: A :class:`dict` representation of this event.
         """
-        return {
+        dct = {
             'type': MSG_STATUS,
             'job': self.job_name,
             'is_running': self.is_running,
             'pid': self.pid
         }
 
+        for field in ('healthy', 'ready', 'status_text'):
+            value = getattr(self, field)
+            if value is not None:
+                dct[field] = value
+        return dct
+
     @staticmethod
     def unserialize(dct):
         """
@@ -222,7 +328,9 @@ class StatusResponse(namedtuple('StatusResponse', ['job_name', 'is_running', 'pi
         """
         if dct['type'] != MSG_STATUS:
             raise ValueError
-        return StatusResponse(dct['job'], dct['is_running'], dct['pid'])
+        return StatusResponse(dct['job'], dct['is_running'], dct['pid'],
+                              dct.get('healthy'), dct.get('ready'),
+                              dct.get('status_text'))
 
 class JobListResponse(namedtuple('JobListResponse', ['all_jobs'])):
     def __str__(self):
@@ -258,6 +366,129 @@ class JobListResponse(namedtuple('JobListResponse', ['all_jobs'])):
             raise ValueError
         return JobListResponse(dct['all_jobs'])
 
+class SpawnPlanResponse(namedtuple('SpawnPlanResponse', ['job_name', 'plan'])):
+    def __str__(self):
+        buffer = 'SpawnPlan[{}]'.format(self.job_name)
+        for key, value in sorted(self.plan.items()):
+            buffer += '\n - {} = {}'.format(key, value)
+
+        return buffer
+
+    __repr__ = __str__
+
+    def serialize(self):
+        """
+        :return: A :class:`dict` representation of this event.
+        """
+        return {
+            'type': MSG_SPAWN_PLAN,
+            'job': self.job_name,
+            'plan': self.plan,
+        }
+
+    @staticmethod
+    def unserialize(dct):
+        """
+        Transforms the given dict into an instance of this class.
+
+        :param dict dct: A serialized message.
+        :return: The corresponding event.
+        """
+        if dct['type'] != MSG_SPAWN_PLAN:
+            raise ValueError
+        return SpawnPlanResponse(dct['job'], dct['plan'])
+
+class OutputRingResponse(namedtuple('OutputRingResponse', ['job_name', 'path'])):
+    def __str__(self):
+        return 'OutputRing[{} at {}]'.format(self.job_name, self.path)
+
+    __repr__ = __str__
+
+    def serialize(self):
+        """
+        :return: A :class:`dict` representation of this event.
+        """
+        return {
+            'type': MSG_OUTPUT_RING,
+            'job': self.job_name,
+            'path': self.path,
+        }
+
+    @staticmethod
+    def unserialize(dct):
+        """
+        Transforms the given dict into an instance of this class.
+
+        :param dict dct: A serialized message.
+        :return: The corresponding event.
+        """
+        if dct['type'] != MSG_OUTPUT_RING:
+            raise ValueError
+        return OutputRingResponse(dct['job'], dct['path'])
+
+class StatsResponse(namedtuple('StatsResponse', ['stats'])):
+    """
+    The stats map each command to the latencies of each stage of answering
+    it - see :func:`jobmon.tracing.get_stats`.
+    """
+    def __str__(self):
+        return 'Stats[{} commands]'.format(len(self.stats))
+
+    __repr__ = __str__
+
+    def serialize(self):
+        """
+        :return: A :class:`dict` representation of this event.
+        """
+        return {
+            'type': MSG_STATS,
+            'stats': self.stats,
+        }
+
+    @staticmethod
+    def unserialize(dct):
+        """
+        Transforms the given dict into an instance of this class.
+
+        :param dict dct: A serialized message.
+        :return: The corresponding event.
+        """
+        if dct['type'] != MSG_STATS:
+            raise ValueError
+        return StatsResponse(dct['stats'])
+
+class BatchResponse(namedtuple('BatchResponse', ['results'])):
+    """
+    The results of each command in a batch, in the same order as the
+    commands.
+    """
+    def __str__(self):
+        return 'Batch[{} results]'.format(len(self.results))
+
+    __repr__ = __str__
+
+    def serialize(self):
+        """
+        :return: A :class:`dict` representation of this event.
+        """
+        return {
+            'type': MSG_BATCH,
+            'results': [result.serialize() for result in self.results],
+        }
+
+    @staticmethod
+    def unserialize(dct):
+        """
+        Transforms the given dict into an instance of this class.
+
+        :param dict dct: A serialized message.
+        :return: The corresponding event.
+        """
+        if dct['type'] != MSG_BATCH:
+            raise ValueError
+        return BatchResponse([RECV_HANDLERS[result['type']].unserialize(result)
+                              for result in dct['results']])
+
 # Matches each type code to the class which is responsible for decoding it.
 RECV_HANDLERS = {
     MSG_EVENT: Event,
@@ -266,6 +497,10 @@ RECV_HANDLERS = {
     MSG_FAILURE: FailureResponse,
     MSG_STATUS: StatusResponse,
     MSG_JOB_LIST: JobListResponse,
+    MSG_SPAWN_PLAN: SpawnPlanResponse,
+    MSG_OUTPUT_RING: OutputRingResponse,
+    MSG_STATS: StatsResponse,
+    MSG_BATCH: BatchResponse,
 }
 
 class ProtocolTimeout(Exception):
@@ -287,6 +522,9 @@ class ProtocolTimeout(Exception):
 # Each message has a 'type' field, which allows the decoding class to be
 # identified in RECV_HANDLERS.
 
+# How long stream sockets wait for a message by default, in seconds
+STREAM_TIMEOUT = 15.0
+
 class ProtocolStreamSocket:
     """
     A protocol socket is a wrapper for sockets which speaks the Jobmon 
@@ -301,7 +539,7 @@ class ProtocolStreamSocket:
     complete within a fixed amount of time, configurable via the timeout
     parameter in __init__ (it can be None to disable the timeout)
     """
-    def __init__(self, sock, timeout=15.0):
+    def __init__(self, sock, timeout=STREAM_TIMEOUT):
         self.sock = sock
         if timeout is not None:
             sock.settimeout(timeout)
@@ -309,6 +547,13 @@ class ProtocolStreamSocket:
     def fileno(self):
         return self.sock.fileno()
 
+    def set_timeout(self, timeout):
+        """
+        Changes how long :meth:`recv` waits, for replies which are expected
+        to take a while (such as waiting for a job to stop).
+        """
+        self.sock.settimeout(timeout)
+
     def _recv_all(self, length):
         """
         Receives the complete length of the socket, or otherwise throws an 
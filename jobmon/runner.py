@@ -7,18 +7,23 @@ This module is meant to be used by setuptools to generate entry points for
 console scripts.
 """
 import argparse
-import logging
 import os
+import shlex
 import sys
-import traceback
+import time
 
-from jobmon import config, launcher, protocol, transport
+# Only what the client commands need is imported here, since they're often
+# run from scripts many times a minute. The supervisor's own modules take far
+# longer to import than a command takes to run, so the commands which need
+# them import them when they run.
+from jobmon import protocol, transport
 
 # Note that this isn't actually used, but it does provide an overview of
 # what options are available when invoking the CLI
 """
 Usage:
-  jobmon <daemon|start|stop|status|pid|list-jobs|terminate|listen>
+  jobmon <daemon|start|stop|status|pid|plan|place|scale|tail|stats|list-jobs|
+          terminate|reexec|wait|listen|batch|shell>
 
 Commands:
   jobmon daemon <config>
@@ -27,35 +32,106 @@ Commands:
     control directory is printed to stdout (which can be used to set
     $JOBMON_CONTROL_DIR for queries to the daemon).
 
-  jobmon start <job> 
-    Starts the given job.
-
-  jobmon stop <job> 
-    Stops the given job.
-
-  jobmon status <job> 
+  jobmon start [--with-deps] [--in <duration> | --at <time>]
+               [--wait [--timeout <seconds>]] <job>...
+    Starts the given jobs. If any jobs that it depends on are starting, it is
+    started once they are up. With --with-deps, the jobs that it requires are
+    started first, if they aren't already running. With --in or --at, the job
+    is started once later on instead - durations are like 90s, 15m or 2h,
+    and times are either HH:MM or a date and time like 2024-01-31T03:00.
+    Stopping the job cancels a start that hasn't happened yet. With --wait,
+    exits once the jobs are ready (see jobmon wait), or with a 1 status if
+    the timeout passes first.
+
+  jobmon stop [--wait [--timeout <seconds>]] <job>...
+    Stops the given jobs. With --wait, exits once their processes have
+    actually exited, or with a 1 status if the timeout passes first.
+
+  jobmon status <job>...
     Queries the status of the given job, and returns a 0 exit status if the
     job is running, a 1 exit status if it is not, and a 2 exit status if no
-    such job exists.
+    such job exists. A job which is running but failing its health checks
+    gets a 3 exit status. If the job has reported a status line (see notify
+    in the README), it is printed.
 
-  jobmon pid <job>
+  jobmon pid <job>...
     Prints the PID of the job's process if it is running and exits with a 
     status of 0, exits with a status of 1 (not printing anything) if the job 
     is not running, or exits with a status of 2 if no such job exists.
 
+    start, stop, status and pid can be given several jobs, which are all
+    sent to the supervisor in one request. A line is printed for each job
+    (as in jobmon batch), and the exit status is the highest of the jobs'.
+
+  jobmon plan <job>
+    Prints the precomputed spawn plan of the job - the exact arguments,
+    environment, standard streams, working directory, signal and resource
+    limits that the supervisor uses to launch it.
+
+  jobmon place [--cpus <cpus>] [--nice <nice>] [--io-class <class>]
+               [--io-priority <priority>] <job>
+    Changes the CPU affinity, nice level or I/O priority of a running job,
+    and everything it has started, without restarting it. The CPUs are a
+    list like 0-3,6 or "auto".
+
+  jobmon scale <job> <replicas>
+    Changes how many instances of a replicated job there are. New instances
+    are started straight away, and when scaling down the newest instances are
+    stopped first - the rest of the instances are left alone.
+
+  jobmon tail [-n <lines>] [-f] <job>
+    Prints the last lines that the job wrote, from its ring buffer. With -f,
+    keeps printing the job's output as it is written.
+
+  jobmon stats
+    Prints how long the supervisor has taken to answer each kind of command,
+    broken down into the stages of answering it. Each line has the command,
+    the stage, the number of commands, and the mean, 50th, 90th and 99th
+    percentile times in milliseconds.
+
   jobmon list-jobs prints out a list of jobs in the following format:
 
     [RUNNING|STOPPED] <JOB NAME>
 
   jobmon terminate
-    Terminates the server.
+    Terminates the server, after stopping every job. Jobs which are still
+    running once their shutdown-timeout has passed are killed with SIGKILL.
+
+  jobmon reexec
+    Has the daemon re-execute itself (picking up a newly installed version
+    of JobMon), without stopping any jobs. Running jobs keep their PIDs, and
+    other clients only see a brief pause. Exits once the new daemon has
+    taken over, or with a 1 status if the daemon couldn't re-execute.
 
   jobmon listen <NUM-EVENTS>
     Prints out events on stdout as they happen, using the same format as
-    list-jobs (except with an additional RESTARTING action).
-
-  jobmon wait <JOB NAME>
-    Waits until the given job changes state.
+    list-jobs (except with additional RESTARTING, UNHEALTHY and READY
+    actions, and STOPPING and KILLED while the daemon shuts down). If a job
+    failed, and it keeps a ring buffer, its last lines of output are printed
+    after the event with a tab in front of each.
+
+  jobmon wait [--ready | --state <state>] [--timeout <seconds>] <JOB NAME>
+    Waits until the given job changes state. With --ready, waits until the
+    job is ready instead (returning straight away if it already is), and
+    exits with a 1 status if it stops first. Jobs which report their
+    readiness are ready once they say so, and other jobs are ready as soon
+    as they are running. --ready is the same as --state ready.
+
+    With --state, waits until the job is running, stopped or ready
+    (returning straight away if it already is). The supervisor answers as
+    soon as the job gets there, without any events being sent. The exit
+    status is 1 if the timeout passes first, and 2 if the job doesn't exist.
+
+  jobmon batch [--json] [<file>]
+    Runs commands read from the file (or standard input), one per line,
+    over a single connection to the supervisor. Each line is written like a
+    command line without the "jobmon" - start, stop, status, pid, scale and
+    list-jobs can be used. The results are printed as each line is
+    answered, as lines of text or (with --json) one JSON object per job. The
+    exit status is 1 if any command failed.
+
+  jobmon shell [--json]
+    Reads commands interactively, in the same way as jobmon batch.
 
   jobmon help
     Shows a help page.
@@ -88,28 +164,86 @@ queries (this environment variable is required for all other commands).''')
 
     start_parser = command_arg.add_parser('start',
         help='Starts a job')
-    start_parser.add_argument('JOB',
-        help='The name of the job to start')
+    start_parser.add_argument('--with-deps', action='store_true',
+        help='Starts the jobs that this one requires first')
+    start_when = start_parser.add_mutually_exclusive_group()
+    start_when.add_argument('--in', dest='delay',
+        help='Starts the job after this long, such as 90s, 15m or 2h')
+    start_when.add_argument('--at',
+        help='Starts the job at this time, either HH:MM or a date and time')
+    start_parser.add_argument('--wait', action='store_true',
+        help='Waits until the jobs are ready before exiting')
+    start_parser.add_argument('--timeout', type=float,
+        help='How long to wait for, in seconds')
+    start_parser.add_argument('JOB', nargs='+',
+        help='The names of the jobs to start')
 
     stop_parser = command_arg.add_parser('stop',
         help='Stops a job')
-    stop_parser.add_argument('JOB',
-        help='The name of the job to stop')
+    stop_parser.add_argument('--wait', action='store_true',
+        help='Waits until the jobs have stopped before exiting')
+    stop_parser.add_argument('--timeout', type=float,
+        help='How long to wait for, in seconds')
+    stop_parser.add_argument('JOB', nargs='+',
+        help='The names of the jobs to stop')
 
     status_parser = command_arg.add_parser('status',
         help='''Gets the status a job. If the job is running, a 0 status is
 returned; if the job is stopped, a 1 status is returned, and if the job does 
-not exist or another errors has happened, a 2 is returned.''')
-    status_parser.add_argument('JOB',
-        help='The name of the job to query')
+not exist or another errors has happened, a 2 is returned. If the job is
+running but failing its health checks, a 3 is returned.''')
+    status_parser.add_argument('JOB', nargs='+',
+        help='The names of the jobs to query')
 
     pid_parser = command_arg.add_parser('pid',
         help='''Prints the PID of a job's process, if it is running. Exits 
 with a 0 status code if the job is running, 1 if the job is not running, and 
 2 if some error occurs.''')
-    pid_parser.add_argument('JOB',
+    pid_parser.add_argument('JOB', nargs='+',
+        help='The names of the jobs to query')
+
+    plan_parser = command_arg.add_parser('plan',
+        help='''Prints the spawn plan the supervisor uses to launch a job.''')
+    plan_parser.add_argument('JOB',
         help='The name of the job to query')
 
+    place_parser = command_arg.add_parser('place',
+        help='''Changes the CPU affinity and priorities of a running job,
+without restarting it.''')
+    place_parser.add_argument('--cpus',
+        help='The CPUs the job can run on, such as 0-3,6, or auto')
+    place_parser.add_argument('--nice', type=int,
+        help='The nice level of the job')
+    place_parser.add_argument('--io-class',
+        choices=['none', 'realtime', 'best-effort', 'idle'],
+        help='The I/O scheduling class of the job')
+    place_parser.add_argument('--io-priority', type=int,
+        help='The I/O priority of the job within its class, from 0 to 7')
+    place_parser.add_argument('JOB',
+        help='The name of the job to change')
+
+    scale_parser = command_arg.add_parser('scale',
+        help='''Changes how many instances of a replicated job there are,
+without disturbing the instances that are kept.''')
+    scale_parser.add_argument('JOB',
+        help='The name of the replicated job')
+    scale_parser.add_argument('REPLICAS', type=int,
+        help='How many instances there should be')
+
+    tail_parser = command_arg.add_parser('tail',
+        help='''Prints the most recent output of a job, from its ring
+buffer.''')
+    tail_parser.add_argument('-n', '--lines', type=int, default=10,
+        help='How many lines to print')
+    tail_parser.add_argument('-f', '--follow', action='store_true',
+        help='Keep printing output as the job writes it')
+    tail_parser.add_argument('JOB',
+        help='The name of the job to read')
+
+    command_arg.add_parser('stats',
+        help='''Prints how long the supervisor takes to answer each kind of
+command, and where that time goes.''')
+
     listen_parser = command_arg.add_parser('listen',
         help='''Prints out events as they are received, in the same format as
 the list-jobs command.''')
@@ -120,6 +254,15 @@ indefinitely.''')
 
     wait_parser = command_arg.add_parser('wait',
         help='''Waits until the given job changes its state.''')
+    wait_for = wait_parser.add_mutually_exclusive_group()
+    wait_for.add_argument('--ready', action='store_true',
+        help='''Waits until the job is ready, rather than until it changes
+its state.''')
+    wait_for.add_argument('--state', choices=protocol.WAIT_STATES,
+        help='''Waits until the job is in this state, rather than until it
+changes its state.''')
+    wait_parser.add_argument('--timeout', type=float,
+        help='How long to wait for, in seconds (only with --ready or --state)')
     wait_parser.add_argument('JOB',
         help='''The name of the job to wait for''')
 
@@ -130,8 +273,97 @@ delimited format - status first, job name second.
 
     command_arg.add_parser('terminate', help='Kills the daemon')
 
+    command_arg.add_parser('reexec',
+        help='Re-executes the daemon, without stopping any jobs')
+
+    batch_parser = command_arg.add_parser('batch',
+        help='''Runs commands read from a file, one per line, over a single
+connection to the supervisor.''')
+    batch_parser.add_argument('--json', action='store_true',
+        help='Prints each result as a line of JSON')
+    batch_parser.add_argument('FILE', nargs='?', default='-',
+        help='The file to read commands from, or - for standard input')
+
+    shell_parser = command_arg.add_parser('shell',
+        help='''Runs commands typed in interactively, over a single connection
+to the supervisor.''')
+    shell_parser.add_argument('--json', action='store_true',
+        help='Prints each result as a line of JSON')
+
     return arg_parser
 
+def run_for_jobs(control_port, name, jobs, command_args=None):
+    """
+    Sends the same command for each of several jobs, in one request, and
+    prints a line for each job.
+
+    :param str name: The command, which is one of the names in \
+    :data:`batch.JOB_COMMANDS`.
+    :param list jobs: The names of the jobs.
+    :param dict command_args: The arguments to send with each command.
+    :return: The exit status, which is the highest of the jobs' statuses.
+    """
+    from jobmon import batch
+
+    try:
+        command_pipe = transport.CommandPipe(control_port)
+        records = batch.send(command_pipe,
+                             batch.job_request(name, jobs, command_args),
+                             sys.stdout)
+    except ValueError:
+        print('Invalid control port:', control_port)
+        return 1
+    except IOError:
+        print('Server dropped our connection.', file=sys.stderr)
+        return 1
+    except transport.JobError as job_err:
+        print(str(job_err), file=sys.stderr)
+        return 1
+
+    return max(batch.status_code(record) for record in records)
+
+def wait_for_jobs(control_port, jobs, state, timeout=None):
+    """
+    Waits for each of several jobs to reach a state. The supervisor answers
+    each wait as soon as the job gets there, so nothing is polled.
+
+    :param list jobs: The names of the jobs.
+    :param str state: One of :data:`protocol.WAIT_STATES`.
+    :param float timeout: How long to wait for all of the jobs, in seconds, \
+    or ``None`` to wait for as long as it takes.
+    :return: The exit status, which is 0 if every job reached the state, 1 \
+    if the timeout passed first and 2 if a job doesn't exist.
+    """
+    deadline = None
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+
+    command_pipe = None
+    try:
+        command_pipe = transport.CommandPipe(control_port, keep_open=True)
+        for job in jobs:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.monotonic())
+            command_pipe.wait_job(job, state, remaining)
+    except ValueError:
+        print('Invalid control port:', control_port)
+        return 1
+    except NameError:
+        print('That job does not exist', file=sys.stderr)
+        return 2
+    except IOError:
+        print('Server dropped our connection.', file=sys.stderr)
+        return 1
+    except transport.JobError as job_err:
+        print(str(job_err), file=sys.stderr)
+        return 1
+    finally:
+        if command_pipe is not None:
+            command_pipe.destroy()
+
+    return 0
+
 def main():
     """
     Invokes different tools, depending upon what arguments are passed in.
@@ -141,6 +373,12 @@ def main():
     parser = load_arg_parser()
     args = parser.parse_args(sys.argv[1:])
 
+    if getattr(args, 'timeout', None) is not None:
+        if args.command == 'wait' and args.state is None and not args.ready:
+            parser.error('--timeout needs --ready or --state')
+        elif args.command in ('start', 'stop') and not args.wait:
+            parser.error('--timeout needs --wait')
+
     if args.command is None:
         # If the usage was incorrect, then just print out a brief summary
         parser.print_usage()
@@ -149,8 +387,10 @@ def main():
         parser.print_help()
         return 0
     elif args.command == 'daemon':
-        # Prevent the config from printing out too much garbage
-        logging.basicConfig(level=logging.WARNING)
+        import traceback
+        from jobmon import config, launcher
+
+        launcher.log_to_console()
 
         # With the daemon, we just have to parse the config and then
         # run the daemon. 
@@ -172,11 +412,44 @@ def main():
         print(config_handler.control_port, ',', config_handler.event_port, sep='')
 
         launcher.run_daemon(config_handler)
+    elif args.command == 'stop' and len(args.JOB) > 1:
+        status = run_for_jobs(control_port, 'stop', args.JOB)
+        if status != 0 or not args.wait:
+            return status
+        return wait_for_jobs(control_port, args.JOB, protocol.WAIT_STOPPED,
+                             args.timeout)
+    elif args.command in ('status', 'pid') and len(args.JOB) > 1:
+        return run_for_jobs(control_port, args.command, args.JOB)
     elif args.command == 'start':
+        from jobmon import schedule
+
+        start_time = None
+        try:
+            if args.delay is not None:
+                start_time = time.time() + schedule.parse_duration(args.delay)
+            elif args.at is not None:
+                start_time = schedule.parse_time(args.at, time.time())
+        except ValueError as ex:
+            print('Invalid start time:', ex, file=sys.stderr)
+            return 1
+
+        if len(args.JOB) > 1:
+            command_args = {}
+            if args.with_deps:
+                command_args['dependencies'] = True
+            if start_time is not None:
+                command_args['at'] = start_time
+            status = run_for_jobs(control_port, 'start', args.JOB,
+                                  command_args or None)
+            if status != 0 or not args.wait:
+                return status
+            return wait_for_jobs(control_port, args.JOB, protocol.WAIT_READY,
+                                 args.timeout)
+
         # Establish a connection to the job service, and start the job.
         try:
-            command_pipe = transport.CommandPipe(int(control_port))
-            command_pipe.start_job(args.JOB)
+            command_pipe = transport.CommandPipe(control_port)
+            command_pipe.start_job(args.JOB[0], args.with_deps, start_time)
         except ValueError:
             print('Invalid control port:', control_port)
             return 1
@@ -191,12 +464,15 @@ def main():
             print(str(job_err), file=sys.stderr)
             return 1
 
+        if args.wait:
+            return wait_for_jobs(control_port, args.JOB, protocol.WAIT_READY,
+                                 args.timeout)
         return 0
     elif args.command == 'stop':
         # Establish a connection to the job service, and stop the job.
         try:
-            command_pipe = transport.CommandPipe(int(control_port))
-            command_pipe.stop_job(args.JOB)
+            command_pipe = transport.CommandPipe(control_port)
+            command_pipe.stop_job(args.JOB[0])
         except ValueError:
             print('Invalid control port:', control_port)
             return 1
@@ -211,15 +487,26 @@ def main():
             print(str(job_err), file=sys.stderr)
             return 1
 
+        if args.wait:
+            return wait_for_jobs(control_port, args.JOB, protocol.WAIT_STOPPED,
+                                 args.timeout)
         return 0
     elif args.command == 'status':
         # Query the status of the job, and modify our return code depending
         # on what the job is doing.
         try:
-            command_pipe = transport.CommandPipe(int(control_port))
-            running = command_pipe.is_running(args.JOB)
-
-            return 0 if running else 1
+            command_pipe = transport.CommandPipe(control_port)
+            status = command_pipe.get_status(args.JOB[0])
+            if status.status_text is not None:
+                print(status.status_text)
+
+            if not status.is_running:
+                return 1
+            elif status.healthy is False:
+                print('UNHEALTHY', args.JOB[0], file=sys.stderr)
+                return 3
+            else:
+                return 0
         except ValueError:
             print('Invalid control port:', control_port)
             return -1
@@ -236,8 +523,8 @@ def main():
     elif args.command == 'pid':
         # Retrieves the PID of the job
         try:
-            command_pipe = transport.CommandPipe(int(control_port))
-            pid = command_pipe.get_pid(args.JOB)
+            command_pipe = transport.CommandPipe(control_port)
+            pid = command_pipe.get_pid(args.JOB[0])
             if pid is not None:
                 print(pid)
 
@@ -254,10 +541,152 @@ def main():
         except transport.JobError as job_err:
             print(str(job_err), file=sys.stderr)
             return -1
+    elif args.command == 'plan':
+        # Print out the plan one field per line, with the environment last
+        # since it's usually the longest
+        try:
+            command_pipe = transport.CommandPipe(control_port)
+            plan = command_pipe.get_spawn_plan(args.JOB)
+
+            print('argv', ' '.join(shlex.quote(arg) for arg in plan['argv']))
+            for key in ('spawn-method', 'working-dir', 'stdin', 'stdout',
+                        'stderr', 'signal', 'cgroup'):
+                print(key, plan[key])
+
+            for key, value in sorted(plan['placement'].items()):
+                print(key, value)
+
+            for name, (soft, hard) in sorted(plan['rlimits'].items()):
+                print('rlimit', name, soft, hard)
+
+            for var, value in sorted(plan['env'].items()):
+                print('env', var + '=' + value)
+            return 0
+        except ValueError:
+            print('Invalid control port:', control_port)
+            return 1
+        except IOError:
+            print('Server dropped our connection.', file=sys.stderr)
+            return 1
+        except NameError:
+            print('That job does not exist', file=sys.stderr)
+            return 1
+        except transport.JobError as job_err:
+            print(str(job_err), file=sys.stderr)
+            return 1
+    elif args.command == 'place':
+        changes = {}
+        for key, value in (('cpu-affinity', args.cpus), ('nice', args.nice),
+                           ('io-class', args.io_class),
+                           ('io-priority', args.io_priority)):
+            if value is not None:
+                changes[key] = value
+
+        if not changes:
+            print('Nothing to change', file=sys.stderr)
+            return 1
+
+        try:
+            command_pipe = transport.CommandPipe(control_port)
+            command_pipe.set_placement(args.JOB, changes)
+            return 0
+        except ValueError:
+            print('Invalid control port:', control_port)
+            return 1
+        except IOError:
+            print('Server dropped our connection.', file=sys.stderr)
+            return 1
+        except NameError:
+            print('That job does not exist', file=sys.stderr)
+            return 1
+        except transport.JobError as job_err:
+            print(str(job_err), file=sys.stderr)
+            return 1
+    elif args.command == 'scale':
+        try:
+            command_pipe = transport.CommandPipe(control_port)
+            command_pipe.scale_job(args.JOB, args.REPLICAS)
+            return 0
+        except ValueError:
+            print('Invalid control port:', control_port)
+            return 1
+        except IOError:
+            print('Server dropped our connection.', file=sys.stderr)
+            return 1
+        except NameError:
+            print('That job does not exist', file=sys.stderr)
+            return 1
+        except transport.JobError as job_err:
+            print(str(job_err), file=sys.stderr)
+            return 1
+    elif args.command == 'tail':
+        try:
+            command_pipe = transport.CommandPipe(control_port)
+            ring = command_pipe.get_output_ring(args.JOB)
+        except ValueError:
+            print('Invalid control port:', control_port)
+            return 1
+        except IOError:
+            print('Server dropped our connection.', file=sys.stderr)
+            return 1
+        except NameError:
+            print('That job does not exist', file=sys.stderr)
+            return 1
+        except transport.JobError as job_err:
+            print(str(job_err), file=sys.stderr)
+            return 1
+
+        try:
+            lines, position = ring.tail(args.lines)
+            for line in lines:
+                print(line)
+
+            if args.follow:
+                sys.stdout.flush()
+                for data in ring.follow(position):
+                    sys.stdout.buffer.write(data)
+                    sys.stdout.buffer.flush()
+            return 0
+        except KeyboardInterrupt:
+            return 0
+        except BrokenPipeError:
+            return 0
+        finally:
+            ring.close()
+    elif args.command == 'stats':
+        from jobmon import tracing
+
+        try:
+            command_pipe = transport.CommandPipe(control_port)
+            stats = command_pipe.get_stats()
+        except ValueError:
+            print('Invalid control port:', control_port)
+            return 1
+        except IOError:
+            print('Server dropped our connection.', file=sys.stderr)
+            return 1
+        except transport.JobError as job_err:
+            print(str(job_err), file=sys.stderr)
+            return 1
+
+        def format_ms(seconds):
+            return '-' if seconds is None else '{:.3f}'.format(seconds * 1000)
+
+        print('COMMAND', 'STAGE', 'COUNT', 'MEAN', 'P50', 'P90', 'P99')
+        for command, stages in sorted(stats.items()):
+            for stage in tracing.STAGES + ('total',):
+                if stage not in stages:
+                    continue
+
+                summary = stages[stage]
+                print(command, stage, summary['count'],
+                      *(format_ms(summary[key])
+                        for key in ('mean', 'p50', 'p90', 'p99')))
+        return 0
     elif args.command == 'list-jobs':
         # Get all the jobs and print them in the specified format
         try:
-            command_pipe = transport.CommandPipe(int(control_port))
+            command_pipe = transport.CommandPipe(control_port)
             jobs = command_pipe.get_jobs()
 
             for job_name, status in jobs.items():
@@ -278,7 +707,7 @@ def main():
             return 1
     elif args.command == 'terminate':
         try:
-            command_pipe = transport.CommandPipe(int(control_port))
+            command_pipe = transport.CommandPipe(control_port)
             command_pipe.terminate()
             return 0
         except ValueError:
@@ -288,9 +717,24 @@ def main():
             print('Server dropped our connection.',
                   file=sys.stderr)
             return 1
+    elif args.command == 'reexec':
+        try:
+            command_pipe = transport.CommandPipe(control_port)
+            command_pipe.reexec()
+            return 0
+        except ValueError:
+            print('Invalid control port:', control_port)
+            return 1
+        except IOError:
+            print('Server dropped our connection.',
+                  file=sys.stderr)
+            return 1
+        except transport.JobError as job_err:
+            print(str(job_err), file=sys.stderr)
+            return 1
     elif args.command == 'listen':
         try:    
-            event_stream = transport.EventStream(int(event_port))
+            event_stream = transport.EventStream(event_port)
            
             if args.NUM_EVENTS <= 0:
                 events_to_go = float('inf')
@@ -311,10 +755,21 @@ def main():
                     print('STOPPED', evt.job_name)
                 elif evt.event_code == protocol.EVENT_RESTARTJOB:
                     print('RESTARTING', evt.job_name)
+                elif evt.event_code == protocol.EVENT_UNHEALTHY:
+                    print('UNHEALTHY', evt.job_name)
+                elif evt.event_code == protocol.EVENT_READY:
+                    print('READY', evt.job_name)
+                elif evt.event_code == protocol.EVENT_STOPPING:
+                    print('STOPPING', evt.job_name)
+                elif evt.event_code == protocol.EVENT_KILLED:
+                    print('KILLED', evt.job_name)
                 elif evt.event_code == protocol.EVENT_TERMINATE:
                     print('TERMINATE')
                     break
 
+                for line in evt.output or []:
+                    print('\t' + line)
+
                 events_to_go -= 1
 
             return 0
@@ -329,9 +784,12 @@ def main():
             print('Server dropped our connection.',
                   file=sys.stderr)
             return 1
+    elif args.command == 'wait' and (args.state is not None or args.ready):
+        state = protocol.WAIT_READY if args.ready else args.state
+        return wait_for_jobs(control_port, [args.JOB], state, args.timeout)
     elif args.command == 'wait':
         try:
-            event_stream = transport.EventStream(int(event_port))
+            event_stream = transport.EventStream(event_port)
             job = args.JOB
 
             while True:
@@ -354,6 +812,41 @@ def main():
             print('Server dropped our connection.',
                   file=sys.stderr)
             return 1
+    elif args.command in ('batch', 'shell'):
+        from jobmon import batch
+
+        if args.command == 'shell':
+            lines = batch.read_interactive()
+        elif args.FILE == '-':
+            lines = sys.stdin
+        else:
+            try:
+                lines = open(args.FILE)
+            except OSError as ex:
+                print('Cannot read commands:', ex, file=sys.stderr)
+                return 1
+
+        command_pipe = None
+        try:
+            command_pipe = transport.CommandPipe(control_port, keep_open=True)
+            return batch.run(command_pipe, lines, sys.stdout, args.json)
+        except ValueError:
+            print('Invalid control port:', control_port)
+            return 1
+        except BrokenPipeError:
+            # Our output has gone away, such as when piping through head
+            return 0
+        except IOError:
+            print('Server dropped our connection.', file=sys.stderr)
+            return 1
+        except transport.JobError as job_err:
+            print(str(job_err), file=sys.stderr)
+            return 1
+        finally:
+            if command_pipe is not None:
+                command_pipe.destroy()
+            if lines is not sys.stdin:
+                lines.close()
     else:
         parser.print_usage()
         return 1
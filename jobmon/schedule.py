@@ -0,0 +1,327 @@
+"""
+JobMon Schedules
+================
+
+Starts jobs at set times, so that periodic jobs don't need a separate cron.
+Each job can have one schedule, which is either:
+
+- ``cron``, a crontab expression (``minute hour day month weekday``, or one
+  of the ``@hourly`` style shortcuts), evaluated in local time.
+- ``every``, a fixed interval between runs.
+
+A run can come due while the job's previous run is still going, in which case
+the job's overlap policy decides what happens - the new run is skipped, or
+queued up until the previous run exits, or the previous run is killed and the
+new run started once it has exited.
+
+Every job is offset from its schedule by a fixed fraction of its jitter,
+worked out from the job's name. Jobs with the same schedule are spread out
+rather than all starting in the same second, while each job still runs
+exactly one period apart.
+
+All of the timing is done on the service's ticker, under a
+:class:`ScheduleKey` so that it is kept apart from the job's restart timer
+and health checks. The same ticker handles one-off starts, such as those from
+``jobmon start --in``.
+"""
+from collections import namedtuple
+import datetime
+import math
+import re
+import zlib
+
+KIND_CRON, KIND_EVERY = 'cron', 'every'
+KINDS = (KIND_CRON, KIND_EVERY)
+
+# What happens when a run comes due while the previous run is still going
+OVERLAP_SKIP, OVERLAP_QUEUE, OVERLAP_KILL = 'skip', 'queue', 'kill'
+OVERLAPS = (OVERLAP_SKIP, OVERLAP_QUEUE, OVERLAP_KILL)
+
+# Unless a schedule says otherwise, its jitter is a tenth of its period (with
+# cron expressions having a period of a minute), up to this many seconds
+MAX_DEFAULT_JITTER = 30
+DEFAULT_JITTER_FRACTION = 0.1
+
+# How far ahead a cron expression is searched for its next time, which is far
+# enough for expressions like "0 0 29 2 1" that rarely come up
+CRON_SEARCH_YEARS = 30
+
+CRON_ALIASES = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+
+MONTH_NAMES = ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep',
+               'oct', 'nov', 'dec']
+WEEKDAY_NAMES = ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']
+
+# The suffixes that durations can have, and how many seconds each is
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# A job's schedule:
+#
+# - kind is one of KINDS, and spec is a CronExpression for cron schedules or
+#   the interval in seconds for every
+# - overlap is one of OVERLAPS
+# - jitter is the most (in seconds) that the job's runs are offset by
+Schedule = namedtuple('Schedule', ['kind', 'spec', 'overlap', 'jitter'])
+
+# The times that a cron expression matches. Each field is a frozenset of the
+# values it matches, with Sunday being weekday 0. Following cron, when both
+# days and weekdays are restricted, a day matching either of them is enough.
+CronExpression = namedtuple('CronExpression',
+                            ['minutes', 'hours', 'days', 'months', 'weekdays',
+                             'any_day', 'any_weekday'])
+
+# The key that a job's runs are registered under in the ticker - one_off is
+# True for a single delayed start, and False for the job's schedule
+ScheduleKey = namedtuple('ScheduleKey', ['job', 'one_off'])
+
+def parse_duration(value):
+    """
+    Reads a duration, which is either a number of seconds or a string like
+    ``90s``, ``15m``, ``2h`` or ``1d``.
+
+    :return: The duration in seconds.
+    :raises ValueError: If the duration is invalid or isn't positive.
+    """
+    if isinstance(value, bool):
+        raise ValueError('Invalid duration {}'.format(value))
+
+    if isinstance(value, (int, float)):
+        seconds = value
+    elif isinstance(value, str):
+        match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*', value)
+        if match is None:
+            raise ValueError('Invalid duration "{}"'.format(value))
+        number, unit = match.groups()
+        seconds = float(number) * DURATION_UNITS[unit or 's']
+    else:
+        raise ValueError('Invalid duration {}'.format(value))
+
+    if seconds <= 0:
+        raise ValueError('Durations must be positive')
+    return seconds
+
+def parse_time(text, now):
+    """
+    Reads a time of day (``HH:MM`` or ``HH:MM:SS``, which is the next time
+    that comes up) or a date and time in ISO 8601 format, in local time.
+
+    :param str text: The time to read.
+    :param float now: The current time, as a timestamp.
+    :return: The time, as a timestamp.
+    :raises ValueError: If the time is invalid.
+    """
+    if re.fullmatch(r'\d{1,2}:\d{2}(:\d{2})?', text):
+        parts = [int(part) for part in text.split(':')] + [0]
+        today = datetime.datetime.fromtimestamp(now)
+        when = today.replace(hour=parts[0], minute=parts[1], second=parts[2],
+                             microsecond=0)
+        if when.timestamp() <= now:
+            when += datetime.timedelta(days=1)
+        return when.timestamp()
+
+    return datetime.datetime.fromisoformat(text).timestamp()
+
+def parse_cron_field(field, low, high, names=None):
+    """
+    Reads one field of a cron expression, which is a comma-separated list of
+    ``*``, values and ranges (``a-b``), each optionally followed by a step
+    (``/n``).
+
+    :param int low: The lowest value the field can have.
+    :param int high: The highest value the field can have.
+    :param list names: The names that can be used in place of values, \
+    starting from ``low``.
+    :return: A :class:`frozenset` of the values that the field matches.
+    :raises ValueError: If the field is invalid.
+    """
+    def read_value(text):
+        if names is not None and text.lower() in names:
+            return names.index(text.lower()) + low
+        value = int(text)
+        if not low <= value <= high:
+            raise ValueError('{} is out of range {}-{}'.format(value, low,
+                                                               high))
+        return value
+
+    values = set()
+    for part in field.split(','):
+        span, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if step < 1:
+            raise ValueError('Steps must be positive')
+
+        if span == '*':
+            start, end = low, high
+        elif '-' in span:
+            start, end = [read_value(bound) for bound in span.split('-', 1)]
+        else:
+            start = read_value(span)
+            end = high if step > 1 else start
+
+        if start > end:
+            raise ValueError('Invalid range "{}"'.format(span))
+        values.update(range(start, end + 1, step))
+
+    return frozenset(values)
+
+def parse_cron(text):
+    """
+    Reads a cron expression.
+
+    :return: A :class:`CronExpression`.
+    :raises ValueError: If the expression is invalid.
+    """
+    text = CRON_ALIASES.get(text.strip().lower(), text)
+    fields = text.split()
+    if len(fields) != 5:
+        raise ValueError('Cron expressions have 5 fields, got "{}"'.format(
+            text))
+
+    minute, hour, day, month, weekday = fields
+    weekdays = parse_cron_field(weekday, 0, 7, WEEKDAY_NAMES)
+    if 7 in weekdays:
+        # Both 0 and 7 are Sunday
+        weekdays = (weekdays - {7}) | {0}
+
+    return CronExpression(
+        parse_cron_field(minute, 0, 59),
+        parse_cron_field(hour, 0, 23),
+        parse_cron_field(day, 1, 31),
+        parse_cron_field(month, 1, 12, MONTH_NAMES),
+        weekdays,
+        day.startswith('*'), weekday.startswith('*'))
+
+def cron_day_matches(expr, when):
+    """
+    Checks whether a cron expression matches a date.
+    """
+    day_matches = when.day in expr.days
+    # datetime counts weekdays from Monday, rather than cron's Sunday
+    weekday_matches = (when.weekday() + 1) % 7 in expr.weekdays
+
+    if expr.any_day or expr.any_weekday:
+        return day_matches and weekday_matches
+    return day_matches or weekday_matches
+
+def next_cron_time(expr, after):
+    """
+    Works out the first time that a cron expression matches.
+
+    :param CronExpression expr: The expression.
+    :param float after: The time to search from, as a timestamp.
+    :return: The first matching time after ``after``, as a timestamp, or \
+    ``None`` if it never matches.
+    """
+    when = datetime.datetime.fromtimestamp(after).replace(second=0,
+                                                          microsecond=0)
+    when += datetime.timedelta(minutes=1)
+    last_year = when.year + CRON_SEARCH_YEARS
+
+    # Anything which doesn't match skips ahead to the start of the next
+    # month, day or hour, rather than going through every minute
+    while when.year <= last_year:
+        if when.month not in expr.months:
+            if when.month == 12:
+                when = when.replace(year=when.year + 1, month=1, day=1,
+                                    hour=0, minute=0)
+            else:
+                when = when.replace(month=when.month + 1, day=1, hour=0,
+                                    minute=0)
+        elif not cron_day_matches(expr, when):
+            when = (when.replace(hour=0, minute=0) +
+                    datetime.timedelta(days=1))
+        elif when.hour not in expr.hours:
+            when = (when.replace(minute=0) + datetime.timedelta(hours=1))
+        elif when.minute not in expr.minutes:
+            when += datetime.timedelta(minutes=1)
+        else:
+            return when.timestamp()
+
+    return None
+
+def from_config(value):
+    """
+    Reads a schedule from a job's ``schedule`` configuration. This is either
+    a cron expression, or a dictionary with exactly one of the keys ``cron``
+    or ``every`` (a duration, as :func:`parse_duration` reads), and
+    optionally ``overlap`` and ``jitter``.
+
+    :return: A :class:`Schedule`.
+    :raises ValueError: If the schedule is invalid.
+    """
+    if isinstance(value, str):
+        value = {KIND_CRON: value}
+
+    if not isinstance(value, dict):
+        raise ValueError('schedule must be a cron expression or a dictionary')
+
+    kinds = [kind for kind in KINDS if kind in value]
+    if len(kinds) != 1:
+        raise ValueError('schedule needs exactly one of: {}'.format(
+            ', '.join(KINDS)))
+    kind = kinds[0]
+
+    if kind == KIND_CRON:
+        if not isinstance(value[KIND_CRON], str):
+            raise ValueError('cron must be a cron expression')
+        spec = parse_cron(value[KIND_CRON])
+        if next_cron_time(spec, 0) is None:
+            raise ValueError('"{}" never matches'.format(value[KIND_CRON]))
+        period = 60
+    else:
+        spec = parse_duration(value[KIND_EVERY])
+        period = spec
+
+    overlap = value.get('overlap', OVERLAP_SKIP)
+    if overlap not in OVERLAPS:
+        raise ValueError('overlap must be one of: {}'.format(
+            ', '.join(OVERLAPS)))
+
+    if 'jitter' in value:
+        jitter = value['jitter']
+        if (isinstance(jitter, bool) or not isinstance(jitter, (int, float))
+                or not 0 <= jitter < period):
+            raise ValueError('jitter must be at least 0 and less than the '
+                             'period of the schedule')
+    else:
+        jitter = min(MAX_DEFAULT_JITTER, period * DEFAULT_JITTER_FRACTION)
+
+    return Schedule(kind, spec, overlap, jitter)
+
+def job_offset(schedule, job):
+    """
+    Works out how far a job's runs are moved from its schedule. This depends
+    only on the job's name, so that it is the same for every run, and across
+    restarts of the supervisor.
+
+    :return: The offset in seconds, which is less than the schedule's jitter.
+    """
+    return schedule.jitter * (zlib.crc32(job.encode('utf-8')) / 2 ** 32)
+
+def next_run(schedule, job, after):
+    """
+    Works out when a job should next run.
+
+    :param Schedule schedule: The job's schedule.
+    :param str job: The name of the job.
+    :param float after: The time to search from, as a timestamp.
+    :return: The time of the first run after ``after``, as a timestamp, or \
+    ``None`` if there aren't any more.
+    """
+    offset = job_offset(schedule, job)
+    if schedule.kind == KIND_CRON:
+        when = next_cron_time(schedule.spec, after - offset)
+        return None if when is None else when + offset
+
+    # Intervals are counted from the epoch rather than from when the
+    # supervisor started, so that the runs don't drift
+    periods = math.floor((after - offset) / schedule.spec) + 1
+    return periods * schedule.spec + offset
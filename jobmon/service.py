@@ -1,11 +1,19 @@
 from collections import namedtuple
 from concurrent.futures import Future
+import itertools
 import logging
-from queue import Queue
+import math
+import os
+from queue import Empty, Queue
+import signal
 import threading
 import time
 
-from jobmon import protocol
+from jobmon import (
+    config as config_mod, dependencies, handoff, health, journal as journal_mod,
+    limits, metrics, monitor, placement, protocol, schedule as schedule_mod,
+    tracing
+)
 
 SERVICE_LOGGER = logging.getLogger('jobmon.service.service')
 SHIM_LOGGER = logging.getLogger('jobmon.service.shim')
@@ -15,33 +23,78 @@ SHIM_LOGGER = logging.getLogger('jobmon.service.shim')
 RESTART_TIMEOUT = 5
 RESTART_BACKOFF = 10
 
+# How many lines of output are attached to the event sent when a job fails
+STOP_OUTPUT_LINES = 20
+
 # This is a much more informal definition than the rest of the protocol, since
 # this is used purely for internal purposes. In brief, 'action' is a string
 # saying what the service should do, and 'args' is a dict of the things that
-# it needs to do it.
-Request = namedtuple('Request', ('action', 'args'))
+# it needs to do it. 'trace' is the tracing.Trace of the command that the
+# request is for, if any.
+Request = namedtuple('Request', ('action', 'args', 'trace'), defaults=[None])
+
+# The key that a waiting client's deadline is registered under in the ticker,
+# which keeps it apart from the job's other timers. Each waiter has its own
+# number, since many clients can wait on the same job.
+WaitKey = namedtuple('WaitKey', ['job', 'waiter'])
+
+# The key that a job's deadline for exiting is registered under in the ticker,
+# while the supervisor is shutting down
+ShutdownKey = namedtuple('ShutdownKey', ['job'])
 
 class NoSuchJobError(Exception):
     def __init__(self, job):
         super().__init__()
         self.job = job
 
+def forward_result(source, target):
+    """
+    Gives one future's result to another, once the first one has it.
+    """
+    source.add_done_callback(lambda done: target.set_result(done.result()))
+
 class SupervisorService(threading.Thread):
     """
     This is the method which is actually responsible for handling the duties
     of the supervisor (unlike the method stubs in Supervisor which just push
     events to the service thread)
     """
-    def __init__(self, config, event_svr, status_svr, restart_ticker):
+    def __init__(self, config, event_svr, status_svr, restart_ticker,
+                 watcher=None, fork_server=None, output_capture=None,
+                 cgroups=None, cpu_allocator=None, metrics_server=None,
+                 health_checker=None, notify_server=None, journal=None,
+                 handed_over=None, clock=time):
         super().__init__()
 
         # This contains pairs of (message, future), where the future is 
         # assigned when the value is computed
         self.request_queue = Queue()
+        metrics.SERVICE_QUEUE_DEPTH.set_function(self.request_queue.qsize)
 
+        self.config = config
         self.jobs = config.jobs
-        self.autostarts = config.autostarts
-        self.restarts = config.restarts
+        # These are looked up on every start and stop, so they're kept as
+        # sets rather than the configuration's lists
+        self.autostarts = set(config.autostarts)
+        self.restarts = set(config.restarts)
+        self.job_files = config.job_files
+        self.replica_groups = config.replica_groups
+        self.group_files = config.group_files
+        self.process_class = config.process_class
+        self.shutdown_timeout = config.shutdown_timeout
+        self.config_file = config.config_file
+
+        # What the supervisor that this one replaced was doing, if it
+        # re-executed itself (see get_handoff)
+        self.handed_over = handed_over
+
+        # Jobs adopted from the supervisor that this one replaced, whose
+        # listeners have already been told that they started
+        self.taken_over = set()
+
+        # Jobs which have been removed from their job file, but which are
+        # still running - these are forgotten once they stop
+        self.removed_jobs = set()
 
         # This is used exclusively for shutdown, when we want to make sure
         # that every job is dead before we stop the event server and take
@@ -52,10 +105,77 @@ class SupervisorService(threading.Thread):
         self.events = event_svr
         self.status = status_svr
         self.restart_ticker = restart_ticker
+        self.watcher = watcher
+        self.fork_server = fork_server
+        self.output_capture = output_capture
+        self.cgroups = cgroups
+        self.cpu_allocator = cpu_allocator
+        self.metrics_server = metrics_server
+        self.health_checker = health_checker
+        self.notify_server = notify_server
+        self.journal = journal
+
+        # Restart throttling is timed by this clock, which is the same as the
+        # restart ticker's
+        self.clock = clock
 
         self.restart_times = {}
         self.blocked_restarts = set()
 
+        # Jobs which are waiting on the restart ticker because they restarted
+        # too often - unlike the blocked restarts, this doesn't include jobs
+        # which were stopped on purpose
+        self.throttled_jobs = set()
+
+        # How many health checks in a row each running job has failed, and
+        # the jobs which have failed too many
+        self.health_failures = {}
+        self.unhealthy_jobs = set()
+
+        # Jobs which were killed so that they would start again, such as for
+        # failing their health checks - these are restarted even if they
+        # normally wouldn't be
+        self.forced_restarts = set()
+
+        # The processes which jobs were running when they reported that they
+        # were ready, along with the status text they last reported - these
+        # only count while the job is still running the same process
+        self.ready_pids = {}
+        self.status_texts = {}
+
+        # Maps PIDs back onto the jobs running them, for notifications. This
+        # is only rebuilt when a notification comes from an unknown process.
+        self.pid_jobs = {}
+
+        # Jobs which are waiting for their dependencies to come up before
+        # they start, mapped to the dependencies they're waiting on, along
+        # with the reverse of that (whose values are dicts with no values,
+        # so that waiting jobs are started in the order they were added)
+        self.waiting_starts = {}
+        self.start_waiters = {}
+
+        # While shutting down, each running job is mapped to the running jobs
+        # which depend on it, which have to stop before it is stopped. Jobs
+        # which have been asked to stop aren't asked again, and jobs which are
+        # still running when their deadlines pass are killed.
+        self.stop_blockers = {}
+        self.stopping_jobs = set()
+        self.killed_jobs = set()
+
+        # Scheduled jobs which came due while their last run was still going,
+        # and which are started once it exits, along with the jobs which have
+        # a one-off start coming up (mapped to whether their dependencies are
+        # started with them)
+        self.queued_runs = set()
+        self.delayed_starts = {}
+
+        # Clients waiting for jobs to reach a state - each job maps each state
+        # onto the waiters' futures, keyed by their WaitKey. These are only
+        # looked at when the job starts, stops or becomes ready, or when a
+        # waiter's deadline passes, so waiting clients cost nothing otherwise.
+        self.job_waiters = {}
+        self.waiter_numbers = itertools.count()
+
     def check_job_exists(self, job):
         """
         Sends back a standard erorr response if the job doesn't exist.
@@ -73,86 +193,87 @@ class SupervisorService(threading.Thread):
         while not done:
             request, future = self.request_queue.get()
             SERVICE_LOGGER.info('Got request %s', request)
+            if request.trace is not None:
+                request.trace.mark(tracing.DEQUEUED)
 
-            # For most commands, no response is necessary, so defaulting to
-            # None cuts out a lot of clutter
-            response = None
+            response = self.handle_request(request)
+            done = request.action == 'terminate'
 
-            try:
-                if request.action == 'init':
-                    self.init_jobs()
-
-                elif request.action == 'terminate':
-                    # Apologies in advance for the control flow here.
-                    #
-                    # It's very important that all child processes get shut
-                    # down, and to that effect, we have to wait from word
-                    # sent by the status server that all of them have died.
-                    #
-                    # The problem is that these come in as requests, which
-                    # means that we have to enter a special mode where we
-                    # handle only job-started and job-stopped, to ensure
-                    # that all dying chidren are accounted for.
-                    self.shutting_down = True
-                    self.cleanup_jobs()
-
-                    done = True
-                elif request.action == 'job-started':
-                    self.process_start(request.args['job'])
-
-                elif request.action == 'job-stopped':
-                    self.process_stop(request.args['job'])
-
-                elif request.action == 'start-job':
-                    self.check_job_exists(request.args['job'])
-                    response = self.start_job(request.args['job'])
-
-                elif request.action == 'stop-job':
-                    self.check_job_exists(request.args['job'])
-                    response = self.stop_job(request.args['job'])
-
-                elif request.action == 'get-status':
-                    self.check_job_exists(request.args['job'])
-                    response = self.get_status(request.args['job'])
-
-                elif request.action == 'list-jobs':
-                    response = self.list_jobs()
-
-                elif request.action == 'job-timer-expire':
-                    self.job_timer_expired(request.args['job'])
-
-            except NoSuchJobError as err:
-                response = protocol.FailureResponse(
-                        err.job, 
-                        protocol.ERR_NO_SUCH_JOB)
-
-            SERVICE_LOGGER.info('Sending response %s', response)
-            future.set_result(response)
+            if request.trace is not None:
+                request.trace.mark(tracing.HANDLED)
+
+            if isinstance(response, Future):
+                # The response to a wait comes later, once the job reaches
+                # the state that it's waiting for
+                SERVICE_LOGGER.info('Deferring response')
+                forward_result(response, future)
+            else:
+                SERVICE_LOGGER.info('Sending response %s', response)
+                future.set_result(response)
 
         # Wait for the status server to get back to us with all of its
-        # closure notifications. See the 'terminate' case above for an
-        # explanation of why this is necessary.
+        # closure notifications. See the 'terminate' case in handle_request
+        # for an explanation of why this is necessary.
         SERVICE_LOGGER.info('Entering event closure loop')
         while self.running_jobs:
             SERVICE_LOGGER.info('Still running: %s', self.running_jobs)
             request, future = self.request_queue.get()
 
             SERVICE_LOGGER.info('Got closing request %s', request)
+            self.handle_closing_request(request)
+            future.set_result(None)
 
-            if request.action == 'job-started':
-                self.process_start(request.args['job'])
+        # Anybody still waiting would wait forever, since nothing else is
+        # going to start or stop
+        for job in list(self.job_waiters):
+            self.end_waits(job, protocol.ERR_WAIT_TIMEOUT)
 
-                # Clearly we can't have it running again, so make sure that
-                # it goes down for good this time
-                SERVICE_LOGGER.info('Re-killing %s', request.args['job'])
-                self.jobs[request.args['job']].kill()
+        if self.watcher is not None:
+            SERVICE_LOGGER.info('KILL: watcher')
+            self.watcher.terminate()
 
-            elif request.action == 'job-stopped':
-                self.process_stop(request.args['job'])
+            SERVICE_LOGGER.info('BURY: watcher')
+            self.watcher.wait_for_exit()
 
-            # Since we can't do anything now but stop jobs, all other
-            # requests are ignored
-            future.set_result(None)
+        if self.fork_server is not None:
+            SERVICE_LOGGER.info('KILL: fork server')
+            self.fork_server.terminate()
+
+        if self.cgroups is not None:
+            SERVICE_LOGGER.info('KILL: cgroups')
+            self.cgroups.cleanup()
+
+        if self.output_capture is not None:
+            SERVICE_LOGGER.info('KILL: output capture')
+            self.output_capture.terminate()
+
+            SERVICE_LOGGER.info('BURY: output capture')
+            self.output_capture.wait_for_exit()
+
+        if self.notify_server is not None:
+            SERVICE_LOGGER.info('KILL: notify server')
+            self.notify_server.terminate()
+
+            SERVICE_LOGGER.info('BURY: notify server')
+            self.notify_server.wait_for_exit()
+
+        if self.health_checker is not None:
+            SERVICE_LOGGER.info('KILL: health checker')
+            self.health_checker.terminate()
+
+            SERVICE_LOGGER.info('BURY: health checker')
+            self.health_checker.wait_for_exit()
+
+        if self.journal is not None:
+            SERVICE_LOGGER.info('KILL: journal')
+            self.journal.close()
+
+        if self.metrics_server is not None:
+            SERVICE_LOGGER.info('KILL: metrics')
+            self.metrics_server.terminate()
+
+            SERVICE_LOGGER.info('BURY: metrics')
+            self.metrics_server.wait_for_exit()
 
         SERVICE_LOGGER.info('KILL: ticker')
         self.restart_ticker.terminate()
@@ -172,29 +293,593 @@ class SupervisorService(threading.Thread):
         SERVICE_LOGGER.info('BURY: events')
         self.events.wait_for_exit()
 
+    def handle_request(self, request):
+        """
+        Carries out a single request.
+
+        :return: The response to send back, which is ``None`` for most \
+        requests that don't come from clients.
+        """
+        # For most commands, no response is necessary, so defaulting to
+        # None cuts out a lot of clutter
+        response = None
+
+        try:
+            if request.action == 'init':
+                self.init_jobs()
+
+            elif request.action == 'terminate':
+                # Apologies in advance for the control flow here.
+                #
+                # It's very important that all child processes get shut
+                # down, and to that effect, we have to wait from word
+                # sent by the status server that all of them have died.
+                #
+                # The problem is that these come in as requests, which
+                # means that we have to enter a special mode where we
+                # handle only job-started and job-stopped, to ensure
+                # that all dying chidren are accounted for. Jobs which
+                # haven't died by their shutdown deadlines are killed, so
+                # this doesn't go on forever.
+                self.shutting_down = True
+                self.cleanup_jobs()
+
+            elif request.action == 'job-started':
+                self.process_start(request.args['job'])
+
+            elif request.action == 'job-stopped':
+                self.process_stop(request.args['job'])
+
+            elif request.action == 'start-job':
+                self.check_job_exists(request.args['job'])
+                if request.args.get('at') is not None:
+                    response = self.start_job_at(
+                        request.args['job'], request.args['at'],
+                        request.args.get('with_deps', False))
+                else:
+                    response = self.start_job(
+                        request.args['job'],
+                        request.args.get('with_deps', False))
+
+            elif request.action == 'stop-job':
+                self.check_job_exists(request.args['job'])
+                response = self.stop_job(request.args['job'])
+
+            elif request.action == 'get-status':
+                self.check_job_exists(request.args['job'])
+                response = self.get_status(request.args['job'])
+
+            elif request.action == 'wait-job':
+                self.check_job_exists(request.args['job'])
+                response = self.wait_job(request.args['job'],
+                                         request.args['state'],
+                                         request.args.get('timeout'))
+
+            elif request.action == 'list-jobs':
+                response = self.list_jobs()
+
+            elif request.action == 'get-spawn-plan':
+                self.check_job_exists(request.args['job'])
+                response = self.get_spawn_plan(request.args['job'])
+
+            elif request.action == 'get-output-ring':
+                self.check_job_exists(request.args['job'])
+                response = self.get_output_ring(request.args['job'])
+
+            elif request.action == 'set-placement':
+                self.check_job_exists(request.args['job'])
+                response = self.set_placement(request.args['job'],
+                                              request.args['placement'])
+
+            elif request.action == 'scale-job':
+                response = self.scale_job(request.args['job'],
+                                          request.args['replicas'])
+
+            elif request.action == 'get-stats':
+                response = protocol.StatsResponse(tracing.get_stats())
+
+            elif request.action == 'job-timer-expire':
+                # Health checks share the ticker with restarts, but their
+                # timers have keys of their own
+                timer = request.args['job']
+                if isinstance(timer, health.CheckKey):
+                    self.run_health_check(timer.job)
+                elif isinstance(timer, schedule_mod.ScheduleKey):
+                    if timer.one_off:
+                        self.delayed_start_expired(timer.job)
+                    else:
+                        self.run_scheduled(timer.job)
+                elif isinstance(timer, WaitKey):
+                    self.wait_expired(timer)
+                else:
+                    self.job_timer_expired(timer)
+
+            elif request.action == 'health-check-done':
+                self.health_check_done(
+                    request.args['job'], request.args['pid'],
+                    request.args['passed'], request.args['message'])
+
+            elif request.action == 'job-notify':
+                self.job_notify(request.args['pid'], request.args['session'],
+                                request.args['fields'])
+
+            elif request.action == 'reload-job-file':
+                self.reload_job_file(request.args['filename'])
+
+            elif request.action == 'reexec':
+                response = self.reexec(request.args['listener'],
+                                       request.args['requester'],
+                                       request.args['clients'])
+
+            elif request.action == 'finish-reexec':
+                response = protocol.SuccessResponse(None)
+
+        except NoSuchJobError as err:
+            response = protocol.FailureResponse(
+                    err.job, 
+                    protocol.ERR_NO_SUCH_JOB)
+
+        return response
+
+    def handle_closing_request(self, request):
+        """
+        Carries out a request after the service has been terminated, while it
+        waits for the remaining jobs to die.
+        """
+        if request.action == 'job-started':
+            job = request.args['job']
+            self.process_start(job)
+
+            # Clearly we can't have it running again, so make sure that
+            # it goes down for good this time
+            SERVICE_LOGGER.info('Re-killing %s', job)
+            if ShutdownKey(job) not in self.restart_ticker:
+                self.restart_ticker.register(
+                    ShutdownKey(job),
+                    self.clock.time() + self.get_shutdown_timeout(job))
+            self.stopping_jobs.discard(job)
+            self.killed_jobs.discard(job)
+            self.kill_for_shutdown(job)
+
+        elif request.action == 'job-stopped':
+            job = request.args['job']
+            job_deps = dependencies.get_dependencies(self.jobs[job])
+            self.restart_ticker.unregister(ShutdownKey(job))
+            self.process_stop(job)
+            self.stop_unblocked(job, job_deps)
+
+        elif (request.action == 'job-timer-expire' and
+                isinstance(request.args['job'], ShutdownKey)):
+            self.shutdown_timeout_expired(request.args['job'].job)
+
+        # Since we can't do anything now but stop jobs, all other
+        # requests are ignored
+
     def init_jobs(self):
         """
-        Configures each job with the status server, and autostarts any jobs
-        that need to be started.
+        Configures each job with the status server, takes back any jobs that
+        were still running when the last supervisor died, and autostarts any
+        jobs that need to be started. A supervisor which replaced another
+        carries on from where that one left off instead.
         """
         SERVICE_LOGGER.info('Initializing %d jobs', len(self.jobs))
-        for job_name, proc_skel in self.jobs.items():
-            proc_skel.set_event_sock(self.status.get_peer())
+        for job, proc_skel in self.jobs.items():
+            self.attach_job(proc_skel)
+            self.schedule_runs(job)
+
+        if self.handed_over is not None:
+            self.take_over(self.handed_over)
+            self.handed_over = None
+            return
+
+        if self.journal is not None:
+            self.adopt_jobs()
+
+        self.start_jobs(self.autostarts, with_deps=True)
+
+    def adopt_jobs(self):
+        """
+        Goes through the journal left by the last supervisor, and adopts the
+        processes of any jobs which are still running them. Processes of jobs
+        which are no longer configured are left alone, since there is no way
+        of knowing how they should be stopped.
+
+        Jobs whose output was captured lost their pipes along with the last
+        supervisor, so their processes are restarted rather than being left
+        to run without anywhere to write to.
+        """
+        for job, state in list(self.journal.states.items()):
+            alive = self.journal.is_alive(job)
+            if job not in self.jobs:
+                if alive:
+                    SERVICE_LOGGER.warning(
+                        'PID %d of %s is still running, but the job is no '
+                        'longer configured - leaving it alone', state.pid, job)
+                self.journal.forget(job)
+                continue
+
+            if state.restarted is not None:
+                self.restart_times[job] = state.restarted
+
+            if not alive:
+                self.journal.stopped(job)
+                continue
+
+            SERVICE_LOGGER.info('Adopting PID %d of %s', state.pid, job)
+            job_obj = self.jobs[job]
+            if state.ready == state.pid:
+                self.ready_pids[job] = state.pid
+            job_obj.adopt(state.pid)
+
+            if job_obj.capture is not None or job_obj.ring is not None:
+                SERVICE_LOGGER.warning('Restarting %s, since its output '
+                                       'capture was lost', job)
+                self.forced_restarts.add(job)
+                job_obj.kill()
+
+        self.journal.open()
+
+    def reexec(self, listener, requester, clients):
+        """
+        Re-executes the supervisor, handing its jobs and connections over to
+        the new one (see :mod:`jobmon.handoff`).
+
+        :param int listener: The command server's listening socket.
+        :param int requester: The connection of the client which asked for \
+        this, which the new supervisor answers.
+        :param list clients: The connections of the command server's idle \
+        clients.
+        :return: A failure response, if the supervisor can't re-execute - \
+        otherwise, this never returns.
+        """
+        SERVICE_LOGGER.info('Request to re-execute the supervisor')
+        if (self.shutting_down or self.config_file is None or
+                not os.access(handoff.get_command(self.config_file)[0],
+                              os.X_OK)):
+            SERVICE_LOGGER.info('Failed re-execution: not possible')
+            return protocol.FailureResponse(None, protocol.ERR_REEXEC_FAILED)
+
+        # The new supervisor would die on a configuration that it can't read,
+        # which is better found out now, while this one can keep going
+        try:
+            config_mod.ConfigHandler(self.process_class).load(self.config_file)
+        except (OSError, ValueError) as ex:
+            SERVICE_LOGGER.warning('Failed re-execution: cannot read %s - %s',
+                                   self.config_file, ex)
+            return protocol.FailureResponse(None, protocol.ERR_REEXEC_FAILED)
+
+        # From here on, children which exit are left for the new supervisor
+        # to reap, rather than being reported to this one
+        monitor.REAP_LOCK.acquire()
+
+        handed_over = {
+            'commands': {'listener': listener, 'requester': requester,
+                         'clients': clients},
+        }
+        fds = [listener, requester] + clients
+
+        if self.notify_server is not None:
+            handed_over['notify'] = self.notify_server.hand_over()
+            fds.append(handed_over['notify']['fd'])
+
+        # Whatever is already waiting is handled before the service's state is
+        # handed over, so that timers which have gone off (and the events of
+        # jobs which have started and stopped) aren't lost
+        self.restart_ticker.terminate()
+        self.restart_ticker.wait_for_exit()
+        self.drain_requests()
+        handed_over['service'] = self.get_handoff()
+
+        # Once everything that has happened is sent out, the event listeners
+        # carry on with the new supervisor
+        handed_over['events'] = self.events.hand_over()
+        fds.append(handed_over['events']['listener'])
+        fds += handed_over['events']['clients']
+
+        if self.output_capture is not None:
+            handed_over['output'] = self.output_capture.hand_over()
+            for pipe in handed_over['output']['pipes']:
+                fds.append(pipe['read_fd'])
+                if pipe['write_fd'] is not None:
+                    fds.append(pipe['write_fd'])
+
+        if self.cgroups is not None:
+            handed_over['cgroup_root'] = self.cgroups.root
 
-            if job_name in self.autostarts:
-                self.running_jobs.add(job_name)
-                SERVICE_LOGGER.info('Autostarting %s', job_name)
-                proc_skel.start()
+        if self.fork_server is not None:
+            # The helper exits once it sees that this supervisor is gone, and
+            # is reaped by the new one
+            handed_over['fork_server'] = self.fork_server.helper_pid
+
+        if self.journal is not None:
+            self.journal.close()
+
+        try:
+            handoff.execute(self.config_file, handed_over, fds)
+        except OSError:
+            SERVICE_LOGGER.critical('Could not re-execute the supervisor',
+                                    exc_info=True)
+        finally:
+            # There's no going back, since everything has been stopped
+            os._exit(1)
+
+    def drain_requests(self):
+        """
+        Handles every request which is waiting in the queue, before the
+        supervisor re-executes.
+        """
+        while True:
+            try:
+                request, future = self.request_queue.get_nowait()
+            except Empty:
+                return
+
+            SERVICE_LOGGER.info('Got request %s while re-executing', request)
+            if request.action in ('terminate', 'reexec'):
+                SERVICE_LOGGER.warning('Ignoring %s while re-executing',
+                                       request.action)
+                future.set_result(None)
+                continue
+
+            response = self.handle_request(request)
+            if not isinstance(response, Future):
+                future.set_result(response)
+
+    def get_handoff(self):
+        """
+        Describes what the service is doing, for the supervisor which
+        replaces this one - which processes the jobs are running, along with
+        the state of their restarts, starts and instances.
+
+        :return: A :class:`dict` which can be serialized as JSON, and given \
+        to :meth:`take_over`.
+        """
+        jobs = {}
+        for job, job_obj in self.jobs.items():
+            pid = job_obj.get_pid()
+            if pid is None:
+                continue
+
+            status_pid, status_text = self.status_texts.get(job, (None, None))
+            jobs[job] = {
+                'pid': pid,
+                'since': journal_mod.process_start_time(pid),
+                'ready': self.ready_pids.get(job) == pid,
+                'status': status_text if status_pid == pid else None,
+                'unhealthy': job in self.unhealthy_jobs,
+                'stopping': job_obj.was_stopped,
+            }
+
+        delayed = {}
+        for job, with_deps in self.delayed_starts.items():
+            when = self.restart_ticker.get(schedule_mod.ScheduleKey(job, True))
+            delayed[job] = [when, with_deps]
+
+        return {
+            'jobs': jobs,
+            'running': sorted(self.running_jobs),
+            'restart_times': dict(self.restart_times),
+            'blocked': sorted(self.blocked_restarts),
+            'throttled': {job: self.restart_ticker.get(job)
+                          for job in self.throttled_jobs},
+            'forced_restarts': sorted(self.forced_restarts),
+            'delayed': delayed,
+            'queued': sorted(self.queued_runs),
+            'waiting': list(self.waiting_starts),
+            'replicas': {group: self.count_instances(group)
+                         for group in self.replica_groups},
+        }
+
+    def take_over(self, state):
+        """
+        Carries on from where the supervisor that this one replaced left off,
+        adopting its jobs' processes. Jobs whose processes exited while the
+        supervisor was re-executing are handled as if they had just stopped.
+
+        :param dict state: What the old service was doing, as returned by \
+        :meth:`get_handoff`.
+        """
+        SERVICE_LOGGER.info('Taking over from the last supervisor')
+        if self.journal is not None:
+            self.journal.open()
+
+        for group, replicas in state['replicas'].items():
+            if (group in self.replica_groups and
+                    self.count_instances(group) != replicas):
+                self.scale_job(group, replicas, start=False)
+
+        def configured(jobs):
+            return [job for job in jobs if job in self.jobs]
+
+        for job in configured(state['restart_times']):
+            self.restart_times[job] = state['restart_times'][job]
+        self.blocked_restarts.update(configured(state['blocked']))
+        self.forced_restarts.update(configured(state['forced_restarts']))
+        self.queued_runs.update(configured(state['queued']))
+
+        for job in configured(state['throttled']):
+            when = state['throttled'][job]
+            if when is not None:
+                self.set_throttled(job, True)
+                self.restart_ticker.register(job, when)
+
+        for job in configured(state['delayed']):
+            when, with_deps = state['delayed'][job]
+            self.delayed_starts[job] = with_deps
+            self.restart_ticker.register(
+                schedule_mod.ScheduleKey(job, True),
+                self.clock.time() if when is None else when)
+
+        adopted = set()
+        for job, process in state['jobs'].items():
+            pid = process['pid']
+            if job not in self.jobs:
+                SERVICE_LOGGER.warning(
+                    'PID %d of %s is still running, but the job is no '
+                    'longer configured - leaving it alone', pid, job)
+                continue
+
+            if not journal_mod.is_running(pid, process['since']):
+                continue
+
+            SERVICE_LOGGER.info('Adopting PID %d of %s', pid, job)
+            if process['ready']:
+                self.ready_pids[job] = pid
+            if process['status'] is not None:
+                self.status_texts[job] = (pid, process['status'])
+            if process['unhealthy']:
+                self.set_unhealthy(job, True)
+
+            self.taken_over.add(job)
+            self.jobs[job].adopt(pid)
+            self.jobs[job].was_stopped = process['stopping']
+            adopted.add(job)
+
+        # The rest stopped while the supervisor was re-executing, and aren't
+        # going to be reported by anybody else
+        for job in configured(state['running']):
+            if job not in adopted:
+                self.running_jobs.add(job)
+                self.process_stop(job)
+
+        self.start_jobs(configured(state['waiting']))
+
+    def attach_job(self, proc_skel):
+        """
+        Hooks up a job to the parts of the supervisor that it needs in order
+        to run.
+        """
+        proc_skel.set_event_sock(self.status.get_peer())
+        proc_skel.set_fork_server(self.fork_server)
+        proc_skel.set_output_capture(self.output_capture)
+        proc_skel.set_cgroups(self.cgroups)
+        proc_skel.set_cpu_allocator(self.cpu_allocator)
+        if self.notify_server is not None:
+            proc_skel.set_notify_socket(self.notify_server.get_address())
 
     def cleanup_jobs(self):
         """
-        Stops each running job, to prepare for exit.
+        Stops each running job, to prepare for exit. Jobs which others
+        depend on are only stopped once those have stopped, and jobs which
+        are still running at their shutdown deadlines are killed.
         """
         SERVICE_LOGGER.info('Stopping %d jobs', len(self.jobs))
-        for job_name, job in self.jobs.items():
-            if job.get_status():
-                SERVICE_LOGGER.info('Killing %s', job_name)
-                job.kill()
+        self.waiting_starts.clear()
+        self.start_waiters.clear()
+
+        self.stop_blockers = {
+            job_name: set() for job_name, job in self.jobs.items()
+            if job.get_status()
+        }
+        for job_name in self.stop_blockers:
+            for dependency in dependencies.get_dependencies(self.jobs[job_name]):
+                if dependency in self.stop_blockers:
+                    self.stop_blockers[dependency].add(job_name)
+
+        deadlines = self.get_shutdown_deadlines(self.clock.time())
+        for job_name, deadline in deadlines.items():
+            self.restart_ticker.register(ShutdownKey(job_name), deadline)
+
+        for job_name, blockers in self.stop_blockers.items():
+            if not blockers:
+                self.kill_for_shutdown(job_name)
+
+    def get_shutdown_timeout(self, job):
+        """
+        :return: How long a job is given to exit when the supervisor shuts \
+        down, in seconds.
+        """
+        timeout = self.jobs[job].shutdown_timeout
+        return self.shutdown_timeout if timeout is None else timeout
+
+    def get_shutdown_deadlines(self, now):
+        """
+        Works out when each job that is being stopped is killed, if it is
+        still running by then. Every job's timeout starts when the shutdown
+        does, so that a slow job doesn't hold up the others. A job that
+        others depend on isn't killed before they are, since it is only asked
+        to stop once they have stopped - if they haven't by its deadline, then
+        it is asked to stop then, and gets its own timeout from there.
+
+        :param float now: When the shutdown started.
+        :return: A :class:`dict` mapping each job to its deadline.
+        """
+        deadlines = {}
+
+        def get_deadline(job):
+            if job not in deadlines:
+                deadline = now + self.get_shutdown_timeout(job)
+                for blocker in self.stop_blockers[job]:
+                    deadline = max(deadline, get_deadline(blocker))
+                deadlines[job] = deadline
+            return deadlines[job]
+
+        for job in self.stop_blockers:
+            get_deadline(job)
+        return deadlines
+
+    def kill_for_shutdown(self, job):
+        """
+        Stops a job while shutting down, if it hasn't already stopped (or
+        been asked to).
+        """
+        if job in self.stopping_jobs or job in self.killed_jobs:
+            return
+
+        SERVICE_LOGGER.info('Killing %s', job)
+        self.stopping_jobs.add(job)
+        try:
+            self.jobs[job].kill()
+            self.events.send(job, protocol.EVENT_STOPPING)
+        except ValueError:
+            # It died on its own, and the service hasn't heard yet
+            pass
+
+    def shutdown_timeout_expired(self, job):
+        """
+        Called while shutting down when a job's deadline has passed, and
+        kills it with ``SIGKILL`` if it is still running. A job that is still
+        waiting on the jobs which depend on it hasn't been asked to stop yet,
+        so it is asked now, and given its own timeout before it is killed.
+        """
+        if not self.jobs[job].get_status():
+            return
+
+        if job not in self.stopping_jobs:
+            SERVICE_LOGGER.warning('Jobs which depend on %s are still running '
+                                   'at its shutdown deadline - stopping it '
+                                   'anyway', job)
+            self.restart_ticker.register(
+                ShutdownKey(job),
+                self.clock.time() + self.get_shutdown_timeout(job))
+            self.kill_for_shutdown(job)
+            return
+
+        SERVICE_LOGGER.warning('%s is still running at its shutdown deadline '
+                               '- sending it SIGKILL', job)
+        self.killed_jobs.add(job)
+        try:
+            self.jobs[job].kill(signal.SIGKILL)
+            self.events.send(job, protocol.EVENT_KILLED)
+        except ValueError:
+            pass
+
+    def stop_unblocked(self, job, job_deps):
+        """
+        Called while shutting down when a job has stopped, and stops any of
+        its dependencies which nothing else running depends on.
+
+        :param job_deps: The jobs that the job depended on.
+        """
+        self.stop_blockers.pop(job, None)
+        for dependency in job_deps:
+            blockers = self.stop_blockers.get(dependency)
+            if blockers is None or job not in blockers:
+                continue
+
+            blockers.discard(job)
+            if not blockers:
+                self.kill_for_shutdown(dependency)
 
     def job_timer_expired(self, job):
         """
@@ -205,40 +890,694 @@ class SupervisorService(threading.Thread):
         self.jobs[job].start()
 
         self.blocked_restarts.remove(job)
-        self.restart_times[job] = time.time()
+        self.set_throttled(job, False)
+        self.set_restart_time(job, self.clock.time())
+        metrics.JOB_RESTARTS.inc(job)
         self.events.send(job, protocol.EVENT_RESTARTJOB)
 
+    def set_restart_time(self, job, when):
+        """
+        Records when a job was last restarted, for restart throttling.
+
+        :param float when: The time of the restart, or ``None`` to forget it.
+        """
+        if when is None:
+            self.restart_times.pop(job, None)
+        else:
+            self.restart_times[job] = when
+
+        if self.journal is not None:
+            self.journal.restarted(job, when)
+
+    def set_throttled(self, job, throttled):
+        """
+        Records whether a job is waiting out its restart backoff.
+        """
+        if throttled:
+            self.throttled_jobs.add(job)
+        else:
+            self.throttled_jobs.discard(job)
+
+        metrics.JOBS_THROTTLED.set(len(self.throttled_jobs))
+
+    def schedule_health_check(self, job):
+        """
+        Sets the timer for a running job's next health check, if it has one.
+        """
+        check = self.jobs[job].health_check
+        if check is None or self.health_checker is None:
+            self.restart_ticker.unregister(health.CheckKey(job))
+            return
+
+        self.restart_ticker.register(
+            health.CheckKey(job),
+            self.health_checker.next_check_time(check, self.clock.time()))
+
+    def run_health_check(self, job):
+        """
+        Hands a job's health check to the health checker, which reports back
+        once it has finished.
+        """
+        job_obj = self.jobs.get(job)
+        if job_obj is None or job_obj.health_check is None:
+            return
+
+        pid = job_obj.get_pid()
+        if pid is None:
+            return
+
+        SERVICE_LOGGER.debug('Checking health of %s', job)
+        self.health_checker.submit(job, pid, job_obj.health_check)
+
+    def health_check_done(self, job, pid, passed, message):
+        """
+        Handles the result of a health check. Once too many checks in a row
+        have failed, the job is marked unhealthy and an event is sent, and
+        the job is restarted if its check asks for that.
+        """
+        job_obj = self.jobs.get(job)
+        if job_obj is None or job_obj.get_pid() != pid:
+            # The process that was checked has already gone
+            return
+
+        check = job_obj.health_check
+        if check is None:
+            return
+
+        if passed:
+            self.health_failures.pop(job, None)
+            if job in self.unhealthy_jobs:
+                SERVICE_LOGGER.info('%s is healthy again', job)
+                self.set_unhealthy(job, False)
+            self.schedule_health_check(job)
+            return
+
+        failures = self.health_failures.get(job, 0) + 1
+        self.health_failures[job] = failures
+        metrics.HEALTH_CHECK_FAILURES.inc(job)
+        SERVICE_LOGGER.info('%s failed health check %d of %d: %s', job,
+                            failures, check.failures, message)
+
+        if failures < check.failures:
+            self.schedule_health_check(job)
+            return
+
+        self.health_failures.pop(job, None)
+        if job not in self.unhealthy_jobs:
+            self.set_unhealthy(job, True)
+            self.events.send(job, protocol.EVENT_UNHEALTHY, [message])
+
+        if check.action == health.ACTION_RESTART:
+            SERVICE_LOGGER.info('Restarting unhealthy job %s', job)
+            self.forced_restarts.add(job)
+            job_obj.kill()
+        else:
+            self.schedule_health_check(job)
+
+    def set_unhealthy(self, job, unhealthy):
+        """
+        Records whether a job has failed its health checks.
+        """
+        if unhealthy:
+            self.unhealthy_jobs.add(job)
+        else:
+            self.unhealthy_jobs.discard(job)
+
+        metrics.JOBS_UNHEALTHY.set(len(self.unhealthy_jobs))
+
+    def schedule_runs(self, job):
+        """
+        Registers a job's next scheduled run with the ticker, replacing any
+        that was registered before. Jobs without a schedule have their runs
+        cancelled.
+        """
+        key = schedule_mod.ScheduleKey(job, False)
+        schedule = self.jobs[job].schedule
+        when = None
+        if schedule is not None:
+            when = schedule_mod.next_run(schedule, job, self.clock.time())
+
+        if when is None:
+            self.restart_ticker.unregister(key)
+            self.queued_runs.discard(job)
+        else:
+            self.restart_ticker.register(key, when)
+
+    def run_scheduled(self, job):
+        """
+        Starts a job whose scheduled run has come due, unless its previous
+        run is still going - in which case what happens depends on the
+        schedule's overlap policy.
+        """
+        if job not in self.jobs or self.jobs[job].schedule is None:
+            return
+
+        self.schedule_runs(job)
+
+        schedule = self.jobs[job].schedule
+        if self.jobs[job].get_status() or job in self.waiting_starts:
+            if schedule.overlap == schedule_mod.OVERLAP_SKIP:
+                SERVICE_LOGGER.info('Skipping scheduled run of %s, still '
+                                    'running', job)
+                return
+
+            SERVICE_LOGGER.info('Queueing scheduled run of %s', job)
+            self.queued_runs.add(job)
+            if schedule.overlap == schedule_mod.OVERLAP_KILL:
+                if job in self.waiting_starts:
+                    # It hasn't started yet, so there's nothing to kill
+                    self.queued_runs.discard(job)
+                    return
+
+                try:
+                    self.jobs[job].kill()
+                except ValueError:
+                    pass
+            return
+
+        SERVICE_LOGGER.info('Starting scheduled run of %s', job)
+        self.start_job(job, with_deps=True)
+
+    def start_job_at(self, job, when, with_deps=False):
+        """
+        Starts a job once, at a later time. This replaces any one-off start
+        that the job already had coming up.
+        """
+        SERVICE_LOGGER.info('Request to start job %s at %s', job, when)
+        if (not isinstance(when, (int, float)) or isinstance(when, bool) or
+                not math.isfinite(when)):
+            return protocol.FailureResponse(job, protocol.ERR_BAD_TIME)
+
+        self.delayed_starts[job] = with_deps
+        self.restart_ticker.register(schedule_mod.ScheduleKey(job, True),
+                                     when)
+        return protocol.SuccessResponse(job)
+
+    def delayed_start_expired(self, job):
+        """
+        Starts a job whose one-off start has come due.
+        """
+        if job not in self.delayed_starts:
+            return
+
+        with_deps = self.delayed_starts.pop(job)
+        if self.jobs[job].get_status():
+            SERVICE_LOGGER.info('Ignoring delayed start of %s: Running', job)
+            return
+
+        SERVICE_LOGGER.info('Starting %s after its delay', job)
+        self.start_job(job, with_deps)
+
+    def cancel_runs(self, job):
+        """
+        Cancels a job's queued scheduled run and its one-off start, if it has
+        either.
+
+        :return: Whether there was a one-off start to cancel.
+        """
+        self.queued_runs.discard(job)
+        self.restart_ticker.unregister(schedule_mod.ScheduleKey(job, True))
+        return self.delayed_starts.pop(job, None) is not None
+
+    def is_up(self, job):
+        """
+        Checks whether a job is running, and ready if it reports that.
+        """
+        job_obj = self.jobs[job]
+        if not job_obj.get_status():
+            return False
+
+        return not job_obj.notify or self.ready_pids.get(job) == job_obj.get_pid()
+
+    def start_jobs(self, jobs, with_deps=False):
+        """
+        Starts a group of jobs, each as soon as the jobs that it depends on
+        are up. Dependencies outside of the group are only waited for if
+        they are already starting.
+
+        :param jobs: The names of the jobs to start.
+        :param bool with_deps: Whether to start the jobs that these require.
+        """
+        group = set(jobs)
+        if with_deps:
+            group = dependencies.pull_in(
+                group,
+                lambda job: [dependency for dependency in self.jobs[job].requires
+                             if dependency in self.jobs])
+
+        # Large groups are started in the order that the jobs were
+        # configured, which doesn't need sorting when starting a single job
+        if len(group) > 1:
+            ordered = [job for job in self.jobs if job in group]
+        else:
+            ordered = list(group)
+
+        to_start = [job for job in ordered
+                    if job not in self.waiting_starts and
+                    not self.jobs[job].get_status()]
+        group = set(to_start)
+
+        start_now = []
+        for job in to_start:
+            waits = set()
+            for dependency in dependencies.get_dependencies(self.jobs[job]):
+                if dependency not in self.jobs or self.is_up(dependency):
+                    continue
+
+                if (dependency in group or dependency in self.waiting_starts or
+                        self.jobs[dependency].get_status()):
+                    waits.add(dependency)
+
+            if waits:
+                SERVICE_LOGGER.info('Starting %s once %s are up', job,
+                                    ', '.join(sorted(waits)))
+                self.waiting_starts[job] = waits
+                for dependency in waits:
+                    self.start_waiters.setdefault(dependency, {})[job] = None
+            else:
+                start_now.append(job)
+
+        for job in start_now:
+            self.launch_job(job)
+
+    def launch_job(self, job):
+        """
+        Starts a job whose dependencies are all up.
+        """
+        SERVICE_LOGGER.info('Launching %s', job)
+        self.running_jobs.add(job)
+        metrics.JOBS_RUNNING.set(len(self.running_jobs))
+        self.jobs[job].start()
+
+    def dependency_up(self, job):
+        """
+        Starts any jobs which were only waiting on this one.
+        """
+        for waiter in self.start_waiters.pop(job, ()):
+            waits = self.waiting_starts.get(waiter)
+            if waits is None:
+                continue
+
+            waits.discard(job)
+            if not waits:
+                del self.waiting_starts[waiter]
+                self.launch_job(waiter)
+
+    def cancel_start(self, job, reason):
+        """
+        Stops a job from being started once its dependencies are up, along
+        with anything waiting on it in turn.
+        """
+        waits = self.waiting_starts.pop(job, None)
+        if waits is None:
+            return
+
+        SERVICE_LOGGER.warning('Not starting %s - %s', job, reason)
+        for dependency in waits:
+            self.start_waiters.get(dependency, {}).pop(job, None)
+
+        self.dependency_failed(job)
+
+    def dependency_failed(self, job):
+        """
+        Cancels the start of any jobs which were waiting on this one, which
+        has stopped without coming up.
+        """
+        for waiter in list(self.start_waiters.pop(job, ())):
+            self.cancel_start(waiter, '{} is not running'.format(job))
+
+    def find_job_by_pid(self, pids):
+        """
+        Finds the job which is running any of the given PIDs.
+
+        :return: The name of the job, or ``None`` if there isn't one.
+        """
+        for attempt in range(2):
+            for pid in pids:
+                job = self.pid_jobs.get(pid)
+                if (pid is not None and job in self.jobs and
+                        self.jobs[job].get_pid() == pid):
+                    return job
+
+            if attempt == 0:
+                self.pid_jobs = {
+                    job_obj.get_pid(): job
+                    for job, job_obj in self.jobs.items()
+                    if job_obj.get_pid() is not None
+                }
+
+        return None
+
+    def job_notify(self, pid, session, fields):
+        """
+        Handles a notification from a job, which was sent either by the job's
+        own process or by another process in its session.
+        """
+        job = self.find_job_by_pid((pid, session))
+        if job is None:
+            SERVICE_LOGGER.warning('Ignoring notification from PID %d, which '
+                                   'is not part of any job', pid)
+            return
+
+        main_pid = self.jobs[job].get_pid()
+        if 'STATUS' in fields:
+            self.status_texts[job] = (main_pid, fields['STATUS'])
+
+        if fields.get('STOPPING') == '1':
+            SERVICE_LOGGER.info('%s is stopping', job)
+            self.ready_pids.pop(job, None)
+        elif fields.get('READY') == '1' and self.ready_pids.get(job) != main_pid:
+            SERVICE_LOGGER.info('%s is ready', job)
+            self.ready_pids[job] = main_pid
+            if self.journal is not None:
+                self.journal.ready(job, main_pid)
+            self.events.send(job, protocol.EVENT_READY)
+            self.dependency_up(job)
+            self.wake_waiters(job, [protocol.WAIT_READY])
+
+    def reload_job_file(self, filename):
+        """
+        Re-reads a single job file, and adds, updates or removes the jobs
+        which were defined by it. Jobs from other files are not touched.
+        """
+        SERVICE_LOGGER.info('Reloading job file %s', filename)
+        file_config = self.config.copy_settings()
+        if os.path.exists(filename):
+            try:
+                file_config.load_job_file(filename)
+            except (OSError, ValueError) as ex:
+                SERVICE_LOGGER.warning('Cannot reload %s - %s', filename, ex)
+                return
+
+        old_jobs = set(self.job_files.get(filename, []))
+        old_groups = set(self.group_files.get(filename, []))
+        new_jobs = []
+        autostarts = []
+
+        # Dependencies on replicated jobs are expanded into their instances,
+        # the same way as when the configuration was loaded
+        file_config.resolve_dependencies(
+            [job for job in self.jobs if job not in old_jobs] +
+            list(file_config.jobs),
+            [group for group in self.replica_groups
+             if group not in old_groups] + list(file_config.replica_groups))
+
+        graph = {job: dependencies.get_dependencies(job_obj)
+                 for job, job_obj in self.jobs.items() if job not in old_jobs}
+        graph.update((job, dependencies.get_dependencies(proc_skel))
+                     for job, proc_skel in file_config.jobs.items())
+        cycle = dependencies.find_cycle(graph)
+        if cycle is not None:
+            SERVICE_LOGGER.warning('Cannot reload %s - jobs depend on each '
+                                   'other in a cycle: %s', filename,
+                                   ' -> '.join(cycle))
+            return
+
+        # Replicated jobs go back to the number of instances in the file,
+        # whatever they were scaled to since
+        for group in old_groups - set(file_config.replica_groups):
+            SERVICE_LOGGER.info('Removing replicated job %s', group)
+            del self.replica_groups[group]
+
+        new_groups = []
+        for group, replica_group in file_config.replica_groups.items():
+            if group in self.replica_groups and group not in old_groups:
+                SERVICE_LOGGER.warning('Ignoring %s from %s - duplicate job',
+                                       group, filename)
+                continue
+
+            self.replica_groups[group] = replica_group
+            new_groups.append(group)
+
+        if new_groups:
+            self.group_files[filename] = new_groups
+        else:
+            self.group_files.pop(filename, None)
+
+        for job in old_jobs - set(file_config.jobs):
+            self.remove_job(job)
+
+        for job, proc_skel in file_config.jobs.items():
+            if job in old_jobs:
+                if not self.jobs[job].same_definition(proc_skel):
+                    SERVICE_LOGGER.info('Updating definition of %s', job)
+                    self.jobs[job].update_from(proc_skel)
+                    self.schedule_runs(job)
+                    if self.jobs[job].get_status():
+                        self.schedule_health_check(job)
+            elif job in self.jobs and job not in self.removed_jobs:
+                SERVICE_LOGGER.warning('Ignoring %s from %s - duplicate job',
+                                       job, filename)
+                continue
+            else:
+                SERVICE_LOGGER.info('Adding job %s', job)
+                self.removed_jobs.discard(job)
+                if job in self.jobs:
+                    # The job was removed and then re-added before its old
+                    # process finished, so the old process is kept around
+                    self.jobs[job].update_from(proc_skel)
+                else:
+                    self.attach_job(proc_skel)
+                    self.jobs[job] = proc_skel
+
+                self.schedule_runs(job)
+                if job in file_config.autostarts and not self.jobs[job].get_status():
+                    SERVICE_LOGGER.info('Autostarting %s', job)
+                    autostarts.append(job)
+
+            if job in file_config.restarts:
+                self.restarts.add(job)
+            else:
+                self.restarts.discard(job)
+
+            if job in file_config.autostarts:
+                self.autostarts.add(job)
+            else:
+                self.autostarts.discard(job)
+
+            new_jobs.append(job)
+
+        if new_jobs:
+            self.job_files[filename] = new_jobs
+        elif filename in self.job_files:
+            del self.job_files[filename]
+
+        self.start_jobs(autostarts, with_deps=True)
+
+    def count_instances(self, group):
+        """
+        Counts the instances of a replicated job, not including any which
+        have been removed but are still stopping.
+        """
+        count = 0
+        while True:
+            job = config_mod.instance_name(group, count)
+            if job not in self.jobs or job in self.removed_jobs:
+                return count
+            count += 1
+
+    def scale_job(self, group, replicas, start=True):
+        """
+        Changes how many instances of a replicated job there are. Instances
+        are added and removed at the end, so that the rest keep running
+        undisturbed. New instances are started straight away, unless
+        ``start`` is ``False``.
+        """
+        SERVICE_LOGGER.info('Request to scale %s to %s', group, replicas)
+        if group not in self.replica_groups:
+            if group in self.jobs:
+                return protocol.FailureResponse(group,
+                                                protocol.ERR_NOT_REPLICATED)
+            raise NoSuchJobError(group)
+
+        if (not isinstance(replicas, int) or isinstance(replicas, bool) or
+                replicas < 0):
+            return protocol.FailureResponse(group, protocol.ERR_BAD_REPLICAS)
+
+        replica_group = self.replica_groups[group]
+        current = self.count_instances(group)
+        names = [config_mod.instance_name(group, index)
+                 for index in range(max(current, replicas))]
+        added = names[current:replicas]
+        removed = names[replicas:current]
+
+        for job in reversed(removed):
+            self.remove_job(job)
+
+        for index, job in enumerate(added, current):
+            proc_skel = config_mod.make_instance(
+                self.process_class, replica_group.template, index)
+            self.removed_jobs.discard(job)
+            if job in self.jobs:
+                # The instance was removed and then added back before its old
+                # process finished, so the old process is kept around
+                self.jobs[job].update_from(proc_skel)
+            else:
+                self.attach_job(proc_skel)
+                self.jobs[job] = proc_skel
+
+            self.schedule_runs(job)
+            if replica_group.restart:
+                self.restarts.add(job)
+            if replica_group.autostart:
+                self.autostarts.add(job)
+
+        # Keep the job file's list of jobs up to date, so that reloading it
+        # knows about every instance
+        for filename, groups in self.group_files.items():
+            if group in groups:
+                self.job_files[filename] = [
+                    job for job in self.job_files.get(filename, [])
+                    if job not in removed] + added
+
+        if start:
+            self.start_jobs(added)
+        return protocol.SuccessResponse(group)
+
+    def remove_job(self, job):
+        """
+        Removes a job whose definition has disappeared. If the job is running,
+        then it is stopped and forgotten once it dies.
+        """
+        SERVICE_LOGGER.info('Removing job %s', job)
+        self.restarts.discard(job)
+        self.autostarts.discard(job)
+
+        self.blocked_restarts.discard(job)
+        self.set_throttled(job, False)
+        self.restart_ticker.unregister(job)
+        self.restart_ticker.unregister(health.CheckKey(job))
+        self.restart_ticker.unregister(schedule_mod.ScheduleKey(job, False))
+        self.restart_times.pop(job, None)
+        self.cancel_runs(job)
+
+        self.cancel_start(job, 'it was removed')
+        self.dependency_failed(job)
+
+        job_obj = self.jobs[job]
+        if job_obj.get_status():
+            self.removed_jobs.add(job)
+            try:
+                job_obj.kill()
+            except ValueError:
+                pass
+        else:
+            del self.jobs[job]
+            metrics.forget_job(job)
+            if self.journal is not None:
+                self.journal.forget(job)
+            self.end_waits(job, protocol.ERR_NO_SUCH_JOB)
+
     def process_start(self, job):
         SERVICE_LOGGER.info('Process %s started', job)
-        self.events.send(job, protocol.EVENT_STARTJOB)
+        if job in self.taken_over:
+            self.taken_over.discard(job)
+        else:
+            self.events.send(job, protocol.EVENT_STARTJOB)
         self.running_jobs.add(job)
+        metrics.JOB_STARTS.inc(job)
+        metrics.JOBS_RUNNING.set(len(self.running_jobs))
+
+        pid = self.jobs[job].get_pid()
+        if self.journal is not None and pid is not None:
+            self.journal.started(job, pid)
+
+        if not self.shutting_down:
+            self.schedule_health_check(job)
+
+            # Jobs which report their readiness are only up once they have
+            if not self.jobs[job].notify:
+                self.dependency_up(job)
+
+        if self.jobs[job].notify:
+            self.wake_waiters(job, [protocol.WAIT_RUNNING])
+        else:
+            self.wake_waiters(job, [protocol.WAIT_RUNNING, protocol.WAIT_READY])
 
     def process_stop(self, job):
         SERVICE_LOGGER.info('Process %s stopped', job)
         self.running_jobs.remove(job)
+        metrics.JOB_STOPS.inc(job)
+        metrics.JOBS_RUNNING.set(len(self.running_jobs))
+
+        self.restart_ticker.unregister(health.CheckKey(job))
+        if self.journal is not None:
+            self.journal.stopped(job)
+        self.ready_pids.pop(job, None)
+        self.status_texts.pop(job, None)
+        self.health_failures.pop(job, None)
+        if job in self.unhealthy_jobs:
+            self.set_unhealthy(job, False)
+
+        # If the job died on its own, then whoever is listening probably wants
+        # to know why
+        job_obj = self.jobs[job]
+        output = None
+        if job_obj.crashed():
+            output = job_obj.get_recent_output(STOP_OUTPUT_LINES)
 
-        is_restartable = job in self.restarts
+        # Jobs killed in order to restart them are restarted, whether or not
+        # they would be restarted after exiting on their own
+        restart_forced = job in self.forced_restarts
+        self.forced_restarts.discard(job)
+
+        is_restartable = job in self.restarts or restart_forced
         not_blocked = job not in self.blocked_restarts
-        if not self.shutting_down and is_restartable and not_blocked:
-            now = time.time()
+        if job_obj.get_status():
+            # A client started the job again before its stop got here, so
+            # there's nothing to restart - its start is on the way
+            SERVICE_LOGGER.info('Not restarting %s, already started', job)
+            self.events.send(job, protocol.EVENT_STOPJOB, output)
+            self.queued_runs.discard(job)
+        elif not self.shutting_down and is_restartable and not_blocked:
+            now = self.clock.time()
             most_recent_restart = self.restart_times.get(job, 0)
-            self.restart_times[job] = now
+            self.set_restart_time(job, now)
 
             if now - most_recent_restart <= RESTART_TIMEOUT:
                 # This job is restarting too frequently, so we need to
                 # wait for its timeout to expire before it restarts
                 SERVICE_LOGGER.info('Throttling job %s', job)
                 self.blocked_restarts.add(job)
+                self.set_throttled(job, True)
                 self.restart_ticker.register(job, now + RESTART_BACKOFF)
             else:
                 SERVICE_LOGGER.info('Restarting job %s', job)
                 self.jobs[job].start()
-                self.events.send(job, protocol.EVENT_RESTARTJOB)
+                metrics.JOB_RESTARTS.inc(job)
+                self.events.send(job, protocol.EVENT_RESTARTJOB, output)
+
+            # Restarting the job covers any scheduled run that was queued
+            self.queued_runs.discard(job)
         else:
             SERVICE_LOGGER.info('Cannot restart %s', job)
-            self.events.send(job, protocol.EVENT_STOPJOB)
-
-    def start_job(self, job):
+            self.events.send(job, protocol.EVENT_STOPJOB, output)
+            self.dependency_failed(job)
+
+            if job in self.queued_runs and job not in self.removed_jobs:
+                self.queued_runs.discard(job)
+                if not self.shutting_down:
+                    SERVICE_LOGGER.info('Starting queued run of %s', job)
+                    self.start_job(job, with_deps=True)
+
+        self.wake_waiters(job, [protocol.WAIT_STOPPED])
+
+        # A job which exits before it is ready (say, if it fails on startup)
+        # won't be ready until it starts again, which it may never do
+        if not job_obj.get_status():
+            self.end_waits(job, protocol.ERR_WAIT_STOPPED,
+                           [protocol.WAIT_RUNNING, protocol.WAIT_READY])
+
+        if job in self.removed_jobs:
+            SERVICE_LOGGER.info('Forgetting removed job %s', job)
+            self.removed_jobs.remove(job)
+            del self.jobs[job]
+            metrics.forget_job(job)
+            if self.journal is not None:
+                self.journal.forget(job)
+            self.end_waits(job, protocol.ERR_NO_SUCH_JOB)
+
+    def start_job(self, job, with_deps=False):
         SERVICE_LOGGER.info('Request to start job %s', job)
         job_obj = self.jobs[job]
 
@@ -246,6 +1585,7 @@ class SupervisorService(threading.Thread):
             # If the job was previously blocked, then allow it to restart
             # in the future
             self.blocked_restarts.remove(job)
+            self.set_throttled(job, False)
             self.restart_ticker.unregister(job)
 
         if job in self.restart_times:
@@ -259,14 +1599,16 @@ class SupervisorService(threading.Thread):
             SERVICE_LOGGER.info('Ignoring start of %s, shutting down', job)
             return protocol.SuccessResponse(job)
 
-        try:
-            job_obj.start()
-            SERVICE_LOGGER.info('Successful start of %s', job)
-            return protocol.SuccessResponse(job)
-        except ValueError:
+        if job_obj.get_status():
             SERVICE_LOGGER.info('Failed start of %s: Running', job)
             return protocol.FailureResponse(job, protocol.ERR_JOB_STARTED)
 
+        # The job may wait for its dependencies, in which case it is started
+        # later on
+        self.start_jobs([job], with_deps)
+        SERVICE_LOGGER.info('Successful start of %s', job)
+        return protocol.SuccessResponse(job)
+
     def stop_job(self, job):
         SERVICE_LOGGER.info('Request to stop job %s', job)
         job_obj = self.jobs[job]
@@ -275,12 +1617,22 @@ class SupervisorService(threading.Thread):
         # from being restarted
         SERVICE_LOGGER.info('Removing job from restart blacklist')
         self.blocked_restarts.add(job)
+        self.set_throttled(job, False)
         self.restart_ticker.unregister(job)
 
         # Also, since it can't restart, there's no need to track the job's
         # last restart time
         if job in self.restart_times:
-            del self.restart_times[job]
+            self.set_restart_time(job, None)
+
+        had_delayed_start = self.cancel_runs(job)
+        if job in self.waiting_starts:
+            self.cancel_start(job, 'it was stopped')
+            return protocol.SuccessResponse(job)
+
+        if had_delayed_start and not job_obj.get_status():
+            SERVICE_LOGGER.info('Cancelled delayed start of %s', job)
+            return protocol.SuccessResponse(job)
 
         try:
             job_obj.kill()
@@ -293,7 +1645,139 @@ class SupervisorService(threading.Thread):
     def get_status(self, job):
         SERVICE_LOGGER.info('Request to query job %s', job)
         job_obj = self.jobs[job]
-        return protocol.StatusResponse(job, job_obj.get_status(), job_obj.get_pid())
+        is_running = job_obj.get_status()
+        pid = job_obj.get_pid()
+
+        healthy = None
+        if is_running and job_obj.health_check is not None:
+            healthy = job not in self.unhealthy_jobs
+
+        ready = None
+        if job_obj.notify:
+            ready = is_running and self.ready_pids.get(job) == pid
+
+        status_text = None
+        if is_running and job in self.status_texts:
+            text_pid, text = self.status_texts[job]
+            if text_pid == pid:
+                status_text = text
+
+        return protocol.StatusResponse(job, is_running, pid, healthy, ready,
+                                       status_text)
+
+    def wait_job(self, job, state, timeout=None):
+        """
+        Waits for a job to reach a state, such as stopping after it was told
+        to stop.
+
+        :param str state: One of :data:`protocol.WAIT_STATES`.
+        :param float timeout: How long to wait, in seconds, or ``None`` to \
+        wait for as long as it takes.
+        :return: The response if there's one already, or otherwise a \
+        :class:`Future` that is given the response later on.
+        """
+        SERVICE_LOGGER.info('Request to wait for %s to be %s', job, state)
+        valid_timeout = timeout is None or (
+            isinstance(timeout, (int, float)) and
+            not isinstance(timeout, bool) and math.isfinite(timeout))
+        if state not in protocol.WAIT_STATES or not valid_timeout:
+            return protocol.FailureResponse(job, protocol.ERR_BAD_COMMAND)
+
+        if self.state_reached(job, state):
+            return self.get_status(job)
+        elif timeout is not None and timeout <= 0:
+            return protocol.FailureResponse(job, protocol.ERR_WAIT_TIMEOUT)
+
+        key = WaitKey(job, next(self.waiter_numbers))
+        future = Future()
+        self.job_waiters.setdefault(job, {}).setdefault(state, {})[key] = \
+            future
+        if timeout is not None:
+            self.restart_ticker.register(key, self.clock.time() + timeout)
+
+        return future
+
+    def state_reached(self, job, state):
+        """
+        :return: Whether a job is in one of :data:`protocol.WAIT_STATES`.
+        """
+        if state == protocol.WAIT_STOPPED:
+            return not self.jobs[job].get_status()
+        elif state == protocol.WAIT_READY:
+            return self.is_up(job)
+        else:
+            return self.jobs[job].get_status()
+
+    def wake_waiters(self, job, states):
+        """
+        Answers the clients waiting for a job to reach any of the given
+        states, which it has just reached. This is done when the job's
+        process starts, stops or becomes ready, rather than by checking the
+        job afterward - a process which has already exited by the time that
+        the service hears it started has still been running.
+        """
+        waiters = self.job_waiters.get(job)
+        if not waiters:
+            return
+
+        response = None
+        for state in states:
+            if state not in waiters:
+                continue
+
+            if response is None:
+                response = self.get_status(job)
+            for key, future in waiters.pop(state).items():
+                self.restart_ticker.unregister(key)
+                future.set_result(response)
+
+        if not waiters:
+            del self.job_waiters[job]
+
+    def wait_expired(self, key):
+        """
+        Gives up on a waiting client whose deadline has passed.
+        """
+        waiters = self.job_waiters.get(key.job, {})
+        for state, futures in list(waiters.items()):
+            future = futures.pop(key, None)
+            if future is None:
+                continue
+
+            SERVICE_LOGGER.info('Timed out waiting for %s to be %s', key.job,
+                                state)
+            future.set_result(protocol.FailureResponse(
+                key.job, protocol.ERR_WAIT_TIMEOUT))
+            if not futures:
+                del waiters[state]
+
+        if not waiters:
+            self.job_waiters.pop(key.job, None)
+
+    def end_waits(self, job, reason, states=None):
+        """
+        Answers the clients waiting on a job with a failure, such as when the
+        job is removed.
+
+        :param int reason: One of the ``ERR_*`` constants in \
+        :mod:`jobmon.protocol`.
+        :param states: The states whose waiters are answered, or ``None`` \
+        for every state.
+        """
+        waiters = self.job_waiters.get(job)
+        if not waiters:
+            return
+
+        for state in list(waiters):
+            if states is not None and state not in states:
+                continue
+
+            for key, future in waiters.pop(state).items():
+                self.restart_ticker.unregister(key)
+                future.set_result(protocol.FailureResponse(job, reason))
+
+        if not waiters:
+            del self.job_waiters[job]
 
     def list_jobs(self):
         SERVICE_LOGGER.info('Request to list jobs')
@@ -304,6 +1788,46 @@ class SupervisorService(threading.Thread):
 
         return protocol.JobListResponse(status_table)
 
+    def get_spawn_plan(self, job):
+        SERVICE_LOGGER.info('Request to get spawn plan of %s', job)
+        plan = self.jobs[job].get_spawn_plan()
+        return protocol.SpawnPlanResponse(job, {
+            'argv': list(plan.argv),
+            'env': dict(plan.env),
+            'stdin': plan.stdin,
+            'stdout': plan.stdout,
+            'stderr': plan.stderr,
+            'working-dir': plan.working_dir,
+            'signal': signal.Signals(plan.exit_signal).name,
+            'spawn-method': plan.spawn_method,
+            'rlimits': {limits.RLIMIT_NAMES[rlimit]: [soft, hard]
+                        for rlimit, soft, hard in plan.rlimits},
+            'cgroup': plan.cgroup,
+            'placement': placement.to_dict(plan.placement),
+        })
+
+    def get_output_ring(self, job):
+        SERVICE_LOGGER.info('Request to get output ring of %s', job)
+        ring = self.jobs[job].get_ring()
+        if ring is None:
+            return protocol.FailureResponse(job, protocol.ERR_NO_OUTPUT_RING)
+        else:
+            return protocol.OutputRingResponse(job, ring.path)
+
+    def set_placement(self, job, changes):
+        SERVICE_LOGGER.info('Request to change placement of %s', job)
+        try:
+            self.jobs[job].change_placement(placement.from_dict(changes))
+            return protocol.SuccessResponse(job)
+        except ValueError as ex:
+            SERVICE_LOGGER.info('Failed placement of %s: %s', job, ex)
+            if not self.jobs[job].get_status():
+                return protocol.FailureResponse(job, protocol.ERR_JOB_STOPPED)
+            return protocol.FailureResponse(job, protocol.ERR_BAD_PLACEMENT)
+        except OSError as ex:
+            SERVICE_LOGGER.info('Failed placement of %s: %s', job, ex)
+            return protocol.FailureResponse(job, protocol.ERR_BAD_PLACEMENT)
+
 class SupervisorShim:
     """
     This is the 'method shell' of the supervisor, and is responsible for
@@ -317,8 +1841,12 @@ class SupervisorShim:
         SHIM_LOGGER.info('Sending %s %s to service', command, kwargs)
         future = Future()
 
+        trace = tracing.current()
+        if trace is not None:
+            trace.mark(tracing.QUEUED)
+
         try:
-            self.request_queue.put((Request(command, kwargs), future))
+            self.request_queue.put((Request(command, kwargs, trace), future))
         except AttributeError:
             # If the service has exited, then there's nothing to do
             future.set_result(None)
@@ -342,14 +1870,43 @@ class SupervisorShim:
         """
         self._request('job-timer-expire', job=job)
 
+    def on_health_check_done(self, job, pid, passed, message):
+        """
+        This is the callback for use with the health checker, when a check
+        of some job has finished.
+        """
+        self._request('health-check-done', job=job, pid=pid, passed=passed,
+                      message=message)
+
+    def job_notify(self, pid, session, fields):
+        """
+        This is the callback for use with the notify server, when a job
+        sends a notification.
+        """
+        self._request('job-notify', pid=pid, session=session, fields=fields)
+
+    def reload_job_file(self, filename):
+        """
+        This is the callback for use with the include watcher, when a job
+        file has changed.
+        """
+        self._request('reload-job-file', filename=filename)
+
     def process_start(self, job):
         self._request('job-started', job=job)
 
     def process_stop(self, job):
         self._request('job-stopped', job=job)
     
-    def start_job(self, job):
-        return self._request('start-job', job=job)
+    def start_job(self, job, options=None):
+        """
+        Starts a job. The options can include ``dependencies``, which starts
+        the jobs that this one requires along with it, and ``at``, which is
+        the time to start it at instead of now.
+        """
+        with_deps = bool(options and options.get('dependencies'))
+        at = options.get('at') if options else None
+        return self._request('start-job', job=job, with_deps=with_deps, at=at)
 
     def stop_job(self, job):
         return self._request('stop-job', job=job)
@@ -357,9 +1914,56 @@ class SupervisorShim:
     def get_status(self, job):
         return self._request('get-status', job=job)
 
+    def wait_job(self, job, args=None):
+        """
+        Waits for a job to reach the ``state`` in the arguments, for up to
+        their ``timeout`` in seconds. The future is only done once the job
+        reaches the state or the timeout passes.
+        """
+        args = args or {}
+        return self._request('wait-job', job=job, state=args.get('state'),
+                             timeout=args.get('timeout'))
+
     def list_jobs(self):
         return self._request('list-jobs')
 
+    def get_spawn_plan(self, job):
+        return self._request('get-spawn-plan', job=job)
+
+    def get_output_ring(self, job):
+        return self._request('get-output-ring', job=job)
+
+    def set_placement(self, job, changes):
+        return self._request('set-placement', job=job, placement=changes)
+
+    def get_stats(self):
+        return self._request('get-stats')
+
+    def scale_job(self, job, args=None):
+        """
+        Changes how many instances of a replicated job there are, to the
+        ``replicas`` in the arguments.
+        """
+        replicas = args.get('replicas') if args else None
+        return self._request('scale-job', job=job, replicas=replicas)
+
+    def reexec(self, listener, requester, clients):
+        """
+        Re-executes the supervisor, handing over the command server's
+        listening socket, the client which asked for this and the idle
+        clients (all as file descriptors). The future only gets a result if
+        the supervisor can't re-execute.
+        """
+        return self._request('reexec', listener=listener,
+                             requester=requester, clients=clients)
+
+    def finish_reexec(self):
+        """
+        Answers the client which asked the last supervisor to re-execute,
+        once this one has taken over.
+        """
+        return self._request('finish-reexec')
+
     def terminate(self):
         """
         Requests that the SupervisorService instance stop, and waits for
@@ -0,0 +1,418 @@
+"""
+JobMon Simulation
+=================
+
+Runs the supervisor's service against simulated processes and a virtual
+clock, so that its behaviour with tens of thousands of jobs (restart
+throttling, autostarts, shutdown) can be tested in seconds, without forking
+anything::
+
+    >>> config_handler = config.ConfigHandler(SimulatedProcess)
+    >>> config_handler.load('/etc/jobmon.json')
+    >>> sim = Simulation(config_handler, seed=42)
+    >>> sim.start()
+    >>> sim.run_for(3600)
+    >>> sim.request('get-status', job='my-job')
+    >>> sim.shutdown()
+
+A simulated process doesn't run its command - instead, its behaviour is
+guessed from the command by :func:`guess_behaviour` (``sleep 5`` exits after
+5 seconds, ``false`` fails straight away, and anything else runs until it is
+stopped). A different guess can be given to the :class:`Simulation`.
+:meth:`Simulation.from_jobs` skips the configuration file, and simulates jobs
+given the same way as a configuration file's ``jobs``.
+Health checks aren't run either - a simulation can be given a probe function
+which decides whether each check passes.
+
+Nothing in a simulation runs in another thread. Requests are handled one at a
+time in the order that they were made, the same as in the service's request
+queue, and the clock only moves forward when there is nothing left to do at
+the current time. Along with the seeded random number generator (which is
+only used to add jitter to how long processes run), this means that every
+run with the same seed does exactly the same thing.
+"""
+from collections import Counter, deque, namedtuple
+import heapq
+import itertools
+import logging
+import random
+import signal
+
+from jobmon import (
+    config as config_mod, health, monitor, protocol, service, ticker
+)
+
+LOGGER = logging.getLogger('jobmon.simulation')
+
+# Where virtual clocks start, by default. The service assumes that jobs which
+# haven't been restarted yet were last restarted at time 0, so the clock can't
+# start there.
+EPOCH = 1000000000.0
+
+# Simulated processes get PIDs from here upwards, which are far above any real
+# PID so that they can't be confused
+FIRST_PID = 10000000
+
+# How a simulated process behaves when it is started. 'lifetime' is how long
+# it runs for, in seconds (or None if it runs until it is stopped), and
+# 'exit_code' is the status it exits with when it stops on its own.
+# 'ignores_signal' is whether it carries on running when it is sent the signal
+# that it is stopped with, so that only SIGKILL stops it.
+Behaviour = namedtuple('Behaviour', ['lifetime', 'exit_code', 'ignores_signal'],
+                       defaults=[False])
+
+def guess_behaviour(program):
+    """
+    Guesses how a job's command would behave, for the simplest commands.
+
+    :param str program: The job's command.
+    :return: A :class:`Behaviour`.
+    """
+    words = program.split()
+    if words == ['true']:
+        return Behaviour(0, 0)
+    elif words == ['false']:
+        return Behaviour(0, 1)
+    elif len(words) == 2 and words[0] == 'sleep':
+        try:
+            return Behaviour(float(words[1]), 0)
+        except ValueError:
+            pass
+
+    return Behaviour(None, 0)
+
+class VirtualClock:
+    """
+    A clock which only moves when it is told to, and which can call functions
+    at given times. It can be used anywhere that the :mod:`time` module is
+    used as a clock, since it has a ``time()`` method.
+    """
+    def __init__(self, start=EPOCH):
+        self.now = start
+        self.calls = []
+        self.order = itertools.count()
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, function, *args):
+        """
+        Calls a function once the clock reaches the given time. Functions
+        due at the same time are called in the order they were given.
+        """
+        heapq.heappush(self.calls, (when, next(self.order), function, args))
+
+    def call_later(self, delay, function, *args):
+        """
+        Calls a function after the given number of seconds.
+        """
+        self.call_at(self.now + delay, function, *args)
+
+    def next_call(self):
+        """
+        :return: When the next function is due, or ``None`` if there are \
+        none.
+        """
+        return self.calls[0][0] if self.calls else None
+
+    def advance_to(self, when):
+        """
+        Moves the clock forward (it never goes backwards), calling every
+        function which is due by then.
+        """
+        while self.calls and self.calls[0][0] <= when:
+            call_time, _, function, args = heapq.heappop(self.calls)
+            self.now = max(self.now, call_time)
+            function(*args)
+
+        self.now = max(self.now, when)
+
+class EventRecorder:
+    """
+    Stands in for the event server, and keeps every event that is sent.
+    """
+    def __init__(self, clock):
+        self.clock = clock
+        self.counts = Counter()
+
+        # The events, as (time, job, event code) tuples
+        self.history = []
+
+    def send(self, job, event_type, output=None):
+        self.counts[event_type] += 1
+        self.history.append((self.clock.time(), job, event_type))
+
+class SimulatedProcess(monitor.ChildProcessSkeleton):
+    """
+    A job which doesn't run anything. It has the same configuration as any
+    other job, but its event socket has to be a :class:`Simulation`, which
+    decides how long it runs for.
+    """
+    def start(self):
+        if self.event_sock is None:
+            raise AttributeError('SimulatedProcess was not instantiated')
+
+        if self.child_pid.get() is not None:
+            raise ValueError('Child process already running - cannot start another')
+
+        self.exit_status = None
+        self.was_stopped = False
+
+        child_pid = self.event_sock.spawn(self)
+        self.child_pid.set(child_pid)
+        self.event_sock.send(protocol.Event(self.name, protocol.EVENT_STARTJOB))
+
+    def adopt(self, pid):
+        """
+        Takes charge of a process that is already running. Since the
+        simulation didn't start it, it runs until it is stopped.
+        """
+        if self.child_pid.get() is not None:
+            raise ValueError('Child process already running - cannot adopt another')
+
+        self.exit_status = None
+        self.was_stopped = False
+
+        self.child_pid.set(pid)
+        self.event_sock.send(protocol.Event(self.name, protocol.EVENT_STARTJOB))
+
+    def die(self, child_pid, status):
+        """
+        Called by the simulation when the process exits. This is ignored if
+        the process it refers to has already exited.
+
+        :param int status: The exit status, as returned by ``waitpid``.
+        """
+        if self.child_pid.get() != child_pid:
+            return
+
+        self.exit_status = status
+        self.child_pid.set(None)
+        self.event_sock.send(protocol.Event(self.name, protocol.EVENT_STOPJOB))
+
+    def kill(self, sig=None):
+        child_pid = self.child_pid.get()
+        if child_pid is None:
+            raise ValueError('Child process not running - cannot kill it')
+
+        self.was_stopped = True
+        self.event_sock.signal(self, child_pid,
+                               self.exit_signal if sig is None else sig)
+
+class SimulatedHealthChecker:
+    """
+    Stands in for the :class:`health.HealthChecker`, and reports the result
+    of each check straight away, as decided by a probe function.
+    """
+    def __init__(self, simulation, probe):
+        self.simulation = simulation
+        self.probe = probe
+
+    def next_check_time(self, check, now):
+        jitter = self.simulation.random.uniform(1 - health.JITTER,
+                                                1 + health.JITTER)
+        return now + check.interval * jitter
+
+    def submit(self, job, pid, check):
+        passed, message = self.probe(job, check)
+        self.simulation.submit('health-check-done', job=job, pid=pid,
+                               passed=passed, message=message)
+
+class Simulation:
+    """
+    Runs a :class:`service.SupervisorService` whose jobs are all
+    :class:`SimulatedProcess` objects, on a :class:`VirtualClock`.
+
+    :param config.ConfigHandler config: The configuration, which should \
+    have been created with :class:`SimulatedProcess` as its process class.
+    :param int seed: The seed for the random number generator.
+    :param behaviour: Works out how a job behaves from its command - see \
+    :func:`guess_behaviour`.
+    :param float jitter: How much each process's lifetime is randomly \
+    stretched or shrunk, as a fraction of it.
+    :param float kill_delay: How long processes take to die after they are \
+    signalled, in seconds.
+    :param probe: Decides whether jobs pass their health checks - it is \
+    called with the job and its :class:`health.HealthCheck`, and returns a \
+    tuple of ``(passed, message)``. If this is ``None``, then no health \
+    checks are run.
+    :param journal.Journal journal: The state journal that the service keeps.
+    :param dict handed_over: The state of another service to take over \
+    from, as returned by :meth:`service.SupervisorService.get_handoff`.
+    """
+    def __init__(self, config, seed=0, behaviour=guess_behaviour, jitter=0.0,
+                 kill_delay=0.01, probe=None, journal=None, handed_over=None):
+        self.clock = VirtualClock()
+        self.random = random.Random(seed)
+        self.behaviour = behaviour
+        self.jitter = jitter
+        self.kill_delay = kill_delay
+        self.pids = itertools.count(FIRST_PID)
+
+        # The requests which the status server and the ticker would have put
+        # onto the service's queue
+        self.pending = deque()
+
+        self.events = EventRecorder(self.clock)
+        self.ticker = ticker.Ticker(self.on_timer_expire, clock=self.clock)
+
+        health_checker = None
+        if probe is not None:
+            health_checker = SimulatedHealthChecker(self, probe)
+
+        self.service = service.SupervisorService(
+            config, self.events, self, self.ticker,
+            health_checker=health_checker, journal=journal,
+            handed_over=handed_over, clock=self.clock)
+
+        LOGGER.info('Simulating %d jobs with seed %d', len(config.jobs), seed)
+
+    @classmethod
+    def from_jobs(cls, jobs, **kwargs):
+        """
+        Simulates some jobs, without a configuration file.
+
+        :param dict jobs: The jobs, the same as a configuration file's \
+        ``jobs``.
+        :param kwargs: Passed on to the :class:`Simulation`.
+        :return: A new :class:`Simulation`.
+        """
+        config_handler = config_mod.ConfigHandler(SimulatedProcess)
+        config_handler.handle_jobs(jobs)
+        config_handler.check_dependencies()
+        return cls(config_handler, **kwargs)
+
+    def get_peer(self):
+        """
+        Stands in for :meth:`status_server.StatusServer.get_peer`, since the
+        simulation also plays the part of the status server.
+        """
+        return self
+
+    def send(self, event):
+        """
+        Receives an event from a simulated process, the same way that the
+        status server does.
+        """
+        if event.event_code == protocol.EVENT_STARTJOB:
+            self.submit('job-started', job=event.job_name)
+        elif event.event_code == protocol.EVENT_STOPJOB:
+            self.submit('job-stopped', job=event.job_name)
+
+    def on_timer_expire(self, job):
+        self.submit('job-timer-expire', job=job)
+
+    def spawn(self, process):
+        """
+        Starts a simulated process, and arranges for it to exit if it
+        doesn't run forever.
+
+        :return: The process's PID.
+        """
+        child_pid = next(self.pids)
+        lifetime, exit_code, _ = self.behaviour(process.program)
+        if lifetime is not None:
+            if self.jitter:
+                lifetime *= 1 + self.random.uniform(-self.jitter, self.jitter)
+            self.clock.call_later(lifetime, process.die, child_pid,
+                                  exit_code << 8)
+
+        return child_pid
+
+    def signal(self, process, child_pid, sig):
+        """
+        Sends a signal to a simulated process, which kills it unless the
+        process ignores it.
+        """
+        if (sig != signal.SIGKILL and
+                self.behaviour(process.program).ignores_signal):
+            return
+
+        self.clock.call_later(self.kill_delay, process.die, child_pid, sig)
+
+    def submit(self, action, **args):
+        """
+        Adds a request to the end of the service's queue.
+        """
+        self.pending.append(service.Request(action, args))
+
+    def drain(self):
+        """
+        Handles every request in the service's queue, including any that are
+        added while doing so.
+        """
+        while self.pending:
+            request = self.pending.popleft()
+            if self.service.shutting_down:
+                self.service.handle_closing_request(request)
+            else:
+                self.service.handle_request(request)
+
+    def request(self, action, **args):
+        """
+        Sends a request to the service, after everything already in its
+        queue, and handles anything that it causes at the current time.
+
+        :return: The service's response.
+        """
+        self.drain()
+        response = self.service.handle_request(service.Request(action, args))
+        self.drain()
+        return response
+
+    def next_deadline(self):
+        """
+        :return: The time that something next happens, or ``None`` if \
+        nothing ever will.
+        """
+        deadlines = [deadline for deadline
+                     in (self.clock.next_call(), self.ticker.next_timeout())
+                     if deadline is not None]
+        return min(deadlines) if deadlines else None
+
+    def run_until(self, when):
+        """
+        Runs the simulation until the clock reaches the given time.
+        """
+        self.drain()
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > when:
+                break
+
+            self.clock.advance_to(deadline)
+            self.ticker.run_timeouts()
+            self.drain()
+
+        self.clock.advance_to(when)
+
+    def run_for(self, seconds):
+        """
+        Runs the simulation for the given number of (virtual) seconds.
+        """
+        self.run_until(self.clock.time() + seconds)
+
+    def start(self):
+        """
+        Starts the service, which autostarts its jobs.
+        """
+        self.request('init')
+
+    def shutdown(self, timeout=60):
+        """
+        Terminates the service, and runs the simulation until every job has
+        stopped.
+
+        :param float timeout: The longest to wait, in virtual seconds.
+        :return: ``True`` if every job stopped in time.
+        """
+        self.request('terminate')
+
+        deadline = self.clock.time() + timeout
+        while self.service.running_jobs:
+            next_deadline = self.next_deadline()
+            if next_deadline is None or next_deadline > deadline:
+                break
+            self.run_until(next_deadline)
+
+        return not self.service.running_jobs
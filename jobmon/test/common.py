@@ -0,0 +1,34 @@
+"""
+Stand-ins and base classes shared by the tests.
+"""
+import logging
+import threading
+import unittest
+
+from jobmon import protocol
+
+class EventRecorder:
+    """
+    A replacement for the status server's socket, which records the events
+    sent by a child process.
+    """
+    def __init__(self):
+        self.events = []
+        self.stopped = threading.Event()
+
+    def send(self, event):
+        self.events.append(event)
+        if event.event_code == protocol.EVENT_STOPJOB:
+            self.stopped.set()
+
+class SimulationTestCase(unittest.TestCase):
+    """
+    A test case which runs simulations (see :mod:`jobmon.simulation`).
+    Logging every request of a large simulation would take far longer than
+    the simulation itself, so only warnings are logged during each test.
+    """
+    def setUp(self):
+        logging.disable(logging.INFO)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
@@ -0,0 +1,74 @@
+import logging
+import os
+import socket
+import tempfile
+import unittest
+
+from jobmon import address
+
+logging.basicConfig(filename='jobmon-test_address.log', level=logging.DEBUG)
+
+class TestAddress(unittest.TestCase):
+    def test_parse(self):
+        """
+        Ensures that ports, paths and abstract names are all understood, and
+        written back the same way.
+        """
+        self.assertEqual(address.parse(6666),
+                         address.Address(socket.AF_INET, 6666))
+        self.assertEqual(address.parse('6666'),
+                         address.Address(socket.AF_INET, 6666))
+        self.assertEqual(address.parse('/run/jobmon.sock'),
+                         address.Address(socket.AF_UNIX, '/run/jobmon.sock'))
+        self.assertEqual(address.parse('unix:@jobmon'),
+                         address.Address(socket.AF_UNIX, '\0jobmon'))
+
+        for value in (6666, '/run/jobmon.sock', '@jobmon'):
+            self.assertEqual(address.to_str(address.parse(value)), str(value))
+
+        for bad_value in ('', '@', 'relative.sock', 0, 70000, True, None,
+                          'unix:'):
+            with self.assertRaises(ValueError):
+                address.parse(bad_value)
+
+    def test_filesystem_socket(self):
+        """
+        Ensures that stale socket files are replaced, that live ones aren't,
+        and that the file is removed once the server closes.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            sock_address = address.parse(os.path.join(temp_dir, 'control'))
+
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(sock_address.target)
+            stale.close()
+
+            listener = address.listen(sock_address)
+            with self.assertRaises(OSError):
+                address.listen(sock_address)
+
+            client = address.connect(sock_address)
+            peer, _ = listener.accept()
+            self.assertEqual(address.peer_allowed(peer, address.default_uids()),
+                             (True, os.getuid()))
+            self.assertEqual(address.peer_allowed(peer, frozenset()),
+                             (False, os.getuid()))
+            self.assertEqual(address.peer_allowed(peer, address.ANY_UID),
+                             (True, os.getuid()))
+            peer.close()
+            client.close()
+
+            address.close_listener(listener, sock_address)
+            self.assertFalse(os.path.exists(sock_address.target))
+
+    def test_read_uids(self):
+        """
+        Ensures that users can be given by UID or by name.
+        """
+        self.assertEqual(address.read_uids([0, 'root', 1234]),
+                         frozenset((0, 1234)))
+        self.assertEqual(address.read_uids('*'), address.ANY_UID)
+
+        for bad_value in ('root', ['no-such-user-for-jobmon'], [1.5]):
+            with self.assertRaises(ValueError):
+                address.read_uids(bad_value)
@@ -0,0 +1,107 @@
+import io
+import json
+import logging
+import unittest
+
+from jobmon import batch, protocol
+
+logging.basicConfig(filename='jobmon-test_batch.log', level=logging.DEBUG)
+
+class FakeCommandPipe:
+    """
+    Stands in for a :class:`transport.CommandPipe`, answering each command
+    from a table of responses.
+    """
+    def __init__(self, responses):
+        self.responses = responses
+        self.batches = []
+
+    def run_batch(self, commands):
+        self.batches.append(commands)
+        return [self.responses.get(command.job_name,
+                                   protocol.FailureResponse(
+                                       command.job_name,
+                                       protocol.ERR_NO_SUCH_JOB))
+                for command in commands]
+
+class TestParse(unittest.TestCase):
+    def test_parse_line(self):
+        """
+        Ensures that commands are read like command lines, with any number
+        of jobs.
+        """
+        request = batch.parse_line('start --with-deps web "my worker"')
+        self.assertEqual(request.name, 'start')
+        self.assertEqual(request.commands, [
+            protocol.Command('web', protocol.CMD_START,
+                             {'dependencies': True}),
+            protocol.Command('my worker', protocol.CMD_START,
+                             {'dependencies': True}),
+        ])
+
+        self.assertEqual(batch.parse_line('scale web 3').commands,
+                         [protocol.Command('web', protocol.CMD_SCALE,
+                                           {'replicas': 3})])
+        self.assertIsNone(batch.parse_line('  # Nothing to see here'))
+
+        for bad_line in ('launch web', 'stop', 'stop --force web',
+                         'scale web many', 'list-jobs web', 'status "web'):
+            with self.assertRaises(ValueError):
+                batch.parse_line(bad_line)
+
+class TestRun(unittest.TestCase):
+    RESPONSES = {
+        'web': protocol.StatusResponse('web', True, 1234, False),
+        'db': protocol.StatusResponse('db', False, None),
+        None: protocol.JobListResponse({'web': True}),
+    }
+
+    def test_lines(self):
+        """
+        Ensures that each line is sent as one request, and that its results
+        are written out in order, carrying on past any errors.
+        """
+        command_pipe = FakeCommandPipe(self.RESPONSES)
+        output = io.StringIO()
+        status = batch.run(command_pipe,
+                           ['status web db nothing\n', 'bogus\n', '\n',
+                            'pid web db\n', 'list-jobs\n'],
+                           output)
+
+        self.assertEqual(status, 1)
+        self.assertEqual([len(commands) for commands in command_pipe.batches],
+                         [3, 2, 1])
+        self.assertEqual(output.getvalue().splitlines(), [
+            'UNHEALTHY web',
+            'STOPPED db',
+            'ERROR status nothing: No such job',
+            'ERROR Unknown command "bogus"',
+            'web 1234',
+            'db -',
+            'RUNNING web',
+        ])
+
+    def test_json(self):
+        """
+        Ensures that JSON results have one object per job.
+        """
+        output = io.StringIO()
+        status = batch.run(FakeCommandPipe(self.RESPONSES), ['status web'],
+                           output, as_json=True)
+
+        self.assertEqual(status, 0)
+        self.assertEqual(json.loads(output.getvalue()),
+                         {'command': 'status', 'job': 'web', 'ok': True,
+                          'running': True, 'pid': 1234, 'healthy': False})
+
+    def test_status_code(self):
+        """
+        Ensures that results give the same exit statuses as jobmon status.
+        """
+        command_pipe = FakeCommandPipe(self.RESPONSES)
+        records = batch.send(command_pipe,
+                             batch.job_request('status',
+                                               ['web', 'db', 'nothing']),
+                             io.StringIO())
+        self.assertEqual([batch.status_code(record) for record in records],
+                         [3, 1, 2])
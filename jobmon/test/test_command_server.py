@@ -3,11 +3,13 @@ import logging
 import os
 import select
 import socket
+import tempfile
+import threading
 import time
 import unittest
 
 from jobmon.protocol import *
-from jobmon import command_server, protocol, transport
+from jobmon import command_server, output, protocol, transport
 
 logging.basicConfig(filename='jobmon-test_command_server.log', level=logging.DEBUG)
 
@@ -31,8 +33,9 @@ class CommandServerRecorder:
     """
     This is a replacement Supervisor that records the commands given to it.
     """
-    def __init__(self):
+    def __init__(self, ring_path):
         self.commands = []
+        self.ring_path = ring_path
 
     @wrap_future
     def start_job(self, job):
@@ -54,17 +57,66 @@ class CommandServerRecorder:
         self.commands.append('list')
         return protocol.JobListResponse({'a': True, 'b': False})
 
+    @wrap_future
+    def get_spawn_plan(self, job):
+        self.commands.append(('plan', job))
+        return protocol.SpawnPlanResponse(job, {'argv': ['true']})
+
+    @wrap_future
+    def get_output_ring(self, job):
+        self.commands.append(('ring', job))
+        return protocol.OutputRingResponse(job, self.ring_path)
+
+    @wrap_future
+    def set_placement(self, job, changes):
+        self.commands.append(('place', job, changes))
+        return protocol.SuccessResponse(job)
+
+    @wrap_future
+    def get_stats(self):
+        self.commands.append('stats')
+        return protocol.StatsResponse({'start_job': {}})
+
+    @wrap_future
+    def scale_job(self, job, args):
+        self.commands.append(('scale', job, args['replicas']))
+        return protocol.SuccessResponse(job)
+
+    @wrap_future
+    def wait_job(self, job, args):
+        self.commands.append(('wait', job, args['state']))
+        return protocol.StatusResponse(job, False, None)
+
     @wrap_future
     def terminate(self):
         self.commands.append('terminate')
 
+class WaitRecorder(CommandServerRecorder):
+    """
+    A replacement Supervisor which holds onto waits, rather than answering
+    them straight away.
+    """
+    def __init__(self):
+        super().__init__(None)
+        self.waits = []
+
+    def wait_job(self, job, args):
+        self.commands.append(('wait', job, args['state']))
+        future = Future()
+        self.waits.append(future)
+        return future
+
 class TestCommandServer(unittest.TestCase):
     def test_command_server(self):
         """
         Ensure that the command pipe can successfully transmit standard
         requests and responses.
         """
-        command_recorder = CommandServerRecorder()
+        temp_dir = tempfile.TemporaryDirectory()
+        ring = output.RingBuffer(temp_dir.name + '/job.ring', 64)
+        ring.write(b'Hello\n')
+
+        command_recorder = CommandServerRecorder(ring.path)
         command_svr = command_server.CommandServer(PORT, command_recorder)
         command_svr.start()
 
@@ -80,6 +132,11 @@ class TestCommandServer(unittest.TestCase):
                     'a': True,
                     'b': False,
                 },
+                {'argv': ['true']},
+                ['Hello'],
+                None,
+                {'start_job': {}},
+                None,
                 None
             ]
 
@@ -89,6 +146,11 @@ class TestCommandServer(unittest.TestCase):
                 command_pipe.is_running('some_job'),
                 command_pipe.get_pid('some_job'),
                 command_pipe.get_jobs(),
+                command_pipe.get_spawn_plan('some_job'),
+                command_pipe.get_output_ring('some_job').tail(10)[0],
+                command_pipe.set_placement('some_job', {'nice': 5}),
+                command_pipe.get_stats(),
+                command_pipe.scale_job('some_job', 3),
                 command_pipe.terminate(),
             ]
 
@@ -102,9 +164,161 @@ class TestCommandServer(unittest.TestCase):
                              ('status', 'some_job'),
                              ('status', 'some_job'),
                              'list',
+                             ('plan', 'some_job'),
+                             ('ring', 'some_job'),
+                             ('place', 'some_job', {'nice': 5}),
+                             'stats',
+                             ('scale', 'some_job', 3),
                              'terminate'])
         finally:
             command_svr.terminate()
             command_pipe.destroy()
 
             command_svr.wait_for_exit()
+
+            ring.close()
+            temp_dir.cleanup()
+
+    def test_unix_socket(self):
+        """
+        Ensure that commands can be sent over a Unix socket, and that clients
+        running as users who aren't allowed are disconnected.
+        """
+        command_recorder = CommandServerRecorder(None)
+        name = '@jobmon-test-{}'.format(os.getpid())
+        command_svr = command_server.CommandServer(name, command_recorder)
+        command_svr.start()
+
+        blocked_name = name + '-blocked'
+        blocked_svr = command_server.CommandServer(
+            blocked_name, command_recorder, allowed_uids=frozenset())
+        blocked_svr.start()
+
+        try:
+            command_pipe = transport.CommandPipe(name)
+            self.assertTrue(command_pipe.is_running('some_job'))
+
+            with self.assertRaises(IOError):
+                transport.CommandPipe(blocked_name).is_running('some_job')
+
+            self.assertEqual(command_recorder.commands,
+                             [('status', 'some_job')])
+        finally:
+            for server in (command_svr, blocked_svr):
+                server.terminate()
+                server.wait_for_exit()
+
+
+    def test_kept_open(self):
+        """
+        Ensure that clients can send several commands over one connection,
+        without holding up other clients, and that batches are answered in
+        order.
+        """
+        command_recorder = CommandServerRecorder(None)
+        name = '@jobmon-test-batch-{}'.format(os.getpid())
+        command_svr = command_server.CommandServer(name, command_recorder)
+        command_svr.start()
+
+        command_pipe = transport.CommandPipe(name, keep_open=True)
+        try:
+            self.assertTrue(command_pipe.is_running('some_job'))
+            sock = command_pipe.sock
+            self.assertEqual(command_pipe.get_pid('some_job'), 1234)
+            self.assertIs(command_pipe.sock, sock)
+
+            # Other clients are still answered while the connection is open
+            self.assertEqual(transport.CommandPipe(name).get_jobs(),
+                             {'a': True, 'b': False})
+
+            results = command_pipe.run_batch([
+                Command('a', CMD_START),
+                Command('b', CMD_STATUS),
+                Command(None, CMD_QUIT),
+                Command('c', 99),
+            ])
+            self.assertEqual(results, [
+                SuccessResponse('a'),
+                StatusResponse('b', True, 1234),
+                FailureResponse(None, ERR_BAD_COMMAND),
+                FailureResponse('c', ERR_BAD_COMMAND),
+            ])
+
+            self.assertEqual(command_recorder.commands,
+                             [('status', 'some_job'),
+                              ('status', 'some_job'),
+                              'list',
+                              ('start', 'a'),
+                              ('status', 'b')])
+        finally:
+            command_pipe.destroy()
+            command_svr.terminate()
+            command_svr.wait_for_exit()
+
+    def test_deferred(self):
+        """
+        Ensure that clients waiting on a reply don't hold up other clients,
+        including other waiting clients, and that batches of waits are
+        answered once all of them are done.
+        """
+        command_recorder = WaitRecorder()
+        name = '@jobmon-test-wait-{}'.format(os.getpid())
+        command_svr = command_server.CommandServer(name, command_recorder)
+        command_svr.start()
+
+        results = {}
+        def wait(key, job):
+            results[key] = transport.CommandPipe(name).wait_job(
+                job, WAIT_STOPPED, 10)
+
+        def wait_batch():
+            results['batch'] = transport.CommandPipe(name).run_batch([
+                Command('c', CMD_STATUS),
+                Command('d', CMD_WAIT, {'state': WAIT_STOPPED}),
+            ])
+
+        waiters = [threading.Thread(target=wait, args=(key, 'a'))
+                   for key in range(20)]
+        waiters.append(threading.Thread(target=wait_batch))
+        try:
+            for waiter in waiters:
+                waiter.start()
+
+            deadline = time.time() + 5
+            while (len(command_recorder.waits) < len(waiters) and
+                   time.time() < deadline):
+                time.sleep(0.01)
+            self.assertEqual(len(command_recorder.waits), len(waiters))
+
+            self.assertEqual(transport.CommandPipe(name).get_pid('b'), 1234)
+            self.assertEqual(results, {})
+
+            # A client which gives up on waiting is forgotten about
+            quitter = socket.socket(socket.AF_UNIX)
+            quitter.connect('\0' + name[1:])
+            quitter_pipe = protocol.ProtocolStreamSocket(quitter)
+            quitter_pipe.send(Command('a', CMD_WAIT, {'state': WAIT_STOPPED}))
+            quitter.close()
+
+            for future in command_recorder.waits:
+                future.set_result(StatusResponse('a', False, None))
+
+            for waiter in waiters:
+                waiter.join(5)
+
+            self.assertEqual(results[0], StatusResponse('a', False, None))
+            self.assertEqual(len(results), len(waiters))
+            self.assertEqual(results['batch'], [
+                StatusResponse('c', True, 1234),
+                StatusResponse('a', False, None),
+            ])
+
+            # Everybody has either been answered or gone away by now, so
+            # none of the connections should be left
+            deadline = time.time() + 5
+            while command_svr.clients and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(command_svr.clients, set())
+        finally:
+            command_svr.terminate()
+            command_svr.wait_for_exit()
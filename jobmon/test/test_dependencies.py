@@ -0,0 +1,128 @@
+import logging
+import unittest
+
+from jobmon import config, dependencies, protocol, simulation
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_dependencies.log',
+                    level=logging.DEBUG)
+
+class TestGraph(unittest.TestCase):
+    def test_find_cycle(self):
+        """
+        Ensures that cycles are found, and that shared dependencies aren't
+        mistaken for them.
+        """
+        self.assertIsNone(dependencies.find_cycle({
+            'api': ['cache', 'db'], 'cache': ['db'], 'db': [],
+            'worker': ['db', 'missing'],
+        }))
+
+        cycle = dependencies.find_cycle({
+            'a': ['b'], 'b': ['c'], 'c': ['a'], 'd': ['a'],
+        })
+        self.assertEqual(cycle[0], cycle[-1])
+        self.assertEqual(set(cycle), {'a', 'b', 'c'})
+
+        self.assertEqual(dependencies.find_cycle({'a': ['a']}), ['a', 'a'])
+
+        # Long chains don't run into the recursion limit
+        chain = {index: [index + 1] for index in range(10000)}
+        self.assertIsNone(dependencies.find_cycle(chain))
+
+    def test_pull_in(self):
+        """
+        Ensures that everything required, directly or not, is pulled in.
+        """
+        requires = {'api': ['cache'], 'cache': ['db'], 'db': [],
+                    'other': ['db']}
+        self.assertEqual(dependencies.pull_in(['api'], requires.get),
+                         {'api', 'cache', 'db'})
+
+    def test_config(self):
+        """
+        Ensures that unknown dependencies are dropped, and that cycles are
+        refused.
+        """
+        config_handler = config.ConfigHandler()
+        config_handler.handle_jobs({
+            'db': {'command': 'true'},
+            'api': {'command': 'true', 'requires': ['db', 'nothing'],
+                    'after': ['db']},
+        })
+        config_handler.check_dependencies()
+        self.assertEqual(config_handler.jobs['api'].requires, ('db',))
+        self.assertEqual(config_handler.jobs['api'].after, ('db',))
+
+        config_handler.handle_jobs({
+            'ping': {'command': 'true', 'after': ['pong']},
+            'pong': {'command': 'true', 'requires': ['ping']},
+        })
+        with self.assertRaises(ValueError):
+            config_handler.check_dependencies()
+
+class TestServiceOrdering(common.SimulationTestCase):
+    def history(self, sim, event_code):
+        return [job for _, job, code in sim.events.history
+                if code == event_code]
+
+    def test_start_and_stop(self):
+        """
+        Ensures that jobs start after what they depend on is up, with
+        independent jobs starting together, and stop in the reverse order.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'web-1': {'command': 'sleep 3600', 'requires': ['cache'],
+                      'autostart': True},
+            'web-2': {'command': 'sleep 3600', 'requires': ['cache', 'db'],
+                      'autostart': True},
+            'cache': {'command': 'sleep 3600', 'requires': ['db']},
+            'db': {'command': 'sleep 3600', 'notify': True},
+            'metrics': {'command': 'sleep 3600', 'after': ['db'],
+                        'autostart': True},
+        })
+        sim.start()
+
+        # The database is pulled in, but nothing else can start until it
+        # says that it's ready
+        self.assertEqual(self.history(sim, protocol.EVENT_STARTJOB), ['db'])
+
+        db_pid = sim.request('get-status', job='db').pid
+        sim.request('job-notify', pid=db_pid, session=db_pid,
+                    fields={'READY': '1'})
+        self.assertEqual(self.history(sim, protocol.EVENT_STARTJOB),
+                         ['db', 'cache', 'metrics', 'web-1', 'web-2'])
+
+        self.assertTrue(sim.shutdown())
+        stops = self.history(sim, protocol.EVENT_STOPJOB)
+        self.assertEqual(set(stops[:3]), {'web-1', 'web-2', 'metrics'})
+        self.assertEqual(stops[3:], ['cache', 'db'])
+
+    def test_start_command(self):
+        """
+        Ensures that starting a job only pulls in its dependencies when
+        asked to, and that a dependency which stops before it is up cancels
+        the start.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'api': {'command': 'sleep 3600', 'requires': ['db']},
+            'db': {'command': 'sleep 3600'},
+            'broken': {'command': 'false', 'notify': True},
+            'client': {'command': 'sleep 3600', 'requires': ['broken']},
+        })
+        sim.start()
+
+        sim.request('start-job', job='api')
+        self.assertEqual(self.history(sim, protocol.EVENT_STARTJOB), ['api'])
+        sim.request('stop-job', job='api')
+        sim.run_for(1)
+
+        sim.request('start-job', job='api', with_deps=True)
+        self.assertEqual(self.history(sim, protocol.EVENT_STARTJOB),
+                         ['api', 'db', 'api'])
+
+        sim.request('start-job', job='client', with_deps=True)
+        sim.run_for(1)
+        self.assertFalse(sim.request('get-status', job='client').is_running)
+        self.assertEqual(sim.service.waiting_starts, {})
+        self.assertTrue(sim.shutdown())
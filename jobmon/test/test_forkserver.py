@@ -0,0 +1,131 @@
+import logging
+import os
+import signal
+import threading
+import time
+import unittest
+
+from jobmon import forkserver, monitor, protocol
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_forkserver.log', level=logging.DEBUG)
+
+def spawn_sleep(fork_server, seconds):
+    """
+    Starts a sleeping child via the fork server.
+    """
+    return fork_server.spawn(['sleep', str(seconds)], dict(os.environ), None,
+                             '/dev/null', '/dev/null', '/dev/null')
+
+class TestForkServer(unittest.TestCase):
+    def test_exit_notification(self):
+        """
+        Ensures that the fork server reports when its children exit.
+        """
+        fork_server = forkserver.ForkServer()
+        fork_server.start()
+
+        try:
+            exited = threading.Event()
+            statuses = []
+            def record_exit(status):
+                statuses.append(status)
+                exited.set()
+
+            pid = spawn_sleep(fork_server, 0)
+            self.assertIsNotNone(pid)
+
+            # The child may already be gone by now, which has to be handled
+            time.sleep(1)
+            fork_server.watch(pid, record_exit)
+            self.assertTrue(exited.wait(5))
+            self.assertEqual(statuses, [0])
+        finally:
+            fork_server.terminate()
+
+    def test_helper_restart(self):
+        """
+        Ensures that the helper is restarted if it dies, and that children of
+        the dead helper are still reported when they exit.
+        """
+        fork_server = forkserver.ForkServer()
+        fork_server.start()
+
+        try:
+            exited = threading.Event()
+            pid = spawn_sleep(fork_server, 2)
+            fork_server.watch(pid, lambda status: exited.set())
+
+            old_helper = fork_server.helper_pid
+            os.kill(old_helper, signal.SIGKILL)
+
+            time.sleep(1) # Give the reader time to notice the death
+            self.assertNotEqual(fork_server.helper_pid, old_helper)
+            self.assertFalse(exited.is_set())
+
+            # The supervisor has threads, so the new helper has to be a fresh
+            # interpreter rather than a fork of it
+            with open('/proc/{}/cmdline'.format(fork_server.helper_pid),
+                      'rb') as cmdline:
+                self.assertIn(b'jobmon.forkserver', cmdline.read())
+
+            self.assertTrue(exited.wait(5))
+
+            second_exited = threading.Event()
+            second_pid = spawn_sleep(fork_server, 0)
+            self.assertIsNotNone(second_pid)
+            fork_server.watch(second_pid,
+                              lambda status: second_exited.set())
+            self.assertTrue(second_exited.wait(5))
+        finally:
+            fork_server.terminate()
+
+    def test_spawn_timeout(self):
+        """
+        Ensures that a spawn request gives up if the helper doesn't answer,
+        and that a child which the helper starts afterwards is killed.
+        """
+        fork_server = forkserver.ForkServer(spawn_timeout=0.5)
+        fork_server.start()
+
+        try:
+            os.kill(fork_server.helper_pid, signal.SIGSTOP)
+            try:
+                with self.assertRaises(TimeoutError):
+                    spawn_sleep(fork_server, 3600)
+            finally:
+                os.kill(fork_server.helper_pid, signal.SIGCONT)
+
+            # Once the late child has been killed, nothing is left waiting
+            # on it
+            time.sleep(1)
+            self.assertEqual(fork_server.abandoned, set())
+            self.assertEqual(fork_server.watchers, {})
+            self.assertEqual(fork_server.early_exits, {})
+        finally:
+            fork_server.terminate()
+
+    def test_fallback(self):
+        """
+        Ensures that jobs are forked directly if the fork server doesn't
+        answer.
+        """
+        fork_server = forkserver.ForkServer(spawn_timeout=0.5)
+        fork_server.start()
+
+        recorder = common.EventRecorder()
+        os.kill(fork_server.helper_pid, signal.SIGSTOP)
+        try:
+            child = monitor.ChildProcess(recorder, 'test', 'true',
+                                         spawn=monitor.SPAWN_FORK_SERVER)
+            child.set_fork_server(fork_server)
+            child.start()
+            self.assertTrue(recorder.stopped.wait(5))
+            self.assertEqual(recorder.events,
+                             [protocol.Event('test', protocol.EVENT_STARTJOB),
+                              protocol.Event('test', protocol.EVENT_STOPJOB)])
+            self.assertEqual(child.exit_status, 0)
+        finally:
+            os.kill(fork_server.helper_pid, signal.SIGCONT)
+            time.sleep(0.5)
+            fork_server.terminate()
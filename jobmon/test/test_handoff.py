@@ -0,0 +1,157 @@
+import itertools
+import json
+import logging
+import os
+import tempfile
+import time
+import unittest
+
+from jobmon import handoff, output, protocol, simulation
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_handoff.log', level=logging.DEBUG)
+
+JOBS = {
+    'web': {'command': 'sleep 3600', 'autostart': True, 'restart': True},
+    'db': {'command': 'sleep 3600', 'autostart': True},
+    'report': {'command': 'sleep 3600'},
+}
+
+class TestTakeOver(common.SimulationTestCase):
+    def test_service(self):
+        """
+        Ensures that a service carries on from the one it replaced - jobs
+        which are still running are adopted without any events, jobs which
+        stopped in the meantime are reported, and delayed starts still happen.
+        """
+        # The test itself stands in for every job's process, since the new
+        # service checks that the processes it adopts are still running
+        pid = os.getpid()
+        old = simulation.Simulation.from_jobs(JOBS)
+        old.pids = itertools.repeat(pid)
+        old.start()
+        old.request('start-job', job='report', at=old.clock.time() + 600)
+
+        state = json.loads(json.dumps(old.service.get_handoff()))
+        self.assertEqual(set(state['jobs']), {'web', 'db'})
+
+        # db's process exits while the supervisor is re-executing
+        state['jobs']['db']['since'] -= 1
+
+        new = simulation.Simulation.from_jobs(JOBS, handed_over=state)
+        new.pids = itertools.repeat(pid)
+        new.start()
+
+        web = new.request('get-status', job='web')
+        self.assertTrue(web.is_running)
+        self.assertEqual(web.pid, pid)
+        self.assertFalse(new.request('get-status', job='db').is_running)
+        self.assertEqual(new.events.counts[protocol.EVENT_STARTJOB], 0)
+        self.assertEqual(new.events.history[-1][1:],
+                         ('db', protocol.EVENT_STOPJOB))
+
+        new.run_for(601)
+        self.assertTrue(new.request('get-status', job='report').is_running)
+        self.assertEqual(new.events.counts[protocol.EVENT_STARTJOB], 1)
+
+        # Adopted jobs are stopped and restarted like any other
+        new.request('stop-job', job='web')
+        new.run_for(1)
+        new.request('start-job', job='web')
+        self.assertEqual(new.events.counts[protocol.EVENT_STOPJOB], 2)
+        self.assertEqual(new.events.counts[protocol.EVENT_STARTJOB], 2)
+        self.assertTrue(new.shutdown())
+
+class TestOutputHandoff(unittest.TestCase):
+    def test_capture(self):
+        """
+        Ensures that output written to a pipe before and after it is handed
+        over ends up in the same file and ring buffer.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            destination = os.path.join(temp_dir, 'job.log')
+            capture = output.OutputCapture()
+            capture.start()
+            try:
+                ring = capture.get_ring('job', 1024)
+                fifo = capture.get_fifo(destination, output.NO_ROTATION, ring)
+                job_output = open(fifo, 'a', buffering=1)
+                job_output.write('before\n')
+                time.sleep(0.5)
+            except:
+                capture.terminate()
+                capture.wait_for_exit()
+                raise
+
+            state = json.loads(json.dumps(capture.hand_over()))
+            self.assertTrue(os.path.exists(fifo))
+
+            # The job keeps writing while nobody is reading
+            job_output.write('during\n')
+
+            capture = output.OutputCapture(handed_over=state)
+            capture.start()
+            try:
+                ring = capture.get_ring('job', 1024)
+                self.assertEqual(
+                    capture.get_fifo(destination, output.NO_ROTATION, ring),
+                    fifo)
+
+                job_output.write('after\n')
+                job_output.close()
+                time.sleep(0.5)
+                self.assertEqual(ring.tail(10)[0],
+                                 ['before', 'during', 'after'])
+            finally:
+                capture.terminate()
+                capture.wait_for_exit()
+
+            with open(destination) as captured:
+                self.assertEqual(captured.read(), 'before\nduring\nafter\n')
+
+    def test_stale_ring(self):
+        """
+        Ensures that a ring buffer file isn't taken over if it doesn't hold
+        what the last supervisor said it did.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'job.ring')
+            ring = output.RingBuffer(path, 64)
+            ring.write(b'kept\n')
+            ring.close()
+
+            ring = output.RingBuffer(path, 64, reopen=True)
+            try:
+                self.assertEqual(ring.tail(10)[0], ['kept'])
+                ring.write(b'more\n')
+                self.assertEqual(ring.tail(10)[0], ['kept', 'more'])
+            finally:
+                ring.close()
+
+            with self.assertRaises(ValueError):
+                output.RingBuffer(path, 128, reopen=True)
+
+class TestReceive(unittest.TestCase):
+    def test_receive(self):
+        """
+        Ensures that a handoff is read from the descriptor in the
+        environment, and that its descriptors aren't passed on to jobs.
+        """
+        self.assertIsNone(handoff.receive())
+
+        read_fd, write_fd = os.pipe()
+        os.set_inheritable(read_fd, True)
+        handoff_file = tempfile.TemporaryFile()
+        handoff_file.write(json.dumps({'fds': [read_fd], 'x': 1}).encode())
+        handoff_file.seek(0)
+
+        os.environ[handoff.ENV_VAR] = str(os.dup(handoff_file.fileno()))
+        handoff_file.close()
+        try:
+            self.assertEqual(handoff.receive(), {'fds': [read_fd], 'x': 1})
+            self.assertNotIn(handoff.ENV_VAR, os.environ)
+            self.assertFalse(os.get_inheritable(read_fd))
+        finally:
+            os.environ.pop(handoff.ENV_VAR, None)
+            os.close(read_fd)
+            os.close(write_fd)
@@ -0,0 +1,256 @@
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from jobmon import config, health, protocol, simulation
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_health.log', level=logging.DEBUG)
+
+def make_check(kind, target, **options):
+    """
+    Makes a health check, with short defaults for anything not given.
+    """
+    options.setdefault('interval', 10)
+    options.setdefault('timeout', 1)
+    options.setdefault('failures', 3)
+    options.setdefault('action', health.ACTION_RESTART)
+    return health.HealthCheck(kind, target, **options)
+
+class TestHealthConfig(unittest.TestCase):
+    def test_from_dict(self):
+        """
+        Ensures that each kind of check is read, along with its options.
+        """
+        self.assertEqual(
+            health.from_dict({'exec': 'pgrep nginx', 'interval': 5,
+                              'failures': 2, 'on-failure': 'event'}),
+            health.HealthCheck('exec', 'pgrep nginx', 5,
+                               health.DEFAULT_TIMEOUT, 2, 'event'))
+        self.assertEqual(health.from_dict({'tcp': 8080}).target,
+                         ('localhost', 8080))
+        self.assertEqual(health.from_dict({'tcp': '10.0.0.1:80'}).target,
+                         ('10.0.0.1', 80))
+        self.assertEqual(
+            health.from_dict({'file': '/tmp/beat', 'max-age': 60}).target,
+            ('/tmp/beat', 60))
+
+        for bad_dict in ({}, {'exec': 'true', 'tcp': 80}, {'exec': ''},
+                         {'tcp': 'nowhere'}, {'file': '/tmp/beat'},
+                         {'exec': 'true', 'interval': 0},
+                         {'exec': 'true', 'failures': 0},
+                         {'exec': 'true', 'on-failure': 'ignore'}):
+            with self.assertRaises(ValueError):
+                health.from_dict(bad_dict)
+
+    def test_config(self):
+        """
+        Ensures that jobs with an invalid health check don't get one.
+        """
+        config_handler = config.ConfigHandler()
+        config_handler.handle_jobs({
+            'good': {'command': 'true', 'health-check': {'tcp': 80}},
+            'bad': {'command': 'true', 'health-check': {'tcp': 'eighty'}},
+        })
+
+        self.assertEqual(config_handler.jobs['good'].health_check.kind,
+                         health.CHECK_TCP)
+        self.assertIsNone(config_handler.jobs['bad'].health_check)
+
+class TestProbes(unittest.TestCase):
+    def test_exec(self):
+        """
+        Ensures that probe commands pass on a zero exit status, and that
+        failures report the command's output.
+        """
+        self.assertEqual(health.run_probe(make_check('exec', 'true')),
+                         (True, None))
+
+        passed, message = health.run_probe(
+            make_check('exec', 'echo "not ready"; exit 3'))
+        self.assertFalse(passed)
+        self.assertEqual(message, 'Probe exited with status 3: not ready')
+
+        passed, message = health.run_probe(
+            make_check('exec', 'no-such-command-for-jobmon'))
+        self.assertFalse(passed)
+
+    def test_exec_timeout(self):
+        """
+        Ensures that probes which hang are killed once they time out.
+        """
+        start = time.time()
+        passed, message = health.run_probe(
+            make_check('exec', 'sleep 30', timeout=0.5))
+        self.assertFalse(passed)
+        self.assertIn('timed out', message)
+        self.assertLess(time.time() - start, 5)
+
+    def test_tcp(self):
+        """
+        Ensures that TCP probes pass only if something is listening.
+        """
+        listener = socket.socket()
+        listener.bind(('localhost', 0))
+        listener.listen(1)
+        port = listener.getsockname()[1]
+
+        try:
+            self.assertEqual(
+                health.run_probe(make_check('tcp', ('localhost', port))),
+                (True, None))
+        finally:
+            listener.close()
+
+        passed, _ = health.run_probe(make_check('tcp', ('localhost', port)))
+        self.assertFalse(passed)
+
+    def test_file(self):
+        """
+        Ensures that file probes pass only if the file is recent enough.
+        """
+        with tempfile.NamedTemporaryFile() as beat:
+            check = make_check('file', (beat.name, 60))
+            self.assertEqual(health.run_probe(check), (True, None))
+
+            old = time.time() - 120
+            os.utime(beat.name, (old, old))
+            passed, _ = health.run_probe(check)
+            self.assertFalse(passed)
+
+        passed, message = health.run_probe(check)
+        self.assertFalse(passed)
+        self.assertIn('Cannot check', message)
+
+class TestHealthChecker(unittest.TestCase):
+    def test_submit(self):
+        """
+        Ensures that results are reported through the callback, along with
+        the PID that was checked.
+        """
+        results = []
+        done = threading.Event()
+
+        def callback(job, pid, passed, message):
+            results.append((job, pid, passed))
+            if len(results) == 2:
+                done.set()
+
+        checker = health.HealthChecker(callback, workers=2)
+        try:
+            checker.submit('good', 100, make_check('exec', 'true'))
+            checker.submit('bad', 200, make_check('exec', 'false'))
+            self.assertTrue(done.wait(10))
+        finally:
+            checker.terminate()
+            checker.wait_for_exit()
+
+        self.assertEqual(sorted(results), [('bad', 200, False),
+                                           ('good', 100, True)])
+
+        # Anything submitted after shutting down is dropped
+        checker.submit('late', 300, make_check('exec', 'true'))
+
+    def test_jitter(self):
+        """
+        Ensures that checks are spread out around their interval.
+        """
+        checker = health.HealthChecker(None)
+        check = make_check('exec', 'true', interval=100)
+        times = [checker.next_check_time(check, 0) for _ in range(200)]
+        checker.terminate()
+
+        self.assertTrue(all(80 <= when <= 120 for when in times))
+        self.assertGreater(len(set(times)), 100)
+
+class TestServiceHealth(common.SimulationTestCase):
+    def make_simulation(self, on_failure, probe):
+        return simulation.Simulation.from_jobs({
+            'web': {'command': 'sleep 3600', 'autostart': True,
+                    'health-check': {'exec': 'check-web', 'interval': 10,
+                                     'failures': 3,
+                                     'on-failure': on_failure}},
+        }, probe=probe)
+
+    def test_restart(self):
+        """
+        Ensures that a job which fails too many checks in a row is marked
+        unhealthy and restarted, and that it is healthy again afterwards.
+        """
+        results = [True, False, False, False]
+
+        def probe(job, check):
+            passed = results.pop(0) if results else True
+            return passed, None if passed else 'deadlocked'
+
+        sim = self.make_simulation('restart', probe)
+        sim.start()
+        self.assertTrue(sim.request('get-status', job='web').healthy)
+        first_pid = sim.request('get-status', job='web').pid
+
+        sim.run_for(60)
+        self.assertEqual(sim.events.counts[protocol.EVENT_UNHEALTHY], 1)
+        self.assertEqual(sim.events.counts[protocol.EVENT_RESTARTJOB], 1)
+
+        status = sim.request('get-status', job='web')
+        self.assertTrue(status.is_running)
+        self.assertTrue(status.healthy)
+        self.assertNotEqual(status.pid, first_pid)
+        self.assertTrue(sim.shutdown())
+
+    def test_event(self):
+        """
+        Ensures that a job whose check only sends an event keeps running,
+        and that it recovers once its checks pass again.
+        """
+        passing = [False]
+        sim = self.make_simulation(
+            'event', lambda job, check: (passing[0], 'slow'))
+        sim.start()
+
+        sim.run_for(100)
+        status = sim.request('get-status', job='web')
+        self.assertTrue(status.is_running)
+        self.assertFalse(status.healthy)
+        self.assertEqual(sim.events.counts[protocol.EVENT_UNHEALTHY], 1)
+        self.assertEqual(sim.events.counts[protocol.EVENT_RESTARTJOB], 0)
+
+        passing[0] = True
+        sim.run_for(20)
+        self.assertTrue(sim.request('get-status', job='web').healthy)
+
+        # Stopped jobs don't have a health to speak of
+        sim.request('stop-job', job='web')
+        sim.run_for(1)
+        self.assertIsNone(sim.request('get-status', job='web').healthy)
+        self.assertIsNone(sim.ticker.next_timeout())
+
+    def test_spread(self):
+        """
+        Ensures that the checks of jobs which started together don't all
+        come due at the same time.
+        """
+        jobs = {'job-{}'.format(index): {'command': 'sleep 3600',
+                                         'autostart': True,
+                                         'health-check': {'tcp': 8000 + index,
+                                                          'interval': 30}}
+                for index in range(200)}
+
+        check_times = []
+
+        def probe(job, check):
+            check_times.append(sim.clock.time())
+            return True, None
+
+        sim = simulation.Simulation.from_jobs(jobs, probe=probe)
+        sim.start()
+        sim.run_for(30 * (1 - health.JITTER))
+        self.assertEqual(check_times, [])
+
+        sim.run_for(30 * health.JITTER * 2)
+        self.assertEqual(len(check_times), 200)
+        self.assertGreater(len(set(check_times)), 150)
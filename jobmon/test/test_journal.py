@@ -0,0 +1,215 @@
+import logging
+import os
+import signal
+import subprocess
+import tempfile
+import unittest
+
+from jobmon import journal, monitor, protocol, simulation
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_journal.log', level=logging.DEBUG)
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'state')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        """
+        Ensures that a journal is read back the same way it was written, and
+        that only the process which was recorded counts as still running.
+        """
+        state_journal = journal.Journal(self.path)
+        state_journal.open()
+        state_journal.started('web', os.getpid())
+        state_journal.ready('web', os.getpid())
+        state_journal.restarted('web', 1234.5)
+        state_journal.started('db', os.getpid())
+        state_journal.stopped('db')
+        state_journal.restarted('gone', 1000.0)
+        state_journal.forget('gone')
+        state_journal.close()
+
+        state_journal = journal.Journal(self.path)
+        since = journal.process_start_time(os.getpid())
+        self.assertEqual(state_journal.states, {
+            'web': journal.JobState(os.getpid(), since, os.getpid(), 1234.5),
+        })
+        self.assertTrue(state_journal.is_alive('web'))
+        self.assertFalse(state_journal.is_alive('db'))
+
+        # A different process with the same PID isn't the same job
+        state_journal.states['web'] = state_journal.get('web')._replace(
+            since=since - 1)
+        self.assertFalse(state_journal.is_alive('web'))
+
+    def test_torn_line(self):
+        """
+        Ensures that a line which was only partly written, when the last
+        supervisor died, is skipped.
+        """
+        with open(self.path, 'w') as journal_file:
+            journal_file.write('{"job":"web","pid":100,"since":5}\n'
+                               '{"job":"db","pid":200,"since":7}\n'
+                               '{"job":"web","pid":nu')
+
+        state_journal = journal.Journal(self.path)
+        self.assertEqual(state_journal.get('web'),
+                         journal.JobState(100, 5, None, None))
+        self.assertEqual(state_journal.get('db'),
+                         journal.JobState(200, 7, None, None))
+
+    def test_compaction(self):
+        """
+        Ensures that the journal is rewritten once it gets too long, and that
+        compacting it doesn't change what it says.
+        """
+        state_journal = journal.Journal(self.path)
+        state_journal.open()
+        for restart in range(10000):
+            state_journal.restarted('web', float(restart))
+        state_journal.started('db', os.getpid())
+        state_journal.close()
+
+        with open(self.path) as journal_file:
+            lines = journal_file.readlines()
+        self.assertLess(len(lines),
+                        journal.COMPACT_FACTOR * (2 + journal.COMPACT_SLACK))
+        self.assertFalse(os.path.exists(self.path + '.new'))
+
+        state_journal = journal.Journal(self.path)
+        self.assertEqual(state_journal.get('web').restarted, 9999.0)
+        self.assertTrue(state_journal.is_alive('db'))
+
+class TestAdoption(common.SimulationTestCase):
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'state')
+
+    def tearDown(self):
+        super().tearDown()
+        self.temp_dir.cleanup()
+
+    def test_service(self):
+        """
+        Ensures that the service takes back jobs which are still running the
+        process it was told about, rather than starting them again, and
+        starts the rest as usual.
+        """
+        # The test itself stands in for a job that is still running, which
+        # is safe since simulated processes are never really signalled
+        pid = os.getpid()
+        since = journal.process_start_time(pid)
+        with open(self.path, 'w') as journal_file:
+            journal_file.write(
+                '{{"job":"web","pid":{0},"since":{1},"ready":{0}}}\n'
+                '{{"job":"db","pid":{0},"since":{2},"restarted":5.0}}\n'
+                '{{"job":"old","pid":{0},"since":{1}}}\n'.format(
+                    pid, since, since - 1))
+
+        state_journal = journal.Journal(self.path)
+        sim = simulation.Simulation.from_jobs({
+            'web': {'command': 'sleep 3600', 'autostart': True,
+                    'notify': True},
+            'db': {'command': 'sleep 3600', 'autostart': True},
+        }, journal=state_journal)
+        sim.start()
+
+        web = sim.request('get-status', job='web')
+        self.assertEqual(web.pid, pid)
+        self.assertTrue(web.ready)
+
+        db = sim.request('get-status', job='db')
+        self.assertTrue(db.is_running)
+        self.assertNotEqual(db.pid, pid)
+        self.assertEqual(sim.service.restart_times['db'], 5.0)
+        self.assertEqual(sim.events.counts[protocol.EVENT_STARTJOB], 2)
+
+        # The journal now describes the new supervisor's jobs
+        self.assertEqual(journal.load(self.path)[1], {
+            'web': journal.JobState(pid, since, pid, None),
+            'db': journal.JobState(db.pid, None, None, 5.0),
+        })
+
+        self.assertTrue(sim.shutdown())
+        self.assertEqual(journal.load(self.path)[1], {
+            'db': journal.JobState(None, None, None, 5.0),
+        })
+
+    def test_captured_output(self):
+        """
+        Ensures that jobs whose output went through the last supervisor are
+        restarted rather than adopted, since their pipes are gone.
+        """
+        pid = os.getpid()
+        since = journal.process_start_time(pid)
+        with open(self.path, 'w') as journal_file:
+            journal_file.write(
+                '{{"job":"logged","pid":{0},"since":{1}}}\n'
+                '{{"job":"plain","pid":{0},"since":{1}}}\n'.format(
+                    pid, since))
+
+        state_journal = journal.Journal(self.path)
+        sim = simulation.Simulation.from_jobs({
+            'logged': {'command': 'sleep 3600', 'capture-output': True},
+            'plain': {'command': 'sleep 3600'},
+        }, journal=state_journal)
+        sim.start()
+        sim.run_for(1)
+
+        logged = sim.request('get-status', job='logged')
+        self.assertTrue(logged.is_running)
+        self.assertNotEqual(logged.pid, pid)
+        self.assertEqual(sim.events.counts[protocol.EVENT_RESTARTJOB], 1)
+        self.assertEqual(sim.request('get-status', job='plain').pid, pid)
+        self.assertTrue(sim.shutdown())
+
+class TestAdoptedProcess(unittest.TestCase):
+    def adopt(self, pid):
+        """
+        Adopts a process, then stops it.
+
+        :return: The job which adopted it.
+        """
+        recorder = common.EventRecorder()
+        child = monitor.ChildProcess(recorder, 'test', 'sleep 30')
+        child.adopt(pid)
+        self.assertEqual(child.get_pid(), pid)
+
+        child.kill()
+        self.assertTrue(recorder.stopped.wait(15))
+        self.assertIsNone(child.get_pid())
+        self.assertEqual(recorder.events,
+                         [protocol.Event('test', protocol.EVENT_STARTJOB),
+                          protocol.Event('test', protocol.EVENT_STOPJOB)])
+        return child
+
+    def test_child(self):
+        """
+        Ensures that an adopted process which is our child is reaped, and
+        has its exit status reported.
+        """
+        process = subprocess.Popen(['sleep', '30'], start_new_session=True)
+        child = self.adopt(process.pid)
+        self.assertEqual(child.exit_status, signal.SIGTERM)
+        self.assertFalse(child.crashed())
+
+    def test_orphan(self):
+        """
+        Ensures that the exit of an adopted process which isn't our child is
+        still noticed.
+        """
+        process = subprocess.Popen(['sh', '-c', 'sleep 30 & echo $!'],
+                                   stdout=subprocess.PIPE,
+                                   start_new_session=True)
+        pid = int(process.stdout.readline())
+        process.stdout.close()
+        process.wait()
+
+        child = self.adopt(pid)
+        self.assertIsNone(child.exit_status)
@@ -0,0 +1,108 @@
+import logging
+import os
+import resource
+import signal
+import subprocess
+import tempfile
+import unittest
+
+from jobmon import config, limits, monitor
+
+logging.basicConfig(filename='jobmon-test_limits.log', level=logging.DEBUG)
+
+def make_fake_cgroup(path, controllers):
+    """
+    Creates a directory which looks enough like a delegated cgroup for the
+    cgroup manager to set it up.
+    """
+    os.makedirs(os.path.join(path, 'supervisor'))
+    with open(os.path.join(path, 'cgroup.controllers'), 'w') as controller_file:
+        controller_file.write(' '.join(controllers))
+
+    for filename in ('cgroup.subtree_control', 'supervisor/cgroup.procs'):
+        open(os.path.join(path, filename), 'w').close()
+
+class TestCgroupManager(unittest.TestCase):
+    def test_setup(self):
+        """
+        Ensures that the cgroup manager enables the controllers it needs, and
+        writes the limits of each job into its cgroup.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            make_fake_cgroup(temp_dir, ['cpuset', 'cpu', 'io', 'memory', 'pids'])
+
+            # This doesn't actually move us anywhere, since the cgroup is fake
+            cgroups = limits.CgroupManager.setup(temp_dir)
+            self.assertIsNotNone(cgroups)
+
+            with open(os.path.join(temp_dir, 'cgroup.subtree_control')) as subtree:
+                self.assertEqual(subtree.read(), '+cpu +memory +pids')
+
+            with open(os.path.join(temp_dir, 'supervisor/cgroup.procs')) as procs:
+                self.assertEqual(procs.read(), str(os.getpid()))
+
+            path = cgroups.get_cgroup('my/job',
+                                      limits.CgroupLimits(1024, None, 10))
+            self.assertEqual(path, os.path.join(temp_dir, 'job-my_job'))
+
+            for filename, value in (('memory.max', '1024'), ('cpu.max', 'max'),
+                                    ('pids.max', '10')):
+                with open(os.path.join(path, filename)) as limit_file:
+                    self.assertEqual(limit_file.read(), value)
+
+    def test_missing_controllers(self):
+        """
+        Ensures that cgroups aren't used if the controllers aren't available.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            make_fake_cgroup(temp_dir, ['cpu'])
+            self.assertIsNone(limits.CgroupManager.setup(temp_dir))
+
+    def test_signal(self):
+        """
+        Ensures that every process listed in a cgroup gets signalled.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            sleepers = [subprocess.Popen(['sleep', '30']) for _ in range(2)]
+            with open(os.path.join(temp_dir, 'cgroup.procs'), 'w') as procs:
+                procs.write('\n'.join(str(sleeper.pid) for sleeper in sleepers))
+
+            cgroups = limits.CgroupManager(os.path.dirname(temp_dir))
+            self.assertTrue(cgroups.signal(temp_dir, signal.SIGTERM))
+
+            for sleeper in sleepers:
+                self.assertEqual(sleeper.wait(5), -signal.SIGTERM)
+
+class TestLimitConfig(unittest.TestCase):
+    def test_read_limits(self):
+        """
+        Ensures that rlimits and cgroup limits are read from the job
+        configuration, and that invalid ones are skipped.
+        """
+        config_handler = config.ConfigHandler()
+        config_handler.handle_jobs({
+            'job': {
+                'command': 'true',
+                'rlimits': {
+                    'nofile': 1024,
+                    'core': [0, None],
+                    'no-such-limit': 1,
+                    'cpu': 'forever',
+                },
+                'cgroup': {
+                    'memory-max': 1 << 30,
+                    'cpu-max': 1.5,
+                },
+            },
+        })
+
+        job = config_handler.jobs['job']
+        self.assertEqual(job.rlimits,
+                         ((resource.RLIMIT_NOFILE, 1024, 1024),
+                          (resource.RLIMIT_CORE, 0, resource.RLIM_INFINITY)))
+        self.assertEqual(job.cgroup_limits,
+                         limits.CgroupLimits(1 << 30, '150000 100000', None))
+
+        # posix_spawn can't apply the limits, so forking is used instead
+        job.config(spawn=monitor.SPAWN_POSIX_SPAWN)
+        self.assertEqual(job.get_spawn_plan().spawn_method, monitor.SPAWN_FORK)
@@ -0,0 +1,122 @@
+import logging
+import unittest
+import urllib.error
+import urllib.request
+
+from jobmon import metrics, simulation, ticker
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_metrics.log', level=logging.DEBUG)
+
+PORT = 9998
+
+class TestMetrics(unittest.TestCase):
+    def test_render(self):
+        """
+        Ensures that counters and gauges are rendered in the text format, with
+        their labels.
+        """
+        registry = metrics.Registry()
+        starts = registry.register(metrics.Counter(
+            'starts_total', 'Starts.', ['job']))
+        depth = registry.register(metrics.Gauge('depth', 'Depth.'))
+
+        starts.inc('b')
+        starts.inc('a "quoted" job', amount=2)
+        depth.set(3)
+
+        self.assertEqual(registry.render(),
+                         '# HELP starts_total Starts.\n'
+                         '# TYPE starts_total counter\n'
+                         'starts_total{job="a \\"quoted\\" job"} 2.0\n'
+                         'starts_total{job="b"} 1.0\n'
+                         '# HELP depth Depth.\n'
+                         '# TYPE depth gauge\n'
+                         'depth 3.0\n')
+
+        depth.set_function(lambda: 7)
+        self.assertIn('depth 7.0\n', registry.render())
+
+    def test_histogram(self):
+        """
+        Ensures that histogram buckets are cumulative, and that the sum and
+        count are kept.
+        """
+        histogram = metrics.Histogram('latency', 'Latency.', ['command'],
+                                      buckets=[0.1, 1])
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value, 'start')
+
+        self.assertEqual(histogram.render()[2:],
+                         ['latency_bucket{command="start",le="0.1"} 2.0',
+                          'latency_bucket{command="start",le="1.0"} 3.0',
+                          'latency_bucket{command="start",le="+Inf"} 4.0',
+                          'latency_sum{command="start"} 5.65',
+                          'latency_count{command="start"} 4.0'])
+
+    def test_ticker_timers(self):
+        """
+        Ensures that the ticker keeps its timer count up to date.
+        """
+        before = metrics.TICKER_TIMERS.values.get((), 0)
+        test_ticker = ticker.Ticker(lambda key: None)
+        test_ticker.register('a', 10 ** 10)
+        test_ticker.register('a', 10 ** 10)
+        test_ticker.register('b', 10 ** 10)
+        self.assertEqual(metrics.TICKER_TIMERS.values[()], before + 2)
+
+        test_ticker.unregister('a')
+        test_ticker.unregister('a')
+        self.assertEqual(metrics.TICKER_TIMERS.values[()], before + 1)
+        test_ticker.unregister('b')
+
+class TestJobMetrics(common.SimulationTestCase):
+    def test_forget_job(self):
+        """
+        Ensures that a job's values are removed once it is gone, whether it
+        was running or not when it was removed.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'metered': {'command': 'sleep 3600', 'replicas': 3,
+                        'autostart': True},
+        })
+        sim.start()
+        sim.request('stop-job', job='metered:2')
+        sim.run_for(1)
+
+        for instance in ('metered:0', 'metered:1', 'metered:2'):
+            self.assertIn((instance,), metrics.JOB_STARTS.values)
+
+        sim.request('scale-job', job='metered', replicas=1)
+        sim.run_for(1)
+        self.assertIn(('metered:0',), metrics.JOB_STARTS.values)
+        for metric in metrics.JOB_METRICS:
+            self.assertNotIn(('metered:1',), metric.values)
+            self.assertNotIn(('metered:2',), metric.values)
+
+        self.assertTrue(sim.shutdown())
+
+class TestMetricsServer(unittest.TestCase):
+    def test_scrape(self):
+        """
+        Ensures that the metrics can be scraped over HTTP.
+        """
+        registry = metrics.Registry()
+        registry.register(metrics.Gauge('up', 'Up.')).set(1)
+
+        server = metrics.MetricsServer(PORT, registry)
+        server.start()
+        try:
+            url = 'http://localhost:{}/metrics'.format(PORT)
+            with urllib.request.urlopen(url, timeout=5) as response:
+                self.assertEqual(response.headers['Content-Type'],
+                                 metrics.CONTENT_TYPE)
+                self.assertEqual(response.read().decode('utf-8'),
+                                 registry.render())
+
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen('http://localhost:{}/'.format(PORT),
+                                       timeout=5)
+        finally:
+            server.terminate()
+            server.wait_for_exit()
@@ -0,0 +1,166 @@
+import logging
+import os
+import resource
+import tempfile
+import unittest
+
+from jobmon import forkserver, monitor, output, placement, protocol
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_monitor.log', level=logging.DEBUG)
+
+class ChildProcessTests:
+    """
+    Tests which are run against each spawn method - subclasses set
+    SPAWN_METHOD.
+    """
+    def run_child(self, command, **config):
+        """
+        Runs a command to completion, and returns the events it sent.
+        """
+        recorder = common.EventRecorder()
+        child = monitor.ChildProcess(recorder, 'test', command,
+                                     spawn=self.SPAWN_METHOD, **config)
+        child.set_fork_server(getattr(self, 'fork_server', None))
+        child.start()
+        self.assertTrue(recorder.stopped.wait(15))
+        return recorder.events
+
+    def test_shell_command(self):
+        """
+        Ensures that commands using shell syntax get the environment and
+        working directory of the job.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output = os.path.join(temp_dir, 'output')
+            events = self.run_child('echo "$MESSAGE" `pwd`', stdout=output,
+                                    env={'MESSAGE': 'Hello'}, cwd=temp_dir)
+
+            self.assertEqual(events,
+                             [protocol.Event('test', protocol.EVENT_STARTJOB),
+                              protocol.Event('test', protocol.EVENT_STOPJOB)])
+            with open(output) as output_file:
+                self.assertEqual(output_file.read(),
+                                 'Hello ' + os.path.realpath(temp_dir) + '\n')
+
+    def test_direct_command(self):
+        """
+        Ensures that commands without shell syntax are executed directly.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output = os.path.join(temp_dir, 'output')
+            self.run_child('echo plain   words', stdout=output)
+
+            with open(output) as output_file:
+                self.assertEqual(output_file.read(), 'plain words\n')
+
+    def test_missing_command(self):
+        """
+        Ensures that a command which cannot be run looks like a job which
+        started and then stopped immediately.
+        """
+        events = self.run_child('/does/not/exist')
+        self.assertEqual(events,
+                         [protocol.Event('test', protocol.EVENT_STARTJOB),
+                          protocol.Event('test', protocol.EVENT_STOPJOB)])
+
+    def test_rlimits(self):
+        """
+        Ensures that rlimits are applied to the child before it runs.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_file = os.path.join(temp_dir, 'output')
+            self.run_child('ulimit -n', stdout=output_file,
+                           rlimits=[(resource.RLIMIT_NOFILE, 64, 64)])
+
+            with open(output_file) as output_contents:
+                self.assertEqual(output_contents.read(), '64\n')
+
+    def test_placement(self):
+        """
+        Ensures that the nice level and I/O priority are applied to the child
+        (and inherited by anything it starts).
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_file = os.path.join(temp_dir, 'output')
+            self.run_child('sleep 0.2; nice; ionice', stdout=output_file,
+                           placement=placement.Placement(
+                               None, 5, placement.IO_CLASSES['idle'], None))
+
+            with open(output_file) as output_contents:
+                self.assertEqual(output_contents.read(), '5\nidle\n')
+
+class TestForkChildProcess(ChildProcessTests, unittest.TestCase):
+    SPAWN_METHOD = monitor.SPAWN_FORK
+
+class TestPosixSpawnChildProcess(ChildProcessTests, unittest.TestCase):
+    SPAWN_METHOD = monitor.SPAWN_POSIX_SPAWN
+
+class TestForkServerChildProcess(ChildProcessTests, unittest.TestCase):
+    SPAWN_METHOD = monitor.SPAWN_FORK_SERVER
+
+    def setUp(self):
+        self.fork_server = forkserver.ForkServer()
+        self.fork_server.start()
+
+    def tearDown(self):
+        self.fork_server.terminate()
+
+class TestSpawnPlan(unittest.TestCase):
+    def test_plan_reuse(self):
+        """
+        Ensures that the spawn plan is reused until the job is reconfigured.
+        """
+        child = monitor.ChildProcess(common.EventRecorder(), 'test', 'sleep 1',
+                                     env={'MESSAGE': 'Hello'})
+
+        plan = child.get_spawn_plan()
+        self.assertEqual(plan.argv, ('sleep', '1'))
+        self.assertEqual(plan.env['MESSAGE'], 'Hello')
+        self.assertEqual(plan.env['PATH'], os.environ['PATH'])
+        self.assertIs(child.get_spawn_plan(), plan)
+
+        child.config(env={'MESSAGE': 'Goodbye'})
+        new_plan = child.get_spawn_plan()
+        self.assertIsNot(new_plan, plan)
+        self.assertEqual(new_plan.env['MESSAGE'], 'Goodbye')
+
+class TestNeedsShell(unittest.TestCase):
+    def test_needs_shell(self):
+        """
+        Checks which commands are run through /bin/sh.
+        """
+        self.assertFalse(monitor.needs_shell('sleep 300'))
+        self.assertFalse(monitor.needs_shell('server --port=8080'))
+        self.assertTrue(monitor.needs_shell('sleep 5; /bin/false'))
+        self.assertTrue(monitor.needs_shell('echo "$HOME"'))
+        self.assertTrue(monitor.needs_shell('FOO=bar server'))
+        self.assertTrue(monitor.needs_shell('exec server'))
+        self.assertTrue(monitor.needs_shell(''))
+
+class TestRecentOutput(unittest.TestCase):
+    def test_crash_output(self):
+        """
+        Ensures that a job which fails on its own is reported as having
+        crashed, and that its last output can be read.
+        """
+        capture = output.OutputCapture()
+        capture.start()
+
+        try:
+            recorder = common.EventRecorder()
+            child = monitor.ChildProcess(recorder, 'test',
+                                         'echo "Out of cheese" >&2; exit 3',
+                                         ring=1024)
+            child.set_output_capture(capture)
+            child.start()
+
+            self.assertTrue(recorder.stopped.wait(15))
+            self.assertTrue(child.crashed())
+
+            # The pipe is drained first, so nothing is missing even though
+            # the capture thread may not have got to it yet
+            self.assertEqual(child.get_recent_output(5), ['Out of cheese'])
+        finally:
+            capture.terminate()
+            capture.wait_for_exit()
@@ -0,0 +1,131 @@
+import logging
+import os
+import socket
+import threading
+import unittest
+
+from jobmon import config, notify, protocol, simulation
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_notify.log', level=logging.DEBUG)
+
+class NotifyRecorder:
+    """
+    Stands in for the supervisor shim, and keeps every notification.
+    """
+    def __init__(self):
+        self.notifications = []
+        self.received = threading.Event()
+
+    def job_notify(self, pid, session, fields):
+        self.notifications.append((pid, session, fields))
+        self.received.set()
+
+class TestNotifyServer(unittest.TestCase):
+    def test_parse(self):
+        """
+        Ensures that notifications are split into their assignments.
+        """
+        self.assertEqual(
+            notify.parse_message(b'READY=1\nSTATUS=Listening on :80\n\nbad'),
+            {'READY': '1', 'STATUS': 'Listening on :80'})
+
+    def test_receive(self):
+        """
+        Ensures that notifications are passed on along with the process
+        that sent them.
+        """
+        recorder = NotifyRecorder()
+        server = notify.NotifyServer(recorder)
+        server.start()
+
+        try:
+            address = server.get_address()
+            self.assertTrue(address.startswith('@'))
+
+            sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sender.sendto(b'READY=1\nSTATUS=up', '\0' + address[1:])
+            sender.close()
+
+            self.assertTrue(recorder.received.wait(5))
+        finally:
+            server.terminate()
+            server.wait_for_exit()
+
+        self.assertEqual(recorder.notifications,
+                         [(os.getpid(), os.getsid(0),
+                           {'READY': '1', 'STATUS': 'up'})])
+
+    def test_environment(self):
+        """
+        Ensures that only jobs with notify set are given the socket.
+        """
+        config_handler = config.ConfigHandler()
+        config_handler.handle_jobs({
+            'notifying': {'command': 'true', 'notify': True},
+            'plain': {'command': 'true'},
+        })
+
+        for job in config_handler.jobs.values():
+            job.set_notify_socket('@jobmon-test')
+
+        notifying = config_handler.jobs['notifying'].get_spawn_plan()
+        plain = config_handler.jobs['plain'].get_spawn_plan()
+        self.assertEqual(notifying.env[notify.ENV_VAR], '@jobmon-test')
+        self.assertEqual(plain.env.get(notify.ENV_VAR),
+                         os.environ.get(notify.ENV_VAR))
+
+class TestServiceReadiness(common.SimulationTestCase):
+    def test_ready(self):
+        """
+        Ensures that jobs are only ready once they say so, and only until
+        their process changes.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'web': {'command': 'sleep 3600', 'notify': True,
+                    'autostart': True},
+            'plain': {'command': 'sleep 3600', 'autostart': True},
+        })
+        sim.start()
+
+        status = sim.request('get-status', job='web')
+        self.assertFalse(status.ready)
+        self.assertIsNone(sim.request('get-status', job='plain').ready)
+
+        # Notifications from other processes in the job's session count too,
+        # but not ones from processes outside of any job
+        sim.request('job-notify', pid=1, session=status.pid,
+                    fields={'READY': '1', 'STATUS': 'Serving'})
+        sim.request('job-notify', pid=2, session=3, fields={'READY': '1'})
+
+        status = sim.request('get-status', job='web')
+        self.assertTrue(status.ready)
+        self.assertEqual(status.status_text, 'Serving')
+        self.assertEqual(sim.events.counts[protocol.EVENT_READY], 1)
+
+        # Saying so again doesn't send another event
+        sim.request('job-notify', pid=status.pid, session=status.pid,
+                    fields={'READY': '1'})
+        self.assertEqual(sim.events.counts[protocol.EVENT_READY], 1)
+
+        sim.request('job-notify', pid=status.pid, session=status.pid,
+                    fields={'STOPPING': '1'})
+        self.assertFalse(sim.request('get-status', job='web').ready)
+
+        sim.request('job-notify', pid=status.pid, session=status.pid,
+                    fields={'READY': '1'})
+        sim.request('stop-job', job='web')
+        sim.run_for(1)
+
+        # A stopped job which reports its readiness isn't ready, so clients
+        # know to wait for it to say so rather than for it to start
+        status = sim.request('get-status', job='web')
+        self.assertFalse(status.is_running)
+        self.assertIs(status.ready, False)
+        sim.request('start-job', job='web')
+
+        status = sim.request('get-status', job='web')
+        self.assertTrue(status.is_running)
+        self.assertFalse(status.ready)
+        self.assertIsNone(status.status_text)
+        self.assertTrue(sim.shutdown())
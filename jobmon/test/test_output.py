@@ -0,0 +1,169 @@
+import glob
+import gzip
+import logging
+import os
+import tempfile
+import time
+import unittest
+
+from jobmon import output
+
+logging.basicConfig(filename='jobmon-test_output.log', level=logging.DEBUG)
+
+class TestOutputCapture(unittest.TestCase):
+    def test_capture_and_rotate(self):
+        """
+        Ensures that output written to a capture pipe ends up in the
+        destination file, and that the file is rotated and compressed once it
+        grows past its size limit.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            capture = output.OutputCapture()
+            capture.start()
+
+            destination = os.path.join(temp_dir, 'job.log')
+            policy = output.RotationPolicy(1000, None, 1, True)
+            try:
+                fifo = capture.get_fifo(destination, policy)
+                self.assertEqual(capture.get_fifo(destination, policy), fifo)
+
+                # Each of these writes is a separate 'job', which opens the
+                # pipe, writes and exits
+                for line in range(5):
+                    with open(fifo, 'a') as job_output:
+                        job_output.write(str(line) * 600 + '\n')
+                    time.sleep(0.5)
+            finally:
+                capture.terminate()
+                capture.wait_for_exit()
+
+            segments = sorted(glob.glob(destination + '.*'))
+            self.assertEqual(len(segments), 1)
+            self.assertTrue(segments[0].endswith('.gz'))
+
+            # Every second write pushes the file over its limit, so the first
+            # two writes are rotated out and pruned, the next two are kept in a
+            # segment, and the last is left in the file itself
+            with gzip.open(segments[0], 'rt') as segment:
+                self.assertEqual(segment.read(),
+                                 '2' * 600 + '\n' + '3' * 600 + '\n')
+
+            with open(destination) as current:
+                self.assertEqual(current.read(), '4' * 600 + '\n')
+
+            self.assertFalse(os.path.exists(capture.fifo_dir))
+
+    def test_rotate_by_age(self):
+        """
+        Ensures that a file is rotated once it is too old, even if nothing
+        has been written to it since.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            capture = output.OutputCapture()
+            capture.start()
+
+            destination = os.path.join(temp_dir, 'job.log')
+            policy = output.RotationPolicy(None, 1, 1, False)
+            try:
+                fifo = capture.get_fifo(destination, policy)
+                with open(fifo, 'a') as job_output:
+                    job_output.write('old\n')
+
+                time.sleep(2.5)
+                segments = glob.glob(destination + '.*')
+                self.assertEqual(len(segments), 1)
+                self.assertFalse(os.path.exists(destination))
+                with open(segments[0]) as segment:
+                    self.assertEqual(segment.read(), 'old\n')
+            finally:
+                capture.terminate()
+                capture.wait_for_exit()
+
+class TestRingBuffer(unittest.TestCase):
+    def test_wrap_around(self):
+        """
+        Ensures that the ring keeps only the most recent output, and that
+        readers in other processes see the same thing as the writer.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            ring = output.RingBuffer(os.path.join(temp_dir, 'job.ring'), 16)
+            reader = output.RingReader(ring.path)
+            try:
+                ring.write(b'first\nsecond\n')
+                self.assertEqual(reader.read(), (b'first\nsecond\n', 13))
+
+                ring.write(b'third\nfourth\n')
+                data, position = reader.read()
+                self.assertEqual(data, b'nd\nthird\nfourth\n')
+                self.assertEqual(position, 26)
+
+                # The partial line at the start is dropped once the ring has
+                # wrapped around
+                self.assertEqual(reader.tail(10), (['third', 'fourth'], 26))
+                self.assertEqual(reader.tail(1), (['fourth'], 26))
+
+                ring.write(b'fifth\n')
+                self.assertEqual(reader.read(26), (b'fifth\n', 32))
+
+                # Writes bigger than the ring only keep their end
+                ring.write(b'x' * 20 + b'\n')
+                self.assertEqual(reader.read(), (b'x' * 15 + b'\n', 53))
+            finally:
+                reader.close()
+                ring.close()
+
+    def test_capture_to_ring(self):
+        """
+        Ensures that output sent to /dev/null still reaches the job's ring.
+        """
+        capture = output.OutputCapture()
+        capture.start()
+
+        try:
+            ring = capture.get_ring('job', 1024)
+            self.assertIs(capture.get_ring('job', 1024), ring)
+
+            fifo = capture.get_fifo(os.devnull, output.NO_ROTATION, ring)
+            with open(fifo, 'a') as job_output:
+                job_output.write('Hello\nWorld\n')
+
+            time.sleep(0.5)
+            self.assertEqual(ring.tail(10)[0], ['Hello', 'World'])
+        finally:
+            capture.terminate()
+            capture.wait_for_exit()
+
+    def test_replace_ring(self):
+        """
+        Ensures that the pipe feeding a replaced ring buffer keeps working
+        until the job writing to it is done, and is then closed along with
+        the old ring.
+        """
+        capture = output.OutputCapture()
+        capture.start()
+
+        try:
+            old_ring = capture.get_ring('job', 1024)
+            old_fifo = capture.get_fifo(os.devnull, output.NO_ROTATION,
+                                        old_ring)
+
+            with open(old_fifo, 'a') as job_output:
+                new_ring = capture.get_ring('job', 2048)
+                self.assertIsNot(new_ring, old_ring)
+
+                job_output.write('Still here\n')
+                job_output.flush()
+                time.sleep(0.5)
+                self.assertEqual(old_ring.tail(10)[0], ['Still here'])
+
+            time.sleep(0.5)
+            self.assertEqual(list(capture.pipes), [])
+            self.assertFalse(os.path.exists(old_fifo))
+            self.assertTrue(old_ring.map.closed)
+
+            new_fifo = capture.get_fifo(os.devnull, output.NO_ROTATION,
+                                        new_ring)
+            self.assertNotEqual(new_fifo, old_fifo)
+        finally:
+            capture.terminate()
+            capture.wait_for_exit()
@@ -0,0 +1,134 @@
+import logging
+import os
+import tempfile
+import time
+import unittest
+
+from jobmon import config, monitor, placement
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_placement.log', level=logging.DEBUG)
+
+def get_nice(pid):
+    """
+    Reads the nice level of a process from /proc.
+    """
+    with open('/proc/{}/stat'.format(pid)) as stat_file:
+        stat = stat_file.read()
+
+    return int(stat[stat.rindex(')') + 2:].split()[16])
+
+class TestCpuList(unittest.TestCase):
+    def test_parse(self):
+        """
+        Ensures that CPU lists can be given as lists or in taskset format.
+        """
+        self.assertEqual(placement.parse_cpu_list('0-3,6'),
+                         frozenset([0, 1, 2, 3, 6]))
+        self.assertEqual(placement.parse_cpu_list([1, 4]), frozenset([1, 4]))
+        self.assertEqual(placement.format_cpu_list([6, 0, 1, 2, 3]), '0-3,6')
+
+        for bad_list in ('', 'one', [-1], ['1'], 3):
+            with self.assertRaises(ValueError):
+                placement.parse_cpu_list(bad_list)
+
+    def test_from_dict(self):
+        """
+        Ensures that placements are read from the same keys as the job
+        configuration, and written back the same way.
+        """
+        dct = {'cpu-affinity': '0-1', 'nice': 10, 'io-class': 'best-effort',
+               'io-priority': 7}
+        job_placement = placement.from_dict(dct)
+        self.assertEqual(job_placement,
+                         placement.Placement(frozenset([0, 1]), 10, 2, 7))
+        self.assertEqual(placement.to_dict(job_placement), dct)
+
+        self.assertEqual(placement.from_dict({'cpu-affinity': 'auto'}).cpus,
+                         placement.AUTO_CPUS)
+
+        for bad_dict in ({'io-class': 'fast'}, {'io-priority': 8},
+                         {'nice': 'low'}):
+            with self.assertRaises(ValueError):
+                placement.from_dict(bad_dict)
+
+    def test_config(self):
+        """
+        Ensures that jobs with an invalid placement fall back to the default.
+        """
+        config_handler = config.ConfigHandler()
+        config_handler.handle_jobs({
+            'good': {'command': 'true', 'nice': 5, 'cpu-affinity': 'auto'},
+            'bad': {'command': 'true', 'io-class': 'fast'},
+        })
+
+        self.assertEqual(config_handler.jobs['good'].placement,
+                         placement.Placement(placement.AUTO_CPUS, 5, None, None))
+        self.assertEqual(config_handler.jobs['bad'].placement,
+                         placement.NO_PLACEMENT)
+
+class TestCpuAllocator(unittest.TestCase):
+    def test_spread(self):
+        """
+        Ensures that each allocation gets the least used CPU.
+        """
+        allocator = placement.CpuAllocator([0, 1, 2])
+        first = [allocator.allocate() for _ in range(4)]
+        self.assertEqual(first, [frozenset([0]), frozenset([1]),
+                                 frozenset([2]), frozenset([0])])
+
+        allocator.release(frozenset([1]))
+        self.assertEqual(allocator.allocate(), frozenset([1]))
+
+    def test_auto_child(self):
+        """
+        Ensures that children with an auto affinity get a CPU when they start,
+        and give it back when they exit.
+        """
+        cpu = min(os.sched_getaffinity(0))
+        allocator = placement.CpuAllocator([cpu])
+
+        recorder = common.EventRecorder()
+        child = monitor.ChildProcess(
+            recorder, 'test', 'true',
+            placement=placement.Placement(placement.AUTO_CPUS, None, None, None))
+        child.set_cpu_allocator(allocator)
+        child.start()
+
+        self.assertEqual(child.running_plan.placement.cpus, frozenset([cpu]))
+        self.assertTrue(recorder.stopped.wait(15))
+        self.assertEqual(allocator.jobs_per_cpu, {cpu: 0})
+
+class TestChangePlacement(unittest.TestCase):
+    def test_change_running(self):
+        """
+        Ensures that a running job, and everything it started, can be moved
+        without restarting it.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pid_file = os.path.join(temp_dir, 'pid')
+            recorder = common.EventRecorder()
+            child = monitor.ChildProcess(
+                recorder, 'test', 'sleep 30 & echo $! > {}; wait'.format(pid_file))
+
+            with self.assertRaises(ValueError):
+                child.change_placement(placement.Placement(None, 5, None, None))
+
+            child.start()
+            try:
+                while not os.path.exists(pid_file) or not os.path.getsize(pid_file):
+                    time.sleep(0.05)
+
+                with open(pid_file) as pid_contents:
+                    sleeper = int(pid_contents.read())
+
+                child.change_placement(placement.Placement(None, 7, None, None))
+                self.assertEqual(get_nice(child.get_pid()), 7)
+                self.assertEqual(get_nice(sleeper), 7)
+                self.assertEqual(child.running_plan.placement.nice, 7)
+
+                # The configured placement is what the next child gets
+                self.assertEqual(child.placement, placement.NO_PLACEMENT)
+            finally:
+                child.kill()
+                self.assertTrue(recorder.stopped.wait(15))
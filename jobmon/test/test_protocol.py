@@ -33,7 +33,7 @@ class TestProtocol:
         Tests that events can be correctly transmitted over a protocol channel.
         """
         events = (EVENT_STARTJOB, EVENT_STOPJOB, EVENT_RESTARTJOB, 
-                EVENT_TERMINATE)
+                EVENT_TERMINATE, EVENT_UNHEALTHY, EVENT_READY)
 
         proto_read, proto_write = self.make_protocol()
 
@@ -44,6 +44,10 @@ class TestProtocol:
 
                 out_event = proto_read.recv()
                 self.assertEqual(out_event, event)
+
+            event = Event('some_job', EVENT_STOPJOB, ['Segmentation fault'])
+            proto_write.send(event)
+            self.assertEqual(proto_read.recv(), event)
         finally:
             self.cleanup_protocol(proto_read, proto_write)
 
@@ -51,7 +55,8 @@ class TestProtocol:
         """
         Tests that events can be correctly transmitted over a protocol channel.
         """
-        commands = (CMD_START, CMD_STOP, CMD_STATUS, CMD_JOB_LIST, CMD_QUIT)
+        commands = (CMD_START, CMD_STOP, CMD_STATUS, CMD_JOB_LIST, CMD_QUIT,
+                    CMD_SPAWN_PLAN, CMD_OUTPUT_RING, CMD_STATS)
         proto_read, proto_write = self.make_protocol()
 
         try:
@@ -61,6 +66,26 @@ class TestProtocol:
 
                 out_command = proto_read.recv()
                 self.assertEqual(out_command, command)
+
+            command = Command('some_job', CMD_SET_PLACEMENT,
+                              {'cpu-affinity': '0-1', 'nice': 5})
+            proto_write.send(command)
+            self.assertEqual(proto_read.recv(), command)
+
+            command = Command('some_job', CMD_SCALE, {'replicas': 4})
+            proto_write.send(command)
+            self.assertEqual(proto_read.recv(), command)
+
+            command = Command('some_job', CMD_WAIT,
+                              {'state': WAIT_STOPPED, 'timeout': 2.5})
+            proto_write.send(command)
+            self.assertEqual(proto_read.recv(), command)
+
+            command = Command(None, CMD_BATCH,
+                              [Command('a', CMD_START).serialize(),
+                               Command('b', CMD_STATUS).serialize()])
+            proto_write.send(command)
+            self.assertEqual(proto_read.recv(), command)
         finally:
             self.cleanup_protocol(proto_read, proto_write)
 
@@ -73,9 +98,23 @@ class TestProtocol:
                 FailureResponse('some_job', ERR_NO_SUCH_JOB),
                 FailureResponse('some_job', ERR_JOB_STARTED),
                 FailureResponse('some_job', ERR_JOB_STOPPED),
+                FailureResponse('some_job', ERR_NO_OUTPUT_RING),
+                FailureResponse('some_job', ERR_BAD_PLACEMENT),
+                FailureResponse('some_job', ERR_NOT_REPLICATED),
+                FailureResponse('some_job', ERR_BAD_REPLICAS),
+                FailureResponse('some_job', ERR_BAD_TIME),
+                FailureResponse(None, ERR_BAD_COMMAND),
                 StatusResponse('some_job', True, 1234),
                 StatusResponse('some_job', False, None),
-                JobListResponse({'a': True, 'b': False}))
+                StatusResponse('some_job', True, 1234, False),
+                StatusResponse('some_job', True, 1234, None, True, 'Serving'),
+                JobListResponse({'a': True, 'b': False}),
+                SpawnPlanResponse('some_job', {'argv': ['true'], 'env': {}}),
+                OutputRingResponse('some_job', '/tmp/some_job.ring'),
+                StatsResponse({'start_job': {'total': {'count': 1}}}),
+                BatchResponse([SuccessResponse('a'),
+                               FailureResponse('b', ERR_NO_SUCH_JOB),
+                               StatusResponse('c', True, 1234)]))
 
         proto_read, proto_write = self.make_protocol()
         try:
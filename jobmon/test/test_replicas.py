@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+
+from jobmon import config, monitor, protocol, simulation
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_replicas.log', level=logging.DEBUG)
+
+class TestReplicaConfig(unittest.TestCase):
+    def test_expand(self):
+        """
+        Ensures that replicated jobs are expanded into instances, which each
+        know their index.
+        """
+        config_handler = config.ConfigHandler()
+        config_handler.handle_jobs({
+            'web': {'command': 'serve', 'replicas': 3, 'autostart': True,
+                    'restart': True, 'env': {'PORT_BASE': '8000'}},
+            'worker': {'command': 'work', 'numprocs': 2},
+            'none': {'command': 'true', 'replicas': 0},
+            'bad': {'command': 'true', 'replicas': -1},
+        })
+
+        self.assertEqual(sorted(config_handler.jobs),
+                         ['bad', 'web:0', 'web:1', 'web:2', 'worker:0',
+                          'worker:1'])
+        self.assertEqual(sorted(config_handler.replica_groups),
+                         ['none', 'web', 'worker'])
+        self.assertEqual(config_handler.autostarts,
+                         ['web:0', 'web:1', 'web:2'])
+        self.assertEqual(config_handler.restarts,
+                         ['web:0', 'web:1', 'web:2'])
+
+        plan = config_handler.jobs['web:2'].get_spawn_plan()
+        self.assertEqual(plan.env[config.INSTANCE_ENV_VAR], '2')
+        self.assertEqual(plan.env['PORT_BASE'], '8000')
+
+        # The template itself doesn't get an index
+        template = config_handler.replica_groups['web'].template
+        self.assertNotIn(config.INSTANCE_ENV_VAR, template.env)
+
+    def test_dependencies(self):
+        """
+        Ensures that depending on a replicated job means depending on each of
+        its instances.
+        """
+        config_handler = config.ConfigHandler()
+        config_handler.handle_jobs({
+            'web': {'command': 'serve', 'replicas': 2},
+            'proxy': {'command': 'proxy', 'requires': ['web']},
+        })
+        config_handler.check_dependencies()
+        self.assertEqual(config_handler.jobs['proxy'].requires,
+                         ('web:0', 'web:1'))
+
+class TestServiceScaling(common.SimulationTestCase):
+    def test_scale(self):
+        """
+        Ensures that scaling adds and removes instances at the end, leaving
+        the others running.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'web': {'command': 'sleep 3600', 'replicas': 2,
+                    'autostart': True},
+            'plain': {'command': 'sleep 3600'},
+        })
+        sim.start()
+        pids = {job: sim.request('get-status', job=job).pid
+                for job in ('web:0', 'web:1')}
+
+        response = sim.request('scale-job', job='web', replicas=4)
+        self.assertEqual(response, protocol.SuccessResponse('web'))
+        for job in ('web:2', 'web:3'):
+            self.assertTrue(sim.request('get-status', job=job).is_running)
+
+        sim.request('scale-job', job='web', replicas=1)
+        sim.run_for(1)
+        self.assertEqual(sorted(sim.service.jobs),
+                         ['plain', 'web:0'])
+        self.assertEqual(sim.request('get-status', job='web:0').pid,
+                         pids['web:0'])
+
+        self.assertEqual(
+            sim.request('scale-job', job='plain', replicas=2),
+            protocol.FailureResponse('plain', protocol.ERR_NOT_REPLICATED))
+        self.assertEqual(
+            sim.request('scale-job', job='web', replicas=-1),
+            protocol.FailureResponse('web', protocol.ERR_BAD_REPLICAS))
+        self.assertEqual(
+            sim.request('scale-job', job='nothing', replicas=1),
+            protocol.FailureResponse('nothing', protocol.ERR_NO_SUCH_JOB))
+        self.assertTrue(sim.shutdown())
+
+    def test_reload(self):
+        """
+        Ensures that reloading a job file sets its replicated jobs back to
+        the number of instances in the file.
+        """
+        with tempfile.TemporaryDirectory() as job_dir:
+            job_file = os.path.join(job_dir, 'web.json')
+            with open(job_file, 'w') as job_stream:
+                json.dump({'web': {'command': 'sleep 3600', 'replicas': 2,
+                                   'autostart': True}}, job_stream)
+
+            config_handler = config.ConfigHandler(simulation.SimulatedProcess)
+            config_handler.load_job_file(job_file)
+            sim = simulation.Simulation(config_handler)
+            sim.start()
+
+            sim.request('scale-job', job='web', replicas=3)
+            self.assertEqual(sim.service.job_files[job_file],
+                             ['web:0', 'web:1', 'web:2'])
+
+            sim.request('reload-job-file', filename=job_file)
+            sim.run_for(1)
+            self.assertEqual(sorted(sim.service.jobs), ['web:0', 'web:1'])
+
+            os.remove(job_file)
+            sim.request('reload-job-file', filename=job_file)
+            sim.run_for(1)
+            self.assertEqual(sim.service.jobs, {})
+            self.assertEqual(sim.service.replica_groups, {})
+            self.assertTrue(sim.shutdown())
+
+class TestReload(common.SimulationTestCase):
+    def test_settings(self):
+        """
+        Ensures that jobs from a reloaded job file get the same defaults
+        from the supervisor as they did when it started.
+        """
+        with tempfile.TemporaryDirectory() as job_dir:
+            job_file = os.path.join(job_dir, 'web.json')
+            with open(job_file, 'w') as job_stream:
+                json.dump({'web': {'command': 'sleep 3600'}}, job_stream)
+
+            config_handler = config.ConfigHandler(simulation.SimulatedProcess)
+            config_handler.handle_supervisor_config(
+                {'spawn-method': monitor.SPAWN_POSIX_SPAWN})
+            config_handler.load_job_file(job_file)
+            sim = simulation.Simulation(config_handler)
+            sim.start()
+
+            with open(job_file, 'w') as job_stream:
+                json.dump({'web': {'command': 'sleep 7200'}}, job_stream)
+
+            sim.request('reload-job-file', filename=job_file)
+            sim.run_for(1)
+            web = sim.service.jobs['web']
+            self.assertEqual(web.program, 'sleep 7200')
+            self.assertEqual(web.spawn_method, monitor.SPAWN_POSIX_SPAWN)
+            self.assertTrue(sim.shutdown())
+
+    def test_replicated_dependencies(self):
+        """
+        Ensures that depending on a replicated job in a reloaded job file
+        means depending on its instances, as it does when the file is first
+        loaded.
+        """
+        with tempfile.TemporaryDirectory() as job_dir:
+            web_file = os.path.join(job_dir, 'web.json')
+            with open(web_file, 'w') as job_stream:
+                json.dump({'web': {'command': 'sleep 3600', 'replicas': 2}},
+                          job_stream)
+
+            config_handler = config.ConfigHandler(simulation.SimulatedProcess)
+            config_handler.load_job_file(web_file)
+            sim = simulation.Simulation(config_handler)
+            sim.start()
+
+            client_file = os.path.join(job_dir, 'client.json')
+            with open(client_file, 'w') as job_stream:
+                json.dump({'client': {'command': 'sleep 3600',
+                                      'requires': ['web', 'nothing'],
+                                      'autostart': True}},
+                          job_stream)
+
+            sim.request('reload-job-file', filename=client_file)
+            sim.run_for(1)
+            self.assertEqual(sim.service.jobs['client'].requires,
+                             ('web:0', 'web:1'))
+            for job in ('client', 'web:0', 'web:1'):
+                self.assertTrue(sim.request('get-status', job=job).is_running)
+            self.assertTrue(sim.shutdown())
+
+    def test_scaled_autostarts(self):
+        """
+        Ensures that instances added by scaling up a replicated job are
+        autostarted if the job is, and are forgotten once they are removed.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'web': {'command': 'sleep 3600', 'replicas': 1,
+                    'autostart': True},
+            'worker': {'command': 'sleep 3600', 'replicas': 1},
+        })
+        sim.start()
+
+        sim.request('scale-job', job='web', replicas=3)
+        sim.request('scale-job', job='worker', replicas=2)
+        self.assertEqual(sim.service.autostarts, {'web:0', 'web:1', 'web:2'})
+
+        sim.request('scale-job', job='web', replicas=1)
+        sim.run_for(1)
+        self.assertEqual(sim.service.autostarts, {'web:0'})
+        self.assertTrue(sim.shutdown())
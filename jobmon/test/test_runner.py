@@ -0,0 +1,61 @@
+import logging
+import os
+import subprocess
+import sys
+import unittest
+
+logging.basicConfig(filename='jobmon-test_runner.log', level=logging.DEBUG)
+
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          '..', '..')
+
+# The most that importing the command line tool can take, in seconds. It
+# takes around 20ms with cached bytecode (and 35ms without); importing the
+# supervisor along with it took over 100ms.
+STARTUP_BUDGET = 0.075
+
+# Modules which only the supervisor needs, and which the client commands
+# shouldn't pull in
+SUPERVISOR_MODULES = [
+    'concurrent.futures', 'logging', 'threading', 'jobmon.config',
+    'jobmon.launcher', 'jobmon.output', 'jobmon.schedule', 'jobmon.service',
+    'jobmon.tracing',
+]
+
+def run_python(code):
+    """
+    Runs some code in a new interpreter, so that it starts out without any
+    modules imported.
+
+    :return: What the code printed.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = SOURCE_DIR
+    return subprocess.check_output([sys.executable, '-c', code], env=env,
+                                   universal_newlines=True)
+
+class TestStartup(unittest.TestCase):
+    def test_client_imports(self):
+        """
+        Ensures that importing the command line tool doesn't import the
+        supervisor.
+        """
+        imported = run_python(
+            'import sys; from jobmon import runner; '
+            'print(" ".join(sys.modules))').split()
+
+        for module in SUPERVISOR_MODULES:
+            self.assertNotIn(module, imported)
+
+    def test_budget(self):
+        """
+        Ensures that importing the command line tool is quick. The best of a
+        few runs is used, so that one slow run doesn't fail the test.
+        """
+        times = [float(run_python(
+            'import time; start = time.perf_counter(); '
+            'from jobmon import runner; '
+            'print(time.perf_counter() - start)'))
+            for _ in range(5)]
+
+        self.assertLess(min(times), STARTUP_BUDGET)
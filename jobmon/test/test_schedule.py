@@ -0,0 +1,222 @@
+import datetime
+import logging
+import unittest
+
+from jobmon import config, protocol, schedule, simulation
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_schedule.log', level=logging.DEBUG)
+
+def timestamp(*args):
+    """
+    Converts a local date and time into a timestamp.
+    """
+    return datetime.datetime(*args).timestamp()
+
+class TestScheduleConfig(unittest.TestCase):
+    def test_durations(self):
+        """
+        Ensures that durations can be given in seconds or with units.
+        """
+        self.assertEqual(schedule.parse_duration(90), 90)
+        self.assertEqual(schedule.parse_duration('90s'), 90)
+        self.assertEqual(schedule.parse_duration('15m'), 900)
+        self.assertEqual(schedule.parse_duration('1.5h'), 5400)
+        self.assertEqual(schedule.parse_duration('1d'), 86400)
+
+        for bad_duration in ('soon', '-5m', '0', 0, True, None):
+            with self.assertRaises(ValueError):
+                schedule.parse_duration(bad_duration)
+
+    def test_times(self):
+        """
+        Ensures that times of day are the next time that comes up.
+        """
+        now = timestamp(2024, 3, 10, 12, 0)
+        self.assertEqual(schedule.parse_time('13:30', now),
+                         timestamp(2024, 3, 10, 13, 30))
+        self.assertEqual(schedule.parse_time('11:00', now),
+                         timestamp(2024, 3, 11, 11, 0))
+        self.assertEqual(schedule.parse_time('2024-04-01T03:00', now),
+                         timestamp(2024, 4, 1, 3, 0))
+
+        with self.assertRaises(ValueError):
+            schedule.parse_time('teatime', now)
+
+    def test_from_config(self):
+        """
+        Ensures that both kinds of schedule are read, along with their
+        options and default jitter.
+        """
+        every = schedule.from_config({'every': '1h', 'overlap': 'kill',
+                                      'jitter': 300})
+        self.assertEqual(every, schedule.Schedule('every', 3600, 'kill', 300))
+        self.assertEqual(schedule.from_config({'every': 60}).jitter, 6)
+        self.assertEqual(schedule.from_config({'every': '1d'}).jitter,
+                         schedule.MAX_DEFAULT_JITTER)
+
+        cron = schedule.from_config('@hourly')
+        self.assertEqual(cron.kind, schedule.KIND_CRON)
+        self.assertEqual(cron.spec.minutes, {0})
+        self.assertEqual(cron.overlap, schedule.OVERLAP_SKIP)
+
+        for bad_config in (5, {}, {'every': 60, 'cron': '* * * * *'},
+                           '* * * *', '60 * * * *', '0 0 31 2 *',
+                           {'every': 60, 'overlap': 'ignore'},
+                           {'every': 60, 'jitter': 60}):
+            with self.assertRaises(ValueError):
+                schedule.from_config(bad_config)
+
+    def test_config(self):
+        """
+        Ensures that jobs with an invalid schedule don't get one.
+        """
+        config_handler = config.ConfigHandler()
+        config_handler.handle_jobs({
+            'good': {'command': 'true', 'schedule': '*/5 * * * *'},
+            'bad': {'command': 'true', 'schedule': 'whenever'},
+        })
+
+        self.assertEqual(config_handler.jobs['good'].schedule.kind,
+                         schedule.KIND_CRON)
+        self.assertIsNone(config_handler.jobs['bad'].schedule)
+
+class TestCron(unittest.TestCase):
+    def next_time(self, expr, *after):
+        return schedule.next_cron_time(schedule.parse_cron(expr),
+                                       timestamp(*after))
+
+    def test_fields(self):
+        """
+        Ensures that ranges, steps, lists and names are all understood.
+        """
+        expr = schedule.parse_cron('*/15 9-17/4 1,15 jan-mar mon-fri')
+        self.assertEqual(expr.minutes, {0, 15, 30, 45})
+        self.assertEqual(expr.hours, {9, 13, 17})
+        self.assertEqual(expr.days, {1, 15})
+        self.assertEqual(expr.months, {1, 2, 3})
+        self.assertEqual(expr.weekdays, {1, 2, 3, 4, 5})
+
+        self.assertEqual(schedule.parse_cron('0 0 * * 7').weekdays, {0})
+        self.assertEqual(schedule.parse_cron('5/20 * * * *').minutes,
+                         {5, 25, 45})
+
+    def test_next_time(self):
+        """
+        Ensures that the next matching time is found, and that a time which
+        matches exactly isn't used again.
+        """
+        self.assertEqual(self.next_time('*/15 * * * *', 2024, 3, 10, 12, 7),
+                         timestamp(2024, 3, 10, 12, 15))
+        self.assertEqual(self.next_time('*/15 * * * *', 2024, 3, 10, 12, 15),
+                         timestamp(2024, 3, 10, 12, 30))
+        self.assertEqual(self.next_time('30 2 * * *', 2024, 12, 31, 23, 0),
+                         timestamp(2025, 1, 1, 2, 30))
+
+        # 2024-03-10 is a Sunday, and February 29th only comes up in leap
+        # years
+        self.assertEqual(self.next_time('0 9 * * mon', 2024, 3, 10, 12, 0),
+                         timestamp(2024, 3, 11, 9, 0))
+        self.assertEqual(self.next_time('0 0 29 2 *', 2024, 3, 1, 0, 0),
+                         timestamp(2028, 2, 29, 0, 0))
+
+        # When both the day and the weekday are given, either will do
+        self.assertEqual(self.next_time('0 0 20 * mon', 2024, 3, 12, 0, 0),
+                         timestamp(2024, 3, 18, 0, 0))
+
+class TestJitter(unittest.TestCase):
+    def test_spread(self):
+        """
+        Ensures that jobs on the same schedule are spread out, but that each
+        job's runs stay exactly one period apart.
+        """
+        every = schedule.from_config({'every': 600, 'jitter': 60})
+        start = simulation.EPOCH
+        first_runs = [schedule.next_run(every, 'job-{}'.format(index), start)
+                      for index in range(100)]
+
+        self.assertTrue(all(start < when <= start + 660
+                            for when in first_runs))
+        self.assertGreater(len(set(int(when) for when in first_runs)), 40)
+
+        second_run = schedule.next_run(every, 'job-0', first_runs[0])
+        self.assertEqual(second_run - first_runs[0], 600)
+
+class TestServiceSchedule(common.SimulationTestCase):
+    def starts(self, sim, job):
+        return [when for when, event_job, code in sim.events.history
+                if event_job == job and code == protocol.EVENT_STARTJOB]
+
+    def test_every(self):
+        """
+        Ensures that scheduled jobs are started once per period.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'backup': {'command': 'sleep 10',
+                       'schedule': {'every': 60, 'jitter': 0}},
+        })
+        sim.start()
+        sim.run_for(600)
+
+        starts = self.starts(sim, 'backup')
+        self.assertEqual(len(starts), 10)
+        self.assertTrue(all(when % 60 == 0 for when in starts))
+        self.assertTrue(sim.shutdown())
+
+    def test_overlap(self):
+        """
+        Ensures that runs which come due while the last one is going are
+        skipped, queued or start over, depending on the overlap policy.
+        """
+        sim = simulation.Simulation.from_jobs({
+            name: {'command': 'sleep 90',
+                   'schedule': {'every': 60, 'jitter': 0, 'overlap': name}}
+            for name in ('skip', 'queue', 'kill')
+        })
+        sim.start()
+        sim.run_for(299)
+
+        # Each run takes 90 seconds, so every other run is skipped
+        self.assertEqual(len(self.starts(sim, 'skip')), 3)
+
+        # The queued runs start as soon as the last one exits, and don't
+        # pile up
+        queued = self.starts(sim, 'queue')
+        self.assertEqual(len(queued), 4)
+        self.assertEqual([b - a for a, b in zip(queued, queued[1:])],
+                         [90, 90, 90])
+
+        # Each run is killed when the next one comes due
+        killed = self.starts(sim, 'kill')
+        self.assertEqual(len(killed), 5)
+        kills = [when for when, job, code in sim.events.history
+                 if job == 'kill' and code == protocol.EVENT_STOPJOB]
+        self.assertEqual(kills, killed[1:])
+        self.assertTrue(sim.shutdown())
+
+    def test_delayed_start(self):
+        """
+        Ensures that one-off starts happen at their time, and that stopping
+        the job first cancels them.
+        """
+        sim = simulation.Simulation.from_jobs({'report': {'command': 'sleep 3600'}})
+        sim.start()
+
+        start_at = sim.clock.time() + 300
+        sim.request('start-job', job='report', at=start_at)
+        sim.run_for(299)
+        self.assertFalse(sim.request('get-status', job='report').is_running)
+        sim.run_for(1)
+        self.assertEqual(self.starts(sim, 'report'), [start_at])
+
+        sim.request('stop-job', job='report')
+        sim.request('start-job', job='report', at=sim.clock.time() + 60)
+        self.assertEqual(sim.request('stop-job', job='report'),
+                         protocol.SuccessResponse('report'))
+        sim.run_for(120)
+        self.assertEqual(self.starts(sim, 'report'), [start_at])
+
+        self.assertEqual(
+            sim.request('start-job', job='report', at='later'),
+            protocol.FailureResponse('report', protocol.ERR_BAD_TIME))
+        self.assertTrue(sim.shutdown())
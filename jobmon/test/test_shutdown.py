@@ -0,0 +1,148 @@
+import logging
+import signal
+import time
+import unittest
+
+from jobmon import config, monitor, protocol, simulation
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_shutdown.log', level=logging.DEBUG)
+
+# A job which has to be killed, since it ignores the signal it is stopped with
+STUBBORN = "trap '' TERM; sleep 3600"
+
+def behaviour(program):
+    if program == STUBBORN:
+        return simulation.Behaviour(None, 0, True)
+    return simulation.guess_behaviour(program)
+
+class TestShutdownConfig(unittest.TestCase):
+    def test_timeouts(self):
+        """
+        Ensures that the supervisor's and each job's shutdown timeouts are
+        read, and that invalid ones are ignored.
+        """
+        config_handler = config.ConfigHandler()
+        self.assertEqual(config_handler.shutdown_timeout,
+                         config.DEFAULT_SHUTDOWN_TIMEOUT)
+
+        config_handler.handle_supervisor_config({'shutdown-timeout': 2.5})
+        self.assertEqual(config_handler.shutdown_timeout, 2.5)
+        config_handler.handle_supervisor_config({'shutdown-timeout': -1})
+        self.assertEqual(config_handler.shutdown_timeout, 2.5)
+
+        config_handler.handle_jobs({
+            'slow': {'command': 'sleep 3600', 'shutdown-timeout': 60},
+            'plain': {'command': 'sleep 3600'},
+            'bad': {'command': 'sleep 3600', 'shutdown-timeout': 0},
+        })
+        self.assertEqual(config_handler.jobs['slow'].shutdown_timeout, 60)
+        self.assertIsNone(config_handler.jobs['plain'].shutdown_timeout)
+        self.assertIsNone(config_handler.jobs['bad'].shutdown_timeout)
+
+        # It is part of the job's definition, so reloading picks it up
+        self.assertFalse(config_handler.jobs['slow'].same_definition(
+            config_handler.jobs['plain']))
+
+class TestShutdown(common.SimulationTestCase):
+    def make_simulation(self, jobs):
+        # Whole seconds keep the times exact, even so far from the epoch
+        return simulation.Simulation.from_jobs(jobs, behaviour=behaviour,
+                                               kill_delay=1)
+
+    def events_about(self, sim, job):
+        """
+        :return: The events sent about a job after it started, as \
+        ``(time since the shutdown started, event code)`` tuples.
+        """
+        return [(when - self.shutdown_started, code)
+                for when, event_job, code in sim.events.history
+                if event_job == job and code != protocol.EVENT_STARTJOB]
+
+    def shutdown(self, sim):
+        self.shutdown_started = sim.clock.time()
+        self.assertTrue(sim.shutdown())
+        return sim.clock.time() - self.shutdown_started
+
+    def test_escalation(self):
+        """
+        Ensures that jobs which don't exit are killed once their timeouts
+        have passed, and that the timeouts run at the same time rather than
+        one after another.
+        """
+        sim = self.make_simulation({
+            'quick': {'command': 'sleep 3600', 'autostart': True},
+            'stuck': {'command': STUBBORN, 'autostart': True},
+            'patient': {'command': STUBBORN, 'autostart': True,
+                        'shutdown-timeout': 30},
+        })
+        sim.start()
+        elapsed = self.shutdown(sim)
+        self.assertEqual(elapsed, 31)
+
+        kill_delay = sim.kill_delay
+        self.assertEqual(self.events_about(sim, 'quick'),
+                         [(0, protocol.EVENT_STOPPING),
+                          (kill_delay, protocol.EVENT_STOPJOB)])
+        self.assertEqual(self.events_about(sim, 'stuck'),
+                         [(0, protocol.EVENT_STOPPING),
+                          (10, protocol.EVENT_KILLED),
+                          (10 + kill_delay, protocol.EVENT_STOPJOB)])
+        self.assertEqual(self.events_about(sim, 'patient'),
+                         [(0, protocol.EVENT_STOPPING),
+                          (30, protocol.EVENT_KILLED),
+                          (30 + kill_delay, protocol.EVENT_STOPJOB)])
+
+    def test_dependencies(self):
+        """
+        Ensures that a job isn't killed before the jobs that depend on it,
+        even if its own timeout is shorter than theirs, and that it is asked
+        to stop (and given its own timeout) before it is killed.
+        """
+        sim = self.make_simulation({
+            'web': {'command': STUBBORN, 'requires': ['db'],
+                    'autostart': True, 'shutdown-timeout': 20},
+            'db': {'command': STUBBORN, 'shutdown-timeout': 5},
+            'cache': {'command': 'sleep 3600', 'requires': ['db'],
+                      'autostart': True},
+        })
+        sim.start()
+        elapsed = self.shutdown(sim)
+        self.assertEqual(elapsed, 26)
+
+        kill_delay = sim.kill_delay
+        self.assertEqual(self.events_about(sim, 'web'),
+                         [(0, protocol.EVENT_STOPPING),
+                          (20, protocol.EVENT_KILLED),
+                          (20 + kill_delay, protocol.EVENT_STOPJOB)])
+        self.assertEqual(self.events_about(sim, 'cache'),
+                         [(0, protocol.EVENT_STOPPING),
+                          (kill_delay, protocol.EVENT_STOPJOB)])
+
+        # The web server was still running at the database's deadline, so
+        # the database was asked to stop then, and given its own 5 seconds
+        self.assertEqual(self.events_about(sim, 'db'),
+                         [(20, protocol.EVENT_STOPPING),
+                          (25, protocol.EVENT_KILLED),
+                          (25 + kill_delay, protocol.EVENT_STOPJOB)])
+        self.assertEqual(sim.service.restart_ticker.timeouts, {})
+
+class TestKillSignal(unittest.TestCase):
+    def test_sigkill(self):
+        """
+        Ensures that a process which ignores its signal can still be killed
+        by sending it another.
+        """
+        recorder = common.EventRecorder()
+        child = monitor.ChildProcess(recorder, 'test', STUBBORN)
+        child.start()
+        try:
+            # Give the shell time to set up its trap
+            time.sleep(0.5)
+            child.kill()
+            self.assertFalse(recorder.stopped.wait(1))
+        finally:
+            child.kill(signal.SIGKILL)
+
+        self.assertTrue(recorder.stopped.wait(15))
+        self.assertEqual(child.exit_status, signal.SIGKILL)
@@ -0,0 +1,173 @@
+import logging
+import time
+import unittest
+
+from jobmon import config, protocol, service, simulation, ticker
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_simulation.log', level=logging.DEBUG)
+
+class TestVirtualClock(unittest.TestCase):
+    def test_call_order(self):
+        """
+        Ensures that functions are called in order of time, and then in the
+        order they were given, and that the clock never goes backwards.
+        """
+        clock = simulation.VirtualClock(start=100)
+        calls = []
+        clock.call_at(105, calls.append, 'b')
+        clock.call_at(102, calls.append, 'a')
+        clock.call_at(105, calls.append, 'c')
+        clock.call_later(10, calls.append, 'd')
+
+        clock.advance_to(105)
+        self.assertEqual(calls, ['a', 'b', 'c'])
+        self.assertEqual(clock.time(), 105)
+        self.assertEqual(clock.next_call(), 110)
+
+        clock.advance_to(50)
+        self.assertEqual(clock.time(), 105)
+
+    def test_ticker(self):
+        """
+        Ensures that a ticker can run on a virtual clock, without its thread.
+        """
+        clock = simulation.VirtualClock(start=0)
+        expired = []
+        ticks = ticker.Ticker(expired.append, clock=clock)
+
+        ticks.register('a', 5)
+        ticks.register('b', 3)
+        ticks.register('c', 8)
+        ticks.unregister('c')
+        self.assertEqual(ticks.next_timeout(), 3)
+
+        clock.advance_to(6)
+        ticks.run_timeouts()
+        self.assertEqual(expired, ['b', 'a'])
+        self.assertIsNone(ticks.next_timeout())
+
+class TestSimulation(common.SimulationTestCase):
+    def test_restart_throttling(self):
+        """
+        Ensures that a crash-looping job is restarted once, and then only
+        once every backoff period.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'crash': {'command': 'false', 'autostart': True, 'restart': True},
+        })
+        sim.start()
+        sim.run_for(service.RESTART_BACKOFF * 3)
+
+        starts = [when - simulation.EPOCH
+                  for when, _, event in sim.events.history
+                  if event == protocol.EVENT_STARTJOB]
+        self.assertEqual(starts, [0, 0] + [service.RESTART_BACKOFF * cycle
+                                           for cycle in (1, 2, 3)])
+        self.assertEqual(sim.service.throttled_jobs, {'crash'})
+
+        # Stopping a throttled job cancels its restart
+        sim.request('stop-job', job='crash')
+        sim.run_for(service.RESTART_BACKOFF * 3)
+        self.assertEqual(sim.events.counts[protocol.EVENT_STARTJOB], 5)
+        self.assertTrue(sim.shutdown())
+
+    def test_commands(self):
+        """
+        Ensures that commands sent to the service act on simulated jobs.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'idle': {'command': 'sleep 3600'},
+        })
+        sim.start()
+
+        self.assertIsInstance(sim.request('start-job', job='idle'),
+                              protocol.SuccessResponse)
+        self.assertTrue(sim.request('get-status', job='idle').is_running)
+
+        sim.request('stop-job', job='idle')
+        sim.run_for(1)
+        self.assertFalse(sim.request('get-status', job='idle').is_running)
+        self.assertEqual(sim.events.counts[protocol.EVENT_STOPJOB], 1)
+
+    def test_started_before_stop(self):
+        """
+        Ensures that a job which a client starts again before its stop is
+        handled isn't restarted on top of itself.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'svc': {'command': 'sleep 3600', 'autostart': True,
+                    'restart': True},
+        })
+        sim.start()
+
+        # The job exits, and the client's start is handled before the
+        # supervisor gets the news
+        job = sim.service.jobs['svc']
+        job.die(job.child_pid.get(), 1 << 8)
+        response = sim.service.handle_request(
+            service.Request('start-job', {'job': 'svc'}))
+        self.assertIsInstance(response, protocol.SuccessResponse)
+
+        sim.drain()
+        sim.run_for(1)
+        self.assertTrue(sim.request('get-status', job='svc').is_running)
+        self.assertEqual(sim.events.counts[protocol.EVENT_RESTARTJOB], 0)
+        self.assertEqual(sim.events.counts[protocol.EVENT_STARTJOB], 2)
+        self.assertTrue(sim.shutdown())
+
+    def test_deterministic(self):
+        """
+        Ensures that simulations with the same seed do the same thing, and
+        that the seed matters.
+        """
+        jobs = {'job-{}'.format(index): {'command': 'sleep 2', 'autostart': True,
+                                         'restart': True}
+                for index in range(50)}
+
+        def run(seed):
+            sim = simulation.Simulation.from_jobs(jobs, seed=seed,
+                                                  jitter=0.5)
+            sim.start()
+            sim.run_for(60)
+            sim.shutdown()
+            return sim.events.history
+
+        self.assertEqual(run(1), run(1))
+        self.assertNotEqual(run(1), run(2))
+
+    def test_scale(self):
+        """
+        Runs 50,000 jobs through autostarting, crashing, throttling and
+        shutdown, which should only take a few seconds.
+        """
+        config_handler = config.ConfigHandler(simulation.SimulatedProcess)
+        kinds = (('short', 'sleep 5', False, 30000),
+                 ('crash', 'false', True, 10000),
+                 ('idle', 'sleep 3600', False, 10000))
+        for prefix, command, restart, count in kinds:
+            for index in range(count):
+                name = '{}-{}'.format(prefix, index)
+                config_handler.jobs[name] = simulation.SimulatedProcess(
+                    name, command)
+                config_handler.autostarts.append(name)
+                if restart:
+                    config_handler.restarts.append(name)
+
+        start_time = time.time()
+        sim = simulation.Simulation(config_handler)
+        sim.start()
+        sim.run_for(service.RESTART_BACKOFF * 2)
+
+        self.assertEqual(len(sim.service.running_jobs), 10000)
+        self.assertEqual(len(sim.service.throttled_jobs), 10000)
+
+        self.assertTrue(sim.shutdown())
+        self.assertEqual(sim.service.running_jobs, set())
+
+        # Every job starts once, and the crashing jobs are restarted once
+        # straight away and then once per backoff period
+        self.assertEqual(sim.events.counts[protocol.EVENT_STARTJOB],
+                         50000 + 10000 * 3)
+        self.assertEqual(sim.events.counts[protocol.EVENT_STOPJOB], 40000)
+        self.assertLess(time.time() - start_time, 60)
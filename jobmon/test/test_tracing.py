@@ -0,0 +1,74 @@
+import logging
+import unittest
+
+from jobmon import metrics, tracing
+
+logging.basicConfig(filename='jobmon-test_tracing.log', level=logging.DEBUG)
+
+class TestTrace(unittest.TestCase):
+    def make_trace(self, command, *marks):
+        """
+        Builds a trace with the given (point, time) marks.
+        """
+        trace = tracing.Trace()
+        trace.command = command
+        trace.marks = [(tracing.ACCEPTED, 0.0)] + list(marks)
+        return trace
+
+    def test_stages(self):
+        """
+        Ensures that the time between marks is given to the stage that ends
+        at the later mark, even when a mark is missing.
+        """
+        trace = self.make_trace('test_stages',
+                                (tracing.RECEIVED, 0.5),
+                                (tracing.DEQUEUED, 2.0),
+                                (tracing.HANDLED, 2.25))
+
+        self.assertEqual(trace.get_stages(), [('recv', 0.5),
+                                              ('queue-wait', 1.5),
+                                              ('handle', 0.25)])
+        self.assertEqual(trace.get_total(), 2.25)
+
+    def test_current(self):
+        """
+        Ensures that a trace is only current inside of its block.
+        """
+        trace = tracing.Trace()
+        self.assertIsNone(tracing.current())
+        with trace:
+            self.assertIs(tracing.current(), trace)
+        self.assertIsNone(tracing.current())
+
+    def test_finish(self):
+        """
+        Ensures that finished traces are recorded in the stats, and logged
+        if they were slow.
+        """
+        fast = self.make_trace('test_finish', (tracing.RECEIVED, 0.001),
+                               (tracing.REPLIED, 0.002))
+        slow = self.make_trace('test_finish', (tracing.RECEIVED, 0.001),
+                               (tracing.REPLIED, 2.0))
+
+        with self.assertLogs('jobmon.tracing', logging.WARNING) as logs:
+            fast.finish(1.0)
+            slow.finish(1.0)
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('test_finish took 2000.000ms', logs.output[0])
+
+        stats = tracing.get_stats()['test_finish']
+        self.assertEqual(stats['recv']['count'], 2)
+        self.assertEqual(stats['total']['count'], 2)
+        self.assertAlmostEqual(stats['total']['mean'], 1.001)
+
+class TestQuantiles(unittest.TestCase):
+    def test_bucket_quantile(self):
+        """
+        Ensures that quantiles are interpolated within their bucket.
+        """
+        bounds = (1, 2, 4)
+        self.assertIsNone(metrics.bucket_quantile(0.5, bounds, [0, 0, 0, 0]))
+        self.assertEqual(metrics.bucket_quantile(0.5, bounds, [2, 0, 2, 0]), 1)
+        self.assertEqual(metrics.bucket_quantile(0.75, bounds, [2, 0, 2, 0]), 3)
+        self.assertEqual(metrics.bucket_quantile(0.99, bounds, [0, 0, 1, 9]), 4)
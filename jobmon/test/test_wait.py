@@ -0,0 +1,141 @@
+import logging
+
+from jobmon import protocol, service, simulation
+from jobmon.test import common
+
+logging.basicConfig(filename='jobmon-test_wait.log', level=logging.DEBUG)
+
+class TestServiceWait(common.SimulationTestCase):
+    def wait(self, sim, job, state, timeout=None):
+        return sim.request('wait-job', job=job, state=state, timeout=timeout)
+
+    def test_already_there(self):
+        """
+        Ensures that waits for the state a job is already in are answered
+        straight away, and that invalid waits are refused.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'web': {'command': 'sleep 3600', 'autostart': True},
+            'idle': {'command': 'sleep 3600'},
+        })
+        sim.start()
+
+        response = self.wait(sim, 'web', protocol.WAIT_RUNNING)
+        self.assertIsInstance(response, protocol.StatusResponse)
+        self.assertTrue(response.is_running)
+        self.assertTrue(self.wait(sim, 'web', protocol.WAIT_READY).is_running)
+        self.assertFalse(
+            self.wait(sim, 'idle', protocol.WAIT_STOPPED).is_running)
+
+        self.assertEqual(
+            self.wait(sim, 'idle', protocol.WAIT_RUNNING, timeout=0),
+            protocol.FailureResponse('idle', protocol.ERR_WAIT_TIMEOUT))
+        for state, timeout in (('asleep', None), ('running', 'soon'),
+                               ('running', float('inf'))):
+            self.assertEqual(
+                self.wait(sim, 'idle', state, timeout),
+                protocol.FailureResponse('idle', protocol.ERR_BAD_COMMAND))
+        self.assertEqual(
+            self.wait(sim, 'nothing', protocol.WAIT_STOPPED),
+            protocol.FailureResponse('nothing', protocol.ERR_NO_SUCH_JOB))
+        self.assertTrue(sim.shutdown())
+
+    def test_stop(self):
+        """
+        Ensures that waiting for a job to stop is answered once its process
+        has actually exited, rather than when it is told to stop.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'web': {'command': 'sleep 3600', 'autostart': True},
+        })
+        sim.start()
+
+        sim.request('stop-job', job='web')
+        waiters = [self.wait(sim, 'web', protocol.WAIT_STOPPED)
+                   for _ in range(100)]
+        self.assertFalse(any(waiter.done() for waiter in waiters))
+
+        sim.run_for(1)
+        self.assertTrue(all(waiter.done() for waiter in waiters))
+        self.assertFalse(waiters[0].result().is_running)
+        self.assertEqual(sim.service.job_waiters, {})
+        self.assertTrue(sim.shutdown())
+
+    def test_ready(self):
+        """
+        Ensures that jobs which report their readiness are only ready once
+        they have, even though they are running before then, and that jobs
+        which exit straight away have still been running.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'db': {'command': 'sleep 3600', 'notify': True},
+            'once': {'command': 'true'},
+        })
+        sim.start()
+
+        once = self.wait(sim, 'once', protocol.WAIT_RUNNING)
+        sim.request('start-job', job='once')
+        self.assertTrue(once.done())
+        sim.run_for(1)
+        self.assertFalse(sim.request('get-status', job='once').is_running)
+
+        running = self.wait(sim, 'db', protocol.WAIT_RUNNING)
+        ready = self.wait(sim, 'db', protocol.WAIT_READY)
+        sim.request('start-job', job='db')
+        self.assertTrue(running.done())
+        self.assertFalse(ready.done())
+
+        pid = running.result().pid
+        sim.request('job-notify', pid=pid, session=pid,
+                    fields={'READY': '1'})
+        self.assertTrue(ready.done())
+        self.assertTrue(ready.result().ready)
+        self.assertTrue(sim.shutdown())
+
+    def test_stopped_first(self):
+        """
+        Ensures that waiting for a job to be running or ready fails if the
+        job exits before it gets there, rather than waiting forever.
+        """
+        sim = simulation.Simulation.from_jobs({
+            'broken': {'command': 'false', 'notify': True},
+        })
+        sim.start()
+
+        ready = self.wait(sim, 'broken', protocol.WAIT_READY, timeout=30)
+        sim.request('start-job', job='broken')
+        self.assertFalse(ready.done())
+
+        sim.run_for(1)
+        self.assertEqual(ready.result(), protocol.FailureResponse(
+            'broken', protocol.ERR_WAIT_STOPPED))
+        self.assertEqual(sim.service.job_waiters, {})
+        self.assertIsNone(sim.ticker.next_timeout())
+        self.assertTrue(sim.shutdown())
+
+    def test_timeout(self):
+        """
+        Ensures that waits give up once their timeout passes, and that
+        waiting without a timeout doesn't set any timers.
+        """
+        sim = simulation.Simulation.from_jobs({'idle': {'command': 'sleep 3600'}})
+        sim.start()
+
+        forever = self.wait(sim, 'idle', protocol.WAIT_RUNNING)
+        self.assertIsNone(sim.ticker.next_timeout())
+
+        brief = self.wait(sim, 'idle', protocol.WAIT_RUNNING, timeout=30)
+        self.assertIn(service.WaitKey('idle', 1), sim.ticker)
+        sim.run_for(29)
+        self.assertFalse(brief.done())
+        sim.run_for(1)
+        self.assertEqual(brief.result(), protocol.FailureResponse(
+            'idle', protocol.ERR_WAIT_TIMEOUT))
+        self.assertFalse(forever.done())
+
+        # Waiters which are still waiting when the job is removed are told
+        # that it doesn't exist
+        sim.service.remove_job('idle')
+        self.assertEqual(forever.result(), protocol.FailureResponse(
+            'idle', protocol.ERR_NO_SUCH_JOB))
+        self.assertTrue(sim.shutdown())
@@ -0,0 +1,117 @@
+import logging
+import os
+import tempfile
+import time
+import unittest
+
+from jobmon import config, watcher
+
+logging.basicConfig(filename='jobmon-test_watcher.log', level=logging.DEBUG)
+
+class ReloadRecorder:
+    """
+    A replacement supervisor which records the files it is asked to reload.
+    """
+    def __init__(self):
+        self.reloads = []
+
+    def reload_job_file(self, filename):
+        self.reloads.append(filename)
+
+class TestIncludeWatcher(unittest.TestCase):
+    def test_debounced_reload(self):
+        """
+        Ensures that a burst of writes to a job file only causes one reload,
+        and that files not matching the include glob are ignored.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            recorder = ReloadRecorder()
+            include_watcher = watcher.IncludeWatcher(
+                [temp_dir + '/*.json'], recorder.reload_job_file, delay=1)
+            include_watcher.start()
+
+            try:
+                job_file = os.path.join(temp_dir, 'jobs.json')
+                for _ in range(5):
+                    with open(job_file, 'w') as jobs:
+                        jobs.write('{}')
+                    time.sleep(0.1)
+
+                with open(os.path.join(temp_dir, 'notes.txt'), 'w') as notes:
+                    notes.write('Not a job file')
+
+                time.sleep(3) # Give the debouncing delay time to expire
+
+                self.assertEqual(recorder.reloads, [job_file])
+            finally:
+                include_watcher.terminate()
+                include_watcher.wait_for_exit()
+
+    def test_directory_replaced(self):
+        """
+        Ensures that an include directory which appears after the watcher
+        has started is watched, and that one which is removed and created
+        again is still watched.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            include_dir = os.path.join(temp_dir, 'jobs')
+            recorder = ReloadRecorder()
+            include_watcher = watcher.IncludeWatcher(
+                [include_dir + '/*.json'], recorder.reload_job_file,
+                delay=0.5)
+            include_watcher.start()
+
+            try:
+                job_file = os.path.join(include_dir, 'jobs.json')
+                other_file = os.path.join(include_dir, 'other.json')
+
+                os.mkdir(include_dir)
+                with open(job_file, 'w') as jobs:
+                    jobs.write('{}')
+                time.sleep(1.5)
+
+                self.assertEqual(recorder.reloads, [job_file])
+
+                # Swap the directory for a new one, the way deployment tools
+                # do, without the old job file
+                os.rename(include_dir, include_dir + '.old')
+                os.mkdir(include_dir)
+                with open(other_file, 'w') as jobs:
+                    jobs.write('{}')
+                time.sleep(1.5)
+
+                self.assertEqual(sorted(recorder.reloads[1:]),
+                                 [job_file, other_file])
+
+                # Writes to the new directory should still be seen
+                del recorder.reloads[:]
+                with open(other_file, 'w') as jobs:
+                    jobs.write('{"a": {"command": "true"}}')
+                time.sleep(1.5)
+
+                self.assertEqual(recorder.reloads, [other_file])
+            finally:
+                include_watcher.terminate()
+                include_watcher.wait_for_exit()
+
+class TestJobFiles(unittest.TestCase):
+    def test_job_file_tracking(self):
+        """
+        Ensures that the configuration records which jobs came from which
+        job file.
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(temp_dir + '/a.json', 'w') as jobs:
+                jobs.write('{"a1": {"command": "true"}, "a2": {"command": "true"}}')
+
+            with open(temp_dir + '/b.json', 'w') as jobs:
+                jobs.write('{"b1": {"command": "true"}, "a1": {"command": "false"}}')
+
+            config_handler = config.ConfigHandler()
+            config_handler.load_job_file(temp_dir + '/a.json')
+            config_handler.load_job_file(temp_dir + '/b.json')
+
+            self.assertEqual(config_handler.job_files,
+                             {temp_dir + '/a.json': ['a1', 'a2'],
+                              temp_dir + '/b.json': ['b1']})
+            self.assertEqual(config_handler.jobs['a1'].program, 'true')
@@ -2,13 +2,15 @@
 A tickers are responsible for calling into the supervisor periodically, and
 getting it to handle restarts.
 """
+import heapq
+import itertools
 import logging
 import os
 import select
 import threading
 import time
 
-from jobmon import util
+from jobmon import metrics, util
 
 LOGGER = logging.getLogger('jobmon.ticker')
 
@@ -17,23 +19,43 @@ class Ticker(threading.Thread, util.TerminableThreadMixin):
     A ticker is responsible for keeping track of a bunch of timeouts (each of 
     which is associated with a key), and then calling a function with
     that key when the timeout expires.
+
+    The ticker reads the time from a clock, which is anything with a
+    ``time()`` method - normally the :mod:`time` module, but the simulation
+    (see :mod:`jobmon.simulation`) gives it a virtual clock instead, and calls
+    :meth:`run_timeouts` itself rather than starting the ticker's thread.
     """
-    def __init__(self, callback):
+    def __init__(self, callback, clock=time):
         threading.Thread.__init__(self)
         util.TerminableThreadMixin.__init__(self)
 
-        # This is used to force ticks when new events are registered
-        reader, writer = os.pipe()
-        self.tick_reader = os.fdopen(reader, 'rb')
-        self.tick_writer = os.fdopen(writer, 'wb')
+        # This is used to force ticks when new events are registered. The
+        # writer never blocks, since a full pipe will wake the ticker anyway.
+        self.tick_reader, self.tick_writer = os.pipe()
+        os.set_blocking(self.tick_writer, False)
 
         self.timeout_lock = threading.Lock()
         self.timeouts = {}
         self.callback = callback
+        self.clock = clock
+
+        # The timeouts, ordered by when they expire, as (abstime, order, key).
+        # Entries aren't removed when their key is unregistered (or registered
+        # again), so anything which doesn't match self.timeouts is skipped.
+        self.deadlines = []
+        self.order = itertools.count()
 
     def __contains__(self, key):
         return key in self.timeouts
 
+    def get(self, key):
+        """
+        :return: The time that a timeout expires, or ``None`` if it isn't \
+        registered.
+        """
+        with self.timeout_lock:
+            return self.timeouts.get(key)
+
     def register(self, key, abstime):
         """
         Registers a new timeout, to be run at the given absolute time.
@@ -41,10 +63,15 @@ class Ticker(threading.Thread, util.TerminableThreadMixin):
         LOGGER.info('Registering %s at %d', key, abstime)
 
         with self.timeout_lock:
+            if key not in self.timeouts:
+                metrics.TICKER_TIMERS.inc()
             self.timeouts[key] = abstime
+            heapq.heappush(self.deadlines, (abstime, next(self.order), key))
 
-        self.tick_writer.write(b' ')
-        self.tick_writer.flush()
+        try:
+            os.write(self.tick_writer, b' ')
+        except BlockingIOError:
+            pass
 
     def unregister(self, key):
         """
@@ -54,19 +81,43 @@ class Ticker(threading.Thread, util.TerminableThreadMixin):
 
         with self.timeout_lock:
             if key in self.timeouts:
+                metrics.TICKER_TIMERS.dec()
                 del self.timeouts[key]
 
+            # Don't let the unregistered entries pile up forever
+            if len(self.deadlines) > 2 * len(self.timeouts) + 64:
+                self.deadlines = [entry for entry in self.deadlines
+                                  if self.timeouts.get(entry[2]) == entry[0]]
+                heapq.heapify(self.deadlines)
+
+    def next_timeout(self):
+        """
+        :return: The time that the next timeout expires, or ``None`` if \
+        there aren't any.
+        """
+        with self.timeout_lock:
+            while self.deadlines:
+                abstime, _, key = self.deadlines[0]
+                if self.timeouts.get(key) == abstime:
+                    return abstime
+                heapq.heappop(self.deadlines)
+
+        return None
+
     def run_timeouts(self):
         """
         Runs all the expired timeouts.
         """
-        expired = []
+        # A key can be in the deadlines more than once, if it was registered
+        # again for the same time - a dict keeps each key once, in order
+        expired = {}
 
-        now = time.time()
+        now = self.clock.time()
         with self.timeout_lock:
-            for key, timeout in self.timeouts.items():
-                if timeout <= now:
-                    expired.append(key)
+            while self.deadlines and self.deadlines[0][0] <= now:
+                abstime, _, key = heapq.heappop(self.deadlines)
+                if self.timeouts.get(key) == abstime:
+                    expired[key] = None
 
         for key in expired:
             LOGGER.info('Running callback on %s', key)
@@ -79,13 +130,11 @@ class Ticker(threading.Thread, util.TerminableThreadMixin):
         Runs the timeout loop, calling the timeout function when appropriate.
         """
         while True:
-            try:
-                min_wait_time = min(self.timeouts.values()) - time.time()
-
-                if min_wait_time < 0:
-                    min_wait_time = 0
-            except ValueError:
+            next_timeout = self.next_timeout()
+            if next_timeout is None:
                 min_wait_time = None
+            else:
+                min_wait_time = max(0, next_timeout - self.clock.time())
 
             readers, _, _ = select.select(
                     [self.tick_reader, self.exit_reader], [], [], 
@@ -99,10 +148,10 @@ class Ticker(threading.Thread, util.TerminableThreadMixin):
             if self.tick_reader in readers:
                 # Flush the pipe, since we don't want it to get backed up
                 LOGGER.info('Woken up by registration')
-                self.tick_reader.read(1)
+                os.read(self.tick_reader, 4096)
 
         LOGGER.info('Closing...')
         self.cleanup()
 
-        self.tick_reader.close()
-        self.tick_writer.close()
+        os.close(self.tick_reader)
+        os.close(self.tick_writer)
@@ -0,0 +1,160 @@
+"""
+JobMon Request Tracing
+======================
+
+Follows each command through the supervisor, recording how long it spends in
+each stage of being answered:
+
+- ``recv`` is reading the command from the client, once it has started
+  arriving.
+- ``dispatch`` is the command server handing the command to the
+  :class:`jobmon.service.SupervisorShim`.
+- ``queue-wait`` is the command waiting in the service's request queue.
+- ``handle`` is the service doing what the command asked (such as forking a
+  job that is being started).
+- ``wakeup`` is the command server noticing that the service is done.
+- ``reply`` is sending the response back to the client.
+
+The command server starts a :class:`Trace` for each command, and makes it the
+current trace of its thread while it calls into the shim, which passes it
+along with the request to the service. Once the reply is sent, the stages are
+recorded in :data:`metrics.COMMAND_STAGE_LATENCY`, and commands which took
+longer than the slow request threshold are logged.
+"""
+import logging
+import threading
+import time
+
+from jobmon import metrics
+
+LOGGER = logging.getLogger('jobmon.tracing')
+
+# The points in a command's life where timestamps are taken
+ACCEPTED, RECEIVED, QUEUED, DEQUEUED, HANDLED, RESUMED, REPLIED = range(7)
+
+# Each stage is named after the mark at its end
+STAGE_NAMES = {
+    RECEIVED: 'recv',
+    QUEUED: 'dispatch',
+    DEQUEUED: 'queue-wait',
+    HANDLED: 'handle',
+    RESUMED: 'wakeup',
+    REPLIED: 'reply',
+}
+STAGES = tuple(STAGE_NAMES[mark] for mark in sorted(STAGE_NAMES))
+
+# The quantiles reported by get_stats
+QUANTILES = (0.5, 0.9, 0.99)
+
+_CURRENT = threading.local()
+
+def current():
+    """
+    :return: The trace of the command that the current thread is handling, \
+    or ``None``.
+    """
+    return getattr(_CURRENT, 'trace', None)
+
+class Trace:
+    """
+    The timestamps taken as a single command makes its way through the
+    supervisor. Using a trace as a context manager makes it the current trace
+    of the thread.
+    """
+    def __init__(self):
+        self.command = None
+        self.marks = [(ACCEPTED, time.perf_counter())]
+
+    def __enter__(self):
+        _CURRENT.trace = self
+        return self
+
+    def __exit__(self, *exc_info):
+        _CURRENT.trace = None
+
+    def mark(self, point):
+        """
+        Records that the command has reached a point, such as
+        :data:`QUEUED`.
+        """
+        self.marks.append((point, time.perf_counter()))
+
+    def get_stages(self):
+        """
+        :return: A list of ``(stage, seconds)`` pairs, in order. If a point \
+        was never marked, its time is counted towards the next stage.
+        """
+        stages = []
+        (_, last_time) = self.marks[0]
+        for point, mark_time in self.marks[1:]:
+            stages.append((STAGE_NAMES[point], mark_time - last_time))
+            last_time = mark_time
+        return stages
+
+    def get_total(self):
+        """
+        :return: The time between the first and last marks, in seconds.
+        """
+        return self.marks[-1][1] - self.marks[0][1]
+
+    def finish(self, slow_threshold=None):
+        """
+        Records the trace in the metrics, and logs it if it was slow.
+
+        :param float slow_threshold: How long a command can take (in seconds) \
+        before it is logged, or ``None`` to never log commands.
+        """
+        stages = self.get_stages()
+        total = self.get_total()
+
+        for stage, duration in stages:
+            metrics.COMMAND_STAGE_LATENCY.observe(duration, self.command, stage)
+        metrics.COMMAND_LATENCY.observe(total, self.command)
+
+        if slow_threshold is not None and total >= slow_threshold:
+            LOGGER.warning('Slow command %s took %.3fms (%s)', self.command,
+                           total * 1000,
+                           ', '.join('{} {:.3f}ms'.format(stage, duration * 1000)
+                                     for stage, duration in stages))
+
+def summarize(bounds, buckets, total, count):
+    """
+    Summarizes the observations of a latency histogram.
+
+    :param bounds: The upper bounds of the histogram's buckets.
+    :param buckets: How many observations fell into each bucket.
+    :param float total: The sum of the observations.
+    :param int count: How many observations there were.
+    :return: A :class:`dict` with the ``count`` and ``mean`` of the \
+    observations, and estimates of their quantiles (such as ``p99``), all \
+    in seconds.
+    """
+    summary = {
+        'count': count,
+        'mean': total / count if count else None,
+    }
+
+    for quantile in QUANTILES:
+        summary['p{:g}'.format(quantile * 100)] = metrics.bucket_quantile(
+            quantile, bounds, buckets)
+
+    return summary
+
+def get_stats():
+    """
+    Gathers the latencies of every command that has been traced.
+
+    :return: A :class:`dict` mapping each command to another :class:`dict`, \
+    which maps each stage (and ``total``) to its :func:`summarize` summary.
+    """
+    stats = {}
+    bounds = metrics.COMMAND_STAGE_LATENCY.buckets
+    for (command, stage), observations in \
+            metrics.COMMAND_STAGE_LATENCY.snapshot().items():
+        stats.setdefault(command, {})[stage] = summarize(bounds, *observations)
+
+    bounds = metrics.COMMAND_LATENCY.buckets
+    for (command,), observations in metrics.COMMAND_LATENCY.snapshot().items():
+        stats.setdefault(command, {})['total'] = summarize(bounds, *observations)
+
+    return stats
@@ -14,13 +14,16 @@ This is an object oriented layer on top of that low-level foundation.
   Clients submit requests to the supervisor, and then the supervisor does an
   action and returns a response back to the client.
 """
-import socket
-
-from jobmon import protocol
+from jobmon import address, protocol
 
 class JobError(Exception):
     pass
 
+class WaitTimeout(JobError):
+    """
+    Raised when a job doesn't reach the state being waited for in time.
+    """
+
 class EventStream:
     """
     An asynchronous one-way stream of events, from the supervisor to the
@@ -31,14 +34,17 @@ class EventStream:
        fashion. This is useful for programs that can focus solely on events for
        a period of time.
      - Passing it to select, since it supports :meth:`fileno`
+
+    The event server's address can be given in any form that
+    :func:`address.parse` reads - an invalid address raises a
+    :class:`ValueError`.
     """
     def __init__(self, socket_no):
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        event_address = address.parse(socket_no)
         try:
-            self.sock.connect(('localhost', socket_no))
-            self.sock = protocol.ProtocolStreamSocket(self.sock, timeout=None)
+            self.sock = protocol.ProtocolStreamSocket(
+                address.connect(event_address), timeout=None)
         except OSError:
-            self.sock.close()
             raise IOError('Cannot connect to supervisor')
 
     def fileno(self):
@@ -72,39 +78,69 @@ class CommandPipe:
     - :meth:`stop_job` forcibly terminates a job. If the given job is not
       currently running, then a :class:`JobError` is raised.
     - :meth:`is_running` queries a job to see if it is currently running or not.
+    - :meth:`get_status` gets everything known about whether a job is running,
+      including whether it is passing its health checks.
+    - :meth:`wait_job` waits until a job is running, stopped or ready, which
+      the supervisor answers as soon as it happens.
     - :meth:`terminate` shuts down the supervisor and all currently running
       tasks.
     - :meth:`get_jobs` gets a :class:`dict` of known jobs, with the key being
       the job name, and the value being ``True`` if the job is running or
       ``False`` if it is not.
+    - :meth:`get_spawn_plan` gets a :class:`dict` describing exactly how the
+      supervisor will launch a job.
+    - :meth:`run_batch` sends several commands in one request, such as
+      starting a number of jobs.
 
     Note that if any of these methods are called with job names that don't
     exist, then a :class:`NameError` will be raised.
+
+    The command server's address can be given in any form that
+    :func:`address.parse` reads - an invalid address raises a
+    :class:`ValueError`.
     """
-    def __init__(self, socket_no):
-        self.port = socket_no
+    def __init__(self, socket_no, keep_open=False):
+        """
+        :param socket_no: The command server's address.
+        :param bool keep_open: Whether to send every command over the same \
+        connection, until :meth:`destroy` is called, rather than connecting \
+        for each command.
+        """
+        self.address = address.parse(socket_no)
+        self.keep_open = keep_open
+        self.sock = None
 
     def reconnect(self):
         """
-        Reconnects to the command socket.
-
-        This is necessary because the server drops us after a single request.
+        Reconnects to the command socket, unless the connection is being kept
+        open and is still there.
         """
-        _sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self.keep_open and self.sock is not None:
+            return
+
         try:
-            _sock.connect(('localhost', self.port))
-            self.sock = protocol.ProtocolStreamSocket(_sock)
+            self.sock = protocol.ProtocolStreamSocket(
+                address.connect(self.address))
         except OSError:
             raise IOError('Cannot connect to supervisor')
 
-    def start_job(self, job_name):
+    def start_job(self, job_name, with_deps=False, at=None):
         """
         Launches a job by name.
 
         :param str job_name: The name of the job to launch.
+        :param bool with_deps: Whether to also launch the jobs that this one \
+        requires (see :mod:`jobmon.dependencies`).
+        :param float at: The time to launch the job at, as a timestamp, or \
+        ``None`` to launch it now.
         """
         self.reconnect()
-        msg = protocol.Command(job_name, protocol.CMD_START)
+        args = {}
+        if with_deps:
+            args['dependencies'] = True
+        if at is not None:
+            args['at'] = at
+        msg = protocol.Command(job_name, protocol.CMD_START, args or None)
         self.sock.send(msg)
         result = self.sock.recv()
         
@@ -121,7 +157,7 @@ class CommandPipe:
                     raise JobError('Unknown error: reason "{}"'.format(
                         protocol.reason_to_str(result.reason)))
         finally:
-            self.sock.close()
+            self.release()
 
     def stop_job(self, job_name):
         """
@@ -147,7 +183,7 @@ class CommandPipe:
                     raise JobError('Unknown error: reason "{}"'.format(
                         protocol.reason_to_str(result.reason)))
         finally:
-            self.sock.close()
+            self.release()
 
     def is_running(self, job_name):
         """
@@ -172,7 +208,81 @@ class CommandPipe:
             else:
                 return result.is_running
         finally:
-            self.sock.close()
+            self.release()
+
+    def get_status(self, job_name):
+        """
+        Gets the status of a job.
+
+        :param str job_name: The name of the job to query.
+        :return: A :class:`protocol.StatusResponse`, whose ``healthy`` is \
+        ``None`` unless the job is running and has a health check.
+        """
+        self.reconnect()
+        msg = protocol.Command(job_name, protocol.CMD_STATUS)
+        self.sock.send(msg)
+        result = self.sock.recv()
+
+        try:
+            if isinstance(result, protocol.FailureResponse):
+                if result.reason == protocol.ERR_NO_SUCH_JOB:
+                    raise NameError(
+                        'The job "{}" does not exist'.format(job_name))
+                else:
+                    raise JobError('Unknown error: reason "{}"'.format(
+                        protocol.reason_to_str(result.reason)))
+            else:
+                return result
+        finally:
+            self.release()
+
+    def wait_job(self, job_name, state, timeout=None):
+        """
+        Waits for a job to reach a state. The supervisor answers as soon as
+        the job reaches it, or straight away if it's already there.
+
+        :param str job_name: The name of the job to wait for.
+        :param str state: One of :data:`protocol.WAIT_STATES`.
+        :param float timeout: How long to wait, in seconds, or ``None`` to \
+        wait for as long as it takes.
+        :return: The job's :class:`protocol.StatusResponse`, once it is in \
+        the state.
+        :raises WaitTimeout: If the job isn't in the state once the timeout \
+        has passed.
+        """
+        self.reconnect()
+        msg = protocol.Command(job_name, protocol.CMD_WAIT,
+                               {'state': state, 'timeout': timeout})
+        self.sock.send(msg)
+
+        # The reply only comes once the wait is over, so the socket has to
+        # wait at least as long
+        if timeout is None:
+            self.sock.set_timeout(None)
+        else:
+            self.sock.set_timeout(timeout + protocol.STREAM_TIMEOUT)
+
+        try:
+            result = self.sock.recv()
+        except (OSError, protocol.ProtocolTimeout):
+            self.destroy()
+            raise IOError('Lost connection to supervisor')
+
+        try:
+            self.sock.set_timeout(protocol.STREAM_TIMEOUT)
+            if isinstance(result, protocol.FailureResponse):
+                if result.reason == protocol.ERR_NO_SUCH_JOB:
+                    raise NameError(
+                        'The job "{}" does not exist'.format(job_name))
+                elif result.reason == protocol.ERR_WAIT_TIMEOUT:
+                    raise WaitTimeout(
+                        'The job "{}" is not {}'.format(job_name, state))
+                else:
+                    raise JobError(protocol.reason_to_str(result.reason))
+            else:
+                return result
+        finally:
+            self.release()
 
     def get_pid(self, job_name):
         """
@@ -198,7 +308,7 @@ class CommandPipe:
             else:
                 return result.pid
         finally:
-            self.sock.close()
+            self.release()
 
     def get_jobs(self):
         """
@@ -219,7 +329,197 @@ class CommandPipe:
             else:
                 return result.all_jobs
         finally:
-            self.sock.close()
+            self.release()
+
+    def get_spawn_plan(self, job_name):
+        """
+        Gets the precomputed plan that the supervisor uses to launch a job.
+
+        :param str job_name: The name of the job to query.
+        :return: A :class:`dict` containing the ``argv``, ``env``, ``stdin``, \
+        ``stdout``, ``stderr``, ``working-dir``, ``signal``, \
+        ``spawn-method``, ``rlimits``, ``cgroup`` and ``placement`` of the \
+        job.
+        """
+        self.reconnect()
+        msg = protocol.Command(job_name, protocol.CMD_SPAWN_PLAN)
+        self.sock.send(msg)
+        result = self.sock.recv()
+
+        try:
+            if isinstance(result, protocol.FailureResponse):
+                if result.reason == protocol.ERR_NO_SUCH_JOB:
+                    raise NameError(
+                        'The job "{}" does not exist'.format(job_name))
+                else:
+                    raise JobError('Unknown error: reason "{}"'.format(
+                        protocol.reason_to_str(result.reason)))
+            else:
+                return result.plan
+        finally:
+            self.release()
+
+    def get_output_ring(self, job_name):
+        """
+        Opens the ring buffer which holds a job's most recent output. Once it
+        is open, it can be read without going through the supervisor.
+
+        :param str job_name: The name of the job to query.
+        :return: An :class:`output.RingReader`.
+        """
+        self.reconnect()
+        msg = protocol.Command(job_name, protocol.CMD_OUTPUT_RING)
+        self.sock.send(msg)
+        result = self.sock.recv()
+
+        try:
+            if isinstance(result, protocol.FailureResponse):
+                if result.reason == protocol.ERR_NO_SUCH_JOB:
+                    raise NameError(
+                        'The job "{}" does not exist'.format(job_name))
+                else:
+                    raise JobError(protocol.reason_to_str(result.reason))
+            else:
+                # Reading rings needs most of the output module, which the
+                # other commands have no use for
+                from jobmon import output
+                return output.RingReader(result.path)
+        finally:
+            self.release()
+
+    def get_stats(self):
+        """
+        Gets the latencies of the commands that the supervisor has answered,
+        broken down by the stage that the time was spent in.
+
+        :return: A :class:`dict` mapping each command to another \
+        :class:`dict`, which maps each stage (and ``total``) to a summary of \
+        its latencies - see :func:`jobmon.tracing.summarize`.
+        """
+        self.reconnect()
+        msg = protocol.Command(None, protocol.CMD_STATS)
+        self.sock.send(msg)
+        result = self.sock.recv()
+
+        try:
+            if isinstance(result, protocol.FailureResponse):
+                raise JobError('Unknown error: reason "{}"'.format(
+                    protocol.reason_to_str(result.reason)))
+            else:
+                return result.stats
+        finally:
+            self.release()
+
+    def set_placement(self, job_name, changes):
+        """
+        Changes the CPU affinity and priorities of a running job, without
+        restarting it.
+
+        :param str job_name: The name of the job to change.
+        :param dict changes: Any of the ``cpu-affinity``, ``nice``, \
+        ``io-class`` and ``io-priority`` keys, in the same format as the job \
+        configuration.
+        """
+        self.reconnect()
+        msg = protocol.Command(job_name, protocol.CMD_SET_PLACEMENT, changes)
+        self.sock.send(msg)
+        result = self.sock.recv()
+
+        try:
+            if isinstance(result, protocol.FailureResponse):
+                if result.reason == protocol.ERR_NO_SUCH_JOB:
+                    raise NameError(
+                        'The job "{}" does not exist'.format(job_name))
+                elif result.reason == protocol.ERR_JOB_STOPPED:
+                    raise JobError(
+                        'The job "{}" is not running'.format(job_name))
+                else:
+                    raise JobError(protocol.reason_to_str(result.reason))
+        finally:
+            self.release()
+
+    def scale_job(self, job_name, replicas):
+        """
+        Changes how many instances of a replicated job are running. New
+        instances are started, and the newest instances are stopped first
+        when scaling down.
+
+        :param str job_name: The name of the replicated job.
+        :param int replicas: How many instances there should be.
+        """
+        self.reconnect()
+        msg = protocol.Command(job_name, protocol.CMD_SCALE,
+                               {'replicas': replicas})
+        self.sock.send(msg)
+        result = self.sock.recv()
+
+        try:
+            if isinstance(result, protocol.FailureResponse):
+                if result.reason == protocol.ERR_NO_SUCH_JOB:
+                    raise NameError(
+                        'The job "{}" does not exist'.format(job_name))
+                elif result.reason == protocol.ERR_NOT_REPLICATED:
+                    raise JobError(
+                        'The job "{}" is not replicated'.format(job_name))
+                else:
+                    raise JobError(protocol.reason_to_str(result.reason))
+        finally:
+            self.release()
+
+    def run_batch(self, commands):
+        """
+        Sends several commands as a single request, which the supervisor
+        answers in order.
+
+        :param list commands: The :class:`protocol.Command` objects to send.
+        :return: A list with the response to each command. Unlike the other \
+        methods, failures are returned as :class:`protocol.FailureResponse` \
+        objects rather than raised.
+        """
+        self.reconnect()
+        msg = protocol.Command(None, protocol.CMD_BATCH,
+                               [command.serialize() for command in commands])
+        try:
+            self.sock.send(msg)
+            result = self.sock.recv()
+        except (OSError, protocol.ProtocolTimeout):
+            # The connection can't be trusted to line up commands with their
+            # responses any more
+            self.destroy()
+            raise IOError('Lost connection to supervisor')
+
+        try:
+            if isinstance(result, protocol.FailureResponse):
+                raise JobError(protocol.reason_to_str(result.reason))
+            else:
+                return result.results
+        finally:
+            self.release()
+
+    def reexec(self):
+        """
+        Has the supervisor re-execute itself, keeping its jobs running. This
+        returns once the new supervisor has taken over.
+        """
+        self.reconnect()
+        msg = protocol.Command(None, protocol.CMD_REEXEC)
+        self.sock.send(msg)
+
+        # The new supervisor answers once it has started up, and if it dies
+        # instead then the connection is closed
+        self.sock.set_timeout(None)
+        try:
+            result = self.sock.recv()
+        except (OSError, protocol.ProtocolTimeout):
+            self.destroy()
+            raise IOError('Lost connection to supervisor')
+
+        try:
+            self.sock.set_timeout(protocol.STREAM_TIMEOUT)
+            if isinstance(result, protocol.FailureResponse):
+                raise JobError(protocol.reason_to_str(result.reason))
+        finally:
+            self.release()
 
     def terminate(self):
         """
@@ -228,10 +528,20 @@ class CommandPipe:
         self.reconnect()
         msg = protocol.Command(None, protocol.CMD_QUIT)
         self.sock.send(msg)
-        self.sock.close()
+        self.destroy()
+
+    def release(self):
+        """
+        Finishes with the connection once a command has been answered,
+        closing it unless it is being kept open.
+        """
+        if not self.keep_open:
+            self.destroy()
 
     def destroy(self):
         """
         Closes the socket owned by this command pipe.
         """
-        self.sock.close()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
@@ -0,0 +1,323 @@
+"""
+The include watcher uses inotify to notice when job files inside of the
+``include-dirs`` are created, changed or removed, and tells the supervisor
+which file needs to be reloaded.
+
+Since editors tend to write files in several steps (truncating, writing,
+renaming, and so on), events for a file are debounced - the supervisor is only
+notified once no events have arrived for that file for :data:`DEBOUNCE_DELAY`
+seconds.
+
+The directories that the include globs point into can come and go while the
+supervisor is running (deployment tools often swap a whole directory for a new
+one), so the directories holding them are watched too. When a directory that
+matches appears, it is watched, and its job files are reloaded; when a watched
+directory disappears, the job files that were in it are reloaded (which
+removes their jobs, unless they have come back in the meantime).
+"""
+import ctypes
+import ctypes.util
+import fnmatch
+import glob
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+from jobmon import util
+
+LOGGER = logging.getLogger('jobmon.watcher')
+
+# How long (in seconds) a file has to be left alone before it is reloaded
+DEBOUNCE_DELAY = 0.5
+
+# These are taken from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Directories holding job files are watched for changes to the files, and
+# the directories holding those only for directories appearing - both are
+# watched for going away themselves
+SELF_MASK = IN_DELETE_SELF | IN_MOVE_SELF
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | SELF_MASK)
+PARENT_MASK = IN_CREATE | IN_MOVED_TO | SELF_MASK
+
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+EVENT_HEADER = struct.Struct('iIII')
+
+def _load_libc():
+    """
+    Loads the C library and checks that it supports inotify.
+
+    :return: A :class:`ctypes.CDLL` for the C library.
+    """
+    libc_name = ctypes.util.find_library('c')
+    libc = ctypes.CDLL(libc_name, use_errno=True)
+    if not hasattr(libc, 'inotify_init1'):
+        raise OSError('inotify is not supported on this platform')
+
+    return libc
+
+class IncludeWatcher(threading.Thread, util.TerminableThreadMixin):
+    """
+    Watches the directories referenced by a group of include globs, and calls
+    a callback with the path of each job file that changes.
+    """
+    def __init__(self, include_globs, callback, delay=DEBOUNCE_DELAY):
+        """
+        Creates a new :class:`IncludeWatcher`.
+
+        :param list include_globs: The (already expanded) include globs.
+        :param callback: A function which is called with the path of each \
+        job file after it has changed.
+        :param float delay: The debouncing delay, in seconds.
+        """
+        threading.Thread.__init__(self)
+        util.TerminableThreadMixin.__init__(self)
+
+        self.include_globs = include_globs
+        self.callback = callback
+        self.delay = delay
+
+        # Maps each file that has changed to the time (on the monotonic
+        # clock) that it should be reloaded at
+        self.pending = {}
+
+        # Every job file that has been seen, so that the files in a directory
+        # which disappears can be reloaded
+        self.job_files = set()
+
+        self.libc = _load_libc()
+        fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        self.inotify = os.fdopen(fd, 'rb', buffering=0)
+
+        # Maps each watch descriptor to the directory it is watching, and
+        # back again. The directories holding job files are kept separately,
+        # since the rest are only watched for directories appearing.
+        self.watches = {}
+        self.watched_dirs = {}
+        self.job_dirs = set()
+
+        for include_glob in self.include_globs:
+            self.job_files.update(os.path.normpath(path)
+                                  for path in glob.glob(include_glob))
+        self.update_watches(reload_new=False)
+
+    def get_directories(self):
+        """
+        Figures out which directories have to be watched to catch changes to
+        every file matching the include globs.
+
+        :return: A set of the directories which can hold job files, and a \
+        set of the directories holding those.
+        """
+        directories = set()
+        parents = set()
+        for include_glob in self.include_globs:
+            dir_glob = os.path.dirname(include_glob) or '.'
+            for directory in glob.glob(dir_glob):
+                if os.path.isdir(directory):
+                    directories.add(os.path.normpath(directory))
+
+            parent_glob = os.path.dirname(os.path.normpath(dir_glob)) or '.'
+            for parent in glob.glob(parent_glob):
+                if os.path.isdir(parent):
+                    parents.add(os.path.normpath(parent))
+
+        return directories, parents
+
+    def update_watches(self, reload_new=True):
+        """
+        Starts watching any directories matching the include globs which
+        aren't being watched yet.
+
+        :param bool reload_new: Whether to reload the job files in the \
+        directories that are newly watched, which could have been written \
+        before the watch was added.
+        """
+        directories, parents = self.get_directories()
+        for directory in sorted(directories | parents):
+            is_job_dir = directory in directories
+            if directory in self.watched_dirs:
+                if is_job_dir == (directory in self.job_dirs):
+                    continue
+
+            if not self.add_watch(directory, is_job_dir):
+                continue
+
+            if is_job_dir and reload_new:
+                for name in os.listdir(directory):
+                    path = os.path.join(directory, name)
+                    if self.is_job_file(path):
+                        self.schedule_reload(path)
+
+    def add_watch(self, directory, is_job_dir):
+        """
+        Starts watching a directory for changes.
+
+        :param str directory: The directory to watch.
+        :param bool is_job_dir: Whether the directory can hold job files, \
+        rather than only the directories which do.
+        :return: Whether the directory is now being watched.
+        """
+        LOGGER.info('Watching directory "%s"', directory)
+        wd = self.libc.inotify_add_watch(self.inotify.fileno(),
+                                         os.fsencode(directory),
+                                         WATCH_MASK if is_job_dir
+                                         else PARENT_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            LOGGER.warning('Cannot watch "%s" - %s', directory,
+                           os.strerror(errno))
+            return False
+
+        # Watching a directory again (say, from a different path) gives the
+        # same descriptor
+        old_directory = self.watches.get(wd)
+        if old_directory is not None:
+            self.watched_dirs.pop(old_directory, None)
+            self.job_dirs.discard(old_directory)
+
+        self.watches[wd] = directory
+        self.watched_dirs[directory] = wd
+        if is_job_dir:
+            self.job_dirs.add(directory)
+        else:
+            self.job_dirs.discard(directory)
+        return True
+
+    def forget_watch(self, wd):
+        """
+        Forgets a watch which the kernel has removed, because its directory
+        was removed (or :meth:`read_events` removed it after the directory
+        was moved). The job files that were in the directory are reloaded,
+        since they are gone too.
+        """
+        directory = self.watches.pop(wd, None)
+        if directory is None:
+            return
+
+        LOGGER.info('Stopped watching directory "%s"', directory)
+        if self.watched_dirs.get(directory) == wd:
+            del self.watched_dirs[directory]
+        self.job_dirs.discard(directory)
+
+        for path in list(self.job_files):
+            if os.path.dirname(path) == directory:
+                self.schedule_reload(path)
+
+    def schedule_reload(self, path):
+        """
+        Reloads a job file once it has been left alone for the debouncing
+        delay.
+        """
+        self.job_files.add(path)
+        self.pending[path] = time.monotonic() + self.delay
+
+    def is_job_file(self, path):
+        """
+        Checks whether a path is matched by any of the include globs.
+        """
+        return any(fnmatch.fnmatch(path, os.path.normpath(include_glob))
+                   for include_glob in self.include_globs)
+
+    def read_events(self):
+        """
+        Reads all of the available inotify events, and schedules reloads for
+        any job files that they refer to.
+        """
+        try:
+            buffer = self.inotify.read(4096)
+        except BlockingIOError:
+            return
+
+        if not buffer:
+            return
+
+        directories_changed = False
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(buffer, offset)
+            offset += EVENT_HEADER.size
+
+            raw_name = buffer[offset:offset + name_len].rstrip(b'\0')
+            offset += name_len
+
+            if wd not in self.watches:
+                continue
+
+            if mask & IN_IGNORED:
+                self.forget_watch(wd)
+                directories_changed = True
+            elif mask & IN_MOVE_SELF:
+                # The watch follows the directory to wherever it went, which
+                # isn't where the job files are looked for - removing the
+                # watch gets IN_IGNORED sent for it
+                self.libc.inotify_rm_watch(self.inotify.fileno(), wd)
+            elif mask & IN_ISDIR:
+                directories_changed = True
+            elif raw_name and self.watches[wd] in self.job_dirs:
+                path = os.path.join(self.watches[wd], os.fsdecode(raw_name))
+                if self.is_job_file(path):
+                    LOGGER.info('Got event %x on "%s"', mask, path)
+                    self.schedule_reload(path)
+
+        if directories_changed:
+            self.update_watches()
+
+    def run_pending(self):
+        """
+        Runs the callback for every file whose debouncing delay has expired.
+        """
+        now = time.monotonic()
+        expired = [path for path, deadline in self.pending.items()
+                   if deadline <= now]
+
+        for path in expired:
+            del self.pending[path]
+            LOGGER.info('Reloading "%s"', path)
+            self.callback(path)
+
+    @util.log_crashes(LOGGER, 'Error in include watcher')
+    def run(self):
+        """
+        Waits for inotify events and dispatches them to the callback.
+        """
+        while True:
+            if self.pending:
+                min_wait_time = max(
+                    min(self.pending.values()) - time.monotonic(), 0)
+            else:
+                min_wait_time = None
+
+            readers, _, _ = select.select(
+                    [self.inotify, self.exit_reader], [], [], min_wait_time)
+
+            if self.exit_reader in readers:
+                break
+
+            if self.inotify in readers:
+                self.read_events()
+
+            self.run_pending()
+
+        LOGGER.info('Closing...')
+        self.cleanup()
+        self.inotify.close()